@@ -19,22 +19,54 @@ This package provides functions and classes for lattice modeling.
 
 from __future__ import absolute_import
 
+import importlib
+
 import tensorflow_lattice.layers
 
 from tensorflow_lattice.python import aggregation_layer
 from tensorflow_lattice.python import categorical_calibration_layer
 from tensorflow_lattice.python import categorical_calibration_lib
+from tensorflow_lattice.python import coarse_to_fine
 from tensorflow_lattice.python import configs
-from tensorflow_lattice.python import estimators
+from tensorflow_lattice.python import constraint_metrics
+from tensorflow_lattice.python import cost_model
+from tensorflow_lattice.python import early_exit
+from tensorflow_lattice.python import export
+from tensorflow_lattice.python import incremental_scoring
+from tensorflow_lattice.python import interpolation_cache
+from tensorflow_lattice.python import interval_evaluation
 from tensorflow_lattice.python import lattice_layer
 from tensorflow_lattice.python import lattice_lib
+from tensorflow_lattice.python import least_squares
 from tensorflow_lattice.python import linear_layer
 from tensorflow_lattice.python import linear_lib
 from tensorflow_lattice.python import model_info
 from tensorflow_lattice.python import parallel_combination_layer
+from tensorflow_lattice.python import partial_dependence
+from tensorflow_lattice.python import partial_evaluation
 from tensorflow_lattice.python import premade
 from tensorflow_lattice.python import premade_lib
+from tensorflow_lattice.python import profiling
 from tensorflow_lattice.python import pwl_calibration_layer
 from tensorflow_lattice.python import pwl_calibration_lib
-from tensorflow_lattice.python import test_utils
-from tensorflow_lattice.python import visualization
+from tensorflow_lattice.python import retrieval
+from tensorflow_lattice.python import shapley
+
+# Submodules with heavy dependencies (tf.estimator and feature columns for
+# estimators, matplotlib for visualization) and test_utils are imported on
+# first attribute access, so that e.g. serving processes which only use
+# tfl.layers do not pay for them and do not need matplotlib installed.
+_LAZY_SUBMODULES = ('estimators', 'test_utils', 'visualization')
+
+
+def __getattr__(name):
+  if name in _LAZY_SUBMODULES:
+    module = importlib.import_module('tensorflow_lattice.python.' + name)
+    globals()[name] = module
+    return module
+  raise AttributeError(
+      'module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+  return sorted(set(globals()) | set(_LAZY_SUBMODULES))
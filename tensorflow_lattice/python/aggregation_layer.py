@@ -31,14 +31,18 @@ class Aggregation(keras.layers.Layer):
   # pyformat: disable
   """Layer which represents an aggregation function.
 
-  Calls the model on each of the ragged dimensions and takes the mean.
+  Calls the model on each of the ragged dimensions and takes the mean. The model
+  is called once on the flat values of all examples in the batch and the
+  results are averaged per example using segment ops. If the model has multiple
+  output units, e.g. a multi-unit lattice, each unit is averaged separately.
 
   Input shape:
   A list or dictionary with num_input_dims Rank-2 ragged tensors with
   shape: (batch_size, ?)
 
   Output shape:
-  Rank-2 tensor with shape: (batch_size, 1)
+  Rank-2 tensor with shape: (batch_size, units), where units is the output
+  dimension of the model.
 
   Attributes:
     - All `__init__ `arguments.
@@ -52,31 +56,147 @@ class Aggregation(keras.layers.Layer):
   """
   # pyformat: enable
 
-  def __init__(self, model, **kwargs):
+  def __init__(self, model, chunk_size=None, **kwargs):
     """initializes an instance of `Aggregation`.
 
     Args:
       model: A tf.keras.Model instance.
+      chunk_size: If set, the model is evaluated on chunks of at most
+        `chunk_size` flat values at a time and the results are accumulated
+        using segment sums. Activations of each chunk are recomputed during
+        backpropagation, so that peak memory depends on `chunk_size` rather
+        than on the total size of the sets in the batch.
       **kwargs: Other args passed to `tf.keras.layers.Layer` initializer.
 
     Raises:
-      ValueError: if model is not at `tf.keras.Model` instance.
+      ValueError: if model is not at `tf.keras.Model` instance or if chunk_size
+        is not positive.
     """
     if not isinstance(model, tf.keras.Model):
       raise ValueError('Model must be a tf.keras.Model instance.')
+    if chunk_size is not None and chunk_size < 1:
+      raise ValueError('chunk_size must be positive: {}'.format(chunk_size))
     super(Aggregation, self).__init__(**kwargs)
     # This flag enables inputs to be Ragged Tensors
     self._supports_ragged_inputs = True
     self.model = model
+    self.chunk_size = chunk_size
 
   def call(self, x):
     """Standard Keras call() method."""
-    return tf.reduce_mean(tf.ragged.map_flat_values(self.model, x), axis=1)
+    if self.chunk_size:
+      return self._chunked_call(x)
+    outputs = tf.ragged.map_flat_values(self.model, x)
+    # Empty sets are aggregated to zero.
+    return tf.math.unsorted_segment_mean(
+        outputs.flat_values,
+        segment_ids=outputs.value_rowids(),
+        num_segments=outputs.nrows())
+
+  def _chunked_call(self, x):
+    """Evaluates the model on chunks of flat values and averages the results."""
+    ragged_inputs = tf.nest.flatten(x)
+    # All ragged inputs share the same row partitions.
+    row_ids = ragged_inputs[0].value_rowids()
+    num_rows = ragged_inputs[0].nrows()
+    num_values = tf.size(row_ids, out_type=row_ids.dtype)
+    chunk_size = tf.constant(self.chunk_size, dtype=row_ids.dtype)
+
+    def chunk_sums(start, chunk):
+      end = tf.minimum(start + chunk_size, num_values)
+      outputs = self.model(tf.nest.pack_sequence_as(x, chunk))
+      return tf.math.unsorted_segment_sum(
+          outputs, row_ids[start:end], num_segments=num_rows)
+
+    def slice_chunk(values, start):
+      return [v[start:tf.minimum(start + chunk_size, num_values)]
+              for v in values]
+
+    @tf.custom_gradient
+    def aggregate(*values):
+      """Returns per row sums of the model outputs."""
+      # The first chunk is evaluated outside of the loop to infer the output
+      # shape of the model.
+      start = tf.zeros_like(chunk_size)
+      sums = chunk_sums(start, slice_chunk(values, start))
+      _, sums = tf.while_loop(
+          cond=lambda start, _: start < num_values,
+          body=lambda start, sums: (  # pylint: disable=g-long-lambda
+              start + chunk_size,
+              sums + chunk_sums(start, slice_chunk(values, start))),
+          loop_vars=(chunk_size, sums),
+          parallel_iterations=1)
+
+      def grad_fn(upstream, variables=None):
+        """Recomputes the activations of each chunk to get its gradients."""
+        variables = list(variables or [])
+        float_indices = [
+            i for i, value in enumerate(values) if value.dtype.is_floating
+        ]
+        num_chunks = tf.cast((num_values + chunk_size - 1) // chunk_size,
+                             tf.int32)
+
+        def body(chunk_index, variable_grads, value_grads):
+          start = tf.cast(chunk_index, chunk_size.dtype) * chunk_size
+          chunk = slice_chunk(values, start)
+          with tf.GradientTape() as tape:
+            tape.watch([chunk[i] for i in float_indices])
+            chunk_output = chunk_sums(start, chunk)
+          grads = tape.gradient(
+              chunk_output, [chunk[i] for i in float_indices] + variables,
+              output_gradients=upstream,
+              unconnected_gradients=tf.UnconnectedGradients.ZERO)
+          value_grads = [
+              value_grad.write(chunk_index, grad) for value_grad, grad in zip(
+                  value_grads, grads[:len(float_indices)])
+          ]
+          variable_grads = [
+              variable_grad + tf.convert_to_tensor(grad)
+              for variable_grad, grad in zip(variable_grads,
+                                             grads[len(float_indices):])
+          ]
+          return chunk_index + 1, variable_grads, value_grads
+
+        _, variable_grads, value_grads = tf.while_loop(
+            cond=lambda chunk_index, *_: chunk_index < num_chunks,
+            body=body,
+            loop_vars=(
+                tf.constant(0),
+                [tf.zeros_like(variable) for variable in variables],
+                [
+                    tf.TensorArray(
+                        values[i].dtype,
+                        size=num_chunks,
+                        infer_shape=False,
+                        element_shape=tf.TensorShape(
+                            [None]).concatenate(values[i].shape[1:]))
+                    for i in float_indices
+                ]),
+            parallel_iterations=1)
+        input_grads = [None] * len(values)
+        for i, value_grad in zip(float_indices, value_grads):
+          input_grads[i] = value_grad.concat()
+        return input_grads, variable_grads
+
+      return sums, grad_fn
+
+    sums = aggregate(*[t.flat_values for t in ragged_inputs])
+    counts = tf.math.unsorted_segment_sum(
+        tf.ones_like(row_ids, dtype=sums.dtype), row_ids,
+        num_segments=num_rows)
+    counts = tf.reshape(
+        counts,
+        tf.concat([[-1], tf.ones([tf.rank(sums) - 1], dtype=tf.int32)], 0))
+    # Empty sets are aggregated to zero.
+    return sums / tf.maximum(counts, 1)
 
   def get_config(self):
     """Standard Keras get_config() method."""
     config = super(Aggregation, self).get_config().copy()
-    config.update({'model': tf.keras.utils.serialize_keras_object(self.model)})
+    config.update({
+        'model': tf.keras.utils.serialize_keras_object(self.model),
+        'chunk_size': self.chunk_size,
+    })
     return config
 
   @classmethod
@@ -17,6 +17,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from absl.testing import parameterized
+import numpy as np
 import tensorflow as tf
 from tensorflow_lattice.python import aggregation_layer
 
@@ -29,7 +31,7 @@ test_input = [
 expected_output = tf.constant([32, 40, 162])
 
 
-class AggregationTest(tf.test.TestCase):
+class AggregationTest(parameterized.TestCase, tf.test.TestCase):
 
   def testAggregationLayer(self):
     # First we test our assertion that the model must be a tf.keras.Model
@@ -43,6 +45,56 @@ class AggregationTest(tf.test.TestCase):
     agg_layer = aggregation_layer.Aggregation(model)
     self.assertAllEqual(agg_layer(test_input), expected_output)
 
+  @parameterized.parameters(
+      ([5, 0, 17, 3], 1),
+      ([5, 0, 17, 3], 4),
+      ([5, 0, 17, 3], 100),
+      ([0, 0], 4),
+  )
+  def testChunkedAggregation(self, row_lengths, chunk_size):
+    inputs = [
+        tf.keras.Input(shape=(1,)),
+        tf.keras.Input(shape=(1,), dtype=tf.int32)
+    ]
+    hidden = tf.keras.layers.Concatenate()(
+        [inputs[0], tf.cast(inputs[1], tf.float32)])
+    hidden = tf.keras.layers.Dense(8, activation='relu')(hidden)
+    outputs = tf.keras.layers.Dense(3, activation='tanh')(hidden)
+    model = tf.keras.Model(inputs=inputs, outputs=outputs)
+
+    rng = np.random.RandomState(42)
+    num_values = sum(row_lengths)
+    values = tf.constant(rng.uniform(size=(num_values, 1)), dtype=tf.float32)
+    buckets = tf.RaggedTensor.from_row_lengths(
+        rng.randint(0, 3, size=(num_values, 1)), row_lengths)
+
+    def outputs_and_gradients(layer):
+
+      @tf.function
+      def compute():
+        with tf.GradientTape() as tape:
+          tape.watch(values)
+          aggregated = layer(
+              [tf.RaggedTensor.from_row_lengths(values, row_lengths), buckets])
+          loss = tf.reduce_sum(tf.square(aggregated))
+        return aggregated, tape.gradient(
+            loss, [values] + model.trainable_variables)
+
+      return self.evaluate(compute())
+
+    expected_outputs, expected_gradients = outputs_and_gradients(
+        aggregation_layer.Aggregation(model))
+    chunked_layer = aggregation_layer.Aggregation(model, chunk_size=chunk_size)
+    chunked_outputs, chunked_gradients = outputs_and_gradients(chunked_layer)
+    self.assertEqual(chunked_outputs.shape, (len(row_lengths), 3))
+    self.assertAllClose(expected_outputs, chunked_outputs, atol=1e-6)
+    for expected, chunked in zip(expected_gradients, chunked_gradients):
+      self.assertAllClose(expected, chunked, atol=1e-6)
+    self.assertEqual(chunked_layer.get_config()['chunk_size'], chunk_size)
+
+    with self.assertRaises(ValueError):
+      aggregation_layer.Aggregation(model, chunk_size=0)
+
 
 if __name__ == '__main__':
   tf.test.main()
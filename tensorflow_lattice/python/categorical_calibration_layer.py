@@ -263,6 +263,23 @@ class CategoricalCalibration(keras.layers.Layer):
         monotonicities=self.monotonicities,
         eps=eps)
 
+  def constraint_violations(self):
+    """Returns amounts by which layer weights violate constraints.
+
+    Cheap alternative to `assert_constraints` which can be used to monitor
+    constraints during training, e.g. using
+    `tfl.constraint_metrics.ConstraintViolation`.
+
+    Returns:
+      Dict from constraint type ('monotonicity' or 'bounds') to a 1-d tensor of
+      non-negative violation amounts.
+    """
+    return categorical_calibration_lib.constraint_violations(
+        weights=self.kernel,
+        output_min=self.output_min,
+        output_max=self.output_max,
+        monotonicities=self.monotonicities)
+
 
 class CategoricalCalibrationConstraints(keras.constraints.Constraint):
   # pyformat: disable
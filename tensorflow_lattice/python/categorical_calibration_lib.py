@@ -124,6 +124,40 @@ def assert_constraints(weights,
   return asserts
 
 
+def constraint_violations(weights, output_min, output_max, monotonicities):
+  """Returns amounts by which `weights` violate constraints.
+
+  Unlike `assert_constraints`, this function does not build assertion ops and
+  is cheap enough to be evaluated periodically during training.
+
+  Args:
+    weights: Tensor which represents weights of Categorical calibration layer.
+    output_min: Lower bound constraint on weights.
+    output_max: Upper bound constraint on weights.
+    monotonicities: List of pair of indices `(i, j)`, indicating constraint
+      `weight[i] <= weight[j]`.
+
+  Returns:
+    Dict from constraint type ('monotonicity' or 'bounds') to a 1-d tensor of
+    non-negative violation amounts. Constraint types which are not specified are
+    omitted.
+  """
+  violations = {}
+  if monotonicities:
+    left = tf.gather(weights, [i for (i, j) in monotonicities])
+    right = tf.gather(weights, [j for (i, j) in monotonicities])
+    violations["monotonicity"] = tf.nn.relu(tf.reshape(left - right, [-1]))
+
+  bounds_violations = []
+  if output_min is not None:
+    bounds_violations.append(tf.reshape(output_min - weights, [-1]))
+  if output_max is not None:
+    bounds_violations.append(tf.reshape(weights - output_max, [-1]))
+  if bounds_violations:
+    violations["bounds"] = tf.nn.relu(tf.concat(bounds_violations, axis=0))
+  return violations
+
+
 def verify_hyperparameters(num_buckets=None,
                            output_min=None,
                            output_max=None,
@@ -0,0 +1,362 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Coarse-to-fine training of lattices by exact multilinear refinement.
+
+Lattices with large `lattice_size` have many parameters and are slow to train.
+Instead, a model can be trained with small lattices first and the lattices can
+then be refined to finer grids. Multilinear interpolation on a lattice with `n`
+intervals along a dimension is also multilinear on a lattice with `k * n`
+intervals, so refining a kernel by interpolating it at the vertices of the finer
+grid does not change the function represented by the lattice, as long as inputs
+are scaled by `k` as well. In premade models, input calibrators are scaled
+accordingly.
+
+Refinement schedules only use such exact refinements, e.g. lattice sizes
+`2, 3, 5, 9` for a target size of 9, and `2, 4, 7` for a target size of 7.
+Refined kernels are convex combinations of the original kernel, so monotonicity
+and bound constraints keep holding. Lattice constraints are still finalized
+after each refinement to guarantee all constraints hold.
+
+```python
+model = tfl.coarse_to_fine.fit_coarse_to_fine(
+    model_config, inputs, labels, epochs_per_stage=50, batch_size=128)
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+
+from . import categorical_calibration_layer
+from . import configs
+from . import lattice_layer
+from . import premade
+from . import premade_lib
+from . import pwl_calibration_layer
+from . import rtl_layer
+import numpy as np
+import tensorflow as tf
+
+
+def refinement_schedule(lattice_size, min_lattice_size=2):
+  """Returns increasing lattice sizes ending in `lattice_size`.
+
+  Each size is an exact refinement of the previous one: its number of intervals
+  `size - 1` is a multiple of the number of intervals of the previous size.
+
+  Args:
+    lattice_size: Target lattice size.
+    min_lattice_size: Smallest lattice size in the schedule. The schedule starts
+      with the smallest exact refinement chain size not less than this value.
+
+  Returns:
+    A list of lattice sizes.
+  """
+  schedule = [lattice_size]
+  intervals = lattice_size - 1
+  while intervals > 1:
+    factor = next(f for f in range(2, intervals + 1) if intervals % f == 0)
+    if intervals // factor + 1 < min_lattice_size:
+      break
+    intervals //= factor
+    schedule.insert(0, intervals + 1)
+  return schedule
+
+
+def refine_lattice_kernel(kernel, lattice_sizes, new_lattice_sizes):
+  """Returns a lattice kernel interpolated at the vertices of a finer lattice.
+
+  Vertex `j` of dimension `d` of the new lattice is placed at input
+  `j * (lattice_sizes[d] - 1) / (new_lattice_sizes[d] - 1)` of the original
+  lattice. The refinement is exact, i.e. the new lattice with scaled inputs
+  represents the same function, if `new_lattice_sizes[d] - 1` is a multiple of
+  `lattice_sizes[d] - 1` for all dimensions.
+
+  Args:
+    kernel: Lattice kernel of shape `(prod(lattice_sizes), units)`.
+    lattice_sizes: List of lattice sizes.
+    new_lattice_sizes: List of lattice sizes of the refined lattice.
+
+  Returns:
+    A numpy array of shape `(prod(new_lattice_sizes), units)`.
+  """
+  kernel = np.asarray(kernel)
+  units = kernel.shape[1]
+  kernel = np.reshape(kernel, list(lattice_sizes) + [units])
+  for dim, (size, new_size) in enumerate(zip(lattice_sizes, new_lattice_sizes)):
+    positions = np.linspace(0.0, size - 1.0, num=new_size)
+    # Weights of 1-D linear interpolation between the original vertices.
+    weights = np.maximum(
+        0.0, 1.0 - np.abs(positions[:, np.newaxis] - np.arange(size)))
+    kernel = np.moveaxis(
+        np.tensordot(weights, kernel, axes=[[1], [dim]]), 0, dim)
+  return np.reshape(kernel, [-1, units])
+
+
+def _replace_lattice_sizes(config, lattice_sizes):
+  """Replaces lattice sizes in a layer config and nested serialized objects."""
+  if isinstance(config, dict):
+    return {
+        key: (lattice_sizes if key == 'lattice_sizes' else
+              _replace_lattice_sizes(value, lattice_sizes))
+        for key, value in config.items()
+    }
+  if isinstance(config, (list, tuple)):
+    values = [_replace_lattice_sizes(value, lattice_sizes) for value in config]
+    return tuple(values) if isinstance(config, tuple) else values
+  return config
+
+
+def _lattice_sizes(layer):
+  if isinstance(layer, rtl_layer.RTL):
+    return [layer.lattice_size] * layer.lattice_rank
+  return list(layer.lattice_sizes)
+
+
+def _set_refined_weights(layer, new_layer):
+  """Sets refined kernels of a `Lattice` or `RTL` layer on a finer copy."""
+  lattice_sizes = _lattice_sizes(layer)
+  new_lattice_sizes = _lattice_sizes(new_layer)
+  # Other weights, e.g. active units of lattices with dropout, are copied.
+  new_layer.set_weights([
+      refine_lattice_kernel(value, lattice_sizes, new_lattice_sizes)
+      if lattice_layer.LATTICE_KERNEL_NAME in weight.name else value
+      for weight, value in zip(layer.weights, layer.get_weights())
+  ])
+  new_layer.finalize_constraints()
+
+
+def _set_refined_ensemble_weights(model, new_model):
+  """Sets refined kernels of the lattices of an ensemble on a refined copy.
+
+  Packed lattice layers group lattices by their lattice sizes, so a packed
+  layer of the refined model can hold a different group of lattices than the
+  layer with the same name in the original model. Kernels are thus refined
+  separately for each submodel, using the lattice layer and unit of the
+  submodel in each model.
+
+  Args:
+    model: A `tfl.premade.CalibratedLatticeEnsemble` model.
+    new_model: A `tfl.premade.CalibratedLatticeEnsemble` model with the same
+      lattices and refined lattice sizes.
+  """
+  new_kernels = {}
+  for (layer_name, unit), (new_layer_name, new_unit) in zip(
+      premade_lib.submodel_lattice_units(model.model_config),
+      premade_lib.submodel_lattice_units(new_model.model_config)):
+    layer = model.get_layer(layer_name)
+    new_layer = new_model.get_layer(new_layer_name)
+    if new_layer_name not in new_kernels:
+      new_kernels[new_layer_name] = tf.keras.backend.get_value(new_layer.kernel)
+    kernel = tf.keras.backend.get_value(layer.kernel)[:, unit:unit + 1]
+    new_kernels[new_layer_name][:, new_unit] = refine_lattice_kernel(
+        kernel, layer.lattice_sizes, new_layer.lattice_sizes)[:, 0]
+  for new_layer_name, new_kernel in new_kernels.items():
+    new_layer = new_model.get_layer(new_layer_name)
+    tf.keras.backend.set_value(new_layer.kernel, new_kernel)
+    new_layer.finalize_constraints()
+
+
+def refine_layer(layer, lattice_sizes):
+  """Returns a copy of a lattice layer refined to finer lattice sizes.
+
+  The refined layer represents the same function as the original layer if its
+  inputs along dimension `d` are scaled by
+  `(lattice_sizes[d] - 1) / (layer.lattice_sizes[d] - 1)` and the refinement is
+  exact (see `refine_lattice_kernel`).
+
+  Args:
+    layer: A built `tfl.layers.Lattice` or `tfl.layers.RTL` layer.
+    lattice_sizes: List of lattice sizes of the refined `Lattice` layer, or the
+      lattice size of the refined `RTL` layer. An int is used for all
+      dimensions of a `Lattice` layer.
+
+  Returns:
+    A built layer of the same type as `layer`.
+
+  Raises:
+    ValueError: If the layer is not a built `Lattice` or `RTL` layer.
+  """
+  if not isinstance(layer, (lattice_layer.Lattice, rtl_layer.RTL)):
+    raise ValueError('refine_layer requires a Lattice or RTL layer.')
+  if not layer.built:
+    raise ValueError('Layer {} must be built to be refined.'.format(
+        layer.name))
+  config = layer.get_config()
+  if isinstance(layer, rtl_layer.RTL):
+    config['lattice_size'] = lattice_sizes
+  else:
+    if isinstance(lattice_sizes, int):
+      lattice_sizes = [lattice_sizes] * len(layer.lattice_sizes)
+    config = _replace_lattice_sizes(config, list(lattice_sizes))
+  new_layer = layer.__class__.from_config(config)
+  # Sublayers of RTL layers are only built when called.
+  # pylint: disable=protected-access
+  new_layer(
+      tf.nest.map_structure(
+          lambda shape: tf.zeros([1] + shape.as_list()[1:], dtype=layer.dtype),
+          layer._build_input_shape))
+  # pylint: enable=protected-access
+  _set_refined_weights(layer, new_layer)
+  return new_layer
+
+
+def _premade_class(model_config):
+  if isinstance(model_config, configs.CalibratedLatticeConfig):
+    return premade.CalibratedLattice
+  if isinstance(model_config, configs.CalibratedLatticeEnsembleConfig):
+    return premade.CalibratedLatticeEnsemble
+  raise ValueError('Coarse-to-fine training requires a CalibratedLatticeConfig '
+                   'or CalibratedLatticeEnsembleConfig.')
+
+
+def refine_model(model, lattice_sizes):
+  """Returns a copy of a premade model with refined lattices.
+
+  Outputs of the input calibrators are scaled to the new lattice sizes and the
+  lattice kernels are refined with `refine_lattice_kernel`, so the refined model
+  represents the same function if all refinements are exact.
+
+  Args:
+    model: A `tfl.premade.CalibratedLattice` or
+      `tfl.premade.CalibratedLatticeEnsemble` model.
+    lattice_sizes: A dict from feature names to their new lattice sizes.
+      Features that are not included keep their lattice size.
+
+  Returns:
+    A new premade model of the same type.
+
+  Raises:
+    ValueError: If the model is not supported or feature names are unknown.
+  """
+  model_class = _premade_class(getattr(model, 'model_config', None))
+  model_config = copy.deepcopy(model.model_config)
+  feature_configs = {
+      feature_config.name: feature_config
+      for feature_config in model_config.feature_configs
+  }
+  unknown_features = set(lattice_sizes) - set(feature_configs)
+  if unknown_features:
+    raise ValueError('Unknown features: {}'.format(sorted(unknown_features)))
+  scales = {}
+  for feature_name, feature_config in feature_configs.items():
+    new_lattice_size = lattice_sizes.get(feature_name,
+                                         feature_config.lattice_size)
+    scales[feature_name] = ((new_lattice_size - 1.0) /
+                            (feature_config.lattice_size - 1.0))
+    feature_config.lattice_size = new_lattice_size
+  new_model = model_class(model_config, dtype=model.outputs[0].dtype)
+
+  # Lattices of ensembles with explicit lattices are refined per submodel.
+  refine_submodels = (
+      isinstance(model_config, configs.CalibratedLatticeEnsembleConfig) and
+      not isinstance(model_config.lattices, str))
+  if refine_submodels:
+    _set_refined_ensemble_weights(model, new_model)
+  for new_layer in new_model.layers:
+    if not new_layer.weights:
+      continue
+    if isinstance(new_layer, (lattice_layer.Lattice, rtl_layer.RTL)):
+      if not refine_submodels:
+        _set_refined_weights(model.get_layer(new_layer.name), new_layer)
+      continue
+    layer = model.get_layer(new_layer.name)
+    if (new_layer.name.startswith(premade_lib.CALIB_LAYER_NAME) and
+        isinstance(new_layer, (pwl_calibration_layer.PWLCalibration,
+                               categorical_calibration_layer
+                               .CategoricalCalibration))):
+      scale = scales[new_layer.name[len(premade_lib.CALIB_LAYER_NAME) + 1:]]
+      # Calibrator outputs are linear in the kernel and the missing output.
+      scaled_weights = [layer.kernel, getattr(layer, 'missing_output', None)]
+      new_layer.set_weights([
+          value * scale if any(weight is scaled for scaled in scaled_weights)
+          else value
+          for weight, value in zip(layer.weights, layer.get_weights())
+      ])
+    else:
+      new_layer.set_weights(layer.get_weights())
+  return new_model
+
+
+def _min_lattice_size(feature_config):
+  # Unimodality requires lattice_size > 2.
+  if feature_config.unimodality not in (None, 0, 'none'):
+    return 3
+  return 2
+
+
+def fit_coarse_to_fine(model_config,
+                       x,
+                       y,
+                       epochs_per_stage,
+                       optimizer='adam',
+                       loss='mse',
+                       metrics=None,
+                       **kwargs):
+  """Trains a premade model with lattices refined from coarse to fine.
+
+  Each feature follows its `refinement_schedule` towards its configured
+  `lattice_size`. The model is trained for `epochs_per_stage` epochs with the
+  first lattice size of each schedule, refined to the next lattice sizes with
+  `refine_model`, and so on until all features reach their configured lattice
+  size. A new optimizer is created for each stage since the number of lattice
+  parameters changes.
+
+  Args:
+    model_config: A `tfl.configs.CalibratedLatticeConfig` or
+      `tfl.configs.CalibratedLatticeEnsembleConfig` with explicit lattices.
+    x: Model inputs, passed to `model.fit`.
+    y: Labels, passed to `model.fit`.
+    epochs_per_stage: Number of training epochs for each lattice resolution.
+    optimizer: A `tf.keras.optimizers.Optimizer` or its name. Optimizer
+      instances are copied for each stage with their config.
+    loss: Loss passed to `model.compile`.
+    metrics: Metrics passed to `model.compile`.
+    **kwargs: Other arguments passed to `model.fit`.
+
+  Returns:
+    The trained premade model with the lattice sizes of `model_config`.
+
+  Raises:
+    ValueError: If the model config is not supported.
+  """
+  model_class = _premade_class(model_config)
+  schedules = {
+      feature_config.name:
+      refinement_schedule(feature_config.lattice_size,
+                          _min_lattice_size(feature_config))
+      for feature_config in model_config.feature_configs
+  }
+  num_stages = max(len(schedule) for schedule in schedules.values())
+
+  coarse_config = copy.deepcopy(model_config)
+  for feature_config in coarse_config.feature_configs:
+    feature_config.lattice_size = schedules[feature_config.name][0]
+  model = model_class(coarse_config)
+  for stage in range(num_stages):
+    if stage:
+      model = refine_model(
+          model, {
+              feature_name: schedule[min(stage, len(schedule) - 1)]
+              for feature_name, schedule in schedules.items()
+          })
+    if isinstance(optimizer, tf.keras.optimizers.Optimizer):
+      stage_optimizer = optimizer.__class__.from_config(optimizer.get_config())
+    else:
+      stage_optimizer = tf.keras.optimizers.get(optimizer)
+    model.compile(optimizer=stage_optimizer, loss=loss, metrics=metrics)
+    model.fit(x, y, epochs=epochs_per_stage, **kwargs)
+  return model
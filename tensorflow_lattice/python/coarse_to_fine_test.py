@@ -0,0 +1,243 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL coarse-to-fine lattice training."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import coarse_to_fine
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import lattice_layer as ll
+from tensorflow_lattice.python import premade
+from tensorflow_lattice.python import rtl_layer
+from tensorflow_lattice.python import test_utils
+
+_FEATURE_CONFIGS = [
+    configs.FeatureConfig(
+        name='numerical_1',
+        lattice_size=2,
+        monotonicity='increasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=6),
+    ),
+    configs.FeatureConfig(
+        name='numerical_2',
+        lattice_size=3,
+        unimodality='valley',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+    ),
+    configs.FeatureConfig(
+        name='categorical',
+        lattice_size=2,
+        num_buckets=3,
+        monotonicity=[(0, 1)],
+    ),
+]
+
+
+def _data(num_examples):
+  rng = np.random.RandomState(0)
+  inputs = [
+      rng.uniform(size=[num_examples, 1]),
+      rng.uniform(size=[num_examples, 1]),
+      rng.randint(0, 3, size=[num_examples, 1]),
+  ]
+  labels = (
+      np.sin(4.0 * inputs[0][:, 0]) + 4.0 * inputs[0][:, 0] +
+      (inputs[1][:, 0] - 0.4)**2 + 0.2 * inputs[2][:, 0])
+  return inputs, labels
+
+
+class CoarseToFineTest(parameterized.TestCase, tf.test.TestCase):
+
+  @parameterized.parameters(
+      (2, 2, [2]),
+      (3, 2, [2, 3]),
+      (9, 2, [2, 3, 5, 9]),
+      (7, 2, [2, 4, 7]),
+      (6, 2, [2, 6]),
+      (9, 3, [3, 5, 9]),
+      (6, 3, [6]),
+  )
+  def testRefinementSchedule(self, lattice_size, min_lattice_size, expected):
+    self.assertEqual(
+        coarse_to_fine.refinement_schedule(lattice_size, min_lattice_size),
+        expected)
+
+  @parameterized.parameters(
+      ([2, 3], [3, 5]),
+      ([2, 2, 3], [5, 2, 7]),
+  )
+  def testRefineLatticeLayer(self, lattice_sizes, new_lattice_sizes):
+    layer = ll.Lattice(
+        lattice_sizes=lattice_sizes,
+        units=2,
+        monotonicities=[1] + [0] * (len(lattice_sizes) - 1),
+        kernel_regularizer=[('torsion', 0.1, 0.1)])
+    layer(tf.zeros([1, 2, len(lattice_sizes)]))
+    rng = np.random.RandomState(2)
+    tf.keras.backend.set_value(
+        layer.kernel, rng.uniform(size=layer.kernel.shape))
+    layer.finalize_constraints()
+    new_layer = coarse_to_fine.refine_layer(layer, new_lattice_sizes)
+    self.assertEqual(new_layer.lattice_sizes, new_lattice_sizes)
+    new_layer.assert_constraints(eps=1e-6)
+
+    inputs = rng.uniform(
+        size=[20, 2, len(lattice_sizes)]) * (np.array(lattice_sizes) - 1.0)
+    scale = ((np.array(new_lattice_sizes) - 1.0) /
+             (np.array(lattice_sizes) - 1.0))
+    self.assertAllClose(
+        new_layer(tf.constant(inputs * scale, dtype=tf.float32)),
+        layer(tf.constant(inputs, dtype=tf.float32)),
+        atol=1e-5)
+
+  def testRefineRtlLayer(self):
+    layer = rtl_layer.RTL(
+        num_lattices=4, lattice_rank=2, lattice_size=2, random_seed=3)
+    inputs = {
+        'increasing': tf.keras.Input(shape=(2,)),
+        'unconstrained': tf.keras.Input(shape=(2,)),
+    }
+    layer(inputs)
+    rng = np.random.RandomState(3)
+    layer.set_weights(
+        [rng.uniform(size=weight.shape) for weight in layer.get_weights()])
+    layer.finalize_constraints()
+    new_layer = coarse_to_fine.refine_layer(layer, 5)
+    self.assertEqual(new_layer.lattice_size, 5)
+    new_layer.assert_constraints(eps=1e-6)
+
+    values = {
+        key: rng.uniform(size=[10, 2]).astype(np.float32)
+        for key in ['increasing', 'unconstrained']
+    }
+    self.assertAllClose(
+        new_layer({key: value * 4.0 for key, value in values.items()}),
+        layer(values),
+        atol=1e-5)
+
+  @parameterized.parameters(
+      ('lattice', True),
+      ('ensemble', False),
+      ('packed_ensemble', True),
+  )
+  def testRefineModel(self, model_type, output_calibration):
+    model = test_utils.premade_model(
+        model_type,
+        _FEATURE_CONFIGS,
+        lattices=[['numerical_1', 'categorical'], ['numerical_1', 'numerical_2'],
+                  ['numerical_2', 'categorical']],
+        seed=1,
+        output_calibration=output_calibration,
+        output_calibration_num_keypoints=5,
+        output_initialization=[0.0, 1.0])
+    new_model = coarse_to_fine.refine_model(model, {
+        'numerical_1': 5,
+        'numerical_2': 5
+    })
+    self.assertEqual(
+        [feature_config.lattice_size
+         for feature_config in new_model.model_config.feature_configs],
+        [5, 5, 2])
+    # The original config is unchanged.
+    self.assertEqual(model.model_config.feature_configs[0].lattice_size, 2)
+    inputs, _ = _data(100)
+    self.assertAllClose(
+        new_model.predict(inputs, verbose=0),
+        model.predict(inputs, verbose=0),
+        atol=1e-5)
+    for layer in new_model.layers:
+      if hasattr(layer, 'assert_constraints'):
+        layer.assert_constraints(eps=1e-6)
+
+  def testRefinePackedEnsemble(self):
+    # Lattices with features 'a' and 'c', and with features 'b' and 'c', are
+    # packed into separate layers until 'a' is refined to the lattice size of
+    # 'b', after which all lattices are packed into a single layer.
+    feature_configs = [
+        configs.FeatureConfig(
+            name=name,
+            lattice_size=lattice_size,
+            monotonicity='increasing',
+            pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+        ) for name, lattice_size in [('a', 2), ('b', 3), ('c', 3)]
+    ]
+    model_config = configs.CalibratedLatticeEnsembleConfig(
+        feature_configs=feature_configs,
+        lattices=[['a', 'c'], ['b', 'c'], ['c', 'a'], ['c', 'b']],
+        pack_lattices=True,
+        output_initialization=[0.0, 1.0])
+    model = premade.CalibratedLatticeEnsemble(model_config)
+    test_utils.randomize_weights(model.trainable_weights, seed=1)
+    self.assertEqual(model.get_layer('tfl_packed_lattice_0').units, 2)
+    new_model = coarse_to_fine.refine_model(model, {'a': 3})
+    self.assertEqual(new_model.get_layer('tfl_packed_lattice_0').units, 4)
+    rng = np.random.RandomState(4)
+    inputs = [rng.uniform(size=[100, 1]) for _ in range(3)]
+    self.assertAllClose(
+        new_model.predict(inputs, verbose=0),
+        model.predict(inputs, verbose=0),
+        atol=1e-5)
+    for layer in new_model.layers:
+      if hasattr(layer, 'assert_constraints'):
+        layer.assert_constraints(eps=1e-6)
+
+    labels = inputs[0][:, 0] + inputs[1][:, 0] * inputs[2][:, 0]
+    model = coarse_to_fine.fit_coarse_to_fine(
+        model_config,
+        inputs,
+        labels,
+        epochs_per_stage=2,
+        batch_size=32,
+        verbose=0)
+    self.assertEqual(model.get_layer('tfl_packed_lattice_0').lattice_sizes,
+                     [3, 3])
+
+  def testFitCoarseToFine(self):
+    feature_configs = copy.deepcopy(_FEATURE_CONFIGS)
+    feature_configs[0].lattice_size = 5
+    feature_configs[1].lattice_size = 5
+    model_config = configs.CalibratedLatticeConfig(
+        feature_configs=feature_configs, output_initialization=[0.0, 5.0])
+    inputs, labels = _data(400)
+    model = coarse_to_fine.fit_coarse_to_fine(
+        model_config,
+        inputs,
+        labels,
+        epochs_per_stage=20,
+        optimizer=tf.keras.optimizers.Adam(0.05),
+        batch_size=32,
+        verbose=0)
+    self.assertEqual(
+        model.get_layer('tfl_lattice_0').lattice_sizes, [5, 5, 2])
+    self.assertEqual(model_config.feature_configs[0].lattice_size, 5)
+    self.assertLess(model.evaluate(inputs, labels, verbose=0), 0.05)
+
+  def testInvalidArguments(self):
+    model = test_utils.premade_model(
+        'linear', _FEATURE_CONFIGS, output_initialization=[0.0, 1.0])
+    with self.assertRaises(ValueError):
+      coarse_to_fine.refine_model(model, {})
+    with self.assertRaises(ValueError):
+      coarse_to_fine.refine_layer(ll.Lattice(lattice_sizes=[2, 2]), [3, 3])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -257,7 +257,9 @@ class CalibratedLatticeEnsembleConfig(_Config, _HasFeatureConfigs,
                output_calibration_num_keypoints=10,
                output_initialization='quantiles',
                fix_ensemble_for_2d_constraints=True,
-               random_seed=0):
+               random_seed=0,
+               pack_lattices=False,
+               lattice_dropout_rate=0.0):
     # pyformat: disable
     """Initializes a `CalibratedLatticeEnsembleConfig` instance.
 
@@ -303,6 +305,19 @@ class CalibratedLatticeEnsembleConfig(_Config, _HasFeatureConfigs,
         requires a lattice that has the "conditional" feature to include the
         "main" feature. Note that this might increase the final lattice rank.
       random_seed: Random seed to use for randomized lattices.
+      pack_lattices: If lattices in the ensemble with the same lattice sizes,
+        constraints and regularizers should be packed into a single
+        multi-unit `tfl.layers.Lattice` layer. This reduces the number of ops
+        in the model and can significantly speed up training and inference of
+        ensembles with many lattices. Lattice weights of each submodel are kept
+        in a separate unit of the packed layer. See
+        `tfl.premade_lib.packed_lattice_groups` for details.
+      lattice_dropout_rate: Fraction of the lattices of each packed lattice
+        layer left out in each training step. Outputs of the active lattices
+        are scaled so that the ensemble average stays unbiased, and only active
+        lattices are evaluated and get gradients. All lattices are projected
+        onto the constraints and used at inference. Requires `pack_lattices`. See `dropout_rate` of
+        `tfl.layers.Lattice` for details.
     """
     # pyformat: enable
     super(CalibratedLatticeEnsembleConfig, self).__init__(locals())
@@ -485,7 +500,9 @@ class AggregateFunctionConfig(_Config, _HasFeatureConfigs,
                output_max=None,
                output_calibration=False,
                output_calibration_num_keypoints=10,
-               output_initialization='uniform'):
+               output_initialization='uniform',
+               separate_calibrators=True,
+               aggregation_chunk_size=None):
     """Initializes an `AggregateFunctionConfig` instance.
 
     Args:
@@ -521,6 +538,15 @@ class AggregateFunctionConfig(_Config, _HasFeatureConfigs,
           - String `'uniform'`: Output is initliazed uniformly in label range.
           - A list of numbers: To be used for initialization of the output
             lattice or output calibrator.
+      separate_calibrators: If separate calibrators and lattices should be used
+        for each of the middle dimensions. If False, the inputs are calibrated
+        once and a single lattice layer with `middle_dimension` units is
+        evaluated on each set element, which reduces compute roughly by a
+        factor of `middle_dimension`.
+      aggregation_chunk_size: If set, the calibrated lattices are evaluated on
+        chunks of at most `aggregation_chunk_size` set elements at a time, so
+        that peak memory does not depend on the size of the largest sets. See
+        `tfl.layers.Aggregation` for details.
     """
     super(AggregateFunctionConfig, self).__init__(locals())
 
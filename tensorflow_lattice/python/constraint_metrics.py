@@ -0,0 +1,182 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Keras metrics for monitoring constraint violations of TFL layers.
+
+`assert_constraints` of TFL layers builds heavy assertion graphs which are
+meant for one-off checks. The metrics in this module use the vectorized
+`constraint_violations` of TFL layers instead, so that the max or mean
+violation of each constraint type can be reported during training like any
+other Keras metric (progress bar, `History`, TensorBoard). This can be used to
+tune how often and how precisely constraints are projected.
+
+```python
+model.compile(
+    loss=...,
+    optimizer=...,
+    metrics=tfl.constraint_metrics.constraint_violation_metrics(model))
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+from tensorflow import keras
+
+_REDUCTIONS = {
+    "max": tf.reduce_max,
+    "mean": tf.reduce_mean,
+}
+
+
+class ConstraintViolation(keras.metrics.Metric):
+  # pyformat: disable
+  """Metric reporting violation of a constraint type by a TFL layer.
+
+  The metric ignores labels and predictions. Every `update_freq` updates it
+  computes the violations of the given constraint type by the layer weights,
+  as returned by `layer.constraint_violations()`, and reduces them using max or
+  mean. The result is the last computed value. Since it describes the current
+  layer weights rather than an aggregate over batches, it is not reset at the
+  beginning of each epoch.
+
+  Attributes:
+    - All `__init__` arguments.
+
+  Example:
+
+  ```python
+  lattice = tfl.layers.Lattice(...)
+  ...
+  model.compile(
+      loss=...,
+      optimizer=...,
+      metrics=[
+          tfl.constraint_metrics.ConstraintViolation(lattice, "monotonicity")
+      ])
+  ```
+  """
+  # pyformat: enable
+
+  def __init__(self,
+               layer,
+               constraint_type,
+               reduction="max",
+               update_freq=1,
+               name=None,
+               dtype=None):
+    """Initializes an instance of `ConstraintViolation`.
+
+    Args:
+      layer: TFL layer with a `constraint_violations` method, e.g.
+        `tfl.layers.Lattice` or `tfl.layers.PWLCalibration`.
+      constraint_type: Key of the dict returned by
+        `layer.constraint_violations()`, e.g. 'monotonicity', 'trust',
+        'dominance' or 'bounds'.
+      reduction: One of 'max' or 'mean'.
+      update_freq: Violations are computed every `update_freq` metric updates.
+      name: Name of the metric. Defaults to
+        '{layer.name}_{constraint_type}_violation_{reduction}'.
+      dtype: Data type of the metric result.
+
+    Raises:
+      ValueError: If layer has no `constraint_violations` method or if reduction
+        or update_freq are invalid.
+    """
+    if not hasattr(layer, "constraint_violations"):
+      raise ValueError(
+          "Layer '{}' does not support constraint violations.".format(
+              layer.name))
+    if reduction not in _REDUCTIONS:
+      raise ValueError("reduction must be one of {}: {}".format(
+          sorted(_REDUCTIONS), reduction))
+    if update_freq < 1:
+      raise ValueError("update_freq must be positive: {}".format(update_freq))
+    if name is None:
+      name = "{}_{}_violation_{}".format(layer.name, constraint_type, reduction)
+    super(ConstraintViolation, self).__init__(name=name, dtype=dtype)
+    self.layer = layer
+    self.constraint_type = constraint_type
+    self.reduction = reduction
+    self.update_freq = update_freq
+    self.violation = self.add_weight("violation", initializer="zeros")
+    self.num_updates = self.add_weight(
+        "num_updates", initializer="zeros", dtype=tf.int64)
+
+  def _compute_violation(self):
+    violations = self.layer.constraint_violations()
+    if self.constraint_type not in violations:
+      raise ValueError(
+          "Layer '{}' has no constraints of type '{}'. Available types: {}"
+          .format(self.layer.name, self.constraint_type, sorted(violations)))
+    return tf.cast(_REDUCTIONS[self.reduction](violations[self.constraint_type]),
+                   self.dtype)
+
+  def update_state(self, y_true, y_pred, sample_weight=None):
+    del y_true, y_pred, sample_weight
+    violation = tf.cond(
+        tf.equal(self.num_updates % self.update_freq, 0),
+        self._compute_violation, self.violation.read_value)
+    return tf.group(
+        self.violation.assign(violation), self.num_updates.assign_add(1))
+
+  def result(self):
+    return tf.identity(self.violation)
+
+  def reset_state(self):
+    # Violations describe the current layer weights, so they are kept between
+    # epochs until they are recomputed.
+    pass
+
+  def get_config(self):
+    # The layer is referred to by name since layers can not be serialized as
+    # part of a metric config.
+    config = {
+        "layer_name": self.layer.name,
+        "constraint_type": self.constraint_type,
+        "reduction": self.reduction,
+        "update_freq": self.update_freq,
+    }
+    config.update(super(ConstraintViolation, self).get_config())
+    return config
+
+
+def constraint_violation_metrics(model, reductions=("max",), update_freq=1):
+  """Returns constraint violation metrics for all TFL layers of a model.
+
+  Args:
+    model: Built Keras model, e.g. a TFL premade model.
+    reductions: Collection of reductions of violations of each constraint type.
+      Each reduction must be one of 'max' or 'mean'.
+    update_freq: Violations are computed every `update_freq` metric updates.
+
+  Returns:
+    List of `ConstraintViolation` metrics, one for each TFL layer of the model
+    that has constraints, each constraint type of the layer and each reduction.
+  """
+  metrics = []
+  for layer in [model] + list(model.submodules):
+    if not (isinstance(layer, keras.layers.Layer) and layer.built and
+            hasattr(layer, "constraint_violations")):
+      continue
+    for constraint_type in sorted(layer.constraint_violations()):
+      for reduction in reductions:
+        metrics.append(
+            ConstraintViolation(
+                layer=layer,
+                constraint_type=constraint_type,
+                reduction=reduction,
+                update_freq=update_freq))
+  return metrics
@@ -0,0 +1,153 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL constraint violation metrics."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow_lattice.python import categorical_calibration_layer as cat
+from tensorflow_lattice.python import constraint_metrics
+from tensorflow_lattice.python import lattice_layer as ll
+from tensorflow_lattice.python import linear_layer
+from tensorflow_lattice.python import pwl_calibration_layer as pwl
+
+
+class ConstraintMetricsTest(parameterized.TestCase, tf.test.TestCase):
+
+  def testLayerConstraintViolations(self):
+    # Decreasing weights of a lattice with increasing monotonicity.
+    lattice = ll.Lattice(
+        lattice_sizes=[3],
+        monotonicities=["increasing"],
+        output_min=0.0,
+        output_max=2.0,
+        kernel_initializer=keras.initializers.Constant([[2.5], [1.0], [-0.5]]))
+    lattice.build(input_shape=(None, 1))
+    violations = self.evaluate(lattice.constraint_violations())
+    self.assertAllClose(violations["monotonicity"], [1.5, 1.5])
+    self.assertAllClose(violations["bounds"], [0.0, 0.0, 0.5, 0.5, 0.0, 0.0])
+
+    calibration = pwl.PWLCalibration(
+        input_keypoints=[0.0, 1.0, 2.0],
+        monotonicity="decreasing",
+        output_min=0.0,
+        output_max=1.0,
+        kernel_initializer=keras.initializers.Constant([[0.5], [0.25],
+                                                        [0.5]]))
+    calibration.build(input_shape=(None, 1))
+    violations = self.evaluate(calibration.constraint_violations())
+    # Keypoint outputs are [0.5, 0.75, 1.25].
+    self.assertAllClose(violations["monotonicity"], [0.25, 0.5])
+    self.assertAllClose(np.max(violations["bounds"]), 0.25)
+
+    categorical = cat.CategoricalCalibration(
+        num_buckets=3,
+        monotonicities=[(0, 1)],
+        output_min=0.0,
+        kernel_initializer=keras.initializers.Constant([[1.0], [0.0], [-1.0]]))
+    categorical.build(input_shape=(None, 1))
+    violations = self.evaluate(categorical.constraint_violations())
+    self.assertAllClose(violations["monotonicity"], [1.0])
+    self.assertAllClose(violations["bounds"], [0.0, 0.0, 1.0])
+
+    linear = linear_layer.Linear(
+        num_input_dims=3,
+        monotonicities=[1, -1, 1],
+        monotonic_dominances=[(0, 2)],
+        kernel_initializer=keras.initializers.Constant([[-1.0], [1.0], [0.5]]))
+    linear.build(input_shape=(None, 3))
+    violations = self.evaluate(linear.constraint_violations())
+    self.assertAllClose(violations["monotonicity"], [1.0, 1.0, 0.0])
+    self.assertAllClose(violations["dominance"], [1.5])
+
+  @parameterized.parameters(
+      ("max", 1, 1.5),
+      ("mean", 1, 1.5),
+      ("max", 100, 1.5),
+  )
+  def testConstraintViolation(self, reduction, update_freq, initial_violation):
+    lattice = ll.Lattice(
+        lattice_sizes=[3],
+        monotonicities=["increasing"],
+        kernel_initializer=keras.initializers.Constant([[2.5], [1.0], [-0.5]]))
+    lattice.build(input_shape=(None, 1))
+    metric = constraint_metrics.ConstraintViolation(
+        lattice, "monotonicity", reduction=reduction, update_freq=update_freq)
+    self.assertEqual(metric.name, "lattice_monotonicity_violation_" + reduction)
+    metric.update_state(None, None)
+    self.assertAllClose(metric.result(), initial_violation)
+
+    # Violations are only recomputed every update_freq updates.
+    lattice.kernel.assign([[0.0], [1.0], [2.0]])
+    metric.update_state(None, None)
+    self.assertAllClose(metric.result(),
+                        0.0 if update_freq == 1 else initial_violation)
+    metric.reset_state()
+    self.assertAllClose(metric.result(),
+                        0.0 if update_freq == 1 else initial_violation)
+
+  def testConstraintViolationMetrics(self):
+    np.random.seed(42)
+    inputs = keras.Input(shape=(2,))
+    calibrated = [
+        pwl.PWLCalibration(
+            input_keypoints=np.linspace(0.0, 1.0, 5),
+            output_min=0.0,
+            output_max=1.0,
+            monotonicity="increasing",
+            name="calib_{}".format(i))(inputs[:, i:i + 1]) for i in range(2)
+    ]
+    outputs = ll.Lattice(
+        lattice_sizes=[2, 2],
+        monotonicities=["increasing", "none"],
+        edgeworth_trusts=[(0, 1, "positive")],
+        name="lattice")(keras.layers.Concatenate()(calibrated))
+    model = keras.Model(inputs=inputs, outputs=outputs)
+    metrics = constraint_metrics.constraint_violation_metrics(
+        model, reductions=("max", "mean"), update_freq=2)
+    self.assertEqual(
+        sorted(metric.name for metric in metrics), [
+            "calib_0_bounds_violation_max",
+            "calib_0_bounds_violation_mean",
+            "calib_0_monotonicity_violation_max",
+            "calib_0_monotonicity_violation_mean",
+            "calib_1_bounds_violation_max",
+            "calib_1_bounds_violation_mean",
+            "calib_1_monotonicity_violation_max",
+            "calib_1_monotonicity_violation_mean",
+            "lattice_monotonicity_violation_max",
+            "lattice_monotonicity_violation_mean",
+            "lattice_trust_violation_max",
+            "lattice_trust_violation_mean",
+        ])
+
+    model.compile(
+        loss="mse", optimizer=keras.optimizers.Adam(0.1), metrics=metrics)
+    x = np.random.uniform(size=(100, 2))
+    y = x[:, :1] - x[:, 1:]
+    history = model.fit(x, y, batch_size=10, epochs=2, verbose=0)
+    for metric in metrics:
+      values = history.history[metric.name]
+      self.assertLen(values, 2)
+      # Constraints are projected after each step.
+      self.assertAllLess(values, 1e-3)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,607 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Static cost model for TFL layers and premade model configs.
+
+Estimates the size and compute requirements of TFL layers and of the models
+described by `tfl.configs` model configs without building them. This can be
+used for capacity planning and for automated config search, e.g. to discard
+ensemble configs whose lattices would not fit in memory.
+
+```python
+cost = tfl.cost_model.model_cost(model_config, batch_size=1024)
+print(cost.num_params, cost.forward_flops, cost.activation_bytes)
+```
+
+Parameter counts are exact. FLOPs, activation memory and projection costs are
+estimates based on the number of elementwise ops of the layer implementations
+with dense interpolation weights, and are meant for comparing configs rather
+than for predicting absolute run times.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+from . import categorical_calibration_layer
+from . import configs
+from . import lattice_layer
+from . import lattice_lib
+from . import linear_layer
+from . import linear_lib
+from . import pwl_calibration_layer
+from . import pwl_calibration_lib
+from . import rtl_layer
+import numpy as np
+import six
+
+# Approximate number of elementwise ops per weight in each Dykstra projection
+# iteration of a single constraint (differences, residual update and clipping).
+_PROJECTION_OPS_PER_WEIGHT = 4
+
+# Approximate number of elementwise ops per lattice vertex in each dimension
+# to compute one dimensional interpolation weights.
+_INTERPOLATION_OPS_PER_VERTEX = 3
+
+
+class Cost(
+    collections.namedtuple(
+        'Cost',
+        ['num_params', 'forward_flops', 'activation_bytes', 'projection_flops'
+        ])):
+  """Estimated cost of a TFL layer or model.
+
+  Attributes:
+    num_params: Number of trainable parameters.
+    forward_flops: Approximate number of floating point ops of the forward pass
+      for a single example.
+    activation_bytes: Approximate memory of intermediate tensors of the forward
+      pass for a batch, including dense interpolation weights, which has to be
+      kept for the backward pass.
+    projection_flops: Approximate number of floating point ops of constraint
+      projections applied after each training step.
+  """
+  __slots__ = ()
+
+  def __add__(self, other):
+    return Cost(*[x + y for x, y in zip(self, other)])
+
+  def scale(self, factor):
+    """Returns the cost of `factor` copies of the layer or model."""
+    return Cost(*[x * factor for x in self])
+
+
+_ZERO_COST = Cost(0, 0, 0, 0)
+
+
+def _total(costs):
+  total = _ZERO_COST
+  for cost in costs:
+    total += cost
+  return total
+
+
+def lattice_cost(lattice_sizes,
+                 units=1,
+                 shared_inputs=False,
+                 num_constraints=0,
+                 bounded=False,
+                 num_projection_iterations=10,
+                 batch_size=1,
+                 dtype_size=4):
+  """Returns the estimated cost of a `tfl.layers.Lattice` layer.
+
+  Forward pass cost accounts for one dimensional interpolation weights, their
+  outer product into dense interpolation weights of size `prod(lattice_sizes)`
+  and the contraction with the kernel, for each unit. With `shared_inputs`,
+  interpolation weights are computed once for all units.
+
+  Args:
+    lattice_sizes: List or tuple of lattice sizes.
+    units: Number of lattice units.
+    shared_inputs: Whether all units are evaluated on the same inputs.
+    num_constraints: Number of shape constraints projected using Dykstra's
+      algorithm: monotonic and unimodal dimensions, trusts, dominances and
+      joint monotonicities.
+    bounded: Whether output bounds are projected.
+    num_projection_iterations: Number of Dykstra projection iterations.
+    batch_size: Batch size used for activation memory.
+    dtype_size: Size in bytes of the layer dtype.
+
+  Returns:
+    A `Cost` instance.
+  """
+  num_vertices = int(np.prod(lattice_sizes))
+  num_params = num_vertices * units
+  # Sizes of intermediate outer products prod(lattice_sizes[:k]) for k >= 2.
+  outer_product_size = int(np.sum(np.cumprod(lattice_sizes)[1:]))
+  num_interpolations = 1 if shared_inputs else units
+  forward_flops = num_interpolations * (
+      _INTERPOLATION_OPS_PER_VERTEX * int(np.sum(lattice_sizes)) +
+      outer_product_size) + units * 2 * num_vertices
+  activations = num_interpolations * (
+      int(np.sum(lattice_sizes)) + outer_product_size) + units
+  projection_flops = 0
+  if num_constraints:
+    projection_flops += (
+        num_projection_iterations * num_constraints *
+        _PROJECTION_OPS_PER_WEIGHT * num_params)
+  if bounded:
+    projection_flops += 2 * num_params
+  return Cost(
+      num_params=num_params,
+      forward_flops=forward_flops,
+      activation_bytes=activations * batch_size * dtype_size,
+      projection_flops=projection_flops)
+
+
+def pwl_calibration_cost(num_keypoints,
+                         units=1,
+                         constrained=False,
+                         impute_missing=False,
+                         num_projection_iterations=8,
+                         batch_size=1,
+                         dtype_size=4):
+  """Returns the estimated cost of a `tfl.layers.PWLCalibration` layer.
+
+  Args:
+    num_keypoints: Number of input keypoints.
+    units: Number of calibration units.
+    constrained: Whether monotonicity, convexity or bounds are projected.
+    impute_missing: Whether the layer learns an output for missing inputs.
+    num_projection_iterations: Number of Dykstra projection iterations.
+    batch_size: Batch size used for activation memory.
+    dtype_size: Size in bytes of the layer dtype.
+
+  Returns:
+    A `Cost` instance.
+  """
+  num_params = num_keypoints * units + (units if impute_missing else 0)
+  # Interpolation weights are shared by all units.
+  forward_flops = (
+      _INTERPOLATION_OPS_PER_VERTEX * num_keypoints +
+      2 * num_keypoints * units)
+  activations = num_keypoints + units
+  projection_flops = 0
+  if constrained:
+    projection_flops = (
+        num_projection_iterations * _PROJECTION_OPS_PER_WEIGHT * num_params)
+  return Cost(
+      num_params=num_params,
+      forward_flops=forward_flops,
+      activation_bytes=activations * batch_size * dtype_size,
+      projection_flops=projection_flops)
+
+
+def categorical_calibration_cost(num_buckets,
+                                 units=1,
+                                 num_monotonicities=0,
+                                 bounded=False,
+                                 batch_size=1,
+                                 dtype_size=4):
+  """Returns the estimated cost of a `tfl.layers.CategoricalCalibration` layer.
+
+  Args:
+    num_buckets: Number of categorical buckets.
+    units: Number of calibration units.
+    num_monotonicities: Number of monotonicity pairs.
+    bounded: Whether output bounds are projected.
+    batch_size: Batch size used for activation memory.
+    dtype_size: Size in bytes of the layer dtype.
+
+  Returns:
+    A `Cost` instance.
+  """
+  num_params = num_buckets * units
+  projection_flops = (
+      _PROJECTION_OPS_PER_WEIGHT * num_monotonicities * units +
+      (2 * num_params if bounded else 0))
+  return Cost(
+      num_params=num_params,
+      forward_flops=units,
+      activation_bytes=units * batch_size * dtype_size,
+      projection_flops=projection_flops)
+
+
+def linear_cost(num_input_dims,
+                use_bias=True,
+                num_constraints=0,
+                batch_size=1,
+                dtype_size=4):
+  """Returns the estimated cost of a `tfl.layers.Linear` layer.
+
+  Args:
+    num_input_dims: Number of input dimensions.
+    use_bias: Whether the layer has a bias term.
+    num_constraints: Number of monotonicity and dominance constraints plus
+      one if weights are normalized.
+    batch_size: Batch size used for activation memory.
+    dtype_size: Size in bytes of the layer dtype.
+
+  Returns:
+    A `Cost` instance.
+  """
+  num_params = num_input_dims + (1 if use_bias else 0)
+  return Cost(
+      num_params=num_params,
+      forward_flops=2 * num_input_dims,
+      activation_bytes=batch_size * dtype_size,
+      projection_flops=_PROJECTION_OPS_PER_WEIGHT * num_constraints *
+      num_input_dims)
+
+
+def _num_lattice_constraints(monotonicities=None,
+                             unimodalities=None,
+                             edgeworth_trusts=None,
+                             trapezoid_trusts=None,
+                             monotonic_dominances=None,
+                             range_dominances=None,
+                             joint_monotonicities=None,
+                             joint_unimodalities=None):
+  """Returns the number of constraints projected by lattice projections."""
+  return (lattice_lib.count_non_zeros(monotonicities, unimodalities) +
+          len(edgeworth_trusts or []) + len(trapezoid_trusts or []) +
+          len(monotonic_dominances or []) + len(range_dominances or []) +
+          len(joint_monotonicities or []) + len(joint_unimodalities or []))
+
+
+def layer_cost(layer, batch_size=1, dtype_size=4):
+  """Returns the estimated cost of a TFL layer.
+
+  The layer does not need to be built. For `tfl.layers.RTL` layers, all lattice
+  inputs are assumed to be monotonic since input monotonicities are only known
+  once the layer is built.
+
+  Args:
+    layer: One of `tfl.layers.Lattice`, `tfl.layers.RTL`,
+      `tfl.layers.PWLCalibration`, `tfl.layers.CategoricalCalibration` or
+      `tfl.layers.Linear`.
+    batch_size: Batch size used for activation memory.
+    dtype_size: Size in bytes of the layer dtype.
+
+  Returns:
+    A `Cost` instance.
+
+  Raises:
+    ValueError: If the layer type is not supported.
+  """
+  if isinstance(layer, lattice_layer.Lattice):
+    return lattice_cost(
+        lattice_sizes=layer.lattice_sizes,
+        units=layer.units,
+        shared_inputs=layer.shared_inputs,
+        num_constraints=_num_lattice_constraints(
+            monotonicities=lattice_lib.canonicalize_monotonicities(
+                layer.monotonicities),
+            unimodalities=lattice_lib.canonicalize_unimodalities(
+                layer.unimodalities),
+            edgeworth_trusts=layer.edgeworth_trusts,
+            trapezoid_trusts=layer.trapezoid_trusts,
+            monotonic_dominances=layer.monotonic_dominances,
+            range_dominances=layer.range_dominances,
+            joint_monotonicities=layer.joint_monotonicities,
+            joint_unimodalities=layer.joint_unimodalities),
+        bounded=(layer.output_min is not None or
+                 layer.output_max is not None),
+        num_projection_iterations=layer.num_projection_iterations,
+        batch_size=batch_size,
+        dtype_size=dtype_size)
+  if isinstance(layer, rtl_layer.RTL):
+    return lattice_cost(
+        lattice_sizes=[layer.lattice_size] * layer.lattice_rank,
+        units=layer.num_lattices,
+        num_constraints=layer.lattice_rank,
+        bounded=(layer.output_min is not None or
+                 layer.output_max is not None),
+        num_projection_iterations=layer.num_projection_iterations,
+        batch_size=batch_size,
+        dtype_size=dtype_size)
+  if isinstance(layer, pwl_calibration_layer.PWLCalibration):
+    return pwl_calibration_cost(
+        num_keypoints=len(layer.input_keypoints),
+        units=layer.units,
+        constrained=(
+            pwl_calibration_lib.canonicalize_monotonicity(layer.monotonicity)
+            != 0 or
+            pwl_calibration_lib.canonicalize_convexity(layer.convexity) != 0 or
+            layer.output_min is not None or layer.output_max is not None),
+        impute_missing=(layer.impute_missing and
+                        layer.missing_output_value is None),
+        num_projection_iterations=layer.num_projection_iterations,
+        batch_size=batch_size,
+        dtype_size=dtype_size)
+  if isinstance(layer, categorical_calibration_layer.CategoricalCalibration):
+    return categorical_calibration_cost(
+        num_buckets=layer.num_buckets,
+        units=layer.units,
+        num_monotonicities=len(layer.monotonicities or []),
+        bounded=(layer.output_min is not None or
+                 layer.output_max is not None),
+        batch_size=batch_size,
+        dtype_size=dtype_size)
+  if isinstance(layer, linear_layer.Linear):
+    return linear_cost(
+        num_input_dims=layer.num_input_dims,
+        use_bias=layer.use_bias,
+        num_constraints=(
+            lattice_lib.count_non_zeros(
+                linear_lib.canonicalize_monotonicities(layer.monotonicities)) +
+            len(layer.monotonic_dominances or []) +
+            len(layer.range_dominances or []) +
+            (1 if layer.normalization_order else 0)),
+        batch_size=batch_size,
+        dtype_size=dtype_size)
+  raise ValueError('Unsupported layer type: {}'.format(type(layer).__name__))
+
+
+def _feature_is_constrained(feature_config):
+  return (pwl_calibration_lib.canonicalize_monotonicity(
+      feature_config.monotonicity if not isinstance(
+          feature_config.monotonicity, list) else 0) != 0 or
+          feature_config.pwl_calibration_always_monotonic or
+          pwl_calibration_lib.canonicalize_convexity(
+              feature_config.pwl_calibration_convexity) != 0)
+
+
+def _calibration_cost(feature_config, units, bounded, batch_size, dtype_size):
+  """Returns the cost of the input calibration layer of a feature."""
+  if feature_config.num_buckets:
+    return categorical_calibration_cost(
+        num_buckets=feature_config.num_buckets,
+        units=units,
+        num_monotonicities=(len(feature_config.monotonicity) if isinstance(
+            feature_config.monotonicity, list) else 0),
+        bounded=bounded,
+        batch_size=batch_size,
+        dtype_size=dtype_size)
+  if isinstance(feature_config.pwl_calibration_input_keypoints,
+                six.string_types):
+    num_keypoints = feature_config.pwl_calibration_num_keypoints
+  else:
+    num_keypoints = len(feature_config.pwl_calibration_input_keypoints)
+  return pwl_calibration_cost(
+      num_keypoints=num_keypoints,
+      units=units,
+      constrained=bounded or _feature_is_constrained(feature_config),
+      impute_missing=feature_config.default_value is not None,
+      batch_size=batch_size,
+      dtype_size=dtype_size)
+
+
+def _calibration_layers_cost(model_config, submodels, separate_calibrators,
+                             bounded, batch_size, dtype_size):
+  """Returns the cost of input calibration layers for the given submodels."""
+  units = collections.Counter()
+  for submodel in submodels:
+    units.update(set(submodel) if separate_calibrators else [])
+  return _total(
+      _calibration_cost(
+          feature_config,
+          units=max(units[feature_config.name], 1),
+          bounded=bounded,
+          batch_size=batch_size,
+          dtype_size=dtype_size)
+      for feature_config in model_config.feature_configs)
+
+
+def _submodel_lattice_cost(model_config,
+                           submodel,
+                           batch_size,
+                           dtype_size,
+                           units=1,
+                           shared_inputs=False):
+  """Returns the cost of a lattice over the given features."""
+  feature_configs = [
+      model_config.feature_config_by_name(feature_name)
+      for feature_name in submodel
+  ]
+  num_constraints = 0
+  for feature_config in feature_configs:
+    if feature_config.num_buckets:
+      # Categorical monotonicities are given as pairs of buckets.
+      num_constraints += bool(feature_config.monotonicity)
+    else:
+      num_constraints += pwl_calibration_lib.canonicalize_monotonicity(
+          feature_config.monotonicity) != 0
+    num_constraints += feature_config.unimodality not in ('none', 0, None)
+    num_constraints += sum(
+        1 for trust in feature_config.reflects_trust_in or []
+        if trust.feature_name in submodel)
+    num_constraints += sum(
+        1 for dominance in feature_config.dominates or []
+        if dominance.feature_name in submodel)
+  return lattice_cost(
+      lattice_sizes=[
+          feature_config.lattice_size for feature_config in feature_configs
+      ],
+      units=units,
+      shared_inputs=shared_inputs,
+      num_constraints=num_constraints,
+      bounded=(model_config.output_min is not None or
+               model_config.output_max is not None),
+      batch_size=batch_size,
+      dtype_size=dtype_size)
+
+
+def _output_calibration_cost(model_config, batch_size, dtype_size):
+  if not model_config.output_calibration:
+    return _ZERO_COST
+  if isinstance(model_config.output_initialization, six.string_types):
+    num_keypoints = model_config.output_calibration_num_keypoints
+  else:
+    num_keypoints = len(model_config.output_initialization)
+  return pwl_calibration_cost(
+      num_keypoints=num_keypoints,
+      constrained=True,
+      batch_size=batch_size,
+      dtype_size=dtype_size)
+
+
+def _ensemble_lattices(model_config):
+  """Returns the lattices of an ensemble config as lists of feature names.
+
+  If lattices are not explicitly specified yet (e.g. 'random' or 'crystals'),
+  `num_lattices` lattices of rank `lattice_rank` are assigned features in a
+  round robin fashion, which has similar cost to the eventual lattices.
+
+  Args:
+    model_config: A `tfl.configs.CalibratedLatticeEnsembleConfig` instance.
+  """
+  if not isinstance(model_config.lattices, six.string_types):
+    return model_config.lattices
+  feature_names = [
+      feature_config.name for feature_config in model_config.feature_configs
+  ]
+  return [[
+      feature_names[(i * model_config.lattice_rank + j) % len(feature_names)]
+      for j in range(model_config.lattice_rank)
+  ] for i in range(model_config.num_lattices)]
+
+
+def model_cost(model_config, batch_size=1, dtype_size=4,
+               aggregation_set_size=1):
+  """Returns the estimated cost of the premade model of a model config.
+
+  Args:
+    model_config: Model configuration object describing model architecture.
+      Should be one of the model configs in `tfl.configs`. Keypoints do not
+      need to be set.
+    batch_size: Batch size used for activation memory.
+    dtype_size: Size in bytes of the model dtype.
+    aggregation_set_size: Average number of elements in the ragged inputs of
+      `tfl.configs.AggregateFunctionConfig` models.
+
+  Returns:
+    A `Cost` instance.
+
+  Raises:
+    ValueError: If model_config is not a supported model config.
+  """
+  if not isinstance(model_config, (configs.CalibratedLinearConfig,
+                                   configs.CalibratedLatticeConfig,
+                                   configs.CalibratedLatticeEnsembleConfig,
+                                   configs.AggregateFunctionConfig)):
+    raise ValueError('Unsupported model config type: {}'.format(
+        type(model_config)))
+  output_calibration = _output_calibration_cost(model_config, batch_size,
+                                                dtype_size)
+  if isinstance(model_config, configs.CalibratedLinearConfig):
+    feature_names = [
+        feature_config.name for feature_config in model_config.feature_configs
+    ]
+    weighted_average = (
+        model_config.output_min is not None or
+        model_config.output_max is not None or
+        model_config.output_calibration)
+    if weighted_average:
+      # Monotonic weights normalized to sum up to one.
+      num_constraints = len(feature_names) + 1
+    else:
+      num_constraints = sum(
+          1 for feature_config in model_config.feature_configs
+          if _feature_is_constrained(feature_config))
+    return (_calibration_layers_cost(
+        model_config, [feature_names],
+        separate_calibrators=False,
+        bounded=weighted_average,
+        batch_size=batch_size,
+        dtype_size=dtype_size) + linear_cost(
+            num_input_dims=len(feature_names),
+            use_bias=model_config.use_bias and not weighted_average,
+            num_constraints=num_constraints,
+            batch_size=batch_size,
+            dtype_size=dtype_size) + output_calibration)
+
+  if isinstance(model_config, configs.CalibratedLatticeConfig):
+    feature_names = [
+        feature_config.name for feature_config in model_config.feature_configs
+    ]
+    return (_calibration_layers_cost(
+        model_config, [feature_names],
+        separate_calibrators=False,
+        bounded=True,
+        batch_size=batch_size,
+        dtype_size=dtype_size) + _submodel_lattice_cost(
+            model_config, feature_names, batch_size, dtype_size) +
+            output_calibration)
+
+  if isinstance(model_config, configs.CalibratedLatticeEnsembleConfig):
+    lattices = _ensemble_lattices(model_config)
+    lattices_cost = _total(
+        _submodel_lattice_cost(model_config, lattice, batch_size, dtype_size)
+        for lattice in lattices)
+    averaging = Cost(
+        num_params=0,
+        forward_flops=len(lattices),
+        activation_bytes=batch_size * dtype_size,
+        projection_flops=0)
+    return (_calibration_layers_cost(
+        model_config,
+        lattices,
+        separate_calibrators=model_config.separate_calibrators,
+        bounded=True,
+        batch_size=batch_size,
+        dtype_size=dtype_size) + lattices_cost + averaging + output_calibration)
+
+  # AggregateFunctionConfig.
+  feature_names = [
+      feature_config.name for feature_config in model_config.feature_configs
+  ]
+  # Each middle dimension applies a calibrated lattice model to each element of
+  # the ragged inputs, with per-element cost scaled by the set size. Without
+  # separate calibrators, the inputs are calibrated once for all middle
+  # dimensions and fed to a single lattice with one unit per middle dimension.
+  separate_calibrators = model_config.separate_calibrators
+  num_models = model_config.middle_dimension if separate_calibrators else 1
+  inner_cost = (
+      _calibration_layers_cost(
+          model_config, [feature_names],
+          separate_calibrators=False,
+          bounded=True,
+          batch_size=batch_size,
+          dtype_size=dtype_size) + _submodel_lattice_cost(
+              model_config,
+              feature_names,
+              batch_size,
+              dtype_size,
+              units=1 if separate_calibrators else
+              model_config.middle_dimension,
+              shared_inputs=not separate_calibrators)).scale(num_models)
+  # With chunked aggregation, only the activations of one chunk of set elements
+  # are kept in memory at a time.
+  num_elements = batch_size * aggregation_set_size
+  if model_config.aggregation_chunk_size:
+    num_elements = min(num_elements, model_config.aggregation_chunk_size)
+  inner_cost = Cost(
+      num_params=inner_cost.num_params,
+      forward_flops=inner_cost.forward_flops * aggregation_set_size,
+      activation_bytes=inner_cost.activation_bytes // batch_size * num_elements,
+      projection_flops=inner_cost.projection_flops)
+  middle_calibration = _ZERO_COST
+  if model_config.middle_calibration:
+    middle_calibration = pwl_calibration_cost(
+        num_keypoints=model_config.middle_calibration_num_keypoints,
+        constrained=True,
+        batch_size=batch_size,
+        dtype_size=dtype_size).scale(model_config.middle_dimension)
+  middle_lattice = lattice_cost(
+      lattice_sizes=[model_config.middle_lattice_size] *
+      model_config.middle_dimension,
+      num_constraints=model_config.middle_dimension,
+      bounded=(model_config.output_min is not None or
+               model_config.output_max is not None),
+      batch_size=batch_size,
+      dtype_size=dtype_size)
+  return inner_cost + middle_calibration + middle_lattice + output_calibration
@@ -0,0 +1,221 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL static cost model."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import categorical_calibration_layer as cat
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import cost_model
+from tensorflow_lattice.python import lattice_layer as ll
+from tensorflow_lattice.python import linear_layer
+from tensorflow_lattice.python import premade
+from tensorflow_lattice.python import pwl_calibration_layer as pwl
+from tensorflow_lattice.python import rtl_layer
+
+
+def _feature_configs():
+  return [
+      configs.FeatureConfig(
+          name='numerical_1',
+          lattice_size=3,
+          monotonicity='increasing',
+          pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=10),
+      ),
+      configs.FeatureConfig(
+          name='numerical_2',
+          lattice_size=2,
+          default_value=-1.0,
+          pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=6),
+      ),
+      configs.FeatureConfig(
+          name='categorical',
+          lattice_size=4,
+          num_buckets=5,
+          monotonicity=[(0, 1), (1, 2)],
+      ),
+      configs.FeatureConfig(
+          name='numerical_3',
+          lattice_size=2,
+          pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+      ),
+  ]
+
+
+class CostModelTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _ModelConfig(self, model_type, output_calibration):
+    kwargs = dict(
+        feature_configs=_feature_configs(),
+        output_calibration=output_calibration,
+        output_initialization=np.linspace(0.0, 1.0, num=7) if
+        output_calibration else [0.0, 1.0])
+    if model_type == 'linear':
+      return configs.CalibratedLinearConfig(use_bias=True, **kwargs)
+    if model_type == 'lattice':
+      return configs.CalibratedLatticeConfig(**kwargs)
+    if model_type == 'ensemble':
+      return configs.CalibratedLatticeEnsembleConfig(
+          lattices=[['numerical_1', 'categorical'],
+                    ['numerical_1', 'numerical_2', 'numerical_3'],
+                    ['categorical', 'numerical_3']],
+          separate_calibrators=True,
+          **kwargs)
+    if model_type == 'ensemble_shared':
+      return configs.CalibratedLatticeEnsembleConfig(
+          lattices=[['numerical_1', 'categorical'],
+                    ['numerical_2', 'numerical_3']],
+          separate_calibrators=False,
+          **kwargs)
+    raise ValueError(model_type)
+
+  @parameterized.parameters(
+      ('linear', False),
+      ('linear', True),
+      ('lattice', False),
+      ('lattice', True),
+      ('ensemble', False),
+      ('ensemble_shared', True),
+  )
+  def testModelNumParams(self, model_type, output_calibration):
+    model_config = self._ModelConfig(model_type, output_calibration)
+    cost = cost_model.model_cost(model_config, batch_size=32)
+    if model_type == 'linear':
+      model = premade.CalibratedLinear(model_config)
+    elif model_type == 'lattice':
+      model = premade.CalibratedLattice(model_config)
+    else:
+      model = premade.CalibratedLatticeEnsemble(model_config)
+    self.assertEqual(cost.num_params, model.count_params())
+    self.assertGreater(cost.forward_flops, 0)
+    self.assertGreater(cost.activation_bytes, 0)
+    self.assertGreater(cost.projection_flops, 0)
+
+  def testLatticeCost(self):
+    cost = cost_model.lattice_cost(
+        lattice_sizes=[2, 3, 4],
+        units=2,
+        num_constraints=2,
+        num_projection_iterations=10,
+        batch_size=8)
+    self.assertEqual(cost.num_params, 48)
+    # 3 * 9 interpolation + (6 + 24) outer products + 2 * 24 contraction.
+    self.assertEqual(cost.forward_flops, 2 * (27 + 30 + 48))
+    # 9 one dimensional weights, 30 outer products and 1 output per unit.
+    self.assertEqual(cost.activation_bytes, 2 * 40 * 8 * 4)
+    self.assertEqual(cost.projection_flops, 10 * 2 * 4 * 48)
+
+    # Costs grow exponentially with the lattice rank.
+    small = cost_model.lattice_cost(lattice_sizes=[2] * 4)
+    large = cost_model.lattice_cost(lattice_sizes=[2] * 8)
+    self.assertEqual(large.num_params, 16 * small.num_params)
+    self.assertGreater(large.forward_flops, 10 * small.forward_flops)
+
+  def testLayerCost(self):
+    layers = [
+        ll.Lattice(
+            lattice_sizes=[2, 3],
+            units=3,
+            monotonicities=['increasing', 'none'],
+            edgeworth_trusts=[(0, 1, 'positive')],
+            output_min=0.0),
+        rtl_layer.RTL(num_lattices=6, lattice_rank=3, lattice_size=3),
+        pwl.PWLCalibration(
+            input_keypoints=np.linspace(0.0, 1.0, num=8),
+            units=2,
+            monotonicity='increasing',
+            impute_missing=True,
+            missing_input_value=-1.0),
+        cat.CategoricalCalibration(num_buckets=4, units=3),
+        linear_layer.Linear(num_input_dims=5, monotonicities=[1] * 5),
+    ]
+    inputs = [
+        tf.zeros([1, 3, 2]), {
+            'increasing': tf.zeros([1, 5])
+        },
+        tf.zeros([1, 1]),
+        tf.zeros([1, 1], dtype=tf.int32),
+        tf.zeros([1, 5])
+    ]
+    for layer, layer_inputs in zip(layers, inputs):
+      cost = cost_model.layer_cost(layer, batch_size=4)
+      self.assertGreater(cost.forward_flops, 0)
+      layer(layer_inputs)
+      self.assertEqual(cost.num_params, layer.count_params())
+
+    lattice_cost = cost_model.layer_cost(layers[0])
+    # 1 monotonicity and 1 trust.
+    self.assertEqual(lattice_cost.projection_flops, 10 * 2 * 4 * 18 + 2 * 18)
+    self.assertEqual(cost_model.layer_cost(layers[3]).projection_flops, 0)
+
+    with self.assertRaises(ValueError):
+      cost_model.layer_cost(tf.keras.layers.Dense(1))
+
+  def testEnsembleWithUnspecifiedLattices(self):
+    model_config = configs.CalibratedLatticeEnsembleConfig(
+        feature_configs=_feature_configs(),
+        lattices='random',
+        num_lattices=6,
+        lattice_rank=2,
+        separate_calibrators=False)
+    cost = cost_model.model_cost(model_config)
+    # 4 calibrators (10 + 7 + 5 + 4 parameters) and 6 lattices of rank 2.
+    calibration_params = 10 + 7 + 5 + 4
+    self.assertBetween(cost.num_params - calibration_params, 6 * 4, 6 * 16)
+
+  def testAggregateFunction(self):
+    model_config = configs.AggregateFunctionConfig(
+        feature_configs=_feature_configs()[:2],
+        middle_dimension=3,
+        middle_lattice_size=2,
+        middle_calibration=True,
+        middle_calibration_num_keypoints=5)
+    cost = cost_model.model_cost(model_config)
+    larger_set_cost = cost_model.model_cost(
+        model_config, aggregation_set_size=10)
+    self.assertEqual(cost.num_params, larger_set_cost.num_params)
+    self.assertGreater(larger_set_cost.forward_flops, cost.forward_flops)
+    # 3 x (calibrators with 10 + 7 parameters, a 3x2 lattice and a middle
+    # calibrator with 5 keypoints) and a 2x2x2 middle lattice.
+    self.assertEqual(cost.num_params, 3 * (10 + 7 + 6 + 5) + 8)
+
+    # Shared calibrators and a single lattice with 3 units.
+    model_config.separate_calibrators = False
+    shared_cost = cost_model.model_cost(model_config)
+    self.assertEqual(shared_cost.num_params, 10 + 7 + 3 * 6 + 3 * 5 + 8)
+    self.assertLess(shared_cost.forward_flops, cost.forward_flops)
+
+    # Chunked aggregation bounds the memory of large sets.
+    model_config.aggregation_chunk_size = 100
+    chunked_cost = cost_model.model_cost(
+        model_config, batch_size=64, aggregation_set_size=1000)
+    model_config.aggregation_chunk_size = None
+    unchunked_cost = cost_model.model_cost(
+        model_config, batch_size=64, aggregation_set_size=1000)
+    self.assertEqual(chunked_cost.forward_flops, unchunked_cost.forward_flops)
+    self.assertLess(100 * chunked_cost.activation_bytes,
+                    unchunked_cost.activation_bytes)
+
+  def testInvalidModelConfig(self):
+    with self.assertRaises(ValueError):
+      cost_model.model_cost(configs.FeatureConfig(name='feature'))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,263 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Early-exit evaluation of thresholded lattice ensemble decisions.
+
+A lattice interpolates its kernel values, so the output of each lattice of a
+`tfl.premade.CalibratedLatticeEnsemble` lies between the minimum and maximum of
+its kernel. After evaluating some of the lattices, the average lattice output
+is bounded by the evaluated outputs plus the bounds of the remaining lattices.
+If the whole interval of possible model outputs is on one side of a decision
+threshold, the decision is known without evaluating the remaining lattices.
+
+`EarlyExitEnsemble` evaluates lattices in chunks, in decreasing order of their
+output range, and only keeps evaluating lattices for the examples that are not
+decided yet. Once all examples of a batch are decided, the remaining chunks are
+skipped by conditional ops, so single example requests only run the ops of the
+evaluated chunks. Decisions are the same as comparing the full model output to
+the threshold. Output calibration is supported by bounding the piecewise linear
+output calibrator over the interval of possible calibrator inputs.
+
+Evaluation only uses TF ops, so it can run eagerly, in a `tf.function` or be
+exported as a SavedModel:
+
+```python
+early_exit = tfl.early_exit.EarlyExitEnsemble(model, threshold=0.5)
+decisions, num_evaluated = early_exit(inputs)
+tf.saved_model.save(
+    early_exit, export_dir,
+    signatures=early_exit.serving_function())
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from . import configs
+from . import premade_lib
+import numpy as np
+import tensorflow as tf
+
+
+class EarlyExitEnsemble(tf.Module):
+  # pyformat: disable
+  """Evaluates thresholded decisions of a lattice model with early exit.
+
+  The decision for an example is `model(example) > threshold`.
+
+  Attributes:
+    - All `__init__` arguments.
+    submodel_order: Indices of the submodels in the order of evaluation.
+
+  Example:
+
+  ```python
+  early_exit = tfl.early_exit.EarlyExitEnsemble(
+      model, threshold=0.5, chunk_size=4)
+  decisions, num_evaluated = early_exit(inputs)
+  ```
+  """
+  # pyformat: enable
+
+  def __init__(self, model, threshold, chunk_size=1, tolerance=1e-6,
+               name=None):
+    """Initializes an `EarlyExitEnsemble` instance.
+
+    The evaluation order of the lattices and the bounds of the lattice outputs
+    are computed from the lattice kernels at construction time. If the model is
+    trained further, `update_bounds` must be called to keep decisions exact.
+
+    Args:
+      model: A `tfl.premade.CalibratedLatticeEnsemble` or
+        `tfl.premade.CalibratedLattice` model.
+      threshold: Decision threshold on the model output.
+      chunk_size: Number of lattices evaluated between checks of the bounds.
+      tolerance: Bounds must clear the threshold by more than this margin for
+        an early decision, which guards against differences in floating point
+        rounding from the full model evaluation.
+      name: Name of the module.
+
+    Raises:
+      ValueError: If the model is not supported or `chunk_size` is not positive.
+    """
+    super(EarlyExitEnsemble, self).__init__(name=name)
+    model_config = getattr(model, 'model_config', None)
+    if not isinstance(model_config, (configs.CalibratedLatticeConfig,
+                                     configs.CalibratedLatticeEnsembleConfig)):
+      raise ValueError('EarlyExitEnsemble requires a CalibratedLattice or '
+                       'CalibratedLatticeEnsemble premade model.')
+    if chunk_size < 1:
+      raise ValueError('chunk_size must be positive: {}'.format(chunk_size))
+    self.model = model
+    self.threshold = threshold
+    self.chunk_size = chunk_size
+    self.tolerance = tolerance
+    self._submodels, self._average = premade_lib.premade_submodels(model)
+    self._feature_names = [
+        feature_config.name for feature_config in model_config.feature_configs
+    ]
+    self._calibration_layers = [
+        model.get_layer('{}_{}'.format(premade_lib.CALIB_LAYER_NAME, name))
+        for name in self._feature_names
+    ]
+    self._output_calibration = None
+    if model_config.output_calibration:
+      self._output_calibration = model.get_layer(
+          premade_lib.OUTPUT_CALIB_LAYER_NAME)
+    self._kernel_min = tf.Variable(
+        tf.zeros([len(self._submodels)], dtype=model.dtype), trainable=False)
+    self._kernel_max = tf.Variable(
+        tf.zeros([len(self._submodels)], dtype=model.dtype), trainable=False)
+    self.update_bounds()
+    # Lattices with wider output ranges are evaluated first since they can move
+    # the average the most.
+    widths = self._kernel_max.numpy() - self._kernel_min.numpy()
+    self.submodel_order = [
+        int(index) for index in np.argsort(widths, kind='stable')[::-1]
+    ]
+
+  def update_bounds(self):
+    """Updates the bounds of the lattice outputs from the current kernels."""
+    kernels = [
+        submodel.layer.kernel[:, submodel.unit] for submodel in self._submodels
+    ]
+    self._kernel_min.assign(
+        tf.stack([tf.reduce_min(kernel) for kernel in kernels]))
+    self._kernel_max.assign(
+        tf.stack([tf.reduce_max(kernel) for kernel in kernels]))
+
+  def _model_output_bounds(self, lower, upper):
+    """Returns bounds of the model output given bounds of the average."""
+    if self._output_calibration is None:
+      return lower, upper
+    # A PWL function attains its extrema over an interval at the interval
+    # endpoints or at keypoints within the interval.
+    keypoints = tf.constant(
+        self._output_calibration.input_keypoints, dtype=lower.dtype)
+    clipped_keypoints = tf.minimum(
+        tf.maximum(keypoints[tf.newaxis, :], lower[:, tf.newaxis]),
+        upper[:, tf.newaxis])
+    candidates = tf.concat(
+        [lower[:, tf.newaxis], upper[:, tf.newaxis], clipped_keypoints], axis=1)
+    outputs = tf.reshape(
+        self._output_calibration(tf.reshape(candidates, [-1, 1])),
+        tf.shape(candidates))
+    return tf.reduce_min(outputs, axis=1), tf.reduce_max(outputs, axis=1)
+
+  def __call__(self, inputs):
+    """Returns thresholded decisions of the model.
+
+    Args:
+      inputs: List of model inputs, one tensor of shape `(batch_size, 1)` or
+        `(batch_size,)` for each feature.
+
+    Returns:
+      A tuple `(decisions, num_evaluated)` of tensors of shape `(batch_size,)`
+      with the boolean decisions and the number of lattices evaluated for each
+      example.
+    """
+    calibrated = {}
+    for feature_name, layer, values, model_input in zip(
+        self._feature_names, self._calibration_layers, inputs,
+        self.model.inputs):
+      values = tf.reshape(tf.cast(values, model_input.dtype), [-1, 1])
+      calibrated[feature_name] = tf.split(layer(values), layer.units, axis=1)
+    some_input = calibrated[self._feature_names[0]][0]
+    batch_size = tf.shape(some_input)[0]
+    dtype = some_input.dtype
+    return self._evaluate_chunks(
+        calibrated,
+        start=0,
+        partial_sum=tf.zeros([batch_size], dtype=dtype),
+        decided=tf.zeros([batch_size], dtype=tf.bool),
+        decisions=tf.zeros([batch_size], dtype=tf.bool),
+        num_evaluated=tf.zeros([batch_size], dtype=tf.int32))
+
+  def _evaluate_chunks(self, calibrated, start, partial_sum, decided,
+                       decisions, num_evaluated):
+    """Evaluates the chunk at start and, if needed, the following chunks.
+
+    Args:
+      calibrated: Dict from feature names to calibrated inputs, one tensor per
+        calibration unit.
+      start: Index into `submodel_order` of the first submodel of the chunk.
+      partial_sum: Sum of evaluated submodel outputs for each example.
+      decided: Whether each example is decided.
+      decisions: Decisions of decided examples.
+      num_evaluated: Number of evaluated submodels for each example.
+
+    Returns:
+      A tuple `(decisions, num_evaluated)` as returned by `__call__`.
+    """
+    chunk = self.submodel_order[start:start + self.chunk_size]
+    # Evaluates the chunk only for undecided examples.
+    active = tf.where(tf.logical_not(decided))[:, 0]
+    chunk_output = 0.0
+    for index in chunk:
+      submodel = self._submodels[index]
+      submodel_inputs = [
+          tf.gather(calibrated[feature_name][unit], active)
+          for feature_name, unit in zip(submodel.feature_names,
+                                        submodel.calibration_units)
+      ]
+      chunk_output += premade_lib.evaluate_submodel(submodel,
+                                                    submodel_inputs)[:, 0]
+    partial_sum = tf.tensor_scatter_nd_add(partial_sum, active[:, tf.newaxis],
+                                           chunk_output)
+    num_evaluated = tf.tensor_scatter_nd_add(
+        num_evaluated, active[:, tf.newaxis],
+        tf.fill(tf.shape(active), len(chunk)))
+
+    scale = 1.0 / len(self._submodels) if self._average else 1.0
+    remaining = self.submodel_order[start + self.chunk_size:]
+    if not remaining:
+      outputs = partial_sum * scale
+      if self._output_calibration is not None:
+        outputs = self._output_calibration(outputs[:, tf.newaxis])[:, 0]
+      return tf.where(decided, decisions, outputs > self.threshold), (
+          num_evaluated)
+    lower = partial_sum + tf.reduce_sum(tf.gather(self._kernel_min, remaining))
+    upper = partial_sum + tf.reduce_sum(tf.gather(self._kernel_max, remaining))
+    lower, upper = self._model_output_bounds(lower * scale, upper * scale)
+    accept = lower > self.threshold + self.tolerance
+    reject = upper < self.threshold - self.tolerance
+    newly_decided = tf.logical_and(
+        tf.logical_not(decided), tf.logical_or(accept, reject))
+    decisions = tf.where(newly_decided, accept, decisions)
+    decided = tf.logical_or(decided, newly_decided)
+    # The remaining chunks are nested in the false branch, so none of their ops
+    # run once all examples are decided.
+    return tf.cond(
+        tf.reduce_all(decided),
+        lambda: (decisions, num_evaluated),
+        lambda: self._evaluate_chunks(  # pylint: disable=g-long-lambda
+            calibrated, start + self.chunk_size, partial_sum, decided,
+            decisions, num_evaluated))
+
+  def serving_function(self):
+    """Returns a concrete function for exporting the module as a SavedModel.
+
+    The function takes one `(batch_size, 1)` tensor per feature, named after
+    the features, and returns a dict with 'decisions' and 'num_evaluated'.
+    """
+
+    @tf.function(input_signature=[
+        tf.TensorSpec(shape=[None, 1], dtype=model_input.dtype, name=name)
+        for name, model_input in zip(self._feature_names, self.model.inputs)
+    ])
+    def serve(*inputs):
+      decisions, num_evaluated = self(list(inputs))
+      return {'decisions': decisions, 'num_evaluated': num_evaluated}
+
+    return serve.get_concrete_function()
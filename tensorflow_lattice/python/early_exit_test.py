@@ -0,0 +1,189 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL early-exit ensemble evaluation."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import early_exit
+from tensorflow_lattice.python import test_utils
+
+
+def _feature_configs():
+  return [
+      configs.FeatureConfig(
+          name='numerical_{}'.format(i),
+          lattice_size=2,
+          pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+      ) for i in range(5)
+  ] + [
+      configs.FeatureConfig(
+          name='categorical',
+          lattice_size=2,
+          num_buckets=3,
+      )
+  ]
+
+
+class EarlyExitTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _Model(self, model_type='ensemble', output_calibration=False):
+    rng = np.random.RandomState(0)
+    feature_names = [config.name for config in _feature_configs()]
+    lattices = [
+        list(rng.choice(feature_names, size=3, replace=False))
+        for _ in range(12)
+    ]
+    model = test_utils.premade_model(
+        model_type,
+        _feature_configs(),
+        lattices=lattices,
+        seed=1,
+        output_calibration=output_calibration,
+        output_calibration_num_keypoints=5,
+        output_initialization=[0.0, 1.0])
+    # Lattices with different output ranges.
+    for weight in model.trainable_weights:
+      if 'lattice' in weight.name:
+        tf.keras.backend.set_value(
+            weight,
+            tf.keras.backend.get_value(
+                weight.constraint(weight * rng.uniform())))
+    return model
+
+  def _Inputs(self, num_examples):
+    rng = np.random.RandomState(2)
+    return [
+        rng.uniform(size=[num_examples, 1]).astype(np.float32)
+        for _ in range(5)
+    ] + [rng.randint(0, 3, size=[num_examples, 1]).astype(np.int32)]
+
+  @parameterized.parameters(
+      (False, False, 1),
+      (False, True, 3),
+      (True, False, 2),
+      (True, True, 12),
+  )
+  def testDecisionsMatchModel(self, output_calibration, pack_lattices,
+                              chunk_size):
+    model = self._Model(
+        'packed_ensemble' if pack_lattices else 'ensemble', output_calibration)
+    inputs = self._Inputs(200)
+    outputs = model.predict(inputs, verbose=0)[:, 0]
+    for threshold in np.quantile(outputs, [0.05, 0.5, 0.95]):
+      evaluator = early_exit.EarlyExitEnsemble(
+          model, threshold=threshold, chunk_size=chunk_size)
+      decisions, num_evaluated = evaluator(inputs)
+      self.assertAllEqual(decisions, outputs > threshold)
+      self.assertAllInRange(num_evaluated, 1, 12)
+      if chunk_size < 12:
+        self.assertLess(np.mean(num_evaluated), 12)
+
+  def testEvaluationOrder(self):
+    model = self._Model()
+    evaluator = early_exit.EarlyExitEnsemble(model, threshold=0.5)
+    self.assertCountEqual(evaluator.submodel_order, range(12))
+    widths = []
+    for index in evaluator.submodel_order:
+      kernel = model.get_layer('tfl_lattice_{}'.format(index)).kernel
+      widths.append(np.max(kernel) - np.min(kernel))
+    self.assertAllEqual(widths, sorted(widths, reverse=True))
+
+  def testExtremeThresholds(self):
+    model = self._Model()
+    inputs = self._Inputs(50)
+    decisions, num_evaluated = early_exit.EarlyExitEnsemble(
+        model, threshold=-1.0)(inputs)
+    self.assertAllEqual(decisions, np.ones(50, dtype=bool))
+    self.assertAllEqual(num_evaluated, np.ones(50))
+    decisions, num_evaluated = early_exit.EarlyExitEnsemble(
+        model, threshold=2.0, chunk_size=5)(inputs)
+    self.assertAllEqual(decisions, np.zeros(50, dtype=bool))
+    self.assertAllEqual(num_evaluated, np.full(50, 5))
+
+  def testSkipsDecidedChunks(self):
+    model = self._Model()
+    inputs = self._Inputs(1)
+    evaluator = early_exit.EarlyExitEnsemble(
+        model, threshold=-1.0, chunk_size=3)
+    evaluate_fn = tf.function(evaluator)
+    decisions, num_evaluated = evaluate_fn(inputs)
+    self.assertAllEqual(decisions, [True])
+    self.assertAllEqual(num_evaluated, [3])
+    # Later chunks are nested in conditional branches.
+    graph = evaluate_fn.get_concrete_function(inputs).graph
+    op_types = set(op.type for op in graph.get_operations())
+    self.assertTrue(op_types & {'If', 'StatelessIf'})
+
+  def testUpdateBounds(self):
+    model = self._Model()
+    inputs = self._Inputs(100)
+    evaluator = early_exit.EarlyExitEnsemble(
+        model, threshold=0.5, chunk_size=2)
+    for weight in model.trainable_weights:
+      if 'lattice' in weight.name:
+        tf.keras.backend.set_value(
+            weight, tf.keras.backend.get_value(weight) * 0.5 + 0.25)
+    evaluator.update_bounds()
+    outputs = model.predict(inputs, verbose=0)[:, 0]
+    threshold = float(np.median(outputs))
+    evaluator.threshold = threshold
+    decisions, _ = evaluator(inputs)
+    self.assertAllEqual(decisions, outputs > threshold)
+
+  def testSingleLattice(self):
+    model = self._Model('lattice', output_calibration=True)
+    inputs = self._Inputs(20)
+    outputs = model.predict(inputs, verbose=0)[:, 0]
+    threshold = np.median(outputs)
+    decisions, num_evaluated = early_exit.EarlyExitEnsemble(
+        model, threshold=threshold)(inputs)
+    self.assertAllEqual(decisions, outputs > threshold)
+    self.assertAllEqual(num_evaluated, np.ones(20))
+
+  def testSavedModel(self):
+    model = self._Model(output_calibration=True)
+    inputs = self._Inputs(100)
+    threshold = float(np.median(model.predict(inputs, verbose=0)))
+    evaluator = early_exit.EarlyExitEnsemble(
+        model, threshold=threshold, chunk_size=2)
+    export_dir = os.path.join(self.get_temp_dir(), 'early_exit')
+    tf.saved_model.save(
+        evaluator, export_dir, signatures=evaluator.serving_function())
+    serving_fn = tf.saved_model.load(export_dir).signatures['serving_default']
+    results = serving_fn(**{
+        'numerical_{}'.format(i): tf.constant(inputs[i]) for i in range(5)
+    }, categorical=tf.constant(inputs[5]))
+    decisions, num_evaluated = evaluator(inputs)
+    self.assertAllEqual(results['decisions'], decisions)
+    self.assertAllEqual(results['num_evaluated'], num_evaluated)
+
+  def testInvalidArguments(self):
+    model = test_utils.premade_model(
+        'linear', _feature_configs(), output_initialization=[0.0, 1.0])
+    with self.assertRaises(ValueError):
+      early_exit.EarlyExitEnsemble(model, threshold=0.5)
+    with self.assertRaises(ValueError):
+      early_exit.EarlyExitEnsemble(self._Model(), threshold=0.5, chunk_size=0)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -66,6 +66,7 @@ from __future__ import print_function
 
 import collections
 import copy
+import hashlib
 import json
 import os
 import re
@@ -89,6 +90,7 @@ from tensorflow.python.feature_column import feature_column as fc  # pylint: dis
 from tensorflow.python.feature_column import feature_column_v2 as fc2  # pylint: disable=g-direct-tensorflow-import
 from tensorflow.python.keras.utils import losses_utils  # pylint: disable=g-direct-tensorflow-import
 from tensorflow.python.training import training_util  # pylint: disable=g-direct-tensorflow-import
+from tensorflow.python.util import function_utils  # pylint: disable=g-direct-tensorflow-import
 from tensorflow_estimator.python.estimator import estimator as estimator_lib
 from tensorflow_estimator.python.estimator.canned import optimizers
 from tensorflow_estimator.python.estimator.head import head_utils
@@ -117,6 +119,15 @@ _LABEL_FEATURE_NAME = '__label__'
 _MAX_WAIT_TIME = 1200
 _POLL_INTERVAL_SECS = 10
 
+# File name pattern for partial keypoints sketches written by each worker.
+_KEYPOINTS_SKETCH_FILE_PATTERN = 'keypoints_sketch_{}.json'
+
+# Maximum number of values per feature in partial keypoints sketches.
+_MAX_KEYPOINTS_SKETCH_SIZE = 10000
+
+# Task types that participate in distributed feature analysis.
+_SKETCHING_TASK_TYPES = ('chief', 'master', 'worker')
+
 
 class WaitTimeOutError(Exception):
   """Timeout error when waiting for a file."""
@@ -129,7 +140,33 @@ def _poll_for_file(filename):
   while not tf.io.gfile.exists(filename):
     time.sleep(_POLL_INTERVAL_SECS)
     if time.time() - start > _MAX_WAIT_TIME:
-      raise WaitTimeOutError('Waiting for file {} timed-out'.filename)
+      raise WaitTimeOutError('Waiting for file {} timed-out'.format(filename))
+
+
+def _poll_for_keypoints_sketch(filename, token):
+  """Waits and polls for a keypoints sketch file written with the given token.
+
+  Sketch files with a different token were left by another run and are
+  treated as not written yet.
+
+  Args:
+    filename: Name of the sketch file.
+    token: Token returned by `_keypoints_sketch_token`.
+
+  Returns:
+    The sketches stored in the file.
+  """
+  start = time.time()
+  while True:
+    try:
+      sketch_file = _read_json_file(filename)
+    except tf.errors.NotFoundError:
+      sketch_file = None
+    if sketch_file is not None and sketch_file.get('token') == token:
+      return sketch_file['sketches']
+    time.sleep(_POLL_INTERVAL_SECS)
+    if time.time() - start > _MAX_WAIT_TIME:
+      raise WaitTimeOutError('Waiting for file {} timed-out'.format(filename))
 
 
 def transform_features(features, feature_columns=None):
@@ -218,6 +255,176 @@ def _materialize_locally(tensors, max_elements=1e6):
     return concatenated_tensors
 
 
+def _call_feature_analysis_input_fn(feature_analysis_input_fn, config):
+  """Calls the input_fn, passing the run config if it is an accepted arg."""
+  if 'config' in function_utils.fn_args(feature_analysis_input_fn):
+    return feature_analysis_input_fn(config=config)
+  return feature_analysis_input_fn()
+
+
+def _write_json_file(filename, value):
+  """Writes value to a json file, renaming a temp file to avoid partial reads."""
+  tf.io.gfile.makedirs(os.path.dirname(filename))
+  tmp_filename = filename + 'tmp'
+  with tf.io.gfile.GFile(tmp_filename, 'w') as json_file:
+    json_file.write(json.dumps(value, indent=2))
+  tf.io.gfile.rename(tmp_filename, filename, overwrite=True)
+
+
+def _read_json_file(filename):
+  """Reads and returns the value stored in a json file."""
+  with tf.io.gfile.GFile(filename) as json_file:
+    return json.loads(json_file.read())
+
+
+def _keypoints_params(model_config, feature_name):
+  """Returns keypoints generation parameters for a feature or the label.
+
+  Args:
+    model_config: Model config with the feature configs.
+    feature_name: Name of the feature or _LABEL_FEATURE_NAME for the label.
+
+  Returns:
+    A tuple (num_keypoints, keypoints, clip_min, clip_max, default_value), or
+    None if no keypoints are needed for the feature.
+  """
+  if feature_name == _LABEL_FEATURE_NAME:
+    return (model_config.output_calibration_num_keypoints,
+            model_config.output_initialization, model_config.output_min,
+            model_config.output_max, None)
+  feature_config = model_config.feature_config_by_name(feature_name)
+  if feature_config.num_buckets:
+    # Skip categorical features.
+    return None
+  return (feature_config.pwl_calibration_num_keypoints,
+          feature_config.pwl_calibration_input_keypoints,
+          feature_config.pwl_calibration_clip_min,
+          feature_config.pwl_calibration_clip_max, feature_config.default_value)
+
+
+def _keypoints_sketch_token(model_config, config):
+  """Returns a token identifying the run that writes keypoints sketches.
+
+  All workers of a run compute the same token from the keypoints parameters of
+  the model config, the cluster spec and the latest checkpoint in the model
+  directory. Partial sketches left in the model directory by an earlier run
+  with different values are ignored when merging.
+
+  Args:
+    model_config: Model config with the feature configs.
+    config: A `tf.RunConfig` of the worker.
+
+  Returns:
+    A hex string.
+  """
+  feature_names = [
+      feature_config.name for feature_config in model_config.feature_configs
+  ] + [_LABEL_FEATURE_NAME]
+  run = {
+      'keypoints_params': {
+          feature_name: _keypoints_params(model_config, feature_name)
+          for feature_name in feature_names
+      },
+      'cluster_spec': config.cluster_spec.as_dict(),
+      'checkpoint': tf.train.latest_checkpoint(config.model_dir),
+  }
+  return hashlib.sha256(
+      json.dumps(run, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _compute_keypoints_sketch(model_config, features, label_dtype,
+                              max_sketch_size=None):
+  """Computes mergeable sketches of the observed feature and label values.
+
+  See `tfl.premade_lib.compute_keypoints_sketch` for details. Sketches computed
+  on different shards of the data can be merged using
+  `_merge_keypoints_sketches`.
+
+  Args:
+    model_config: Model config with the feature configs.
+    features: A dict from feature name to materialized values, including the
+      label values under _LABEL_FEATURE_NAME.
+    label_dtype: Dtype of the label tensor.
+    max_sketch_size: Maximum number of values kept for each feature. If None,
+      all unique values are kept.
+
+  Returns:
+    A dict from feature name to a (values, weights) pair of lists.
+
+  Raises:
+    ValueError: If NaN values are observed for a numeric feature.
+  """
+  sketches = {}
+  for feature_name, feature_values in six.iteritems(features):
+    if feature_name == _LABEL_FEATURE_NAME and label_dtype == tf.string:
+      # Only the set of classes is needed for string labels.
+      classes = sorted(
+          set(six.ensure_text(x) for x in feature_values.flatten()))
+      sketches[feature_name] = (classes, [1.0] * len(classes))
+      continue
+
+    keypoints_params = _keypoints_params(model_config, feature_name)
+    if keypoints_params is None:
+      continue
+    _, _, clip_min, clip_max, default_value = keypoints_params
+    values, weights = premade_lib.compute_keypoints_sketch(
+        feature_values,
+        clip_min=clip_min,
+        clip_max=clip_max,
+        default_value=default_value,
+        max_sketch_size=max_sketch_size,
+        feature_name=feature_name)
+    sketches[feature_name] = ([float(x) for x in values],
+                              [float(x) for x in weights])
+  return sketches
+
+
+def _merge_keypoints_sketches(worker_sketches):
+  """Merges a list of sketches created by `_compute_keypoints_sketch`."""
+  feature_sketches = collections.defaultdict(list)
+  for sketches in worker_sketches:
+    for feature_name, sketch in six.iteritems(sketches):
+      feature_sketches[feature_name].append(sketch)
+  merged_sketches = {}
+  for feature_name, sketches in six.iteritems(feature_sketches):
+    values, weights = premade_lib.merge_keypoints_sketches(sketches)
+    merged_sketches[feature_name] = (values.tolist(),
+                                     [float(x) for x in weights])
+  return merged_sketches
+
+
+def _keypoints_from_sketch(model_config, sketches, label_dtype):
+  """Calculates input and label keypoints from the given sketches.
+
+  Args:
+    model_config: Model config with the feature configs.
+    sketches: A dict from feature name to sketch as returned by
+      `_compute_keypoints_sketch` or `_merge_keypoints_sketches`.
+    label_dtype: Dtype of the label tensor.
+
+  Returns:
+    A dict from feature name to the list of keypoints.
+
+  Raises:
+    ValueError: If keypoints mode is invalid.
+  """
+  feature_keypoints = {}
+  for feature_name, sketch in six.iteritems(sketches):
+    num_keypoints, keypoints, clip_min, clip_max, _ = _keypoints_params(
+        model_config, feature_name)
+    if feature_name == _LABEL_FEATURE_NAME and label_dtype == tf.string:
+      # Default feature_values to [0, ... n_class-1] if string label.
+      sketch = premade_lib.compute_keypoints_sketch(
+          np.arange(len(sketch[0])), clip_min=clip_min, clip_max=clip_max)
+    feature_keypoints[feature_name] = premade_lib.compute_keypoints(
+        sketch,
+        num_keypoints=num_keypoints,
+        keypoints=keypoints,
+        feature_name=feature_name,
+        reduce_num_keypoints=(feature_name != _LABEL_FEATURE_NAME))
+  return feature_keypoints
+
+
 def _finalize_keypoints(model_config, config, feature_columns,
                         feature_analysis_input_fn, logits_output):
   """Calculates and sets keypoints for input and output calibration.
@@ -225,11 +432,24 @@ def _finalize_keypoints(model_config, config, feature_columns,
   Input and label keypoints are calculated, stored in a file and also set in the
   model_config to be used for model construction.
 
+  In a distributed setting with multiple workers, each worker (including the
+  chief) materializes the data returned by its feature_analysis_input_fn,
+  which is expected to read the shard of the data assigned to the worker, and
+  writes a partial sketch of the feature values to the model directory. The
+  chief merges the partial sketches into the final keypoints file, while other
+  workers wait for that file to be created. Other tasks (e.g. evaluators) only
+  wait for the final keypoints file. Workers remove their sketch file of an
+  earlier run before analyzing their data, and sketches are written with a
+  token identifying the run (see `_keypoints_sketch_token`) that is checked by
+  the chief when merging.
+
   Args:
     model_config: Model config to be updated.
     config: A `tf.RunConfig` to indicate if worker is chief.
     feature_columns: A list of FeatureColumn's to use for feature parsing.
     feature_analysis_input_fn: An input_fn used to collect feature statistics.
+      If it accepts a `config` argument, the `tf.RunConfig` is passed to it,
+      which can be used to shard the input among workers.
     logits_output: A boolean indicating if model outputs logits.
 
   Raises:
@@ -239,96 +459,65 @@ def _finalize_keypoints(model_config, config, feature_columns,
     return
 
   keypoints_filename = os.path.join(config.model_dir, _KEYPOINTS_FILE)
-  if ((config is None or config.is_chief) and
+  is_chief = config is None or config.is_chief
+  num_sketching_workers = 1
+  if (config is not None and config.num_worker_replicas > 1 and
+      config.task_type in _SKETCHING_TASK_TYPES):
+    num_sketching_workers = config.num_worker_replicas
+
+  feature_keypoints = None
+  if ((is_chief or num_sketching_workers > 1) and
       not tf.io.gfile.exists(keypoints_filename)):
+    if num_sketching_workers > 1:
+      sketch_token = _keypoints_sketch_token(model_config, config)
+      sketch_filename = os.path.join(
+          config.model_dir,
+          _KEYPOINTS_SKETCH_FILE_PATTERN.format(config.global_id_in_cluster))
+      # Removes the sketch of an earlier run of this worker.
+      if tf.io.gfile.exists(sketch_filename):
+        tf.io.gfile.remove(sketch_filename)
     with tf.Graph().as_default():
-      features, label = feature_analysis_input_fn()
+      features, label = _call_feature_analysis_input_fn(
+          feature_analysis_input_fn, config)
       features = transform_features(features, feature_columns)
       features[_LABEL_FEATURE_NAME] = label
       features = _materialize_locally(features)
 
-    feature_keypoints = {}
-    for feature_name, feature_values in six.iteritems(features):
-      feature_values = feature_values.flatten()
-
-      if feature_name == _LABEL_FEATURE_NAME:
-        # Default feature_values to [0, ... n_class-1] if string label.
-        if label.dtype == tf.string:
-          feature_values = np.arange(len(set(feature_values)))
-        num_keypoints = model_config.output_calibration_num_keypoints
-        keypoints = model_config.output_initialization
-        clip_min = model_config.output_min
-        clip_max = model_config.output_max
-        default_value = None
-      else:
-        feature_config = model_config.feature_config_by_name(feature_name)
-        if feature_config.num_buckets:
-          # Skip categorical features.
-          continue
-        num_keypoints = feature_config.pwl_calibration_num_keypoints
-        keypoints = feature_config.pwl_calibration_input_keypoints
-        clip_min = feature_config.pwl_calibration_clip_min
-        clip_max = feature_config.pwl_calibration_clip_max
-        default_value = feature_config.default_value
-
-      # Remove default values before calculating stats.
-      feature_values = feature_values[feature_values != default_value]
-
-      if np.isnan(feature_values).any():
-        raise ValueError(
-            'NaN values were observed for numeric feature `{}`. '
-            'Consider replacing the values in transform or input_fn.'.format(
-                feature_name))
-
-      # Before calculating keypoints, clip values as requested.
-      # Add min and max to the value list to make sure min/max in values match
-      # the requested range.
-      if clip_min is not None:
-        feature_values = np.maximum(feature_values, clip_min)
-        feature_values = np.append(feature_values, clip_min)
-      if clip_max is not None:
-        feature_values = np.minimum(feature_values, clip_max)
-        feature_values = np.append(feature_values, clip_max)
-
-      # Remove duplicate values before calculating stats.
-      feature_values = np.unique(feature_values)
-
-      if isinstance(keypoints, str):
-        if keypoints == 'quantiles':
-          if (feature_name != _LABEL_FEATURE_NAME and
-              feature_values.size < num_keypoints):
-            logging.info(
-                'Not enough unique values observed for feature `%s` to '
-                'construct %d keypoints for pwl calibration. Using %d unique '
-                'values as keypoints.', feature_name, num_keypoints,
-                feature_values.size)
-            num_keypoints = feature_values.size
-          quantiles = np.quantile(
-              feature_values,
-              np.linspace(0., 1., num_keypoints),
-              interpolation='nearest')
-          feature_keypoints[feature_name] = [float(x) for x in quantiles]
-        elif keypoints == 'uniform':
-          linspace = np.linspace(
-              np.min(feature_values), np.max(feature_values), num_keypoints)
-          feature_keypoints[feature_name] = [float(x) for x in linspace]
-        else:
-          raise ValueError(
-              'Invalid keypoint generation mode: {}'.format(keypoints))
-      else:
-        # Keypoints are explicitly provided in the config.
-        feature_keypoints[feature_name] = [float(x) for x in keypoints]
-
-    # Save keypoints to file as the chief worker.
-    tmp_keypoints_filename = keypoints_filename + 'tmp'
-    with tf.io.gfile.GFile(tmp_keypoints_filename, 'w') as keypoints_file:
-      keypoints_file.write(json.dumps(feature_keypoints, indent=2))
-    tf.io.gfile.rename(tmp_keypoints_filename, keypoints_filename)
-  else:
+    if num_sketching_workers == 1:
+      sketches = _compute_keypoints_sketch(model_config, features,
+                                           label.dtype)
+    else:
+      # Each worker writes a partial sketch of its shard of the data.
+      worker_sketches = _compute_keypoints_sketch(
+          model_config,
+          features,
+          label.dtype,
+          max_sketch_size=_MAX_KEYPOINTS_SKETCH_SIZE)
+      _write_json_file(sketch_filename, {
+          'token': sketch_token,
+          'sketches': worker_sketches
+      })
+      if is_chief:
+        # The chief merges the partial sketches of all workers.
+        all_worker_sketches = []
+        for worker_id in range(num_sketching_workers):
+          all_worker_sketches.append(
+              _poll_for_keypoints_sketch(
+                  os.path.join(config.model_dir,
+                               _KEYPOINTS_SKETCH_FILE_PATTERN.format(worker_id)),
+                  sketch_token))
+        sketches = _merge_keypoints_sketches(all_worker_sketches)
+
+    if is_chief:
+      feature_keypoints = _keypoints_from_sketch(model_config, sketches,
+                                                 label.dtype)
+      # Save keypoints to file as the chief worker.
+      _write_json_file(keypoints_filename, feature_keypoints)
+
+  if feature_keypoints is None:
     # Non-chief workers read the keypoints from file.
     _poll_for_file(keypoints_filename)
-    with tf.io.gfile.GFile(keypoints_filename) as keypoints_file:
-      feature_keypoints = json.loads(keypoints_file.read())
+    feature_keypoints = _read_json_file(keypoints_filename)
 
   if _LABEL_FEATURE_NAME in feature_keypoints:
     output_init = feature_keypoints.pop(_LABEL_FEATURE_NAME)
@@ -801,6 +990,10 @@ class CannedEstimator(estimator_lib.EstimatorV2):
         the model.
       feature_analysis_input_fn: An input_fn used to calculate statistics about
         features and labels in order to setup calibration keypoint and values.
+        In multi-worker training, each worker analyzes the data returned by
+        this input_fn and the chief merges the results, so it can return the
+        worker's shard of the data. If the input_fn has a `config` argument,
+        the `RunConfig` of the estimator is passed to it.
       prefitting_input_fn: An input_fn used in the pre fitting stage to estimate
         non-linear feature interactions. Required for crystals models.
         Prefitting typically uses the same dataset as the main training, but
@@ -925,6 +1118,10 @@ class CannedClassifier(estimator_lib.EstimatorV2):
         the model.
       feature_analysis_input_fn: An input_fn used to calculate statistics about
         features and labels in order to setup calibration keypoint and values.
+        In multi-worker training, each worker analyzes the data returned by
+        this input_fn and the chief merges the results, so it can return the
+        worker's shard of the data. If the input_fn has a `config` argument,
+        the `RunConfig` of the estimator is passed to it.
       prefitting_input_fn: An input_fn used in the pre fitting stage to estimate
         non-linear feature interactions. Required for crystals models.
         Prefitting typically uses the same dataset as the main training, but
@@ -1068,6 +1265,10 @@ class CannedRegressor(estimator_lib.EstimatorV2):
         the model.
       feature_analysis_input_fn: An input_fn used to calculate statistics about
         features and labels in order to setup calibration keypoint and values.
+        In multi-worker training, each worker analyzes the data returned by
+        this input_fn and the chief merges the results, so it can return the
+        worker's shard of the data. If the input_fn has a `config` argument,
+        the `RunConfig` of the estimator is passed to it.
       prefitting_input_fn: An input_fn used in the pre fitting stage to estimate
         non-linear feature interactions. Required for crystals models.
         Prefitting typically uses the same dataset as the main training, but
@@ -1448,6 +1649,44 @@ def get_model_graph(saved_model_path, tag='serve'):
       submodel_output_nodes[submodel_idx] = lattice_node
       nodes.append(lattice_node)
 
+    # Packed lattice weights.
+    # {PACKED_LATTICE_LAYER_NAME}_{group_idx}/{LATTICE_KERNEL_NAME}
+    packed_lattice_kernel_op_re = '^{}_(.*)/{}/Read/ReadVariableOp$'.format(
+        premade_lib.PACKED_LATTICE_LAYER_NAME,
+        lattice_layer.LATTICE_KERNEL_NAME,
+    )
+    for packed_lattice_kernel_op, group_idx in _match_op(
+        ops, packed_lattice_kernel_op_re):
+      packed_lattice_kernel = sess.run(
+          g.get_operation_by_name(packed_lattice_kernel_op).outputs[0])
+
+      # Lattice sizes.
+      # {PACKED_LATTICE_LAYER_NAME}_{group_idx}/{LATTICE_SIZES_NAME}
+      lattice_sizes_op_name = '{}_{}/{}'.format(
+          premade_lib.PACKED_LATTICE_LAYER_NAME, group_idx,
+          lattice_layer.LATTICE_SIZES_NAME)
+      lattice_sizes = sess.run(
+          g.get_operation_by_name(lattice_sizes_op_name).outputs[0]).flatten()
+
+      # Identity passthrough ops that pass each unit output to a submodel.
+      # {PACKED_LATTICE_PASSTHROUGH_NAME}_{group_idx}_{unit_idx}_{submodel_idx}
+      packed_lattice_passthrough_op_re = r'^{}_{}_(\d*)_(\d*)$'.format(
+          premade_lib.PACKED_LATTICE_PASSTHROUGH_NAME, group_idx)
+      for _, (unit_idx, submodel_idx) in _match_op(
+          ops, packed_lattice_passthrough_op_re):
+        weights = np.reshape(packed_lattice_kernel[:, int(unit_idx)],
+                             lattice_sizes)
+
+        # Sort input nodes by input index.
+        input_nodes = [
+            node for _, node in sorted(submodel_input_nodes[submodel_idx])
+        ]
+
+        lattice_node = model_info.LatticeNode(
+            input_nodes=input_nodes, weights=weights)
+        submodel_output_nodes[submodel_idx] = lattice_node
+        nodes.append(lattice_node)
+
     ###################
     # Create mean node.
     ###################
@@ -17,6 +17,10 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import json
+import multiprocessing
+import os
+
 from absl import logging
 from absl.testing import parameterized
 import numpy as np
@@ -30,6 +34,80 @@ from tensorflow_lattice.python import model_info
 from tensorflow_estimator.python.estimator.head import regression_head
 
 
+def _GetKeypointsAnalysisModelConfig():
+  return configs.CalibratedLatticeConfig(
+      feature_configs=[
+          configs.FeatureConfig(
+              name='x0', pwl_calibration_num_keypoints=8),
+          configs.FeatureConfig(
+              name='x1',
+              pwl_calibration_num_keypoints=5,
+              pwl_calibration_input_keypoints='uniform',
+              pwl_calibration_clip_max=0.5),
+          configs.FeatureConfig(
+              name='x2', pwl_calibration_num_keypoints=4, default_value=-1.0),
+      ],
+      output_calibration=True,
+      output_calibration_num_keypoints=6)
+
+
+def _GetKeypointsAnalysisInputFn(shard_index=0, num_shards=1):
+  """Returns an input_fn reading a shard of a synthetic dataset."""
+  rng = np.random.RandomState(42)
+  num_examples = 1000
+  x = {
+      'x0': rng.normal(size=num_examples),
+      'x1': rng.uniform(size=num_examples),
+      'x2': np.where(
+          rng.uniform(size=num_examples) < 0.2, -1.0,
+          rng.randint(0, 20, size=num_examples).astype(float)),
+  }
+  y = x['x0'] + x['x1']
+  shard = slice(shard_index, None, num_shards)
+  return tf.compat.v1.estimator.inputs.numpy_input_fn(
+      x={name: values[shard] for name, values in x.items()},
+      y=y[shard],
+      batch_size=64,
+      shuffle=False,
+      num_epochs=1)
+
+
+def _GetFinalizedKeypoints(model_config):
+  keypoints = {
+      feature_config.name: feature_config.pwl_calibration_input_keypoints
+      for feature_config in model_config.feature_configs
+  }
+  keypoints['__label__'] = model_config.output_initialization
+  return keypoints
+
+
+def _FinalizeKeypointsAsClusterTask(args):
+  """Runs feature analysis as a task in a local multi-worker cluster."""
+  task_type, task_index, cluster, model_dir = args
+  os.environ['TF_CONFIG'] = json.dumps({
+      'cluster': cluster,
+      'task': {
+          'type': task_type,
+          'index': task_index
+      },
+  })
+  estimators._POLL_INTERVAL_SECS = 0.1
+
+  def feature_analysis_input_fn(config):
+    return _GetKeypointsAnalysisInputFn(
+        shard_index=config.global_id_in_cluster,
+        num_shards=config.num_worker_replicas)()
+
+  model_config = _GetKeypointsAnalysisModelConfig()
+  estimators._finalize_keypoints(
+      model_config=model_config,
+      config=tf.estimator.RunConfig(model_dir=model_dir),
+      feature_columns=None,
+      feature_analysis_input_fn=feature_analysis_input_fn,
+      logits_output=False)
+  return _GetFinalizedKeypoints(model_config)
+
+
 class CannedEstimatorsTest(parameterized.TestCase, tf.test.TestCase):
 
   def setUp(self):
@@ -565,12 +643,13 @@ class CannedEstimatorsTest(parameterized.TestCase, tf.test.TestCase):
     self.assertLess(results['average_loss'], average_loss)
 
   @parameterized.parameters(
-      (5, 6, False, True),
-      (4, 5, True, False),
+      (5, 6, False, True, False),
+      (4, 5, True, False, False),
+      (5, 6, True, True, True),
   )
   def testCalibratedLatticeEnsembleModelInfo(self, num_lattices, lattice_rank,
                                              separate_calibrators,
-                                             output_calibration):
+                                             output_calibration, pack_lattices):
     self._ResetAllBackends()
     model_config = configs.CalibratedLatticeEnsembleConfig(
         feature_configs=self.heart_feature_configs,
@@ -578,6 +657,7 @@ class CannedEstimatorsTest(parameterized.TestCase, tf.test.TestCase):
         lattice_rank=lattice_rank,
         separate_calibrators=separate_calibrators,
         output_calibration=output_calibration,
+        pack_lattices=pack_lattices,
     )
     estimator = estimators.CannedClassifier(
         feature_columns=self.heart_feature_columns,
@@ -710,6 +790,53 @@ class CannedEstimatorsTest(parameterized.TestCase, tf.test.TestCase):
 
     self.assertLen(model.nodes, expected_num_nodes)
 
+  def testDistributedFeatureAnalysis(self):
+    # Keypoints calculated on a single worker using the full dataset.
+    model_config = _GetKeypointsAnalysisModelConfig()
+    estimators._finalize_keypoints(
+        model_config=model_config,
+        config=tf.estimator.RunConfig(
+            model_dir=os.path.join(self.get_temp_dir(), 'single')),
+        feature_columns=None,
+        feature_analysis_input_fn=_GetKeypointsAnalysisInputFn(),
+        logits_output=False)
+    expected_keypoints = _GetFinalizedKeypoints(model_config)
+
+    # Keypoints calculated by a chief and two workers, each using a shard of
+    # the dataset, running as separate processes that share the model_dir.
+    model_dir = os.path.join(self.get_temp_dir(), 'distributed')
+    cluster = {
+        'chief': ['localhost:2222'],
+        'worker': ['localhost:2223', 'localhost:2224'],
+    }
+    tasks = [('chief', 0, cluster, model_dir), ('worker', 0, cluster, model_dir),
+             ('worker', 1, cluster, model_dir)]
+    # Sketches left by an earlier run are not merged.
+    tf.io.gfile.makedirs(model_dir)
+    for worker_id in range(len(tasks)):
+      estimators._write_json_file(
+          os.path.join(model_dir, 'keypoints_sketch_{}.json'.format(worker_id)),
+          {
+              'token': 'stale',
+              'sketches': {
+                  'x0': [[100.0, 200.0], [1.0, 1.0]]
+              }
+          })
+    pool = multiprocessing.get_context('spawn').Pool(len(tasks))
+    try:
+      task_keypoints = pool.map(_FinalizeKeypointsAsClusterTask, tasks)
+    finally:
+      pool.close()
+      pool.join()
+
+    for keypoints in task_keypoints:
+      self.assertEqual(keypoints, expected_keypoints)
+    for worker_id in range(len(tasks)):
+      self.assertTrue(
+          tf.io.gfile.exists(
+              os.path.join(model_dir,
+                           'keypoints_sketch_{}.json'.format(worker_id))))
+
 
 if __name__ == '__main__':
   tf.test.main()
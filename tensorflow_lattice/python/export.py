@@ -0,0 +1,174 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Export of TFL models for mobile and embedded CPU scoring with TFLite.
+
+`to_tflite` converts a Keras model with TFL layers, such as a TFL premade
+model, into a TFLite flatbuffer that uses only builtin TFLite ops, so it can be
+run by the standard TFLite interpreter without the Flex delegate:
+
+- The model is traced in inference mode, so training-only logic such as lattice
+  dropout is not exported.
+- The lattice sizes constant kept by `tfl.layers.Lattice` for visualization and
+  passthrough (identity) nodes of premade models are removed by the converter.
+- Missing value handling of `tfl.layers.PWLCalibration` and default values of
+  `tfl.layers.CategoricalCalibration` are element-wise selects, which are
+  builtin ops.
+
+The model is converted from a traced function rather than from a SavedModel,
+so models with layers that can not be saved as a SavedModel, such as
+`tfl.layers.RTL`, are supported. Inputs of the exported model keep the names
+(e.g. `tfl_input_{feature_name}` for premade models) and order of the Keras
+model inputs. Inputs have shape `(batch_size, 1)` for premade models and the
+batch size is dynamic.
+
+With `quantize=True`, post-training dynamic range quantization stores kernels
+with at least 1024 elements, such as those of large lattices and packed
+lattice ensembles, as int8 with per-channel scales. Smaller kernels are kept in
+float. Rounding is monotonic, so quantized lattice kernels keep their
+(non-strict) monotonicity.
+
+```python
+tflite_model = tfl.export.to_tflite(model, quantize=True)
+with open('model.tflite', 'wb') as f:
+  f.write(tflite_model)
+
+scorer = tfl.export.TFLiteScorer(tflite_model)
+scores = scorer.predict(inputs)
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+
+def _input_name(model_input):
+  return model_input.name.split(':')[0]
+
+
+def to_tflite(model, quantize=False):
+  """Converts a Keras model with TFL layers into a TFLite model.
+
+  Args:
+    model: A Keras model, e.g. a `tfl.premade` model, with a single output.
+    quantize: Whether to apply post-training dynamic range (int8 weights)
+      quantization.
+
+  Returns:
+    The TFLite flatbuffer as bytes.
+
+  Raises:
+    ValueError: If the model has multiple outputs.
+    tf.lite ConverterError: If the model uses ops that are not TFLite builtins.
+  """
+  if len(model.outputs) != 1:
+    raise ValueError('to_tflite requires a model with a single output, '
+                     'got {}.'.format(len(model.outputs)))
+  input_signature = [
+      tf.TensorSpec(
+          model_input.shape, model_input.dtype, name=_input_name(model_input))
+      for model_input in model.inputs
+  ]
+
+  @tf.function(input_signature=input_signature)
+  def serve(*inputs):
+    inputs = list(inputs) if len(inputs) > 1 else inputs[0]
+    return model(inputs, training=False)
+
+  converter = tf.lite.TFLiteConverter.from_concrete_functions(
+      [serve.get_concrete_function()], model)
+  # Converts the frozen function directly, keeping the names and order of the
+  # inputs.
+  converter.experimental_lower_to_saved_model = False
+  converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+  if quantize:
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+  return converter.convert()
+
+
+class TFLiteScorer(object):
+  # pyformat: disable
+  """Scores examples with a TFLite model exported by `to_tflite`.
+
+  Attributes:
+    input_names: Names of the model inputs, in the order of the Keras model
+      inputs.
+
+  Example:
+
+  ```python
+  scorer = tfl.export.TFLiteScorer(tfl.export.to_tflite(model))
+  scores = scorer.predict(inputs)
+  ```
+  """
+  # pyformat: enable
+
+  def __init__(self, model_content, num_threads=None):
+    """Initializes a `TFLiteScorer` instance.
+
+    Args:
+      model_content: TFLite flatbuffer returned by `to_tflite`.
+      num_threads: Number of threads used by the interpreter.
+    """
+    self._interpreter = tf.lite.Interpreter(
+        model_content=model_content, num_threads=num_threads)
+    self._input_details = self._interpreter.get_input_details()
+    self._output_index = self._interpreter.get_output_details()[0]['index']
+    self.input_names = [details['name'] for details in self._input_details]
+    self._input_shapes = None
+
+  def predict(self, inputs):
+    """Returns model outputs.
+
+    Args:
+      inputs: List of model inputs in the order of `input_names`, or a dict
+        from input names to inputs. A single input can be given as an array.
+
+    Returns:
+      Model outputs as a numpy array.
+
+    Raises:
+      ValueError: If inputs do not match the model inputs.
+    """
+    if isinstance(inputs, dict):
+      unknown_names = set(inputs) - set(self.input_names)
+      missing_names = set(self.input_names) - set(inputs)
+      if unknown_names or missing_names:
+        raise ValueError('Unknown inputs: {}, missing inputs: {}'.format(
+            sorted(unknown_names), sorted(missing_names)))
+      inputs = [inputs[name] for name in self.input_names]
+    elif len(self.input_names) == 1 and not isinstance(inputs, (list, tuple)):
+      inputs = [inputs]
+    if len(inputs) != len(self.input_names):
+      raise ValueError('Expected {} inputs, got {}.'.format(
+          len(self.input_names), len(inputs)))
+    inputs = [
+        np.asarray(value, dtype=details['dtype'])
+        for value, details in zip(inputs, self._input_details)
+    ]
+
+    # Tensors are only reallocated when the input shapes change.
+    input_shapes = [value.shape for value in inputs]
+    if input_shapes != self._input_shapes:
+      for value, details in zip(inputs, self._input_details):
+        self._interpreter.resize_tensor_input(details['index'], value.shape)
+      self._interpreter.allocate_tensors()
+      self._input_shapes = input_shapes
+    for value, details in zip(inputs, self._input_details):
+      self._interpreter.set_tensor(details['index'], value)
+    self._interpreter.invoke()
+    return self._interpreter.get_tensor(self._output_index)
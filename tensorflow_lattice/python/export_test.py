@@ -0,0 +1,178 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL TFLite export."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import export
+from tensorflow_lattice.python import lattice_layer
+from tensorflow_lattice.python import linear_layer
+from tensorflow_lattice.python import pwl_calibration_layer
+from tensorflow_lattice.python import rtl_layer
+from tensorflow_lattice.python import test_utils
+
+_FEATURE_CONFIGS = [
+    configs.FeatureConfig(
+        name='numerical_1',
+        lattice_size=3,
+        monotonicity='increasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+    ),
+    configs.FeatureConfig(
+        name='numerical_2',
+        lattice_size=2,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+        default_value=-1.0,
+    ),
+    configs.FeatureConfig(
+        name='categorical',
+        lattice_size=2,
+        num_buckets=4,
+        default_value=-1,
+    ),
+    configs.FeatureConfig(
+        name='numerical_3',
+        lattice_size=3,
+        monotonicity='decreasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=6),
+    ),
+]
+
+_LATTICES = [['numerical_1', 'categorical'], ['numerical_1', 'numerical_2'],
+             ['numerical_2', 'categorical', 'numerical_3'],
+             ['numerical_3', 'numerical_1']]
+
+
+def _inputs(num_examples):
+  rng = np.random.RandomState(1)
+  numerical_2 = rng.uniform(-0.2, 1.2, size=[num_examples, 1])
+  numerical_2[rng.uniform(size=num_examples) < 0.1] = -1.0
+  return [
+      rng.uniform(-0.2, 1.2, size=[num_examples, 1]),
+      numerical_2,
+      rng.randint(-1, 4, size=[num_examples, 1]),
+      rng.uniform(-0.2, 1.2, size=[num_examples, 1]),
+  ]
+
+
+class ExportTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _Model(self, model_type):
+    return test_utils.premade_model(
+        model_type,
+        _FEATURE_CONFIGS,
+        lattices=_LATTICES,
+        output_calibration=True,
+        output_calibration_num_keypoints=5,
+        output_initialization=[-1.0, 1.0])
+
+  @parameterized.parameters('linear', 'lattice', 'ensemble', 'packed_ensemble')
+  def testPremadeParity(self, model_type):
+    model = self._Model(model_type)
+    scorer = export.TFLiteScorer(export.to_tflite(model))
+    self.assertEqual(scorer.input_names, [
+        'tfl_input_{}'.format(feature_config.name)
+        for feature_config in _FEATURE_CONFIGS
+    ])
+    inputs = _inputs(200)
+    expected = model.predict(inputs, verbose=0)
+    self.assertAllClose(scorer.predict(inputs), expected, atol=1e-5)
+    # Batch size is dynamic.
+    self.assertAllClose(
+        scorer.predict([value[:1] for value in inputs]),
+        expected[:1],
+        atol=1e-5)
+    self.assertAllClose(
+        scorer.predict(dict(zip(scorer.input_names, inputs))),
+        expected,
+        atol=1e-5)
+
+  @parameterized.parameters('lattice', 'rtl')
+  def testLayersParity(self, layer_type):
+    inputs = tf.keras.Input(shape=(3,))
+    calibrated = pwl_calibration_layer.PWLCalibration(
+        input_keypoints=np.linspace(0.0, 1.0, num=5),
+        units=3,
+        output_min=0.0,
+        output_max=2.0,
+        monotonicity='increasing')(
+            inputs)
+    if layer_type == 'lattice':
+      outputs = lattice_layer.Lattice(
+          lattice_sizes=[3, 3, 3], units=1, monotonicities=[1, 1, 0])(
+              calibrated)
+    else:
+      lattice_outputs = rtl_layer.RTL(
+          num_lattices=4, lattice_rank=2, lattice_size=3)({
+              'increasing': calibrated
+          })
+      outputs = linear_layer.Linear(
+          num_input_dims=4, monotonicities='increasing')(
+              lattice_outputs)
+    model = tf.keras.Model(inputs=inputs, outputs=outputs)
+    test_utils.randomize_weights(model.trainable_weights)
+    values = np.random.RandomState(2).uniform(size=[100, 3])
+    scorer = export.TFLiteScorer(export.to_tflite(model))
+    self.assertAllClose(
+        scorer.predict(values), model.predict(values, verbose=0), atol=1e-5)
+
+  def testQuantization(self):
+    feature_configs = [
+        configs.FeatureConfig(
+            name='feature_{}'.format(index),
+            lattice_size=4,
+            monotonicity='increasing',
+            pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=8))
+        for index in range(5)
+    ]
+    # The lattice kernel has 4^5 = 1024 elements and is quantized.
+    model = test_utils.premade_model(
+        'lattice', feature_configs, output_initialization=[0.0, 1.0])
+    float_model = export.to_tflite(model)
+    quantized_model = export.to_tflite(model, quantize=True)
+    self.assertLess(len(quantized_model), len(float_model))
+    interpreter = tf.lite.Interpreter(model_content=quantized_model)
+    self.assertIn(np.int8, [
+        details['dtype'] for details in interpreter.get_tensor_details()
+    ])
+
+    inputs = list(np.random.RandomState(3).uniform(size=[5, 500, 1]))
+    self.assertAllClose(
+        export.TFLiteScorer(quantized_model).predict(inputs),
+        model.predict(inputs, verbose=0),
+        atol=2e-2)
+
+  def testInvalidArguments(self):
+    scorer = export.TFLiteScorer(export.to_tflite(self._Model('lattice')))
+    with self.assertRaises(ValueError):
+      scorer.predict(_inputs(3)[:2])
+    with self.assertRaises(ValueError):
+      scorer.predict({'unknown': np.zeros([3, 1])})
+    inputs = tf.keras.Input(shape=(1,))
+    model = tf.keras.Model(
+        inputs=inputs,
+        outputs=[tf.keras.layers.Dense(1)(inputs),
+                 tf.keras.layers.Dense(1)(inputs)])
+    with self.assertRaises(ValueError):
+      export.to_tflite(model)
+
+
+if __name__ == '__main__':
+  tf.test.main()
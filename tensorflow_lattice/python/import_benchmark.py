@@ -0,0 +1,149 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Import time and memory benchmarks for the TFL package.
+
+Each benchmark imports TFL (and optionally accesses some of its submodules) in
+a fresh Python interpreter and measures the import wall time and the peak
+resident memory of the process. Importing TensorFlow alone is measured as the
+baseline. Heavy submodules (estimators, visualization and test_utils) are only
+imported on first access, so `import tensorflow_lattice` followed by use of
+`tfl.layers` should be close to the baseline. Run with:
+
+```shell
+python -m tensorflow_lattice.python.import_benchmark --benchmark_filter=. \
+    --num_runs=5
+```
+
+Each benchmark result is reported using `tf.test.Benchmark.report_benchmark`
+with the median import time as wall time and the median peak memory, as well as
+whether matplotlib or tf.estimator got imported, as extras.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import subprocess
+import sys
+
+from absl import flags
+import numpy as np
+import tensorflow as tf
+
+flags.DEFINE_integer('num_runs', 5,
+                     'Number of fresh interpreters used for each benchmark.')
+
+FLAGS = flags.FLAGS
+
+# Modules whose presence in sys.modules indicates that heavy dependencies were
+# imported.
+_HEAVY_MODULES = {
+    'loads_matplotlib': 'matplotlib',
+    'loads_estimator': 'tensorflow_estimator',
+}
+
+# Executed in a fresh interpreter. Prints the measurements as JSON.
+_CHILD_TEMPLATE = """
+import json
+import resource
+import sys
+import time
+start = time.time()
+{statement}
+import_time = time.time() - start
+max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+max_rss_mb = max_rss / (2.0**20 if sys.platform == 'darwin' else 2.0**10)
+print(json.dumps({{
+    'import_time': import_time,
+    'max_rss_mb': max_rss_mb,
+    'modules': {modules!r},
+    'loaded': [m for m in {modules!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_import(statement):
+  """Runs statement in a fresh interpreter and returns its measurements.
+
+  Args:
+    statement: Python code importing modules, e.g. 'import tensorflow_lattice'.
+
+  Returns:
+    A dict with the import time in seconds ('import_time'), the peak resident
+    memory of the process in MB ('max_rss_mb') and a bool for each of the heavy
+    dependencies indicating whether they got imported (e.g. 'loads_matplotlib').
+
+  Raises:
+    ValueError: If the statement fails.
+  """
+  code = _CHILD_TEMPLATE.format(
+      statement=statement, modules=sorted(_HEAVY_MODULES.values()))
+  process = subprocess.Popen([sys.executable, '-c', code],
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+  stdout, stderr = process.communicate()
+  if process.returncode != 0:
+    raise ValueError('Failed to run {!r}: {}'.format(
+        statement, stderr.decode('utf-8', 'replace')))
+  child_result = json.loads(stdout.decode('utf-8').strip().splitlines()[-1])
+  result = {
+      'import_time': child_result['import_time'],
+      'max_rss_mb': child_result['max_rss_mb'],
+  }
+  for key, module in _HEAVY_MODULES.items():
+    result[key] = module in child_result['loaded']
+  return result
+
+
+class ImportBenchmark(tf.test.Benchmark):
+  """Import time and memory benchmarks for the TFL package."""
+
+  def _run_import_benchmark(self, name, statement):
+    results = [measure_import(statement) for _ in range(FLAGS.num_runs)]
+    extras = {
+        'max_rss_mb': np.median([result['max_rss_mb'] for result in results]),
+    }
+    for key in _HEAVY_MODULES:
+      extras[key] = any(result[key] for result in results)
+    import_time = np.median([result['import_time'] for result in results])
+    self.report_benchmark(
+        iters=FLAGS.num_runs, wall_time=import_time, name=name, extras=extras)
+    return import_time, extras
+
+  def benchmarkImportTensorFlow(self):
+    self._run_import_benchmark('import_tensorflow', 'import tensorflow')
+
+  def benchmarkImportTFL(self):
+    self._run_import_benchmark('import_tfl', 'import tensorflow_lattice')
+
+  def benchmarkImportTFLLayers(self):
+    self._run_import_benchmark(
+        'import_tfl_layers',
+        'import tensorflow_lattice as tfl; tfl.layers.Lattice')
+
+  def benchmarkImportTFLEstimators(self):
+    self._run_import_benchmark(
+        'import_tfl_estimators',
+        'import tensorflow_lattice as tfl; tfl.estimators.CannedClassifier')
+
+  def benchmarkImportTFLVisualization(self):
+    self._run_import_benchmark(
+        'import_tfl_visualization',
+        'import tensorflow_lattice as tfl; tfl.visualization.draw_model_graph')
+
+
+if __name__ == '__main__':
+  tf.test.main()
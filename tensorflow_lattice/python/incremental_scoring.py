@@ -0,0 +1,206 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Incremental re-scoring of TFL premade models when features change.
+
+When only a few features of an entity change, e.g. in streaming applications,
+most of the calibrator and lattice outputs of a lattice ensemble stay the same.
+`IncrementalScorer` keeps the calibrated features and the outputs of each
+submodel for a set of entities, and an inverted index from features to the
+submodels that use them. When features of some entities are updated, only
+their calibrators and the submodels using them are evaluated, and the sum of
+submodel outputs is adjusted by the difference between their new and old
+outputs. Output calibration is then applied to the updated average.
+
+```python
+scorer = tfl.incremental_scoring.IncrementalScorer(model)
+scores = scorer.score(inputs)
+new_scores = scorer.update({'price': [[9.99]]}, indices=[entity_index])
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from . import premade_lib
+import numpy as np
+import tensorflow as tf
+
+
+class IncrementalScorer(object):
+  # pyformat: disable
+  """Scores entities and re-scores them when some of their features change.
+
+  Attributes:
+    - All `__init__` arguments.
+    feature_names: Names of the model features, in the order of model inputs.
+    feature_submodels: A dict from feature names to the indices of the
+      submodels (lattices) using the feature.
+    num_entities: Number of scored entities, or None if `score` has not been
+      called.
+
+  Example:
+
+  ```python
+  scorer = tfl.incremental_scoring.IncrementalScorer(model)
+  scorer.score(inputs)
+  scorer.update({'feature_1': new_values}, indices=updated_entities)
+  ```
+  """
+  # pyformat: enable
+
+  def __init__(self, model):
+    """Initializes an `IncrementalScorer` instance.
+
+    Args:
+      model: A `tfl.premade.CalibratedLinear`, `tfl.premade.CalibratedLattice`
+        or `tfl.premade.CalibratedLatticeEnsemble` model.
+
+    Raises:
+      ValueError: If the model is not supported.
+    """
+    if getattr(model, 'model_config', None) is None:
+      raise ValueError('IncrementalScorer requires a premade model.')
+    self.model = model
+    self._submodels, self._average = premade_lib.premade_submodels(model)
+    model_config = model.model_config
+    self.feature_names = [
+        feature_config.name for feature_config in model_config.feature_configs
+    ]
+    self._input_dtypes = dict(
+        zip(self.feature_names,
+            [model_input.dtype for model_input in model.inputs]))
+    self._calibration_layers = {
+        feature_name: model.get_layer('{}_{}'.format(
+            premade_lib.CALIB_LAYER_NAME, feature_name))
+        for feature_name in self.feature_names
+    }
+    self._output_calibration = None
+    if model_config.output_calibration:
+      self._output_calibration = model.get_layer(
+          premade_lib.OUTPUT_CALIB_LAYER_NAME)
+
+    self.feature_submodels = {
+        feature_name: [] for feature_name in self.feature_names
+    }
+    for submodel_index, submodel in enumerate(self._submodels):
+      for feature_name in set(submodel.feature_names):
+        self.feature_submodels[feature_name].append(submodel_index)
+
+    self.num_entities = None
+    self._calibrated = None
+    self._submodel_outputs = None
+    self._sum = None
+
+  def _calibrate(self, feature_name, values):
+    values = np.reshape(values, [-1, 1])
+    return np.array(self._calibration_layers[feature_name](tf.constant(
+        values, dtype=self._input_dtypes[feature_name])))
+
+  def _evaluate_submodel(self, submodel_index, indices):
+    submodel = self._submodels[submodel_index]
+    inputs = [
+        self._calibrated[feature_name][indices, unit:unit + 1]
+        for feature_name, unit in zip(submodel.feature_names,
+                                      submodel.calibration_units)
+    ]
+    return np.asarray(premade_lib.evaluate_submodel(submodel, inputs))[:, 0]
+
+  def _outputs(self, indices):
+    """Returns model outputs of the entities from the sum of submodels."""
+    outputs = self._sum[indices]
+    if self._average:
+      outputs = outputs / len(self._submodels)
+    outputs = tf.constant(
+        outputs[:, np.newaxis], dtype=self.model.outputs[0].dtype)
+    if self._output_calibration is not None:
+      outputs = self._output_calibration(outputs)
+    return np.asarray(outputs)
+
+  def score(self, inputs):
+    """Scores entities and keeps their state for later updates.
+
+    Replaces any previously scored entities.
+
+    Args:
+      inputs: List of model inputs, one array of shape `(num_entities, 1)` per
+        feature.
+
+    Returns:
+      Model outputs of shape `(num_entities, 1)`.
+
+    Raises:
+      ValueError: If the number of inputs does not match the model.
+    """
+    if len(inputs) != len(self.feature_names):
+      raise ValueError('Expected {} inputs, got {}.'.format(
+          len(self.feature_names), len(inputs)))
+    self.num_entities = len(inputs[0])
+    self._calibrated = {
+        feature_name: self._calibrate(feature_name, values)
+        for feature_name, values in zip(self.feature_names, inputs)
+    }
+    all_entities = np.arange(self.num_entities)
+    self._submodel_outputs = np.stack([
+        self._evaluate_submodel(submodel_index, all_entities)
+        for submodel_index in range(len(self._submodels))
+    ],
+                                      axis=1).astype(np.float64)
+    self._sum = np.sum(self._submodel_outputs, axis=1)
+    return self._outputs(all_entities)
+
+  def update(self, features, indices=None):
+    """Updates features of scored entities and returns their new scores.
+
+    Only the calibrators of the updated features and the submodels using them
+    are evaluated.
+
+    Args:
+      features: A dict from feature names to new values, each of shape
+        `(len(indices), 1)`.
+      indices: Indices of the updated entities, in the order of `score` inputs.
+        All entities are updated if not given.
+
+    Returns:
+      New model outputs of the updated entities, of shape `(len(indices), 1)`.
+
+    Raises:
+      ValueError: If no entities have been scored or feature names are unknown.
+    """
+    if self.num_entities is None:
+      raise ValueError('score must be called before update.')
+    unknown_features = set(features) - set(self.feature_names)
+    if unknown_features:
+      raise ValueError('Unknown features: {}'.format(sorted(unknown_features)))
+    if indices is None:
+      indices = np.arange(self.num_entities)
+    indices = np.asarray(indices, dtype=np.int64)
+
+    touched_submodels = set()
+    for feature_name, values in features.items():
+      self._calibrated[feature_name][indices] = self._calibrate(
+          feature_name, values)
+      touched_submodels.update(self.feature_submodels[feature_name])
+    for submodel_index in sorted(touched_submodels):
+      outputs = self._evaluate_submodel(submodel_index, indices)
+      self._sum[indices] += outputs - self._submodel_outputs[indices,
+                                                             submodel_index]
+      self._submodel_outputs[indices, submodel_index] = outputs
+    return self._outputs(indices)
+
+  def scores(self):
+    """Returns current model outputs of all entities."""
+    if self.num_entities is None:
+      raise ValueError('score must be called before scores.')
+    return self._outputs(np.arange(self.num_entities))
@@ -0,0 +1,137 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL incremental scoring."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import incremental_scoring
+from tensorflow_lattice.python import test_utils
+
+_FEATURE_CONFIGS = [
+    configs.FeatureConfig(
+        name='numerical_1',
+        lattice_size=3,
+        monotonicity='increasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+    ),
+    configs.FeatureConfig(
+        name='numerical_2',
+        lattice_size=2,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+    ),
+    configs.FeatureConfig(
+        name='categorical',
+        lattice_size=2,
+        num_buckets=3,
+    ),
+    configs.FeatureConfig(
+        name='numerical_3',
+        lattice_size=3,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+    ),
+]
+
+_LATTICES = [['numerical_1', 'categorical'], ['numerical_1', 'numerical_2'],
+             ['numerical_2', 'categorical', 'numerical_3'],
+             ['numerical_3', 'numerical_2']]
+
+
+def _inputs(rng, num_examples):
+  return [
+      rng.uniform(size=[num_examples, 1]),
+      rng.uniform(size=[num_examples, 1]),
+      rng.randint(0, 3, size=[num_examples, 1]),
+      rng.uniform(size=[num_examples, 1]),
+  ]
+
+
+class IncrementalScoringTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _Model(self, model_type, output_calibration):
+    return test_utils.premade_model(
+        model_type,
+        _FEATURE_CONFIGS,
+        lattices=_LATTICES,
+        output_calibration=output_calibration,
+        output_calibration_num_keypoints=5,
+        output_initialization=[-1.0, 1.0])
+
+  @parameterized.parameters(
+      ('linear', True),
+      ('lattice', False),
+      ('ensemble', True),
+      ('shared_ensemble', False),
+      ('packed_ensemble', True),
+  )
+  def testUpdates(self, model_type, output_calibration):
+    model = self._Model(model_type, output_calibration)
+    scorer = incremental_scoring.IncrementalScorer(model)
+    rng = np.random.RandomState(1)
+    inputs = _inputs(rng, 50)
+    self.assertAllClose(
+        scorer.score(inputs), model.predict(inputs, verbose=0), atol=1e-5)
+
+    for step in range(20):
+      num_updated = 1 + step % 3
+      indices = rng.choice(50, size=num_updated, replace=False)
+      new_values = _inputs(rng, num_updated)
+      updated_features = rng.choice(4, size=1 + step % 2, replace=False)
+      for feature_index in updated_features:
+        inputs[feature_index][indices] = new_values[feature_index]
+      scores = scorer.update(
+          {
+              scorer.feature_names[feature_index]: new_values[feature_index]
+              for feature_index in updated_features
+          },
+          indices=indices)
+      expected = model.predict(inputs, verbose=0)
+      self.assertAllClose(scores, expected[indices], atol=1e-5)
+    self.assertAllClose(scorer.scores(), expected, atol=1e-5)
+
+  def testFeatureSubmodels(self):
+    scorer = incremental_scoring.IncrementalScorer(
+        self._Model('ensemble', False))
+    self.assertEqual(
+        scorer.feature_submodels, {
+            'numerical_1': [0, 1],
+            'numerical_2': [1, 2, 3],
+            'categorical': [0, 2],
+            'numerical_3': [2, 3],
+        })
+
+  def testInvalidArguments(self):
+    scorer = incremental_scoring.IncrementalScorer(
+        self._Model('lattice', False))
+    with self.assertRaises(ValueError):
+      scorer.update({'numerical_1': [[0.5]]})
+    scorer.score(_inputs(np.random.RandomState(2), 3))
+    with self.assertRaises(ValueError):
+      scorer.update({'unknown': [[0.5]]})
+    with self.assertRaises(ValueError):
+      scorer.score([np.zeros([3, 1])])
+    inputs = tf.keras.Input(shape=(1,))
+    keras_model = tf.keras.Model(
+        inputs=inputs, outputs=tf.keras.layers.Dense(1)(inputs))
+    with self.assertRaises(ValueError):
+      incremental_scoring.IncrementalScorer(keras_model)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,301 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Cached lattice interpolation for training lattices with frozen calibrators.
+
+When input calibrators are frozen, e.g. in a second training stage in which
+only the lattices are tuned, the calibrated inputs of every example do not
+change between epochs. Neither do the lattice vertices used to interpolate each
+example and their interpolation weights. Only the lattice kernels change.
+
+`InterpolationCache` computes, once, the `2^rank` vertex indices and weights of
+each example for each lattice of a premade model, and stores them in memory or
+as memory-mapped numpy files. Lattice kernels (and the output calibrator) are
+then trained directly from the cache: the output of a lattice is a gather of
+its kernel at the cached indices weighted by the cached weights, so input
+calibration and interpolation are skipped.
+
+```python
+for feature_config in model_config.feature_configs:
+  model.get_layer('tfl_calib_' + feature_config.name).trainable = False
+cache = tfl.interpolation_cache.InterpolationCache(
+    model, inputs, directory='/tmp/cache')
+cache.fit(labels, epochs=100, batch_size=256)
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+from . import configs
+from . import lattice_lib
+from . import premade_lib
+import numpy as np
+import tensorflow as tf
+
+
+class InterpolationCache(object):
+  # pyformat: disable
+  """Interpolation vertices and weights of the lattices of a premade model.
+
+  The cache is only valid as long as the input calibrators of the model do not
+  change.
+
+  Attributes:
+    - All `__init__` arguments.
+    num_examples: Number of cached examples.
+
+  Example:
+
+  ```python
+  cache = tfl.interpolation_cache.InterpolationCache(model, inputs)
+  cache.fit(labels, epochs=10)
+  ```
+  """
+  # pyformat: enable
+
+  def __init__(self, model, inputs=None, directory=None, batch_size=10000):
+    """Initializes an `InterpolationCache` instance.
+
+    Args:
+      model: A `tfl.premade.CalibratedLattice` or
+        `tfl.premade.CalibratedLatticeEnsemble` model.
+      inputs: List of model inputs, one array of shape `(num_examples, 1)` per
+        feature. If None, the cache is loaded from `directory`.
+      directory: Optional directory in which the cache is stored as numpy files,
+        which are memory-mapped. The cache is kept in memory if not given.
+      batch_size: Number of examples calibrated at once when building the
+        cache.
+
+    Raises:
+      ValueError: If the model is not supported, or if neither inputs nor a
+        directory are given.
+    """
+    model_config = getattr(model, 'model_config', None)
+    if not isinstance(model_config, (configs.CalibratedLatticeConfig,
+                                     configs.CalibratedLatticeEnsembleConfig)):
+      raise ValueError('InterpolationCache requires a CalibratedLattice or '
+                       'CalibratedLatticeEnsemble premade model.')
+    if inputs is None and directory is None:
+      raise ValueError('Either inputs or a directory must be given.')
+    self.model = model
+    self.directory = directory
+    self.batch_size = batch_size
+    self._submodels, self._average = premade_lib.premade_submodels(model)
+    self._output_calibration = None
+    if model_config.output_calibration:
+      self._output_calibration = model.get_layer(
+          premade_lib.OUTPUT_CALIB_LAYER_NAME)
+    if inputs is None:
+      self._indices, self._weights = self._load()
+    else:
+      self._indices, self._weights = self._build(inputs)
+    self.num_examples = self._indices[0].shape[0]
+
+  def _paths(self, submodel_index):
+    return (os.path.join(self.directory,
+                         'lattice_{}_indices.npy'.format(submodel_index)),
+            os.path.join(self.directory,
+                         'lattice_{}_weights.npy'.format(submodel_index)))
+
+  def _load(self):
+    indices, weights = [], []
+    for submodel_index in range(len(self._submodels)):
+      indices_path, weights_path = self._paths(submodel_index)
+      indices.append(np.load(indices_path, mmap_mode='r'))
+      weights.append(np.load(weights_path, mmap_mode='r'))
+    return indices, weights
+
+  def _build(self, inputs):
+    """Computes the cache, writing it to the directory if given."""
+    num_examples = len(inputs[0])
+    indices, weights = [], []
+    for submodel_index, submodel in enumerate(self._submodels):
+      shape = (num_examples, 2**len(submodel.feature_names))
+      if self.directory is None:
+        indices.append(np.empty(shape, dtype=np.int32))
+        weights.append(np.empty(shape, dtype=np.float32))
+      else:
+        tf.io.gfile.makedirs(self.directory)
+        indices_path, weights_path = self._paths(submodel_index)
+        indices.append(
+            np.lib.format.open_memmap(
+                indices_path, mode='w+', dtype=np.int32, shape=shape))
+        weights.append(
+            np.lib.format.open_memmap(
+                weights_path, mode='w+', dtype=np.float32, shape=shape))
+
+    feature_names = [
+        feature_config.name
+        for feature_config in self.model.model_config.feature_configs
+    ]
+    calibration_layers = {
+        name: self.model.get_layer('{}_{}'.format(premade_lib.CALIB_LAYER_NAME,
+                                                  name))
+        for name in feature_names
+    }
+    for start in range(0, num_examples, self.batch_size):
+      calibrated = {}
+      for feature_name, values, model_input in zip(feature_names, inputs,
+                                                   self.model.inputs):
+        values = np.reshape(values[start:start + self.batch_size], [-1, 1])
+        calibrated[feature_name] = np.asarray(calibration_layers[feature_name](
+            tf.constant(values, dtype=model_input.dtype)))
+      for submodel_index, submodel in enumerate(self._submodels):
+        lattice_inputs = np.stack([
+            calibrated[feature_name][:, unit] for feature_name, unit in zip(
+                submodel.feature_names, submodel.calibration_units)
+        ],
+                                  axis=1)
+        batch_indices, batch_weights = (
+            lattice_lib.compute_interpolation_corners(
+                tf.constant(lattice_inputs),
+                submodel.layer.lattice_sizes,
+                clip_inputs=submodel.layer.clip_inputs))
+        indices[submodel_index][start:start + self.batch_size] = batch_indices
+        weights[submodel_index][start:start + self.batch_size] = batch_weights
+    for submodel_indices, submodel_weights in zip(indices, weights):
+      if isinstance(submodel_indices, np.memmap):
+        submodel_indices.flush()
+        submodel_weights.flush()
+    return indices, weights
+
+  def _trained_layers(self):
+    """Returns the trainable lattice and output calibration layers."""
+    layers = []
+    for submodel in self._submodels:
+      if submodel.layer.trainable and submodel.layer not in layers:
+        layers.append(submodel.layer)
+    if (self._output_calibration is not None and
+        self._output_calibration.trainable):
+      layers.append(self._output_calibration)
+    return layers
+
+  def _outputs(self, indices, weights):
+    """Returns model outputs computed from cached vertices and weights."""
+    outputs = []
+    for submodel, submodel_indices, submodel_weights in zip(
+        self._submodels, indices, weights):
+      kernel = submodel.layer.kernel[:, submodel.unit]
+      outputs.append(
+          tf.reduce_sum(
+              tf.gather(kernel, submodel_indices) * submodel_weights, axis=1))
+    output = tf.add_n(outputs)
+    if self._average:
+      output /= len(self._submodels)
+    output = output[:, tf.newaxis]
+    if self._output_calibration is not None:
+      output = self._output_calibration(output)
+    return output
+
+  def _batches(self, batch_order, batch_size):
+    """Yields slices of the cache in the given order of batches."""
+    for batch_index in batch_order:
+      start = batch_index * batch_size
+      batch = slice(start, start + batch_size)
+      yield batch, ([tf.constant(indices[batch]) for indices in self._indices],
+                    [tf.constant(weights[batch]) for weights in self._weights])
+
+  def predict(self):
+    """Returns model outputs for the cached examples, of shape `(n, 1)`."""
+    num_batches = -(-self.num_examples // self.batch_size)
+    return np.concatenate([
+        np.asarray(self._outputs(indices, weights))
+        for _, (indices, weights) in self._batches(
+            range(num_batches), self.batch_size)
+    ])
+
+  def fit(self,
+          labels,
+          epochs=1,
+          batch_size=None,
+          optimizer='adam',
+          loss='mse',
+          sample_weights=None,
+          shuffle=True,
+          seed=None):
+    """Trains lattice kernels and the output calibrator from the cache.
+
+    Input calibrators are not used. Weight constraints are applied after each
+    step and regularization losses of the trained layers are added to the
+    loss, as in `model.fit`.
+
+    Args:
+      labels: Array of shape `(num_examples,)` or `(num_examples, 1)`.
+      epochs: Number of passes over the cached examples.
+      batch_size: Number of examples in each step. Defaults to the batch size
+        of the cache.
+      optimizer: A `tf.keras.optimizers.Optimizer` or its name.
+      loss: A `tf.keras.losses.Loss` or its name.
+      sample_weights: Optional array of shape `(num_examples,)`.
+      shuffle: If the order of batches is shuffled for each epoch. Examples
+        within a batch stay together so that memory-mapped caches are read
+        sequentially.
+      seed: Random seed used for shuffling.
+
+    Returns:
+      A list with the average training loss of each epoch.
+    """
+    if batch_size is None:
+      batch_size = self.batch_size
+    optimizer = tf.keras.optimizers.get(optimizer)
+    loss_fn = tf.keras.losses.get(loss)
+    layers = self._trained_layers()
+    variables = [
+        variable for layer in layers for variable in layer.trainable_weights
+    ]
+    dtype = self.model.outputs[0].dtype
+    labels = np.reshape(labels, [-1, 1])
+    if sample_weights is None:
+      sample_weights = np.ones([self.num_examples])
+
+    @tf.function(reduce_retracing=True)
+    def train_step(indices, weights, batch_labels, batch_sample_weights):
+      with tf.GradientTape() as tape:
+        outputs = self._outputs(indices, weights)
+        step_loss = loss_fn(batch_labels, outputs)
+        step_loss = tf.reduce_sum(step_loss * batch_sample_weights) / (
+            tf.reduce_sum(batch_sample_weights))
+        regularization_losses = [
+            loss for layer in layers for loss in layer.losses
+        ]
+        total_loss = step_loss
+        if regularization_losses:
+          total_loss += tf.add_n(regularization_losses)
+      gradients = tape.gradient(total_loss, variables)
+      optimizer.apply_gradients(zip(gradients, variables))
+      for variable in variables:
+        if variable.constraint is not None:
+          variable.assign(variable.constraint(variable))
+      return total_loss
+
+    rng = np.random.RandomState(seed)
+    num_batches = -(-self.num_examples // batch_size)
+    history = []
+    for _ in range(epochs):
+      batch_order = (
+          rng.permutation(num_batches) if shuffle else range(num_batches))
+      epoch_loss, epoch_size = 0.0, 0
+      for batch, (indices, weights) in self._batches(batch_order, batch_size):
+        batch_labels = tf.constant(labels[batch], dtype=dtype)
+        batch_loss = train_step(
+            indices, weights, batch_labels,
+            tf.constant(sample_weights[batch], dtype=dtype))
+        num_batch_examples = int(batch_labels.shape[0])
+        epoch_loss += float(batch_loss) * num_batch_examples
+        epoch_size += num_batch_examples
+      history.append(epoch_loss / epoch_size)
+    return history
@@ -0,0 +1,139 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL interpolation cache."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import interpolation_cache
+from tensorflow_lattice.python import test_utils
+
+_FEATURE_CONFIGS = [
+    configs.FeatureConfig(
+        name='numerical_1',
+        lattice_size=3,
+        monotonicity='increasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+    ),
+    configs.FeatureConfig(
+        name='numerical_2',
+        lattice_size=2,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+    ),
+    configs.FeatureConfig(
+        name='categorical',
+        lattice_size=2,
+        num_buckets=3,
+    ),
+]
+
+
+def _data(num_examples):
+  rng = np.random.RandomState(0)
+  inputs = [
+      rng.uniform(size=[num_examples, 1]),
+      rng.uniform(size=[num_examples, 1]),
+      rng.randint(0, 3, size=[num_examples, 1]),
+  ]
+  labels = (
+      inputs[0][:, 0]**2 + np.sin(3.0 * inputs[1][:, 0]) +
+      0.5 * (inputs[2][:, 0] == 2))
+  return inputs, labels
+
+
+class InterpolationCacheTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _Model(self, model_type, output_calibration):
+    model = test_utils.premade_model(
+        model_type,
+        _FEATURE_CONFIGS,
+        lattices=[['numerical_1', 'categorical'], ['numerical_1', 'numerical_2'],
+                  ['numerical_2', 'categorical']],
+        seed=1,
+        output_calibration=output_calibration,
+        output_calibration_num_keypoints=5,
+        output_initialization=[0.0, 2.0])
+    for feature_config in model.model_config.feature_configs:
+      model.get_layer('tfl_calib_{}'.format(feature_config.name)).trainable = (
+          False)
+    return model
+
+  @parameterized.parameters(
+      ('lattice', False),
+      ('lattice', True),
+      ('ensemble', True),
+      ('shared_ensemble', False),
+      ('packed_ensemble', True),
+  )
+  def testPredict(self, model_type, output_calibration):
+    model = self._Model(model_type, output_calibration)
+    inputs, _ = _data(250)
+    cache = interpolation_cache.InterpolationCache(model, inputs, batch_size=64)
+    self.assertEqual(cache.num_examples, 250)
+    self.assertAllClose(
+        cache.predict(), model.predict(inputs, verbose=0), atol=1e-5)
+
+  @parameterized.parameters(
+      ('lattice', True),
+      ('packed_ensemble', False),
+  )
+  def testFit(self, model_type, output_calibration):
+    model = self._Model(model_type, output_calibration)
+    calibration_weights = [
+        tf.keras.backend.get_value(weight)
+        for weight in model.non_trainable_weights
+    ]
+    inputs, labels = _data(500)
+    directory = os.path.join(self.get_temp_dir(), model_type)
+    interpolation_cache.InterpolationCache(model, inputs, directory=directory)
+    cache = interpolation_cache.InterpolationCache(model, directory=directory)
+    history = cache.fit(
+        labels,
+        epochs=30,
+        batch_size=50,
+        optimizer=tf.keras.optimizers.Adam(0.05),
+        seed=0)
+    self.assertLess(history[-1], 0.75 * history[0])
+    self.assertEqual(cache.batch_size, 10000)
+
+    # Calibrators are unchanged and the model matches the cache.
+    for weight, value in zip(model.non_trainable_weights, calibration_weights):
+      self.assertAllEqual(tf.keras.backend.get_value(weight), value)
+    self.assertAllClose(
+        cache.predict(), model.predict(inputs, verbose=0), atol=1e-5)
+    model.compile(loss='mse')
+    self.assertLess(model.evaluate(inputs, labels, verbose=0), history[0])
+    for layer in model.layers:
+      if hasattr(layer, 'assert_constraints'):
+        layer.assert_constraints(eps=1e-4)
+
+  def testInvalidArguments(self):
+    model = test_utils.premade_model(
+        'linear', _FEATURE_CONFIGS, output_initialization=[0.0, 1.0])
+    inputs, _ = _data(10)
+    with self.assertRaises(ValueError):
+      interpolation_cache.InterpolationCache(model, inputs)
+    with self.assertRaises(ValueError):
+      interpolation_cache.InterpolationCache(self._Model('lattice', False))
+
+
+if __name__ == '__main__':
+  tf.test.main()
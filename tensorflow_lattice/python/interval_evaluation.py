@@ -0,0 +1,429 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Interval (box) evaluation of TFL layers and premade models.
+
+Given lower and upper bounds on the inputs, the functions in this module return
+lower and upper bounds on the outputs that hold for all inputs in the box:
+
+- `PWLCalibration` is piecewise linear, so its extremes over an input range are
+  reached at the ends of the range or at the keypoints inside it. The missing
+  output is included if the missing input value is in the range.
+- `CategoricalCalibration` takes the extremes over the buckets in the range.
+- `Lattice` interpolation is multilinear within each cell, so its extremes over
+  a box are reached at the corners of the box or at the lattice vertices inside
+  it.
+- `Linear` layers are bounded by splitting weights by sign.
+
+Bounds of premade models are composed from the bounds of their calibrators,
+lattices or linear layers and output calibration. Premade models are monotonic
+in monotonic features, so those features are set to the corners of the box that
+minimize or maximize the output.
+
+Bounds are computed by evaluating the layers at the extreme points, so they are
+exact up to floating point rounding of the layer outputs.
+
+```python
+lower, upper = tfl.interval_evaluation.model_bounds(
+    model, lower=[x_min, y_min], upper=[x_max, y_max])
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+
+from . import categorical_calibration_layer
+from . import lattice_layer
+from . import linear_layer
+from . import premade_lib
+from . import pwl_calibration_layer
+from . import pwl_calibration_lib
+import numpy as np
+import tensorflow as tf
+
+
+def _masked_bounds(values, valid, axis):
+  """Returns min and max of values over the axis ignoring invalid entries."""
+  return (np.min(np.where(valid, values, np.inf), axis=axis),
+          np.max(np.where(valid, values, -np.inf), axis=axis))
+
+
+def _evaluate_pwl(layer, inputs, is_missing=False):
+  inputs = tf.constant(inputs, dtype=layer.dtype)
+  if layer.impute_missing:
+    # Keypoints are not treated as missing even if equal to the missing value.
+    inputs = [inputs, tf.ones_like(inputs) * float(is_missing)]
+  return np.asarray(layer(inputs), dtype=np.float64)
+
+
+def pwl_calibration_bounds(layer, lower, upper):
+  """Returns bounds on the outputs of a `PWLCalibration` layer.
+
+  Args:
+    layer: A built `tfl.layers.PWLCalibration` layer.
+    lower: Lower bounds on the inputs of shape `(batch_size, 1)` or
+      `(batch_size, units)`.
+    upper: Upper bounds on the inputs of the same shape as `lower`.
+
+  Returns:
+    A tuple `(lower, upper)` of output bounds of shape `(batch_size, units)`.
+  """
+  lower = np.asarray(lower, dtype=np.float64)
+  upper = np.asarray(upper, dtype=np.float64)
+  keypoints = np.array(layer.input_keypoints, dtype=np.float64)
+  keypoint_outputs = _evaluate_pwl(layer, keypoints[:, np.newaxis])
+  # Values of shape [batch_size, num_values, units].
+  values = np.concatenate([
+      _evaluate_pwl(layer, lower)[:, np.newaxis],
+      _evaluate_pwl(layer, upper)[:, np.newaxis],
+      np.broadcast_to(keypoint_outputs[np.newaxis],
+                      (len(lower),) + keypoint_outputs.shape),
+  ],
+                          axis=1)
+  inside = ((keypoints[np.newaxis, :, np.newaxis] > lower[:, np.newaxis]) &
+            (keypoints[np.newaxis, :, np.newaxis] < upper[:, np.newaxis]))
+  valid = np.concatenate([
+      np.ones([len(lower), 2, values.shape[2]], dtype=bool),
+      np.broadcast_to(inside, inside.shape[:2] + (values.shape[2],)),
+  ],
+                         axis=1)
+  if layer.impute_missing and layer.missing_input_value is not None:
+    missing_outputs = _evaluate_pwl(
+        layer, [[layer.missing_input_value]], is_missing=True)
+    values = np.concatenate([
+        values,
+        np.broadcast_to(missing_outputs[np.newaxis],
+                        (len(lower), 1, values.shape[2]))
+    ],
+                            axis=1)
+    has_missing = ((lower <= layer.missing_input_value) &
+                   (upper >= layer.missing_input_value))
+    valid = np.concatenate([
+        valid,
+        np.broadcast_to(has_missing[:, np.newaxis],
+                        (len(lower), 1, values.shape[2]))
+    ],
+                           axis=1)
+  return _masked_bounds(values, valid, axis=1)
+
+
+def categorical_calibration_bounds(layer, lower, upper):
+  """Returns bounds on the outputs of a `CategoricalCalibration` layer.
+
+  Args:
+    layer: A built `tfl.layers.CategoricalCalibration` layer.
+    lower: Lower bounds on the input buckets of shape `(batch_size, 1)`.
+    upper: Upper bounds on the input buckets of shape `(batch_size, 1)`.
+
+  Returns:
+    A tuple `(lower, upper)` of output bounds of shape `(batch_size, units)`.
+  """
+  lower = np.ceil(np.reshape(lower, [-1, 1]))
+  upper = np.floor(np.reshape(upper, [-1, 1]))
+  num_buckets = layer.num_buckets
+  buckets = np.arange(num_buckets)
+  bucket_outputs = np.asarray(
+      layer(tf.constant(buckets[:, np.newaxis], dtype=tf.int32)),
+      dtype=np.float64)
+  values = np.broadcast_to(bucket_outputs[np.newaxis],
+                           (len(lower),) + bucket_outputs.shape)
+  valid = (buckets[np.newaxis, :] >= lower) & (buckets[np.newaxis, :] <= upper)
+  # Inputs outside of [0, num_buckets) other than the default input value are
+  # calibrated to zero.
+  num_outside = (
+      np.maximum(np.minimum(upper, -1.0) - lower + 1.0, 0.0) +
+      np.maximum(upper - np.maximum(lower, num_buckets) + 1.0, 0.0))
+  default_value = layer.default_input_value
+  if default_value is not None:
+    has_default = (lower <= default_value) & (upper >= default_value)
+    valid[:, -1] |= has_default[:, 0]
+    if default_value < 0 or default_value >= num_buckets:
+      num_outside -= has_default
+  values = np.concatenate(
+      [values, np.zeros([len(lower), 1, values.shape[2]])], axis=1)
+  valid = np.concatenate([valid, num_outside > 0], axis=1)
+  return _masked_bounds(values, valid[:, :, np.newaxis], axis=1)
+
+
+def _piecewise_multilinear_bounds(evaluate, lower, upper, lattice_sizes,
+                                  batch_size):
+  """Returns bounds on a piecewise multilinear function over boxes.
+
+  Args:
+    evaluate: Function evaluating inputs of shape `(batch_size, num_points, ...,
+      num_dims)` into outputs of shape `(batch_size, num_points, ...)`.
+    lower: Lower bounds on the inputs of shape `(batch_size, ..., num_dims)`.
+    upper: Upper bounds on the inputs of the same shape as `lower`.
+    lattice_sizes: Lattice sizes along each dimension or None if the function
+      is multilinear everywhere.
+    batch_size: Maximum number of points evaluated at once.
+
+  Returns:
+    A tuple `(lower, upper)` of output bounds.
+  """
+  # Extreme points along each dimension: the ends of the range and the
+  # vertices strictly inside it. Unused vertices are replaced by the lower end.
+  dimension_points = []
+  for dimension in range(lower.shape[-1]):
+    dimension_lower = lower[..., dimension]
+    dimension_upper = upper[..., dimension]
+    points = [dimension_lower, dimension_upper]
+    if lattice_sizes is not None:
+      for vertex in range(lattice_sizes[dimension]):
+        points.append(
+            np.where((dimension_lower < vertex) & (dimension_upper > vertex),
+                     float(vertex), dimension_lower))
+    dimension_points.append(np.stack(points, axis=1))
+  combinations = np.array(
+      list(
+          itertools.product(
+              *[range(points.shape[1]) for points in dimension_points])))
+
+  output_lower = []
+  output_upper = []
+  examples_per_batch = max(1, batch_size // len(combinations))
+  for start in range(0, len(lower), examples_per_batch):
+    end = min(start + examples_per_batch, len(lower))
+    # Points of shape [batch, num_points, ..., num_dims].
+    points = np.stack([
+        points[start:end][:, combinations[:, dimension]]
+        for dimension, points in enumerate(dimension_points)
+    ],
+                      axis=-1)
+    outputs = np.asarray(evaluate(points), dtype=np.float64)
+    output_lower.append(np.min(outputs, axis=1))
+    output_upper.append(np.max(outputs, axis=1))
+  return np.concatenate(output_lower), np.concatenate(output_upper)
+
+
+def lattice_bounds(layer, lower, upper, batch_size=65536):
+  """Returns bounds on the outputs of a `Lattice` layer.
+
+  Args:
+    layer: A built `tfl.layers.Lattice` layer.
+    lower: Lower bounds on the inputs of shape `(batch_size, ..., num_dims)` as
+      accepted by the layer.
+    upper: Upper bounds on the inputs of the same shape as `lower`.
+    batch_size: Maximum number of points evaluated at once.
+
+  Returns:
+    A tuple `(lower, upper)` of output bounds of the shape of the layer output.
+  """
+  return _piecewise_multilinear_bounds(
+      lambda points: layer(tf.constant(points, dtype=layer.dtype),
+                           training=False),
+      np.asarray(lower, dtype=np.float64),
+      np.asarray(upper, dtype=np.float64),
+      layer.lattice_sizes,
+      batch_size)
+
+
+def linear_bounds(layer, lower, upper):
+  """Returns bounds on the outputs of a `Linear` layer.
+
+  Args:
+    layer: A built `tfl.layers.Linear` layer.
+    lower: Lower bounds on the inputs of shape `(batch_size, num_input_dims)`.
+    upper: Upper bounds on the inputs of the same shape as `lower`.
+
+  Returns:
+    A tuple `(lower, upper)` of output bounds of shape `(batch_size, 1)`.
+  """
+  # Normalization and input clipping preserve the signs of the weights.
+  positive = np.asarray(layer.kernel)[:, 0] >= 0
+  lower = np.asarray(lower, dtype=np.float64)
+  upper = np.asarray(upper, dtype=np.float64)
+  minimizer = np.where(positive, lower, upper)
+  maximizer = np.where(positive, upper, lower)
+  return (np.asarray(
+      layer(tf.constant(minimizer, dtype=layer.dtype)), dtype=np.float64),
+          np.asarray(
+              layer(tf.constant(maximizer, dtype=layer.dtype)),
+              dtype=np.float64))
+
+
+def _submodel_bounds(submodel, lower, upper, batch_size):
+  """Returns bounds on submodel outputs given bounds on calibrated inputs."""
+  if isinstance(submodel.layer, linear_layer.Linear):
+    return linear_bounds(submodel.layer, lower, upper)
+
+  def evaluate(points):
+    shape = points.shape
+    inputs = [
+        tf.constant(
+            np.reshape(points[..., dimension], [-1, 1]),
+            dtype=submodel.layer.dtype) for dimension in range(shape[-1])
+    ]
+    outputs = premade_lib.evaluate_submodel(submodel, inputs)
+    return np.reshape(outputs, shape[:-1] + (1,))
+
+  return _piecewise_multilinear_bounds(evaluate, lower, upper,
+                                       submodel.layer.lattice_sizes,
+                                       batch_size)
+
+
+def calibration_bounds(layer, lower, upper):
+  """Returns bounds on the outputs of a calibration layer.
+
+  Args:
+    layer: A built `tfl.layers.PWLCalibration` or
+      `tfl.layers.CategoricalCalibration` layer.
+    lower: Lower bounds on the inputs of shape `(batch_size, 1)`.
+    upper: Upper bounds on the inputs of shape `(batch_size, 1)`.
+
+  Returns:
+    A tuple `(lower, upper)` of output bounds of shape `(batch_size, units)`.
+
+  Raises:
+    ValueError: If the layer is not a calibration layer.
+  """
+  if isinstance(layer, pwl_calibration_layer.PWLCalibration):
+    return pwl_calibration_bounds(layer, lower, upper)
+  if isinstance(layer, categorical_calibration_layer.CategoricalCalibration):
+    return categorical_calibration_bounds(layer, lower, upper)
+  raise ValueError('Unsupported calibration layer: {}'.format(layer.name))
+
+
+def _feature_bounds(model, bounds, name):
+  """Returns bounds as a list of 2-d arrays in model input order."""
+  feature_configs = model.model_config.feature_configs
+  if isinstance(bounds, dict):
+    missing_features = [
+        feature_config.name
+        for feature_config in feature_configs
+        if feature_config.name not in bounds
+    ]
+    if missing_features:
+      raise ValueError('Missing {} bounds for features: {}'.format(
+          name, missing_features))
+    bounds = [bounds[feature_config.name] for feature_config in feature_configs]
+  if len(bounds) != len(feature_configs):
+    raise ValueError('Expected {} {} bounds, got {}.'.format(
+        len(feature_configs), name, len(bounds)))
+  return [
+      np.reshape(np.asarray(bound, dtype=np.float64), [-1, 1])
+      for bound in bounds
+  ]
+
+
+def model_bounds(model, lower, upper, batch_size=65536):
+  """Returns bounds on the outputs of a premade model.
+
+  Args:
+    model: A `tfl.premade.CalibratedLinear`, `tfl.premade.CalibratedLattice` or
+      `tfl.premade.CalibratedLatticeEnsemble` model.
+    lower: Lower bounds on the features, either a list of arrays of shape
+      `(batch_size, 1)` in the order of model inputs or a dict from feature
+      names to such arrays.
+    upper: Upper bounds on the features in the same format as `lower`.
+    batch_size: Maximum number of points evaluated at once.
+
+  Returns:
+    A tuple `(lower, upper)` of output bounds of shape `(batch_size, 1)`.
+
+  Raises:
+    ValueError: If the model is not supported or bounds do not match the model
+      inputs.
+  """
+  if getattr(model, 'model_config', None) is None:
+    raise ValueError('model_bounds requires a premade model.')
+  model_config = model.model_config
+  submodels, average = premade_lib.premade_submodels(model)
+  lower = _feature_bounds(model, lower, 'lower')
+  upper = _feature_bounds(model, upper, 'upper')
+
+  # Calibrated bounds for minimizing (-1) and maximizing (1) the output, with
+  # monotonic features set to the corresponding corners of the box.
+  calibrated = {-1: {}, 1: {}}
+  has_monotonic_features = False
+  for feature_config, feature_lower, feature_upper in zip(
+      model_config.feature_configs, lower, upper):
+    layer = model.get_layer('{}_{}'.format(premade_lib.CALIB_LAYER_NAME,
+                                           feature_config.name))
+    bounds = calibration_bounds(layer, feature_lower, feature_upper)
+    calibrated[-1][feature_config.name] = bounds
+    calibrated[1][feature_config.name] = bounds
+    if feature_config.num_buckets or isinstance(feature_config.monotonicity,
+                                                list):
+      continue
+    monotonicity = pwl_calibration_lib.canonicalize_monotonicity(
+        feature_config.monotonicity)
+    if not monotonicity:
+      continue
+    has_monotonic_features = True
+    # The missing output is not ordered with the other outputs.
+    use_corner = np.ones_like(feature_lower, dtype=bool)
+    if feature_config.default_value is not None:
+      use_corner = ((feature_lower > feature_config.default_value) |
+                    (feature_upper < feature_config.default_value))
+    for direction in [-1, 1]:
+      corner = feature_upper if direction * monotonicity > 0 else feature_lower
+      corner_outputs, _ = pwl_calibration_bounds(layer, corner, corner)
+      calibrated[direction][feature_config.name] = tuple(
+          np.where(use_corner, corner_outputs, bound) for bound in bounds)
+
+  def submodels_bounds(direction):
+    submodels_lower = np.zeros([len(lower[0]), 1])
+    submodels_upper = np.zeros([len(lower[0]), 1])
+    for submodel in submodels:
+      inputs_lower = []
+      inputs_upper = []
+      for feature_name, unit in zip(submodel.feature_names,
+                                    submodel.calibration_units):
+        feature_lower, feature_upper = calibrated[direction][feature_name]
+        inputs_lower.append(feature_lower[:, unit])
+        inputs_upper.append(feature_upper[:, unit])
+      bounds = _submodel_bounds(submodel, np.stack(inputs_lower, axis=1),
+                                np.stack(inputs_upper, axis=1), batch_size)
+      submodels_lower += bounds[0]
+      submodels_upper += bounds[1]
+    if average:
+      submodels_lower /= len(submodels)
+      submodels_upper /= len(submodels)
+    return submodels_lower, submodels_upper
+
+  output_lower, output_upper = submodels_bounds(1)
+  if has_monotonic_features:
+    output_lower, _ = submodels_bounds(-1)
+  if model_config.output_calibration:
+    output_lower, output_upper = pwl_calibration_bounds(
+        model.get_layer(premade_lib.OUTPUT_CALIB_LAYER_NAME), output_lower,
+        output_upper)
+  return output_lower, output_upper
+
+
+def layer_bounds(layer, lower, upper, batch_size=65536):
+  """Returns bounds on the outputs of a TFL layer.
+
+  Args:
+    layer: A built `tfl.layers.PWLCalibration`,
+      `tfl.layers.CategoricalCalibration`, `tfl.layers.Lattice` or
+      `tfl.layers.Linear` layer.
+    lower: Lower bounds on the layer inputs.
+    upper: Upper bounds on the layer inputs of the same shape as `lower`.
+    batch_size: Maximum number of points evaluated at once by lattice layers.
+
+  Returns:
+    A tuple `(lower, upper)` of output bounds.
+
+  Raises:
+    ValueError: If the layer is not supported.
+  """
+  if isinstance(layer, lattice_layer.Lattice):
+    return lattice_bounds(layer, lower, upper, batch_size)
+  if isinstance(layer, linear_layer.Linear):
+    return linear_bounds(layer, lower, upper)
+  return calibration_bounds(layer, lower, upper)
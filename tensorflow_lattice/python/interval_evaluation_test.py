@@ -0,0 +1,242 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL interval evaluation."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import categorical_calibration_layer
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import interval_evaluation
+from tensorflow_lattice.python import lattice_layer
+from tensorflow_lattice.python import linear_layer
+from tensorflow_lattice.python import pwl_calibration_layer
+from tensorflow_lattice.python import test_utils
+
+_FEATURE_CONFIGS = [
+    configs.FeatureConfig(
+        name='increasing',
+        lattice_size=3,
+        monotonicity='increasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+    ),
+    configs.FeatureConfig(
+        name='decreasing',
+        lattice_size=2,
+        monotonicity='decreasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+        default_value=-1.0,
+    ),
+    configs.FeatureConfig(
+        name='unconstrained',
+        lattice_size=3,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=6),
+    ),
+    configs.FeatureConfig(
+        name='categorical',
+        lattice_size=2,
+        num_buckets=4,
+        default_value=-1,
+    ),
+]
+
+_LATTICES = [['increasing', 'categorical'], ['increasing', 'decreasing'],
+             ['decreasing', 'unconstrained', 'categorical'],
+             ['unconstrained', 'increasing']]
+
+
+def _boxes(rng, lower, upper, num_boxes, shape):
+  """Returns random boxes, including single points, within [lower, upper]."""
+  ends = rng.uniform(lower, upper, size=(2, num_boxes) + shape)
+  box_lower = np.min(ends, axis=0)
+  box_upper = np.max(ends, axis=0)
+  box_upper[:num_boxes // 4] = box_lower[:num_boxes // 4]
+  return box_lower, box_upper
+
+
+class IntervalEvaluationTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _assertBounds(self, bounds, outputs, atol=1e-5):
+    """Checks that sampled outputs of shape [samples, ...] are in bounds."""
+    self.assertAllGreaterEqual(outputs - bounds[0][np.newaxis], -atol)
+    self.assertAllLessEqual(outputs - bounds[1][np.newaxis], atol)
+
+  @parameterized.parameters((1, False), (3, True))
+  def testPWLCalibrationBounds(self, units, impute_missing):
+    layer = pwl_calibration_layer.PWLCalibration(
+        input_keypoints=np.linspace(0.0, 1.0, num=6),
+        units=units,
+        impute_missing=impute_missing,
+        missing_input_value=-1.0 if impute_missing else None)
+    layer(tf.zeros([1, 1]))
+    test_utils.randomize_weights(layer.trainable_weights)
+    rng = np.random.RandomState(1)
+    lower, upper = _boxes(rng, -1.5, 1.5, 100, (1,))
+    bounds = interval_evaluation.pwl_calibration_bounds(layer, lower, upper)
+    self.assertEqual(bounds[0].shape, (100, units))
+
+    samples = np.linspace(0.0, 1.0, num=101)
+    points = lower[np.newaxis] + samples[:, np.newaxis, np.newaxis] * (
+        upper - lower)[np.newaxis]
+    if impute_missing:
+      points[0, :5] = -1.0
+      lower[:5] = np.minimum(lower[:5], -1.0)
+      upper[:5] = np.maximum(upper[:5], -1.0)
+      bounds = interval_evaluation.pwl_calibration_bounds(layer, lower, upper)
+    outputs = np.reshape(
+        layer(tf.constant(np.reshape(points, [-1, 1]), dtype=tf.float32)),
+        [len(samples), 100, units])
+    self._assertBounds(bounds, outputs)
+    if not impute_missing:
+      # Bounds are tight.
+      self.assertAllClose(bounds[0], np.min(outputs, axis=0), atol=1e-2)
+      self.assertAllClose(bounds[1], np.max(outputs, axis=0), atol=1e-2)
+
+  @parameterized.parameters((1, None), (2, -1), (2, 5))
+  def testCategoricalCalibrationBounds(self, units, default_input_value):
+    layer = categorical_calibration_layer.CategoricalCalibration(
+        num_buckets=4, units=units, default_input_value=default_input_value)
+    layer(tf.zeros([1, 1], dtype=tf.int32))
+    test_utils.randomize_weights(layer.trainable_weights)
+    lower = np.array([[0], [1], [-2], [2], [-1]])
+    upper = np.array([[3], [1], [1], [6], [-1]])
+    bounds = interval_evaluation.categorical_calibration_bounds(
+        layer, lower, upper)
+    for box_lower, box_upper, bound_lower, bound_upper in zip(
+        lower[:, 0], upper[:, 0], bounds[0], bounds[1]):
+      outputs = layer(
+          tf.constant(np.arange(box_lower, box_upper + 1)[:, np.newaxis]))
+      self.assertAllClose(bound_lower, np.min(outputs, axis=0))
+      self.assertAllClose(bound_upper, np.max(outputs, axis=0))
+
+  @parameterized.parameters(
+      ([2, 3], 1),
+      ([3, 2, 4], 1),
+      ([2, 3], 2),
+  )
+  def testLatticeBounds(self, lattice_sizes, units):
+    layer = lattice_layer.Lattice(
+        lattice_sizes=lattice_sizes,
+        units=units,
+        monotonicities=[1] + [0] * (len(lattice_sizes) - 1))
+    shape = (len(lattice_sizes),) if units == 1 else (units,
+                                                      len(lattice_sizes))
+    layer(tf.zeros((1,) + shape))
+    test_utils.randomize_weights(layer.trainable_weights)
+    rng = np.random.RandomState(2)
+    lower, upper = _boxes(rng, -0.5, np.array(lattice_sizes) - 0.5, 50, shape)
+    bounds = interval_evaluation.lattice_bounds(layer, lower, upper)
+    self.assertEqual(bounds[0].shape, (50, units))
+
+    samples = rng.uniform(size=(500, 1) + shape)
+    points = lower[np.newaxis] + samples * (upper - lower)[np.newaxis]
+    outputs = np.reshape(
+        layer(
+            tf.constant(np.reshape(points, (-1,) + shape), dtype=tf.float32)),
+        [500, 50, units])
+    self._assertBounds(bounds, outputs)
+    # Single points have exact bounds.
+    self.assertAllClose(bounds[0][:12], outputs[0, :12])
+    self.assertAllClose(bounds[1][:12], outputs[0, :12])
+
+  def testLinearBounds(self):
+    layer = linear_layer.Linear(
+        num_input_dims=3, monotonicities=[1, 0, 0], use_bias=True)
+    layer(tf.zeros([1, 3]))
+    tf.keras.backend.set_value(layer.kernel, [[0.5], [-2.0], [1.0]])
+    tf.keras.backend.set_value(layer.bias, 0.25)
+    bounds = interval_evaluation.linear_bounds(
+        layer, lower=[[0.0, 0.0, -1.0]], upper=[[1.0, 1.0, 2.0]])
+    self.assertAllClose(bounds, ([[-2.75]], [[2.75]]))
+
+  @parameterized.parameters(
+      ('linear', True),
+      ('lattice', False),
+      ('ensemble', True),
+      ('shared_ensemble', False),
+      ('packed_ensemble', True),
+  )
+  def testModelBounds(self, model_type, output_calibration):
+    model = test_utils.premade_model(
+        model_type,
+        _FEATURE_CONFIGS,
+        lattices=_LATTICES,
+        output_calibration=output_calibration,
+        output_calibration_num_keypoints=5,
+        output_initialization=[-1.0, 1.0])
+
+    rng = np.random.RandomState(3)
+    num_boxes = 40
+    lower, upper = [], []
+    for feature_config in _FEATURE_CONFIGS:
+      if feature_config.num_buckets:
+        box = _boxes(rng, -1, 4, num_boxes, (1,))
+        box = (np.floor(box[0]), np.floor(box[1]))
+      else:
+        box = _boxes(rng, -1.2, 1.2, num_boxes, (1,))
+      lower.append(box[0])
+      upper.append(box[1])
+    bounds = interval_evaluation.model_bounds(
+        model,
+        lower={
+            feature_config.name: feature_lower
+            for feature_config, feature_lower in zip(_FEATURE_CONFIGS, lower)
+        },
+        upper=upper)
+    self.assertEqual(bounds[0].shape, (num_boxes, 1))
+
+    num_samples = 300
+    inputs = []
+    for feature_config, feature_lower, feature_upper in zip(
+        _FEATURE_CONFIGS, lower, upper):
+      samples = rng.uniform(size=(num_samples, num_boxes, 1))
+      if feature_config.num_buckets:
+        values = np.floor(feature_lower + samples *
+                          (feature_upper - feature_lower + 1.0))
+      else:
+        values = feature_lower + samples * (feature_upper - feature_lower)
+        # Includes missing values of boxes covering the default value.
+        if feature_config.default_value is not None:
+          covered = ((feature_lower <= feature_config.default_value) &
+                     (feature_upper >= feature_config.default_value))
+          values[-1] = np.where(covered, feature_config.default_value,
+                                values[-1])
+      inputs.append(np.reshape(values, [-1, 1]))
+    outputs = np.reshape(
+        model.predict(inputs, batch_size=4000, verbose=0),
+        [num_samples, num_boxes, 1])
+    self._assertBounds(bounds, outputs)
+    # Single points have exact bounds.
+    self.assertAllClose(bounds[0][:10], outputs[0, :10], atol=1e-5)
+    self.assertAllClose(bounds[1][:10], outputs[0, :10], atol=1e-5)
+
+  def testInvalidArguments(self):
+    model = test_utils.premade_model(
+        'lattice', _FEATURE_CONFIGS, output_initialization=[0.0, 1.0])
+    with self.assertRaises(ValueError):
+      interval_evaluation.model_bounds(model, [[[0.0]]], [[[1.0]]])
+    with self.assertRaises(ValueError):
+      interval_evaluation.model_bounds(model, {'increasing': [[0.0]]},
+                                       {'increasing': [[1.0]]})
+    with self.assertRaises(ValueError):
+      interval_evaluation.layer_bounds(
+          tf.keras.layers.Dense(1), [[0.0]], [[1.0]])
+
+
+if __name__ == '__main__':
+  tf.test.main()
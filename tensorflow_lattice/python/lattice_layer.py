@@ -29,6 +29,7 @@ from tensorflow import keras
 
 LATTICE_KERNEL_NAME = "lattice_kernel"
 LATTICE_SIZES_NAME = "lattice_sizes"
+LATTICE_ACTIVE_UNITS_NAME = "lattice_active_units"
 
 
 class Lattice(keras.layers.Layer):
@@ -117,6 +118,7 @@ class Lattice(keras.layers.Layer):
     - if `units > 1`: tensor of shape:
       `(batch_size, ..., units, len(lattice_sizes))` or list of
       `len(lattice_sizes)` tensors of same shape: `(batch_size, ..., units, 1)`
+    - if `units > 1` and `shared_inputs=True`: same as for `units == 1`.
 
     A typical shape is: `(batch_size, len(lattice_sizes))`
 
@@ -126,6 +128,8 @@ class Lattice(keras.layers.Layer):
   Attributes:
     - All `__init__` arguments.
     kernel: weights of the lattice.
+    active_units: int32 weight with the units evaluated in the last training
+      step if `dropout_rate` drops units, otherwise `None`.
 
   Example:
 
@@ -166,6 +170,9 @@ class Lattice(keras.layers.Layer):
                clip_inputs=True,
                kernel_initializer="linear_initializer",
                kernel_regularizer=None,
+               sparse_kernel_gradients=False,
+               dropout_rate=0.0,
+               shared_inputs=False,
                **kwargs):
     # pyformat: disable
     """Initializes an instance of `Lattice`.
@@ -255,6 +262,30 @@ class Lattice(keras.layers.Layer):
           either be single floats or lists of floats to specify different
           regularization amount for every dimension.
         - Any Keras regularizer object.
+      sparse_kernel_gradients: If the lattice should be evaluated by gathering
+        the `2 ** len(lattice_sizes)` kernel rows of the lattice cell that
+        contains each input, instead of weighting all `prod(lattice_sizes)`
+        rows. Gradients of the kernel are then `tf.IndexedSlices` holding only
+        the rows touched by the batch, which makes evaluation and optimizer
+        updates scale with the batch size rather than the kernel size. Use
+        with an optimizer that applies sparse updates lazily (e.g. Adagrad,
+        FTRL or SGD without momentum) to avoid dense updates of optimizer
+        slots. Note that constraint projection is still applied to the whole
+        kernel after every update.
+      dropout_rate: Fraction of the units of a multi-unit lattice left out in
+        each training step. A random subset of
+        `max(1, round((1 - dropout_rate) * units))` units is evaluated in each
+        step and their outputs are scaled by `units / num_active_units`, so
+        that averages of unit outputs, e.g. of lattice ensembles, stay unbiased.
+        Outputs of the other units are zero. Only the active units are
+        evaluated and get kernel gradients. Since optimizers with momentum
+        still move inactive units, all units are projected onto the
+        constraints after each update. All units are evaluated at inference.
+        Has no effect on single-unit lattices.
+      shared_inputs: If all units of a multi-unit lattice should be evaluated
+        on the same inputs of shape `(batch_size, ..., len(lattice_sizes))`.
+        Interpolation weights are then computed once and multiplied by the
+        kernel of all units.
       **kwargs: Other args passed to `tf.keras.layers.Layer` initializer.
 
     Raises:
@@ -265,6 +296,8 @@ class Lattice(keras.layers.Layer):
         lattice_sizes=lattice_sizes,
         monotonicities=monotonicities,
         unimodalities=unimodalities)
+    if not 0.0 <= dropout_rate < 1.0:
+      raise ValueError("dropout_rate must be in [0, 1): %s" % dropout_rate)
     super(Lattice, self).__init__(**kwargs)
 
     self.lattice_sizes = lattice_sizes
@@ -308,6 +341,9 @@ class Lattice(keras.layers.Layer):
     self.num_projection_iterations = num_projection_iterations
     self.monotonic_at_every_step = monotonic_at_every_step
     self.clip_inputs = clip_inputs
+    self.sparse_kernel_gradients = sparse_kernel_gradients
+    self.dropout_rate = dropout_rate
+    self.shared_inputs = shared_inputs
 
     def default_params(output_min, output_max):
       """Return reasonable default parameters if not defined explicitly."""
@@ -398,7 +434,7 @@ class Lattice(keras.layers.Layer):
     """Standard Keras build() method."""
     lattice_lib.verify_hyperparameters(
         lattice_sizes=self.lattice_sizes,
-        units=self.units,
+        units=None if self.shared_inputs else self.units,
         input_shape=input_shape)
     constraints = LatticeConstraints(
         lattice_sizes=self.lattice_sizes,
@@ -414,6 +450,18 @@ class Lattice(keras.layers.Layer):
         output_max=self.output_max,
         num_projection_iterations=self.num_projection_iterations,
         enforce_strict_monotonicity=self.monotonic_at_every_step)
+    num_active_units = max(
+        1, int(round((1.0 - self.dropout_rate) * self.units)))
+    if num_active_units < self.units:
+      # Units evaluated in the last training step.
+      self.active_units = self.add_weight(
+          LATTICE_ACTIVE_UNITS_NAME,
+          shape=[num_active_units],
+          initializer=keras.initializers.Constant(list(range(num_active_units))),
+          trainable=False,
+          dtype=tf.int32)
+    else:
+      self.active_units = None
 
     if not self.kernel_regularizer:
       kernel_reg = None
@@ -466,8 +514,25 @@ class Lattice(keras.layers.Layer):
         self.lattice_sizes, dtype=tf.int32, name=LATTICE_SIZES_NAME)
     super(Lattice, self).build(input_shape)
 
-  def call(self, inputs):
+  def call(self, inputs, training=None):
     """Standard Keras call() method."""
+    if self.active_units is not None:
+      if training is None:
+        training = keras.backend.learning_phase()
+      if tf.is_tensor(training):
+        return tf.cond(
+            tf.cast(training, tf.bool),
+            lambda: self._call_with_dropout(inputs),
+            lambda: self._call_all_units(inputs))
+      if training:
+        return self._call_with_dropout(inputs)
+    return self._call_all_units(inputs)
+
+  def _call_all_units(self, inputs):
+    """Evaluates all units of the lattice."""
+    if self.sparse_kernel_gradients:
+      return self._call_with_sparse_kernel_gradients(inputs)
+
     interpolation_weights = lattice_lib.compute_interpolation_weights(
         inputs=inputs,
         lattice_sizes=self.lattice_sizes,
@@ -478,9 +543,9 @@ class Lattice(keras.layers.Layer):
     # Wrap this constant into pure op since in TF 2.0 there are issues passing
     # tensors into control_dependencies.
     with tf.control_dependencies([tf.identity(self.lattice_sizes_tensor)]):
-      if self.units == 1:
+      if self.units == 1 or self.shared_inputs:
         # Weights shape: (batch-size, ..., prod(lattice_sizes))
-        # Kernel shape:  (prod(lattice_sizes), 1)
+        # Kernel shape:  (prod(lattice_sizes), units)
         return tf.matmul(interpolation_weights, self.kernel)
       else:
         # Weights shape: (batch-size, ..., units, prod(lattice_sizes))
@@ -488,12 +553,111 @@ class Lattice(keras.layers.Layer):
         return tf.reduce_sum(
             interpolation_weights * tf.transpose(self.kernel), axis=-1)
 
+  def _call_with_sparse_kernel_gradients(self, inputs):
+    """Evaluates the lattice by gathering kernel rows of the lattice cells."""
+    indices, interpolation_weights = lattice_lib.compute_interpolation_corners(
+        inputs=inputs,
+        lattice_sizes=self.lattice_sizes,
+        clip_inputs=self.clip_inputs)
+
+    # See comment in call() about the control dependencies.
+    with tf.control_dependencies([tf.identity(self.lattice_sizes_tensor)]):
+      # Gathering directly from the kernel variable results in IndexedSlices
+      # gradients.
+      if self.units == 1 or self.shared_inputs:
+        # Indices and weights shape: (batch-size, ..., 2 ** len(lattice_sizes))
+        # Gathered kernel shape:
+        #   (batch-size, ..., 2 ** len(lattice_sizes), units)
+        kernel_rows = tf.gather(self.kernel, indices)
+        return tf.reduce_sum(
+            tf.expand_dims(interpolation_weights, axis=-1) * kernel_rows,
+            axis=-2)
+      else:
+        # Indices and weights shape:
+        #   (batch-size, ..., units, 2 ** len(lattice_sizes))
+        kernel_values = self._gather_kernel_values(indices, tf.range(self.units))
+        return tf.reduce_sum(interpolation_weights * kernel_values, axis=-1)
+
+  def _gather_kernel_values(self, indices, unit_indices):
+    """Gathers kernel values of each unit at the given kernel rows.
+
+    Args:
+      indices: Kernel row indices of shape `(batch-size, ..., num_units, k)`.
+      unit_indices: Kernel columns of the `num_units` units.
+
+    Returns:
+      Tensor of the same shape as `indices` with the kernel value of each unit.
+    """
+    # Each distinct row is gathered once from the kernel variable, so the
+    # gradient is `tf.IndexedSlices` with at most `prod(lattice_sizes)` rows.
+    # Each unit then only reads its own element of the gathered rows, so the
+    # cost is linear in the number of units.
+    rows, row_positions = tf.unique(tf.reshape(indices, [-1]))
+    kernel_rows = tf.gather(self.kernel, rows)
+    positions = tf.reshape(row_positions, tf.shape(indices)) * self.units
+    positions += tf.expand_dims(unit_indices, axis=-1)
+    return tf.gather(tf.reshape(kernel_rows, [-1]), positions)
+
+  def _call_with_dropout(self, inputs):
+    """Evaluates a random subset of units, leaving the other outputs zero."""
+    num_active_units = self.active_units.shape[0]
+    active_units = tf.random.shuffle(tf.range(self.units))[:num_active_units]
+    with tf.control_dependencies([self.active_units.assign(active_units)]):
+      if self.shared_inputs:
+        active_inputs = tf.identity(inputs)
+      else:
+        active_inputs = tf.gather(inputs, active_units, axis=-2)
+
+    # See comment in call() about the control dependencies.
+    with tf.control_dependencies([tf.identity(self.lattice_sizes_tensor)]):
+      if self.sparse_kernel_gradients:
+        indices, interpolation_weights = (
+            lattice_lib.compute_interpolation_corners(
+                inputs=active_inputs,
+                lattice_sizes=self.lattice_sizes,
+                clip_inputs=self.clip_inputs))
+        if self.shared_inputs:
+          # Gathered kernel shape:
+          #   (batch-size, ..., 2 ** len(lattice_sizes), num_active_units)
+          kernel_values = tf.gather(
+              tf.gather(self.kernel, indices), active_units, axis=-1)
+          outputs = tf.reduce_sum(
+              tf.expand_dims(interpolation_weights, axis=-1) * kernel_values,
+              axis=-2)
+        else:
+          kernel_values = self._gather_kernel_values(indices, active_units)
+          outputs = tf.reduce_sum(
+              interpolation_weights * kernel_values, axis=-1)
+      else:
+        interpolation_weights = lattice_lib.compute_interpolation_weights(
+            inputs=active_inputs,
+            lattice_sizes=self.lattice_sizes,
+            clip_inputs=self.clip_inputs)
+        # Kernel shape:  (prod(lattice_sizes), num_active_units)
+        kernel = tf.gather(self.kernel, active_units, axis=1)
+        if self.shared_inputs:
+          # Weights shape: (batch-size, ..., prod(lattice_sizes))
+          outputs = tf.matmul(interpolation_weights, kernel)
+        else:
+          # Weights shape:
+          #   (batch-size, ..., num_active_units, prod(lattice_sizes))
+          outputs = tf.reduce_sum(
+              interpolation_weights * tf.transpose(kernel), axis=-1)
+      outputs *= self.units / num_active_units
+      # Scatters active unit outputs, moving units to the first dimension.
+      rank = len(outputs.shape)
+      outputs = tf.scatter_nd(
+          tf.expand_dims(active_units, axis=1),
+          tf.transpose(outputs, [rank - 1] + list(range(rank - 1))),
+          shape=tf.concat([[self.units], tf.shape(outputs)[:-1]], axis=0))
+      return tf.transpose(outputs, list(range(1, rank)) + [0])
+
   def compute_output_shape(self, input_shape):
     """Standard Keras compute_output_shape() method."""
     if isinstance(input_shape, list):
       input_shape = input_shape[0]
-    if self.units == 1:
-      return tuple(input_shape[:-1]) + (1,)
+    if self.units == 1 or self.shared_inputs:
+      return tuple(input_shape[:-1]) + (self.units,)
     else:
       # Second to last dimension must be equal to 'units'. Nothing to append.
       return input_shape[:-1]
@@ -516,6 +680,9 @@ class Lattice(keras.layers.Layer):
         "num_projection_iterations": self.num_projection_iterations,
         "monotonic_at_every_step": self.monotonic_at_every_step,
         "clip_inputs": self.clip_inputs,
+        "sparse_kernel_gradients": self.sparse_kernel_gradients,
+        "dropout_rate": self.dropout_rate,
+        "shared_inputs": self.shared_inputs,
         "kernel_initializer":
             keras.initializers.serialize(self.kernel_initializer),
         "kernel_regularizer":
@@ -565,6 +732,31 @@ class Lattice(keras.layers.Layer):
         output_max=self.output_max,
         eps=eps)
 
+  def constraint_violations(self):
+    """Returns amounts by which layer weights violate constraints.
+
+    Cheap alternative to `assert_constraints` which can be used to monitor
+    constraints during training, e.g. using
+    `tfl.constraint_metrics.ConstraintViolation`.
+
+    Returns:
+      Dict from constraint type ('monotonicity', 'trust', 'dominance' or
+      'bounds') to a 1-d tensor of non-negative violation amounts. See
+      `tfl.lattice_lib.constraint_violations` for details.
+    """
+    return lattice_lib.constraint_violations(
+        weights=self.kernel,
+        lattice_sizes=self.lattice_sizes,
+        monotonicities=lattice_lib.canonicalize_monotonicities(
+            self.monotonicities),
+        edgeworth_trusts=lattice_lib.canonicalize_trust(self.edgeworth_trusts),
+        trapezoid_trusts=lattice_lib.canonicalize_trust(self.trapezoid_trusts),
+        monotonic_dominances=self.monotonic_dominances,
+        range_dominances=self.range_dominances,
+        joint_monotonicities=self.joint_monotonicities,
+        output_min=self.output_min,
+        output_max=self.output_max)
+
 
 class LinearInitializer(keras.initializers.Initializer):
   # pyformat: disable
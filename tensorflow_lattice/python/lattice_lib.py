@@ -102,6 +102,89 @@ def compute_interpolation_weights(inputs, lattice_sizes, clip_inputs=True):
   return batch_outer_operation(one_d_interpolation_weights, operation="auto")
 
 
+def compute_interpolation_corners(inputs, lattice_sizes, clip_inputs=True):
+  """Computes vertex indices and weights for lattice interpolation.
+
+  Unlike `compute_interpolation_weights` which returns weights for all
+  `prod(lattice_sizes)` vertices, only the `2 ** len(lattice_sizes)` vertices
+  of the lattice cell containing each input are returned. Interpolated values
+  can then be computed by gathering rows of the lattice kernel, which makes
+  kernel gradients sparse (`tf.IndexedSlices`).
+
+  Running time: `O(batch_size * 2 ** len(lattice_sizes))`
+
+  If `clip_inputs == True`, inputs outside of the range defined by
+  `lattice_sizes` will be clipped into the lattice input range. If not, the
+  corresponding weights will linearly approach 0.0 with input moving away from
+  the valid input range, same as in `compute_interpolation_weights`.
+
+  Args:
+    inputs: Tensor of shape: `(batch_size, ..., len(lattice_sizes))` or list of
+      `len(lattice_sizes)` tensors of same shape `(batch_size, ..., 1)` which
+      represents points to apply lattice interpolation to. A typical shape is
+      `(batch_size, len(lattice_sizes))`.
+    lattice_sizes: List or tuple of integers which represents lattice sizes of
+      layer for which interpolation is being computed.
+    clip_inputs: Whether inputs should be clipped to the input range of the
+      lattice.
+
+  Raises:
+    ValueError: If last dimension of `inputs` does not match `lattice_sizes`.
+
+  Returns:
+    Tuple `(indices, weights)` of tensors of shape
+    `(batch_size, ..., 2 ** len(lattice_sizes))`, where `indices` are int32
+    indices of lattice vertices in the flattened lattice kernel and `weights`
+    are the corresponding interpolation weights.
+  """
+  if isinstance(inputs, list):
+    input_shape = [tensor.shape for tensor in inputs]
+  else:
+    input_shape = inputs.shape
+  verify_hyperparameters(lattice_sizes=lattice_sizes, input_shape=input_shape)
+
+  if clip_inputs:
+    inputs = _clip_onto_lattice_range(
+        inputs=inputs, lattice_sizes=lattice_sizes)
+  if isinstance(inputs, list):
+    inputs = tf.concat(inputs, axis=-1)
+
+  # Index of the lower vertex of the cell in each dimension. Inputs outside of
+  # the lattice range use the first or last cell of the dimension, which gives
+  # the same weights as `compute_interpolation_weights` for those inputs.
+  upper_bounds = tf.constant([dim_size - 2 for dim_size in lattice_sizes],
+                             dtype=inputs.dtype)
+  lower_vertices = tf.clip_by_value(
+      tf.floor(inputs), clip_value_min=0.0, clip_value_max=upper_bounds)
+  fractions = inputs - lower_vertices
+  lower_vertices = tf.cast(lower_vertices, tf.int32)
+
+  # Strides of each dimension in the flattened kernel. The last dimension
+  # varies the fastest.
+  strides = [1] * len(lattice_sizes)
+  for i in range(len(lattice_sizes) - 2, -1, -1):
+    strides[i] = strides[i + 1] * lattice_sizes[i + 1]
+
+  one_d_indices = []
+  one_d_weights = []
+  for dim, stride in enumerate(strides):
+    lower_vertex = lower_vertices[..., dim:dim + 1]
+    fraction = fractions[..., dim:dim + 1]
+    one_d_indices.append(
+        tf.concat([lower_vertex * stride, (lower_vertex + 1) * stride],
+                  axis=-1))
+    one_d_weights.append(
+        tf.concat([
+            tf.maximum(1.0 - tf.abs(fraction), 0.0),
+            tf.maximum(1.0 - tf.abs(fraction - 1.0), 0.0)
+        ],
+                  axis=-1))
+
+  indices = batch_outer_operation(one_d_indices, operation=tf.add)
+  weights = batch_outer_operation(one_d_weights, operation=tf.multiply)
+  return indices, weights
+
+
 def batch_outer_operation(list_of_tensors, operation="auto"):
   """Computes outer operation of last dimensions of each of given tensors.
 
@@ -2487,6 +2570,113 @@ def assert_constraints(weights,
   return asserts
 
 
+def constraint_violations(weights,
+                          lattice_sizes,
+                          monotonicities=None,
+                          edgeworth_trusts=None,
+                          trapezoid_trusts=None,
+                          monotonic_dominances=None,
+                          range_dominances=None,
+                          joint_monotonicities=None,
+                          output_min=None,
+                          output_max=None):
+  """Returns amounts by which weights violate constraints.
+
+  Unlike `assert_constraints`, which builds separate ops for every pair of
+  lattice layers, violations are computed using a few vectorized ops per
+  constraint, so this function is cheap enough to be evaluated periodically
+  during training.
+
+  Args:
+    weights: `Lattice` weights tensor of shape: `(prod(lattice_sizes), units)`.
+    lattice_sizes: List or tuple of integers which represents lattice sizes.
+    monotonicities: Monotonicity constraints canonicalized using
+      `canonicalize_monotonicities`.
+    edgeworth_trusts: Edgeworth trust constraints canonicalized using
+      `canonicalize_trust`.
+    trapezoid_trusts: Trapezoid trust constraints canonicalized using
+      `canonicalize_trust`.
+    monotonic_dominances: Monotonic dominance constraints.
+    range_dominances: Range dominance constraints.
+    joint_monotonicities: Joint monotonicity constraints.
+    output_min: None or lower bound constraints.
+    output_max: None or upper bound constraints.
+
+  Returns:
+    Dict from constraint type ('monotonicity', 'trust', 'dominance' or
+    'bounds') to a 1-d tensor of non-negative violation amounts, one for each
+    constrained lattice vertex or group of vertices. Joint monotonicity is
+    reported as monotonicity. Constraint types which are not specified are
+    omitted.
+  """
+  units = int(weights.shape[1])
+  weights = tf.reshape(weights, shape=list(lattice_sizes) + [units])
+
+  def corner(offsets):
+    """Slices weights along dims of offsets dict with 0 or 1 vertex offsets."""
+    index = [slice(None)] * len(weights.shape)
+    for dim, offset in offsets.items():
+      index[dim] = slice(1, None) if offset else slice(None, -1)
+    return weights[tuple(index)]
+
+  violations = collections.defaultdict(list)
+  for dim, monotonicity in enumerate(monotonicities or []):
+    if monotonicity == 1:
+      violations["monotonicity"].append(-(corner({dim: 1}) - corner({dim: 0})))
+
+  for dim1, dim2 in joint_monotonicities or []:
+    midpoint = (corner({dim1: 1, dim2: 0}) + corner({dim1: 0, dim2: 1})) / 2
+    violations["monotonicity"].append(midpoint - corner({dim1: 1, dim2: 1}))
+    violations["monotonicity"].append(corner({dim1: 0, dim2: 0}) - midpoint)
+
+  for main_dim, cond_dim, cond_direction in edgeworth_trusts or []:
+    violations["trust"].append(
+        -cond_direction * ((corner({main_dim: 1, cond_dim: 1}) -
+                            corner({main_dim: 0, cond_dim: 1})) -
+                           (corner({main_dim: 1, cond_dim: 0}) -
+                            corner({main_dim: 0, cond_dim: 0}))))
+
+  for main_dim, cond_dim, cond_direction in trapezoid_trusts or []:
+    cond_diff = corner({cond_dim: 1}) - corner({cond_dim: 0})
+    # Values along cond_dim at the smallest main_dim vertex must move opposite
+    # to cond_direction and at the largest main_dim vertex along it.
+    violations["trust"].append(cond_direction *
+                               tf.gather(cond_diff, [0], axis=main_dim))
+    violations["trust"].append(
+        -cond_direction *
+        tf.gather(cond_diff, [lattice_sizes[main_dim] - 1], axis=main_dim))
+
+  for dominant_dim, weak_dim in monotonic_dominances or []:
+    midpoint = (corner({dominant_dim: 1, weak_dim: 1}) +
+                corner({dominant_dim: 0, weak_dim: 0})) / 2
+    violations["dominance"].append(midpoint -
+                                   corner({dominant_dim: 1, weak_dim: 0}))
+    violations["dominance"].append(
+        corner({dominant_dim: 0, weak_dim: 1}) - midpoint)
+
+  for dominant_dim, weak_dim in range_dominances or []:
+    dominant_range = (
+        tf.gather(weights, [lattice_sizes[dominant_dim] - 1],
+                  axis=dominant_dim) -
+        tf.gather(weights, [0], axis=dominant_dim))
+    weak_range = (
+        tf.gather(weights, [lattice_sizes[weak_dim] - 1], axis=weak_dim) -
+        tf.gather(weights, [0], axis=weak_dim))
+    # Broadcasts to all pairs of dominant_dim and weak_dim vertices.
+    violations["dominance"].append(weak_range - dominant_range)
+
+  if output_min is not None:
+    violations["bounds"].append(output_min - weights)
+  if output_max is not None:
+    violations["bounds"].append(weights - output_max)
+
+  return {
+      constraint_type: tf.nn.relu(
+          tf.concat([tf.reshape(v, [-1]) for v in values], axis=0))
+      for constraint_type, values in violations.items()
+  }
+
+
 def count_non_zeros(*iterables):
   """Returns total number of non 0 elements in given iterables."""
   result = 0
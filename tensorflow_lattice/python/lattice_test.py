@@ -17,6 +17,7 @@ from __future__ import division
 from __future__ import print_function
 
 import math
+import os
 
 from absl import logging
 from absl.testing import parameterized
@@ -24,6 +25,7 @@ import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow_lattice.python import lattice_layer as ll
+from tensorflow_lattice.python import lattice_lib
 from tensorflow_lattice.python import test_utils
 
 
@@ -1774,6 +1776,265 @@ class LatticeTest(parameterized.TestCase, tf.test.TestCase):
     loss = self._TrainModel(config)
     self.assertAlmostEqual(loss, expected_loss, delta=self.loss_eps)
 
+  @parameterized.parameters(
+      ([3], 1, True),
+      ([2, 3, 4], 1, True),
+      ([2, 3, 4], 1, False),
+      ([3, 2, 2, 3], 3, True),
+      ([3, 2, 2, 3], 3, False),
+  )
+  def testSparseKernelGradients(self, lattice_sizes, units, clip_inputs):
+    if self.disable_all:
+      return
+    self._ResetAllBackends()
+    np.random.seed(41)
+    num_weights = np.prod(lattice_sizes)
+    kernel = np.random.uniform(size=(num_weights, units))
+    input_shape = (100, units, len(lattice_sizes)) if units > 1 else (
+        100, len(lattice_sizes))
+    # Include inputs outside of the lattice range.
+    inputs = tf.constant(
+        np.random.uniform(-1.5, max(lattice_sizes) + 0.5, size=input_shape),
+        dtype=tf.float32)
+
+    outputs = []
+    gradients = []
+    for sparse_kernel_gradients in [False, True]:
+      layer = ll.Lattice(
+          lattice_sizes=lattice_sizes,
+          units=units,
+          clip_inputs=clip_inputs,
+          kernel_initializer=keras.initializers.Constant(kernel),
+          sparse_kernel_gradients=sparse_kernel_gradients)
+      with tf.GradientTape() as tape:
+        output = layer(inputs)
+        loss = tf.reduce_sum(output * output)
+      gradient = tape.gradient(loss, layer.kernel)
+      if sparse_kernel_gradients:
+        self.assertIsInstance(gradient, tf.IndexedSlices)
+      if not tf.executing_eagerly():
+        self.evaluate(tf.compat.v1.global_variables_initializer())
+      outputs.append(self.evaluate(output))
+      gradients.append(self.evaluate(tf.convert_to_tensor(gradient)))
+
+    self.assertAllClose(outputs[0], outputs[1])
+    self.assertAllClose(gradients[0], gradients[1])
+
+  @parameterized.parameters(
+      ([3], 4, 0.5, 2, False),
+      ([2, 3], 5, 0.3, 4, False),
+      ([2, 3], 5, 0.3, 4, True),
+      ([2, 2, 2], 3, 0.9, 1, True),
+  )
+  def testLatticeDropout(self, lattice_sizes, units, dropout_rate,
+                         num_active_units, sparse_kernel_gradients):
+    if self.disable_all:
+      return
+    self._ResetAllBackends()
+    np.random.seed(41)
+    num_weights = np.prod(lattice_sizes)
+    kernel = np.random.uniform(1.0, 2.0, size=(num_weights, units))
+    inputs = tf.constant(
+        np.random.uniform(0.0, 1.0, size=(20, units, len(lattice_sizes))) *
+        (np.array(lattice_sizes) - 1.0),
+        dtype=tf.float32)
+    layer = ll.Lattice(
+        lattice_sizes=lattice_sizes,
+        units=units,
+        monotonicities=[1] * len(lattice_sizes),
+        kernel_initializer=keras.initializers.Constant(kernel),
+        dropout_rate=dropout_rate,
+        sparse_kernel_gradients=sparse_kernel_gradients)
+    full_outputs = layer(inputs)
+    inference_outputs = layer(inputs, training=False)
+    with tf.GradientTape() as tape:
+      outputs = layer(inputs, training=True)
+      loss = tf.reduce_sum(outputs)
+    gradient = tape.gradient(loss, layer.kernel)
+    if sparse_kernel_gradients:
+      self.assertIsInstance(gradient, tf.IndexedSlices)
+    gradient = tf.convert_to_tensor(gradient)
+    if not tf.executing_eagerly():
+      self.evaluate(tf.compat.v1.global_variables_initializer())
+    full_outputs, inference_outputs, outputs, gradient = self.evaluate(
+        [full_outputs, inference_outputs, outputs, gradient])
+    active_units = self.evaluate(layer.active_units)
+    self.assertAllClose(inference_outputs, full_outputs)
+
+    self.assertLen(set(active_units), num_active_units)
+    inactive_units = sorted(set(range(units)) - set(active_units))
+    self.assertAllClose(outputs[:, active_units],
+                        full_outputs[:, active_units] * units / num_active_units)
+    self.assertAllEqual(outputs[:, inactive_units],
+                        np.zeros([20, len(inactive_units)]))
+    self.assertAllEqual(gradient[:, inactive_units],
+                        np.zeros([num_weights, len(inactive_units)]))
+
+    # All units are projected onto the constraints.
+    decreasing_kernel = -np.tile(
+        np.arange(num_weights, dtype=np.float32)[:, np.newaxis], [1, units])
+    projected = self.evaluate(
+        layer.kernel.constraint(tf.constant(decreasing_kernel)))
+    for unit in range(units):
+      self.assertNotAllClose(projected[:, unit], decreasing_kernel[:, unit])
+
+    # Single unit lattices are not dropped.
+    layer = ll.Lattice(lattice_sizes=lattice_sizes, dropout_rate=dropout_rate)
+    outputs = [layer(inputs[:, 0], training=True), layer(inputs[:, 0])]
+    if not tf.executing_eagerly():
+      self.evaluate(tf.compat.v1.global_variables_initializer())
+    outputs = self.evaluate(outputs)
+    self.assertAllClose(outputs[0], outputs[1])
+    with self.assertRaises(ValueError):
+      ll.Lattice(lattice_sizes=lattice_sizes, dropout_rate=1.0)
+
+  @parameterized.parameters(
+      ([3], 4, False, 0.0),
+      ([2, 3, 2], 3, False, 0.0),
+      ([2, 3, 2], 3, True, 0.0),
+      ([2, 3], 5, False, 0.4),
+      ([2, 3], 5, True, 0.4),
+  )
+  def testSharedInputs(self, lattice_sizes, units, sparse_kernel_gradients,
+                       dropout_rate):
+    if self.disable_all:
+      return
+    self._ResetAllBackends()
+    np.random.seed(41)
+    num_weights = np.prod(lattice_sizes)
+    kernel = np.random.uniform(size=(num_weights, units))
+    inputs = tf.constant(
+        np.random.uniform(-0.5, max(lattice_sizes) - 0.5,
+                          size=(50, len(lattice_sizes))),
+        dtype=tf.float32)
+    stacked_inputs = tf.stack([inputs] * units, axis=1)
+    layers = [
+        ll.Lattice(
+            lattice_sizes=lattice_sizes,
+            units=units,
+            kernel_initializer=keras.initializers.Constant(kernel),
+            sparse_kernel_gradients=sparse_kernel_gradients,
+            dropout_rate=dropout_rate,
+            shared_inputs=shared_inputs)
+        for shared_inputs in [False, True]
+    ]
+    outputs = [layers[0](stacked_inputs), layers[1](inputs)]
+    self.assertEqual(layers[1].compute_output_shape(inputs.shape),
+                     (50, units))
+    if not tf.executing_eagerly():
+      self.evaluate(tf.compat.v1.global_variables_initializer())
+    outputs = self.evaluate(outputs)
+    self.assertAllClose(outputs[0], outputs[1])
+
+    if dropout_rate:
+      with tf.GradientTape() as tape:
+        dropout_outputs = layers[1](inputs, training=True)
+        loss = tf.reduce_sum(dropout_outputs)
+      gradient = tf.convert_to_tensor(tape.gradient(loss, layers[1].kernel))
+      dropout_outputs, gradient = self.evaluate([dropout_outputs, gradient])
+      active_units = self.evaluate(layers[1].active_units)
+      inactive_units = sorted(set(range(units)) - set(active_units))
+      self.assertAllClose(
+          dropout_outputs[:, active_units],
+          outputs[1][:, active_units] * units / len(active_units))
+      self.assertAllEqual(dropout_outputs[:, inactive_units],
+                          np.zeros([50, len(inactive_units)]))
+      self.assertAllEqual(gradient[:, inactive_units],
+                          np.zeros([num_weights, len(inactive_units)]))
+
+  def testLatticeDropoutConstraints(self):
+    if self.disable_all or not tf.executing_eagerly():
+      return
+    self._ResetAllBackends()
+    np.random.seed(41)
+    inputs = keras.Input(shape=(6, 2))
+    layer = ll.Lattice(
+        lattice_sizes=[3, 3],
+        units=6,
+        monotonicities=[1, 1],
+        output_min=0.0,
+        output_max=1.0,
+        dropout_rate=0.5)
+    model = keras.Model(inputs=inputs, outputs=layer(inputs))
+    # Adam keeps moving inactive units with its momentum.
+    model.compile(loss="mse", optimizer=keras.optimizers.Adam(0.5))
+    x = np.random.uniform(0.0, 2.0, size=(100, 6, 2)).astype(np.float32)
+    y = np.random.uniform(-1.0, 2.0, size=(100, 6)).astype(np.float32)
+    model.fit(x, y, epochs=5, batch_size=10, verbose=0)
+    layer.assert_constraints(eps=1e-4)
+
+  def testLatticeDropoutSavedModel(self):
+    if self.disable_all or not tf.executing_eagerly():
+      return
+    self._ResetAllBackends()
+    inputs = keras.Input(shape=(4, 2))
+    model = keras.Model(
+        inputs=inputs,
+        outputs=ll.Lattice(lattice_sizes=[2, 3], units=4, dropout_rate=0.5)(
+            inputs))
+    model.compile(loss="mse", optimizer=keras.optimizers.Adagrad(0.1))
+    x = np.random.uniform(size=(20, 4, 2)).astype(np.float32)
+    y = np.random.uniform(size=(20, 4)).astype(np.float32)
+    model.fit(x, y, epochs=1, verbose=0)
+    self.assertLen(model.non_trainable_weights, 1)
+    path = os.path.join(self.get_temp_dir(), "model")
+    model.save(path, save_format="tf")
+    loaded_model = keras.models.load_model(path)
+    self.assertAllClose(loaded_model.predict(x, verbose=0),
+                        model.predict(x, verbose=0))
+
+  @parameterized.parameters(
+      ([3, 2], {"monotonicities": [1, 0]}, "monotonicity"),
+      ([3, 3], {"joint_monotonicities": [(0, 1)]}, "monotonicity"),
+      ([3, 3], {"edgeworth_trusts": [(0, 1, 1)]}, "trust"),
+      ([3, 3], {"edgeworth_trusts": [(1, 0, -1)]}, "trust"),
+      ([2, 3], {"trapezoid_trusts": [(0, 1, 1)]}, "trust"),
+      ([3, 2], {"trapezoid_trusts": [(0, 1, -1)]}, "trust"),
+      ([3, 2, 2], {"monotonic_dominances": [(0, 2)]}, "dominance"),
+      ([3, 2, 2], {"range_dominances": [(2, 0)]}, "dominance"),
+      ([3, 2], {"output_min": 0.5, "output_max": 2.5}, "bounds"),
+  )
+  def testConstraintViolations(self, lattice_sizes, constraints,
+                               constraint_type):
+    if self.disable_all:
+      return
+    np.random.seed(41)
+    # Weights of an increasing linear function with noise of different scales,
+    # so that constraints are satisfied for some of the weights.
+    grid = np.meshgrid(*[range(size) for size in lattice_sizes], indexing="ij")
+    linear = np.sum(grid, axis=0).reshape([-1, 1]) / len(lattice_sizes)
+    for units in [1, 3]:
+      for noise in [0.0, 0.01, 0.1, 1.0]:
+        weights = tf.constant(
+            linear + noise * np.random.normal(size=(linear.size, units)))
+        kwargs = {
+            "monotonicities": None,
+            "edgeworth_trusts": None,
+            "trapezoid_trusts": None,
+            "monotonic_dominances": None,
+            "range_dominances": None,
+            "joint_monotonicities": None,
+        }
+        kwargs.update(constraints)
+        violations = self.evaluate(
+            lattice_lib.constraint_violations(
+                weights=weights, lattice_sizes=lattice_sizes, **kwargs))
+        self.assertEqual(list(violations), [constraint_type])
+        self.assertTrue(np.all(violations[constraint_type] >= 0.0))
+        violated = np.max(violations[constraint_type]) > self.small_eps
+        try:
+          self.evaluate(
+              lattice_lib.assert_constraints(
+                  weights=weights,
+                  lattice_sizes=lattice_sizes,
+                  joint_unimodalities=None,
+                  eps=self.small_eps,
+                  **kwargs))
+          asserted = False
+        except tf.errors.InvalidArgumentError:
+          asserted = True
+        self.assertEqual(violated, asserted)
+
   @parameterized.parameters(
       ([2, 2, 2, 2, 2, 2], 92),
       ([2, 2, 3, 2, 3, 2], 117),
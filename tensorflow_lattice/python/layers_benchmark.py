@@ -0,0 +1,432 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Micro-benchmarks for TF Lattice layers.
+
+Measures forward pass, backward pass and constraint projection wall time and
+peak memory of TFL layers over a sweep of layer hyperparameters and batch
+sizes. Run with:
+
+```shell
+python -m tensorflow_lattice.python.layers_benchmark --benchmark_filter=. \
+    --benchmark_output_file=/tmp/tfl_layers_benchmark.json
+```
+
+`--benchmark_filter` (`--benchmarks` in older TF versions) is a regex selecting
+the benchmark methods to run, e.g. `--benchmark_filter=benchmarkLattice`. Each
+benchmark result is reported using `tf.test.Benchmark.report_benchmark` and, if
+`--benchmark_output_file` is set, also appended to the given file as a single
+line JSON object so that results of different runs can be compared over time.
+Peak memory is read from the memory stats of devices that track them (e.g.
+GPUs). On other devices, e.g. CPUs, the increase of the peak resident set size
+of the process is reported instead. It only accounts for memory beyond the peak
+of earlier measurements, so it is a lower bound. `peak_memory_source` records
+which measurement was used, or `unavailable` if neither is supported.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import json
+import sys
+import time
+
+from absl import flags
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import categorical_calibration_layer
+from tensorflow_lattice.python import lattice_layer
+from tensorflow_lattice.python import linear_layer
+from tensorflow_lattice.python import parallel_combination_layer
+from tensorflow_lattice.python import pwl_calibration_layer
+from tensorflow_lattice.python import rtl_layer
+
+try:
+  import resource  # pylint: disable=g-import-not-at-top
+except ImportError:
+  # Not available on Windows.
+  resource = None
+
+flags.DEFINE_string(
+    'benchmark_output_file', None,
+    'If set, benchmark results are appended to this file as JSON lines.')
+flags.DEFINE_integer('benchmark_iters', 20,
+                     'Number of timed iterations for each measurement.')
+flags.DEFINE_integer('benchmark_warmup_iters', 3,
+                     'Number of untimed iterations before each measurement.')
+
+FLAGS = flags.FLAGS
+
+_BATCH_SIZES = [32, 1024]
+
+# Lattice sweep: (lattice_sizes, units).
+_LATTICE_SHAPES = [
+    ([2] * 2, 1),
+    ([2] * 4, 1),
+    ([2] * 8, 1),
+    ([3] * 4, 1),
+    ([5] * 3, 1),
+    ([2] * 4, 16),
+    ([3] * 4, 16),
+]
+# Lattice constraint sets. Indices refer to the first two lattice dimensions.
+_LATTICE_CONSTRAINTS = {
+    'none': {},
+    'monotonic': {
+        'monotonicities': 'increasing',
+    },
+    'monotonic_trust': {
+        'monotonicities': 'increasing',
+        'edgeworth_trusts': [(0, 1, 'positive')],
+        'trapezoid_trusts': [(0, 1, 'positive')],
+    },
+    'monotonic_dominance': {
+        'monotonicities': 'increasing',
+        'monotonic_dominances': [(0, 1)],
+    },
+    'monotonic_bounds': {
+        'monotonicities': 'increasing',
+        'output_min': 0.0,
+        'output_max': 1.0,
+    },
+}
+
+# PWL calibration sweep: (num_keypoints, units).
+_PWL_CALIBRATION_SHAPES = [(10, 1), (100, 1), (1000, 1), (10, 16), (100, 16)]
+_PWL_CALIBRATION_CONSTRAINTS = {
+    'none': {},
+    'monotonic': {
+        'monotonicity': 'increasing',
+    },
+    'monotonic_convex_bounds': {
+        'monotonicity': 'increasing',
+        'convexity': 'convex',
+        'output_min': 0.0,
+        'output_max': 1.0,
+    },
+}
+
+# Categorical calibration sweep: (num_buckets, units).
+_CATEGORICAL_CALIBRATION_SHAPES = [(10, 1), (1000, 1), (100000, 1), (10, 16)]
+_CATEGORICAL_CALIBRATION_CONSTRAINTS = {
+    'none': {},
+    'monotonic_bounds': {
+        'monotonicities': [(0, 1), (1, 2)],
+        'output_min': 0.0,
+        'output_max': 1.0,
+    },
+}
+
+# Linear sweep: num_input_dims.
+_LINEAR_SHAPES = [4, 64, 512]
+_LINEAR_CONSTRAINTS = {
+    'none': {},
+    'monotonic': {
+        'monotonicities': 'increasing',
+    },
+    'monotonic_normalized': {
+        'monotonicities': 'increasing',
+        'normalization_order': 1,
+    },
+}
+
+# RTL sweep: (num_features, num_lattices, lattice_rank, lattice_size).
+_RTL_SHAPES = [
+    (8, 8, 2, 2),
+    (16, 32, 4, 2),
+    (32, 128, 4, 2),
+    (32, 64, 4, 3),
+]
+_RTL_CONSTRAINTS = {
+    'none': 0.0,
+    'half_monotonic': 0.5,
+    'monotonic': 1.0,
+}
+
+# Parallel combination sweep: number of PWL calibrators.
+_PARALLEL_COMBINATION_SHAPES = [4, 32, 128]
+
+
+def _time_fn(fn, iters, warmup_iters):
+  """Returns median wall time of fn() in seconds."""
+  for _ in range(warmup_iters):
+    fn()
+  times = []
+  for _ in range(iters):
+    start = time.time()
+    fn()
+    times.append(time.time() - start)
+  return float(np.median(times))
+
+
+def _device_name():
+  """Returns the name of the device used for memory measurements."""
+  if tf.config.list_logical_devices('GPU'):
+    return 'GPU:0'
+  return 'CPU:0'
+
+
+def _max_rss():
+  """Returns the peak resident set size of the process in bytes or None."""
+  if resource is None:
+    return None
+  max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+  return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _reset_peak_memory():
+  """Resets peak memory stats and returns the peak resident set size."""
+  try:
+    tf.config.experimental.reset_memory_stats(_device_name())
+  except (ValueError, AttributeError):
+    pass
+  return _max_rss()
+
+
+def _peak_memory(start_max_rss):
+  """Returns peak memory in bytes and the source of the measurement.
+
+  Args:
+    start_max_rss: Peak resident set size returned by `_reset_peak_memory`.
+
+  Returns:
+    A tuple `(peak_memory, source)`. `source` is 'device' if the device tracks
+    memory stats, 'max_rss_increase' if the increase of the peak resident set
+    size of the process is used instead, or 'unavailable' if neither is
+    supported, in which case `peak_memory` is None.
+  """
+  try:
+    peak_memory = tf.config.experimental.get_memory_info(_device_name())['peak']
+  except (ValueError, AttributeError):
+    peak_memory = 0
+  # Devices that do not track memory stats report zero.
+  if peak_memory:
+    return int(peak_memory), 'device'
+  max_rss = _max_rss()
+  if max_rss is None or start_max_rss is None:
+    return None, 'unavailable'
+  return max_rss - start_max_rss, 'max_rss_increase'
+
+
+class LayersBenchmark(tf.test.Benchmark):
+  """Benchmarks forward, backward and projection time of TFL layers."""
+
+  def _run_layer_benchmark(self, layer_name, layer, inputs, params):
+    """Measures and reports performance of a single layer configuration.
+
+    Args:
+      layer_name: Name of the benchmarked layer type.
+      layer: Keras layer to benchmark. Must not be built yet.
+      inputs: Inputs to the layer. A tensor or a dict/list of tensors.
+      params: Dict of parameters of the benchmark configuration. Used in the
+        benchmark name and reported with the results.
+
+    Returns:
+      Dict with benchmark results.
+    """
+    iters = FLAGS.benchmark_iters
+    warmup_iters = FLAGS.benchmark_warmup_iters
+    # Builds the layer.
+    layer(inputs)
+    variables = layer.trainable_variables
+
+    @tf.function
+    def forward():
+      return layer(inputs)
+
+    @tf.function
+    def backward():
+      with tf.GradientTape() as tape:
+        loss = tf.reduce_sum(layer(inputs))
+      return tape.gradient(loss, variables)
+
+    constrained_variables = [
+        variable for variable in variables
+        if getattr(variable, 'constraint', None) is not None
+    ]
+
+    @tf.function
+    def project():
+      return [
+          variable.assign(variable.constraint(variable))
+          for variable in constrained_variables
+      ]
+
+    start_max_rss = _reset_peak_memory()
+    forward_time = _time_fn(forward, iters, warmup_iters)
+    backward_time = _time_fn(backward, iters, warmup_iters)
+    if constrained_variables:
+      projection_time = _time_fn(project, iters, warmup_iters)
+    else:
+      projection_time = 0.0
+    peak_memory, peak_memory_source = _peak_memory(start_max_rss)
+
+    name = '{}_{}'.format(
+        layer_name, '_'.join('{}_{}'.format(key, params[key])
+                             for key in sorted(params)))
+    extras = {
+        'forward_time': forward_time,
+        'backward_time': backward_time,
+        'projection_time': projection_time,
+        'num_weights': int(sum(np.prod(v.shape) for v in variables)),
+        'peak_memory_source': peak_memory_source,
+    }
+    if peak_memory is not None:
+      extras['peak_memory_bytes'] = peak_memory
+    self.report_benchmark(
+        iters=iters,
+        wall_time=forward_time + backward_time + projection_time,
+        name=name,
+        extras=extras)
+
+    result = {
+        'name': name,
+        'layer': layer_name,
+        'params': params,
+        'iters': iters,
+        'device': _device_name(),
+        'tf_version': tf.__version__,
+        'timestamp': time.time(),
+    }
+    result.update(extras)
+    # Unavailable peak memory is recorded explicitly as null.
+    result['peak_memory_bytes'] = peak_memory
+    if FLAGS.benchmark_output_file:
+      with tf.io.gfile.GFile(FLAGS.benchmark_output_file, 'a') as f:
+        f.write(json.dumps(result, sort_keys=True) + '\n')
+    return result
+
+  def benchmarkLattice(self):
+    for (lattice_sizes, units), constraint_name, batch_size in itertools.product(
+        _LATTICE_SHAPES, sorted(_LATTICE_CONSTRAINTS), _BATCH_SIZES):
+      constraints = dict(_LATTICE_CONSTRAINTS[constraint_name])
+      if constraints.get('monotonicities') == 'increasing':
+        constraints['monotonicities'] = ['increasing'] * len(lattice_sizes)
+      layer = lattice_layer.Lattice(
+          lattice_sizes=lattice_sizes, units=units, **constraints)
+      input_shape = [batch_size, len(lattice_sizes)]
+      if units > 1:
+        input_shape.insert(1, units)
+      inputs = tf.random.uniform(
+          input_shape, maxval=min(lattice_sizes) - 1.0, seed=42)
+      self._run_layer_benchmark(
+          'lattice', layer, inputs, {
+              'lattice_size': lattice_sizes[0],
+              'rank': len(lattice_sizes),
+              'units': units,
+              'constraints': constraint_name,
+              'batch_size': batch_size,
+          })
+
+  def benchmarkPWLCalibration(self):
+    for (num_keypoints, units), constraint_name, batch_size in (
+        itertools.product(_PWL_CALIBRATION_SHAPES,
+                          sorted(_PWL_CALIBRATION_CONSTRAINTS), _BATCH_SIZES)):
+      layer = pwl_calibration_layer.PWLCalibration(
+          input_keypoints=np.linspace(0.0, 1.0, num=num_keypoints),
+          units=units,
+          **_PWL_CALIBRATION_CONSTRAINTS[constraint_name])
+      inputs = tf.random.uniform([batch_size, 1], seed=42)
+      self._run_layer_benchmark(
+          'pwl_calibration', layer, inputs, {
+              'num_keypoints': num_keypoints,
+              'units': units,
+              'constraints': constraint_name,
+              'batch_size': batch_size,
+          })
+
+  def benchmarkCategoricalCalibration(self):
+    for (num_buckets, units), constraint_name, batch_size in itertools.product(
+        _CATEGORICAL_CALIBRATION_SHAPES,
+        sorted(_CATEGORICAL_CALIBRATION_CONSTRAINTS), _BATCH_SIZES):
+      layer = categorical_calibration_layer.CategoricalCalibration(
+          num_buckets=num_buckets,
+          units=units,
+          **_CATEGORICAL_CALIBRATION_CONSTRAINTS[constraint_name])
+      inputs = tf.random.uniform([batch_size, 1],
+                                 maxval=num_buckets,
+                                 dtype=tf.int32,
+                                 seed=42)
+      self._run_layer_benchmark(
+          'categorical_calibration', layer, inputs, {
+              'num_buckets': num_buckets,
+              'units': units,
+              'constraints': constraint_name,
+              'batch_size': batch_size,
+          })
+
+  def benchmarkLinear(self):
+    for num_input_dims, constraint_name, batch_size in itertools.product(
+        _LINEAR_SHAPES, sorted(_LINEAR_CONSTRAINTS), _BATCH_SIZES):
+      constraints = dict(_LINEAR_CONSTRAINTS[constraint_name])
+      if constraints.get('monotonicities') == 'increasing':
+        constraints['monotonicities'] = ['increasing'] * num_input_dims
+      layer = linear_layer.Linear(num_input_dims=num_input_dims, **constraints)
+      inputs = tf.random.uniform([batch_size, num_input_dims], seed=42)
+      self._run_layer_benchmark(
+          'linear', layer, inputs, {
+              'num_input_dims': num_input_dims,
+              'constraints': constraint_name,
+              'batch_size': batch_size,
+          })
+
+  def benchmarkRTL(self):
+    for ((num_features, num_lattices, lattice_rank, lattice_size),
+         constraint_name, batch_size) in itertools.product(
+             _RTL_SHAPES, sorted(_RTL_CONSTRAINTS), _BATCH_SIZES):
+      num_monotonic = int(num_features * _RTL_CONSTRAINTS[constraint_name])
+      inputs = {}
+      if num_monotonic:
+        inputs['increasing'] = tf.random.uniform(
+            [batch_size, num_monotonic], seed=42)
+      if num_features > num_monotonic:
+        inputs['unconstrained'] = tf.random.uniform(
+            [batch_size, num_features - num_monotonic], seed=43)
+      layer = rtl_layer.RTL(
+          num_lattices=num_lattices,
+          lattice_rank=lattice_rank,
+          lattice_size=lattice_size)
+      self._run_layer_benchmark(
+          'rtl', layer, inputs, {
+              'num_features': num_features,
+              'num_lattices': num_lattices,
+              'rank': lattice_rank,
+              'lattice_size': lattice_size,
+              'constraints': constraint_name,
+              'batch_size': batch_size,
+          })
+
+  def benchmarkParallelCombination(self):
+    for num_calibrators, batch_size in itertools.product(
+        _PARALLEL_COMBINATION_SHAPES, _BATCH_SIZES):
+      layer = parallel_combination_layer.ParallelCombination()
+      for _ in range(num_calibrators):
+        layer.append(
+            pwl_calibration_layer.PWLCalibration(
+                input_keypoints=np.linspace(0.0, 1.0, num=20),
+                monotonicity='increasing',
+                output_min=0.0,
+                output_max=1.0))
+      inputs = tf.random.uniform([batch_size, num_calibrators], seed=42)
+      self._run_layer_benchmark(
+          'parallel_combination', layer, inputs, {
+              'num_calibrators': num_calibrators,
+              'batch_size': batch_size,
+          })
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,77 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for lazy imports of heavy TFL submodules."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import subprocess
+import sys
+
+import tensorflow as tf
+from tensorflow_lattice.python import import_benchmark
+
+
+class LazyImportTest(tf.test.TestCase):
+
+  def _Run(self, code):
+    """Runs code in a fresh interpreter and returns its stripped stdout."""
+    process = subprocess.Popen([sys.executable, '-c', code],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    self.assertEqual(process.returncode, 0, stderr.decode('utf-8', 'replace'))
+    return stdout.decode('utf-8').strip().splitlines()[-1]
+
+  def testHeavyDependenciesAreNotImported(self):
+    result = import_benchmark.measure_import(
+        'import tensorflow_lattice as tfl; tfl.layers.Lattice; tfl.premade')
+    self.assertFalse(result['loads_matplotlib'])
+    self.assertFalse(result['loads_estimator'])
+    self.assertGreater(result['import_time'], 0.0)
+    self.assertGreater(result['max_rss_mb'], 0.0)
+
+  def testLazySubmodules(self):
+    output = self._Run(
+        'import sys\n'
+        'import tensorflow_lattice as tfl\n'
+        'lazy = ["estimators", "test_utils", "visualization"]\n'
+        'assert all(name in dir(tfl) for name in lazy)\n'
+        'assert "tensorflow_lattice.python.estimators" not in sys.modules\n'
+        'assert tfl.estimators.CannedClassifier is not None\n'
+        'assert tfl.visualization.plot_outputs is not None\n'
+        'assert tfl.test_utils.run_training_loop is not None\n'
+        'from tensorflow_lattice import estimators\n'
+        'assert estimators is tfl.estimators\n'
+        'print("ok")\n')
+    self.assertEqual(output, 'ok')
+
+  def testImportWithoutMatplotlib(self):
+    # Setting a sys.modules entry to None makes imports of it fail.
+    output = self._Run(
+        'import sys\n'
+        'sys.modules["matplotlib"] = None\n'
+        'import tensorflow_lattice as tfl\n'
+        'tfl.layers.Lattice(lattice_sizes=[2, 2])\n'
+        'tfl.test_utils.two_dim_mesh_grid(4, 0.0, 0.0, 1.0, 1.0)\n'
+        'try:\n'
+        '  tfl.visualization\n'
+        'except ImportError:\n'
+        '  print("ok")\n')
+    self.assertEqual(output, 'ok')
+
+
+if __name__ == '__main__':
+  tf.test.main()
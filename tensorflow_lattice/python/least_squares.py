@@ -0,0 +1,450 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Direct constrained least-squares fitting of small calibrated lattice models.
+
+With fixed calibrators, the output of a lattice is linear in its kernel, and
+with a fixed lattice, the output of a calibrator is linear in its kernel. So
+for squared loss, fitting each layer while the others are fixed is a quadratic
+program with linear constraints (monotonicity, convexity and output bounds).
+The quadratic terms of Laplacian, torsion and the other `tfl` regularizers are
+taken from the layers' own regularizers.
+
+`fit_least_squares` alternates between the layers of the model (input
+calibrators, lattices and the output calibrator). For each layer it forms the
+normal equations of the model linearized in the layer kernel, which is exact
+for lattices without output calibration, solves the constrained problem using
+ADMM and keeps the update only if it decreases the objective. For small models
+this converges in a few alternations, instead of the thousands of gradient
+steps needed by SGD.
+
+```python
+model = tfl.premade.CalibratedLattice(model_config)
+losses = tfl.least_squares.fit_least_squares(model, inputs, labels)
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from . import categorical_calibration_layer
+from . import lattice_layer
+from . import lattice_lib
+from . import pwl_calibration_layer
+from . import pwl_calibration_lib
+import numpy as np
+import tensorflow as tf
+
+_FITTED_LAYER_TYPES = (categorical_calibration_layer.CategoricalCalibration,
+                       lattice_layer.Lattice, pwl_calibration_layer.PWLCalibration)
+
+
+def solve_qp(quadratic,
+             linear,
+             constraints=None,
+             lower=None,
+             upper=None,
+             initial=None,
+             rho=1.0,
+             num_iterations=1000,
+             tolerance=1e-7):
+  """Minimizes `x^T quadratic x / 2 - linear^T x` s.t. `lower <= C x <= upper`.
+
+  Uses the ADMM splitting of OSQP: the linear system is inverted once, which is
+  cheap for the kernels of small models, and each iteration solves it and
+  projects the constraint values onto the bounds.
+
+  Args:
+    quadratic: Positive semi-definite matrix of shape `(n, n)`.
+    linear: Vector of shape `(n,)`.
+    constraints: Constraint matrix `C` of shape `(m, n)`, or None.
+    lower: Lower bounds of shape `(m,)`. May contain `-np.inf`.
+    upper: Upper bounds of shape `(m,)`. May contain `np.inf`.
+    initial: Initial solution of shape `(n,)`. Also used to regularize
+      directions in which `quadratic` is singular.
+    rho: ADMM penalty parameter.
+    num_iterations: Maximum number of ADMM iterations.
+    tolerance: Stops when primal and dual residuals are below this value.
+
+  Returns:
+    Solution vector of shape `(n,)`.
+  """
+  quadratic = np.asarray(quadratic, dtype=np.float64)
+  linear = np.asarray(linear, dtype=np.float64)
+  size = linear.shape[0]
+  x = (np.zeros(size) if initial is None else np.asarray(
+      initial, dtype=np.float64))
+  # Small proximal term keeps the system positive definite.
+  sigma = 1e-6 * max(1.0, np.trace(quadratic) / max(size, 1))
+  if constraints is None or not len(constraints):
+    return np.linalg.solve(quadratic + sigma * np.eye(size),
+                           linear + sigma * x)
+
+  constraints = np.asarray(constraints, dtype=np.float64)
+  lower = np.asarray(lower, dtype=np.float64)
+  upper = np.asarray(upper, dtype=np.float64)
+  inverse = np.linalg.inv(quadratic + sigma * np.eye(size) +
+                          rho * np.dot(constraints.T, constraints))
+  z = np.clip(np.dot(constraints, x), lower, upper)
+  u = np.zeros_like(z)
+  for _ in range(num_iterations):
+    rhs = sigma * x + linear + rho * np.dot(constraints.T, z - u)
+    x = np.dot(inverse, rhs)
+    constraint_values = np.dot(constraints, x)
+    z_previous = z
+    z = np.clip(constraint_values + u, lower, upper)
+    u += constraint_values - z
+    primal_residual = np.max(np.abs(constraint_values - z))
+    dual_residual = rho * np.max(
+        np.abs(np.dot(constraints.T, z - z_previous)))
+    if primal_residual < tolerance and dual_residual < tolerance:
+      break
+  return x
+
+
+def _lattice_constraints(layer):
+  """Returns linear constraints on the flattened kernel of a lattice layer."""
+  lattice_sizes = list(layer.lattice_sizes)
+  num_vertices = int(np.prod(lattice_sizes))
+  units = layer.units
+  vertices = np.reshape(np.arange(num_vertices), lattice_sizes)
+  rows, lower, upper = [], [], []
+  monotonicities = (
+      lattice_lib.canonicalize_monotonicities(layer.monotonicities) or
+      [0] * len(lattice_sizes))
+  for dim, monotonicity in enumerate(monotonicities):
+    if not monotonicity:
+      continue
+    # Pairs of adjacent vertices along the dimension.
+    first = np.take(vertices, np.arange(lattice_sizes[dim] - 1), axis=dim)
+    second = np.take(vertices, np.arange(1, lattice_sizes[dim]), axis=dim)
+    for i, j in zip(first.flatten(), second.flatten()):
+      for unit in range(units):
+        row = np.zeros(num_vertices * units)
+        row[j * units + unit] = 1.0
+        row[i * units + unit] = -1.0
+        rows.append(row)
+        lower.append(0.0)
+        upper.append(np.inf)
+  if layer.output_min is not None or layer.output_max is not None:
+    rows.extend(np.eye(num_vertices * units))
+    lower.extend([_bound(layer.output_min, -np.inf)] * num_vertices * units)
+    upper.extend([_bound(layer.output_max, np.inf)] * num_vertices * units)
+  return rows, lower, upper
+
+
+def _pwl_calibration_constraints(layer):
+  """Returns linear constraints on the flattened kernel of a PWL calibrator."""
+  if layer.is_cyclic:
+    raise ValueError('Cyclic PWL calibration is not supported.')
+  num_keypoints = len(layer.input_keypoints)
+  units = layer.units
+  size = num_keypoints * units
+  lengths = np.diff(np.asarray(layer.input_keypoints, dtype=np.float64))
+  monotonicity = pwl_calibration_lib.canonicalize_monotonicity(
+      layer.monotonicity)
+  convexity = pwl_calibration_lib.canonicalize_convexity(layer.convexity)
+  output_min = _bound(layer.output_min, -np.inf)
+  output_max = _bound(layer.output_max, np.inf)
+  rows, lower, upper = [], [], []
+  for unit in range(units):
+    # Kernel holds the output at the first keypoint followed by the differences
+    # between outputs at consecutive keypoints.
+    def index(k, unit=unit):
+      return k * units + unit
+
+    if monotonicity:
+      for k in range(1, num_keypoints):
+        row = np.zeros(size)
+        row[index(k)] = monotonicity
+        rows.append(row)
+        lower.append(0.0)
+        upper.append(np.inf)
+    if convexity:
+      for k in range(1, num_keypoints - 1):
+        row = np.zeros(size)
+        row[index(k + 1)] = convexity / lengths[k]
+        row[index(k)] = -convexity / lengths[k - 1]
+        rows.append(row)
+        lower.append(0.0)
+        upper.append(np.inf)
+    if layer.output_min is not None or layer.output_max is not None:
+      for k in range(num_keypoints):
+        row = np.zeros(size)
+        row[[index(j) for j in range(k + 1)]] = 1.0
+        keypoint_min, keypoint_max = output_min, output_max
+        # Clamped outputs at the extreme keypoints of monotonic calibrators.
+        is_min_keypoint = k == (0 if monotonicity == 1 else num_keypoints - 1)
+        is_max_keypoint = k == (num_keypoints - 1 if monotonicity == 1 else 0)
+        if monotonicity and layer.clamp_min and is_min_keypoint:
+          keypoint_max = output_min
+        if monotonicity and layer.clamp_max and is_max_keypoint:
+          keypoint_min = output_max
+        rows.append(row)
+        lower.append(keypoint_min)
+        upper.append(keypoint_max)
+  return rows, lower, upper
+
+
+def _categorical_calibration_constraints(layer):
+  """Returns linear constraints on the flattened kernel of a categorical layer."""
+  units = layer.units
+  size = layer.num_buckets * units
+  rows, lower, upper = [], [], []
+  for i, j in layer.monotonicities or []:
+    for unit in range(units):
+      row = np.zeros(size)
+      row[j * units + unit] = 1.0
+      row[i * units + unit] = -1.0
+      rows.append(row)
+      lower.append(0.0)
+      upper.append(np.inf)
+  if layer.output_min is not None or layer.output_max is not None:
+    rows.extend(np.eye(size))
+    lower.extend([_bound(layer.output_min, -np.inf)] * size)
+    upper.extend([_bound(layer.output_max, np.inf)] * size)
+  return rows, lower, upper
+
+
+def _bound(value, default):
+  return default if value is None else value
+
+
+def _kernel_constraints(layer):
+  """Returns `(C, lower, upper)` constraining the flattened layer kernel."""
+  if isinstance(layer, lattice_layer.Lattice):
+    rows, lower, upper = _lattice_constraints(layer)
+  elif isinstance(layer, pwl_calibration_layer.PWLCalibration):
+    rows, lower, upper = _pwl_calibration_constraints(layer)
+  else:
+    rows, lower, upper = _categorical_calibration_constraints(layer)
+  if not rows:
+    return None, None, None
+  return np.array(rows), np.array(lower), np.array(upper)
+
+
+def _regularization_hessian(layer):
+  """Returns the Hessian of the layer losses w.r.t. its kernel.
+
+  TFL regularizers are quadratic in the kernel up to their l1 terms, so the
+  Hessian is constant and the regularization loss is represented exactly by
+  the Hessian and the gradient at the current kernel.
+  """
+  kernel = layer.kernel
+  size = int(np.prod(kernel.shape))
+  if not layer.losses:
+    return np.zeros([size, size])
+  with tf.GradientTape() as outer_tape:
+    with tf.GradientTape() as inner_tape:
+      loss = tf.add_n(layer.losses)
+    gradient = tf.reshape(inner_tape.gradient(loss, kernel), [-1])
+  hessian = outer_tape.jacobian(gradient, kernel)
+  if hessian is None:
+    return np.zeros([size, size])
+  return np.reshape(np.asarray(hessian, dtype=np.float64), [size, size])
+
+
+def _regularization_gradient(layer):
+  """Returns the gradient of the layer losses w.r.t. its kernel."""
+  kernel = layer.kernel
+  if not layer.losses:
+    return np.zeros(int(np.prod(kernel.shape)))
+  with tf.GradientTape() as tape:
+    loss = tf.add_n(layer.losses)
+  gradient = tape.gradient(loss, kernel)
+  if gradient is None:
+    return np.zeros(int(np.prod(kernel.shape)))
+  return np.reshape(np.asarray(gradient, dtype=np.float64), [-1])
+
+
+def _objective(model, inputs, labels, sample_weights):
+  """Weighted mean squared error plus regularization losses."""
+  outputs = model(inputs, training=False)[:, 0]
+  loss = tf.reduce_sum(sample_weights * tf.square(outputs - labels))
+  loss /= tf.reduce_sum(sample_weights)
+  if model.losses:
+    loss += tf.add_n(model.losses)
+  return float(loss)
+
+
+def _jacobian_fn(model, layer):
+  """Returns a function computing model outputs and their kernel Jacobian.
+
+  Kernels have far fewer parameters than there are examples in a batch, so the
+  Jacobian is computed in forward mode with one tangent per kernel parameter.
+  """
+  kernel = layer.kernel
+  size = int(np.prod(kernel.shape))
+  tangents = tf.reshape(
+      tf.eye(size, dtype=kernel.dtype), [size] + kernel.shape.as_list())
+
+  @tf.function(reduce_retracing=True)
+  def jacobian_fn(inputs):
+
+    def jvp(tangent):
+      with tf.autodiff.ForwardAccumulator(kernel, tangent) as accumulator:
+        outputs = model(inputs, training=False)[:, 0]
+      return accumulator.jvp(outputs)
+
+    outputs = model(inputs, training=False)[:, 0]
+    return outputs, tf.transpose(tf.vectorized_map(jvp, tangents))
+
+  return jacobian_fn
+
+
+def _fit_layer(model, layer, jacobian_fn, regularization_hessian, inputs,
+               labels, sample_weights, batch_size, loss, solver_kwargs):
+  """Fits the kernel of a layer keeping other layers fixed.
+
+  Returns:
+    The objective value after the update.
+  """
+  kernel = layer.kernel
+  shape = kernel.shape
+  size = int(np.prod(shape))
+  initial = np.reshape(tf.keras.backend.get_value(kernel),
+                       [-1]).astype(np.float64)
+  normalizer = float(tf.reduce_sum(sample_weights))
+
+  # Normal equations of the model linearized in the kernel.
+  quadratic = np.zeros([size, size])
+  linear = np.zeros(size)
+  num_examples = int(labels.shape[0])
+  for start in range(0, num_examples, batch_size):
+    batch_inputs = [x[start:start + batch_size] for x in inputs]
+    outputs, jacobian = jacobian_fn(batch_inputs)
+    jacobian = np.reshape(np.asarray(jacobian, dtype=np.float64), [-1, size])
+    weights = np.asarray(sample_weights[start:start + batch_size],
+                         dtype=np.float64)
+    residuals = (
+        np.asarray(labels[start:start + batch_size], dtype=np.float64) -
+        np.asarray(outputs, dtype=np.float64) + np.dot(jacobian, initial))
+    weighted_jacobian = jacobian * weights[:, np.newaxis]
+    quadratic += 2.0 / normalizer * np.dot(weighted_jacobian.T, jacobian)
+    linear += 2.0 / normalizer * np.dot(weighted_jacobian.T, residuals)
+  quadratic += regularization_hessian
+  linear += (
+      np.dot(regularization_hessian, initial) -
+      _regularization_gradient(layer))
+
+  constraints, lower, upper = _kernel_constraints(layer)
+  solution = solve_qp(
+      quadratic,
+      linear,
+      constraints,
+      lower,
+      upper,
+      initial=initial,
+      **solver_kwargs)
+
+  # Backtracking keeps the objective non-increasing for layers in which the
+  # model is not linear, e.g. input calibrators of lattices with more than 2
+  # vertices per dimension.
+  step = 1.0
+  for _ in range(10):
+    candidate = initial + step * (solution - initial)
+    value = tf.constant(np.reshape(candidate, shape), dtype=kernel.dtype)
+    if kernel.constraint is not None:
+      value = kernel.constraint(value)
+    kernel.assign(value)
+    new_loss = _objective(model, inputs, labels, sample_weights)
+    if new_loss <= loss:
+      return new_loss
+    step /= 2.0
+  kernel.assign(tf.constant(np.reshape(initial, shape), dtype=kernel.dtype))
+  return loss
+
+
+def fit_least_squares(model,
+                      inputs,
+                      labels,
+                      sample_weights=None,
+                      num_alternations=10,
+                      batch_size=1000,
+                      rho=1.0,
+                      num_admm_iterations=1000,
+                      tolerance=1e-6):
+  """Fits a calibrated lattice model to minimize the squared loss.
+
+  Trainable layers are fitted in the order of `model.layers`, which for
+  premade models is input calibrators, lattices and then the output
+  calibrator. Monotonicity,
+  convexity, output bounds and clamping of calibrators as well as monotonicity
+  and output bounds of lattices are enforced by the solver. Other lattice
+  constraints, e.g. trust or dominance constraints, are enforced by projecting
+  the solution with the layer constraints.
+
+  Args:
+    model: A Keras model, e.g. `tfl.premade.CalibratedLattice`, with trainable
+      weights only in `tfl.layers.Lattice`, `tfl.layers.PWLCalibration` and
+      `tfl.layers.CategoricalCalibration` layers. Missing value outputs of PWL
+      calibrators are not fitted.
+    inputs: List of model inputs, one array of shape `(num_examples, 1)` per
+      feature.
+    labels: Array of shape `(num_examples,)` or `(num_examples, 1)`.
+    sample_weights: Optional array of shape `(num_examples,)`.
+    num_alternations: Maximum number of passes over the layers.
+    batch_size: Number of examples for which the model Jacobian is computed at
+      once.
+    rho: ADMM penalty parameter.
+    num_admm_iterations: Maximum number of ADMM iterations for each layer.
+    tolerance: Stops when a pass decreases the objective by less than this
+      relative amount.
+
+  Returns:
+    List with the objective, the weighted mean squared error plus
+    regularization losses, before fitting and after each pass.
+
+  Raises:
+    ValueError: If the model has trainable weights in other layers.
+  """
+  layers = [
+      layer for layer in model.layers
+      if isinstance(layer, _FITTED_LAYER_TYPES) and layer.trainable
+  ]
+  for layer in model.layers:
+    if layer.trainable_weights and not isinstance(layer, _FITTED_LAYER_TYPES):
+      raise ValueError('Unsupported layer with trainable weights: {}'.format(
+          layer.name))
+
+  dtype = model.outputs[0].dtype
+  inputs = [
+      tf.constant(np.reshape(x, [-1, 1]), dtype=model_input.dtype)
+      for x, model_input in zip(inputs, model.inputs)
+  ]
+  labels = tf.constant(np.reshape(labels, [-1]), dtype=dtype)
+  if sample_weights is None:
+    sample_weights = tf.ones_like(labels)
+  else:
+    sample_weights = tf.constant(np.reshape(sample_weights, [-1]), dtype=dtype)
+  solver_kwargs = dict(rho=rho, num_iterations=num_admm_iterations)
+
+  jacobian_fns = [_jacobian_fn(model, layer) for layer in layers]
+  regularization_hessians = [_regularization_hessian(layer) for layer in layers]
+  losses = [_objective(model, inputs, labels, sample_weights)]
+  for _ in range(num_alternations):
+    loss = losses[-1]
+    for layer, jacobian_fn, regularization_hessian in zip(
+        layers, jacobian_fns, regularization_hessians):
+      loss = _fit_layer(model, layer, jacobian_fn, regularization_hessian,
+                        inputs, labels, sample_weights, batch_size, loss,
+                        solver_kwargs)
+    losses.append(loss)
+    if losses[-2] - losses[-1] <= tolerance * max(abs(losses[-2]), 1e-12):
+      break
+
+  for layer in layers:
+    if isinstance(layer, lattice_layer.Lattice):
+      layer.finalize_constraints()
+  return losses
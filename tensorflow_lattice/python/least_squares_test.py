@@ -0,0 +1,173 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL direct least-squares fitting."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import least_squares
+from tensorflow_lattice.python import premade
+
+
+def _feature_configs():
+  return [
+      configs.FeatureConfig(
+          name='numerical_1',
+          lattice_size=3,
+          monotonicity='increasing',
+          pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=8),
+      ),
+      configs.FeatureConfig(
+          name='numerical_2',
+          lattice_size=2,
+          monotonicity='decreasing',
+          pwl_calibration_convexity='concave',
+          pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=6),
+      ),
+      configs.FeatureConfig(
+          name='categorical',
+          lattice_size=2,
+          num_buckets=3,
+          monotonicity=[(0, 1)],
+      ),
+  ]
+
+
+def _data(num_examples):
+  rng = np.random.RandomState(0)
+  inputs = [
+      rng.uniform(size=[num_examples, 1]),
+      rng.uniform(size=[num_examples, 1]),
+      rng.randint(0, 3, size=[num_examples, 1]),
+  ]
+  labels = (
+      np.sqrt(inputs[0][:, 0]) - inputs[1][:, 0]**2 +
+      0.3 * (inputs[2][:, 0] == 1) + 0.05 * rng.normal(size=num_examples))
+  return inputs, labels
+
+
+class LeastSquaresTest(parameterized.TestCase, tf.test.TestCase):
+
+  def testSolveQp(self):
+    # Isotonic regression of [3, 1, 2, 5, 4].
+    values = np.array([3.0, 1.0, 2.0, 5.0, 4.0])
+    constraints = np.diff(np.eye(5), axis=0)
+    solution = least_squares.solve_qp(
+        np.eye(5),
+        values,
+        constraints,
+        lower=np.zeros(4),
+        upper=np.full(4, np.inf),
+        num_iterations=5000,
+        tolerance=1e-10)
+    self.assertAllClose(solution, [2.0, 2.0, 2.0, 4.5, 4.5], atol=1e-5)
+
+    # Without constraints the solution solves the linear system.
+    quadratic = np.array([[2.0, 1.0], [1.0, 3.0]])
+    solution = least_squares.solve_qp(quadratic, [1.0, 2.0])
+    self.assertAllClose(np.dot(quadratic, solution), [1.0, 2.0], atol=1e-5)
+
+    # Box constraints.
+    solution = least_squares.solve_qp(
+        np.eye(2), [2.0, -2.0],
+        np.eye(2),
+        lower=[-1.0, -1.0],
+        upper=[1.0, 1.0],
+        tolerance=1e-10)
+    self.assertAllClose(solution, [1.0, -1.0], atol=1e-5)
+
+  @parameterized.parameters(
+      ('lattice', False),
+      ('lattice', True),
+      ('ensemble', True),
+  )
+  def testFitPremadeModel(self, model_type, output_calibration):
+    inputs, labels = _data(500)
+    kwargs = dict(
+        feature_configs=_feature_configs(),
+        output_calibration=output_calibration,
+        output_calibration_num_keypoints=5,
+        output_initialization=[np.min(labels), np.max(labels)],
+        regularizer_configs=[
+            configs.RegularizerConfig(name='torsion', l2=1e-4),
+            configs.RegularizerConfig(name='calib_hessian', l2=1e-4),
+        ])
+    if model_type == 'lattice':
+      model = premade.CalibratedLattice(
+          configs.CalibratedLatticeConfig(**kwargs))
+    else:
+      model = premade.CalibratedLatticeEnsemble(
+          configs.CalibratedLatticeEnsembleConfig(
+              lattices=[['numerical_1', 'categorical'],
+                        ['numerical_1', 'numerical_2']],
+              **kwargs))
+    losses = least_squares.fit_least_squares(
+        model, inputs, labels, num_alternations=5)
+    self.assertLessEqual(len(losses), 6)
+    # Objective never increases.
+    self.assertAllLessEqual(np.diff(losses), 1e-7)
+    self.assertLess(losses[-1], 0.01)
+    model.compile(loss='mse')
+    self.assertAllClose(
+        model.evaluate(inputs, labels, verbose=0),
+        losses[-1],
+        atol=1e-3)
+    for layer in model.layers:
+      if hasattr(layer, 'assert_constraints'):
+        layer.assert_constraints(eps=1e-4)
+
+  def testLatticeFitIsExact(self):
+    inputs, labels = _data(300)
+    model = premade.CalibratedLattice(
+        configs.CalibratedLatticeConfig(
+            feature_configs=_feature_configs()[:2],
+            output_initialization=[0.0, 1.0]))
+    for feature_config in model.model_config.feature_configs:
+      model.get_layer('tfl_calib_{}'.format(feature_config.name)).trainable = (
+          False)
+    # With fixed calibrators the lattice is fitted in a single step.
+    losses = least_squares.fit_least_squares(
+        model, inputs[:2], labels, num_alternations=3, tolerance=0.0)
+    self.assertAllClose(losses[1], losses[-1], atol=1e-6)
+
+  def testLaplacianRegularization(self):
+    inputs, labels = _data(200)
+    model = premade.CalibratedLattice(
+        configs.CalibratedLatticeConfig(
+            feature_configs=_feature_configs(),
+            output_initialization=[0.0, 1.0],
+            regularizer_configs=[
+                configs.RegularizerConfig(name='laplacian', l2=1e3)
+            ]))
+    least_squares.fit_least_squares(model, inputs, labels)
+    kernel = tf.keras.backend.get_value(model.get_layer('tfl_lattice_0').kernel)
+    self.assertLess(np.max(kernel) - np.min(kernel), 1e-2)
+
+  def testUnsupportedModel(self):
+    model = premade.CalibratedLinear(
+        configs.CalibratedLinearConfig(
+            feature_configs=_feature_configs(),
+            output_initialization=[0.0, 1.0]))
+    inputs, labels = _data(10)
+    with self.assertRaises(ValueError):
+      least_squares.fit_least_squares(model, inputs, labels)
+
+
+if __name__ == '__main__':
+  tf.test.main()
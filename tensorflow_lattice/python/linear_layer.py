@@ -324,6 +324,23 @@ class Linear(keras.layers.Layer):
         normalization_order=self.normalization_order,
         eps=eps)
 
+  def constraint_violations(self):
+    """Returns amounts by which layer weights violate constraints.
+
+    Cheap alternative to `assert_constraints` which can be used to monitor
+    monotonicity and monotonic dominance constraints during training, e.g.
+    using `tfl.constraint_metrics.ConstraintViolation`.
+
+    Returns:
+      Dict from constraint type ('monotonicity' or 'dominance') to a 1-d tensor
+      of non-negative violation amounts.
+    """
+    return linear_lib.constraint_violations(
+        weights=self.kernel,
+        monotonicities=linear_lib.canonicalize_monotonicities(
+            self.monotonicities),
+        monotonic_dominances=self.monotonic_dominances)
+
 
 class LinearConstraints(keras.constraints.Constraint):
   # pyformat: disable
@@ -195,6 +195,41 @@ def assert_constraints(weights, monotonicities, monotonic_dominances,
   return asserts
 
 
+def constraint_violations(weights, monotonicities, monotonic_dominances=None):
+  """Returns amounts by which weights violate constraints.
+
+  Unlike `assert_constraints`, this function does not build assertion ops and
+  is cheap enough to be evaluated periodically during training.
+
+  Args:
+    weights: Weights of Linear layer.
+    monotonicities: List or tuple of same length as number of elements in
+      'weights' of {-1, 0, 1} which represent monotonicity constraints per
+      dimension. -1 stands for decreasing, 0 for no constraints, 1 for
+      increasing.
+    monotonic_dominances: List of two-element tuple. First element is the index
+      of the dominant feature. Second element is the index of the weak feature.
+
+  Returns:
+    Dict from constraint type ('monotonicity' or 'dominance') to a 1-d tensor
+    of non-negative violation amounts. Constraint types which are not specified
+    are omitted.
+  """
+  violations = {}
+  if any(monotonicities):
+    monotonicities_constant = tf.constant(monotonicities,
+                                          shape=weights.shape,
+                                          dtype=weights.dtype)
+    violations["monotonicity"] = tf.nn.relu(
+        tf.reshape(-weights * monotonicities_constant, [-1]))
+
+  if monotonic_dominances:
+    dominant = tf.gather(weights, [i for (i, j) in monotonic_dominances])
+    weak = tf.gather(weights, [j for (i, j) in monotonic_dominances])
+    violations["dominance"] = tf.nn.relu(tf.reshape(weak - dominant, [-1]))
+  return violations
+
+
 def verify_hyperparameters(num_input_dims=None,
                            monotonicities=None,
                            monotonic_dominances=None,
@@ -0,0 +1,375 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Partial dependence, ICE curves and interaction surfaces for TFL models.
+
+Partial dependence of a model on a feature is the average model output over a
+background dataset when the feature is set to each of a grid of values.
+Individual conditional expectation (ICE) curves are the per example outputs
+before averaging, and interaction surfaces are the partial dependence on a
+pair of features.
+
+For TFL premade models the computation exploits the model structure:
+
+- Input calibrators are evaluated once on the background data and once on the
+  grid values, and their outputs are cached.
+- Only the submodels (lattices or linear layer) that contain the varied
+  features are re-evaluated, and only their inputs are expanded to all
+  (grid value, background example) pairs. Outputs of the other submodels of an
+  ensemble are cached and summed once per background example.
+- Grid values are evaluated in batches of (grid value, background example)
+  pairs, and features can be processed in parallel threads.
+
+Other Keras models are evaluated by calling the model on batches of modified
+background examples.
+
+```python
+analysis = tfl.partial_dependence.PartialDependence(
+    model, background_inputs=[x[name] for name in feature_names])
+grid, ice_curves = analysis.ice('age')
+grid, pd = analysis.partial_dependence('age')
+(age_grid, chol_grid), surface = analysis.interaction('age', 'chol')
+results = analysis.partial_dependences(num_workers=8)
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from concurrent import futures
+
+from . import categorical_calibration_layer
+from . import configs
+from . import premade_lib
+from . import pwl_calibration_layer
+import numpy as np
+import tensorflow as tf
+
+
+class PartialDependence(object):
+  # pyformat: disable
+  """Computes partial dependence and ICE curves of a model.
+
+  Attributes:
+    - All `__init__` arguments.
+    feature_names: Names of the model input features.
+
+  Example:
+
+  ```python
+  analysis = tfl.partial_dependence.PartialDependence(
+      model, background_inputs)
+  grid, pd = analysis.partial_dependence('age', grid=[20, 40, 60, 80])
+  ```
+  """
+  # pyformat: enable
+
+  def __init__(self,
+               model,
+               background_inputs,
+               feature_names=None,
+               batch_size=100000):
+    """Initializes a `PartialDependence` instance.
+
+    Args:
+      model: A Keras model taking a list of `(batch_size, 1)` inputs, one per
+        feature. If the model is a `tfl.premade` model with a `model_config`,
+        other than `tfl.premade.AggregateFunction`, its structure is used to
+        speed up evaluation.
+      background_inputs: List of background feature values, one array of shape
+        `(num_examples,)` or `(num_examples, 1)` for each model input.
+      feature_names: Names of the model inputs. Defaults to the feature config
+        names of premade models. Required for other models.
+      batch_size: Maximum number of (grid value, background example) pairs
+        evaluated at once.
+
+    Raises:
+      ValueError: If feature names are missing or do not match the inputs.
+    """
+    self.model = model
+    self.batch_size = batch_size
+    model_config = getattr(model, 'model_config', None)
+    if feature_names is None:
+      if model_config is None:
+        raise ValueError('feature_names must be provided for models without '
+                         'a model_config.')
+      feature_names = [
+          feature_config.name
+          for feature_config in model_config.feature_configs
+      ]
+    self.feature_names = list(feature_names)
+    if len(self.feature_names) != len(background_inputs):
+      raise ValueError(
+          'Number of background inputs ({}) does not match the number of '
+          'features ({}).'.format(
+              len(background_inputs), len(self.feature_names)))
+    self.background_inputs = [
+        np.reshape(np.asarray(values), [-1, 1]) for values in background_inputs
+    ]
+    self.num_examples = self.background_inputs[0].shape[0]
+
+    self._submodels = None
+    if model_config is not None and not isinstance(
+        model_config, configs.AggregateFunctionConfig):
+      self._submodels, self._average = premade_lib.premade_submodels(model)
+      self._output_calibration = None
+      if model_config.output_calibration:
+        self._output_calibration = model.get_layer(
+            premade_lib.OUTPUT_CALIB_LAYER_NAME)
+      self._calibrated_inputs = {
+          name: self._calibrate(name, values)
+          for name, values in zip(self.feature_names, self.background_inputs)
+      }
+      self._submodel_outputs = [
+          premade_lib.evaluate_submodel(submodel,
+                                        self._submodel_inputs(submodel))
+          for submodel in self._submodels
+      ]
+
+  def _input_dtype(self, feature_name):
+    return self.model.inputs[self.feature_names.index(feature_name)].dtype
+
+  def _calibrate(self, feature_name, values):
+    """Returns the calibrated values of a feature, one tensor per unit."""
+    layer = self.model.get_layer('{}_{}'.format(premade_lib.CALIB_LAYER_NAME,
+                                                feature_name))
+    calibrated = layer(
+        tf.constant(
+            np.reshape(values, [-1, 1]), dtype=self._input_dtype(feature_name)))
+    return tf.split(calibrated, layer.units, axis=1)
+
+  def _submodel_inputs(self, submodel):
+    """Returns calibrated background inputs of a submodel."""
+    return [
+        self._calibrated_inputs[feature_name][unit] for feature_name, unit in
+        zip(submodel.feature_names, submodel.calibration_units)
+    ]
+
+  def default_grid(self, feature_name, num_points=None):
+    """Returns the default grid of values for a feature.
+
+    For premade models, these are the input keypoints of PWL calibrators or the
+    buckets of categorical calibrators. Otherwise and if `num_points` is given
+    for numeric features, quantiles of the background values are used.
+
+    Args:
+      feature_name: Name of the feature.
+      num_points: Number of grid points for numeric features.
+
+    Returns:
+      A 1-D numpy array of grid values.
+    """
+    if self._submodels is not None and num_points is None:
+      layer = self.model.get_layer('{}_{}'.format(premade_lib.CALIB_LAYER_NAME,
+                                                  feature_name))
+      if isinstance(layer, pwl_calibration_layer.PWLCalibration):
+        return np.array(layer.input_keypoints)
+      if isinstance(layer, categorical_calibration_layer.CategoricalCalibration):
+        return np.arange(layer.num_buckets)
+    values = self.background_inputs[self.feature_names.index(feature_name)]
+    if np.issubdtype(values.dtype, np.integer):
+      return np.unique(values)
+    return np.unique(
+        np.quantile(values, np.linspace(0.0, 1.0, num=num_points or 20)))
+
+  def _evaluate_grid(self, feature_names, grid_values):
+    """Returns model outputs with features set to each of the grid values.
+
+    Args:
+      feature_names: List of names of the varied features.
+      grid_values: List of 1-D arrays of equal length with the values of each
+        of the varied features at each grid point.
+
+    Returns:
+      A numpy array of shape `(num_grid_points, num_examples)`.
+    """
+    num_points = len(grid_values[0])
+    points_per_batch = max(1, self.batch_size // self.num_examples)
+    if self._submodels is not None:
+      affected_submodels, unaffected_output = self._split_submodels(
+          feature_names)
+    outputs = []
+    for start in range(0, num_points, points_per_batch):
+      batch_values = [
+          values[start:start + points_per_batch] for values in grid_values
+      ]
+      if self._submodels is not None:
+        batch_outputs = self._evaluate_premade(feature_names, batch_values,
+                                               affected_submodels,
+                                               unaffected_output)
+      else:
+        batch_outputs = self._evaluate_model(feature_names, batch_values)
+      outputs.append(
+          np.reshape(batch_outputs, [len(batch_values[0]), self.num_examples]))
+    return np.concatenate(outputs, axis=0)
+
+  def _evaluate_model(self, feature_names, grid_values):
+    """Evaluates the full model on modified background examples."""
+    num_points = len(grid_values[0])
+    inputs = [np.tile(values, [num_points, 1]) for values in
+              self.background_inputs]
+    for feature_name, values in zip(feature_names, grid_values):
+      inputs[self.feature_names.index(feature_name)] = np.repeat(
+          np.reshape(values, [-1, 1]), self.num_examples, axis=0)
+    inputs = [
+        tf.constant(values, dtype=model_input.dtype)
+        for values, model_input in zip(inputs, self.model.inputs)
+    ]
+    return self.model(inputs)
+
+  def _split_submodels(self, feature_names):
+    """Returns the submodels with any of the features and the sum of others.
+
+    Args:
+      feature_names: List of names of the varied features.
+
+    Returns:
+      A tuple `(affected_submodels, unaffected_output)`, where
+      `affected_submodels` are the submodels that contain any of the features
+      and `unaffected_output` is the sum of the cached outputs of the other
+      submodels for each background example, or None if there are none.
+    """
+    affected_submodels = []
+    unaffected_outputs = []
+    for submodel, submodel_output in zip(self._submodels,
+                                         self._submodel_outputs):
+      if set(feature_names) & set(submodel.feature_names):
+        affected_submodels.append(submodel)
+      else:
+        unaffected_outputs.append(submodel_output)
+    unaffected_output = None
+    if unaffected_outputs:
+      unaffected_output = tf.add_n(unaffected_outputs)
+    return affected_submodels, unaffected_output
+
+  def _evaluate_premade(self, feature_names, grid_values, affected_submodels,
+                        unaffected_output):
+    """Re-evaluates the submodels that contain any of the varied features."""
+    num_points = len(grid_values[0])
+    replaced_inputs = {}
+    for feature_name, values in zip(feature_names, grid_values):
+      # Each calibrated grid value is repeated for all background examples.
+      replaced_inputs[feature_name] = [
+          tf.repeat(calibrated, self.num_examples, axis=0)
+          for calibrated in self._calibrate(feature_name, values)
+      ]
+
+    output = 0.0
+    if unaffected_output is not None:
+      output = tf.tile(unaffected_output, [num_points, 1])
+    # Only calibrator units used by affected submodels are tiled.
+    tiled_inputs = {}
+    for submodel in affected_submodels:
+      submodel_inputs = []
+      for feature_name, unit in zip(submodel.feature_names,
+                                    submodel.calibration_units):
+        if feature_name in replaced_inputs:
+          submodel_inputs.append(replaced_inputs[feature_name][unit])
+          continue
+        if (feature_name, unit) not in tiled_inputs:
+          tiled_inputs[(feature_name, unit)] = tf.tile(
+              self._calibrated_inputs[feature_name][unit], [num_points, 1])
+        submodel_inputs.append(tiled_inputs[(feature_name, unit)])
+      output += premade_lib.evaluate_submodel(submodel, submodel_inputs)
+    if self._average:
+      output /= len(self._submodels)
+    if self._output_calibration is not None:
+      output = self._output_calibration(output)
+    return output
+
+  def ice(self, feature_name, grid=None):
+    """Returns individual conditional expectation curves of a feature.
+
+    Args:
+      feature_name: Name of the feature.
+      grid: Values of the feature. Defaults to `default_grid(feature_name)`.
+
+    Returns:
+      A tuple `(grid, curves)`, where `curves` has shape
+      `(num_examples, len(grid))` with the model output for each background
+      example when the feature is set to each of the grid values.
+    """
+    if grid is None:
+      grid = self.default_grid(feature_name)
+    grid = np.asarray(grid)
+    return grid, self._evaluate_grid([feature_name], [grid]).T
+
+  def partial_dependence(self, feature_name, grid=None):
+    """Returns the partial dependence of the model on a feature.
+
+    Args:
+      feature_name: Name of the feature.
+      grid: Values of the feature. Defaults to `default_grid(feature_name)`.
+
+    Returns:
+      A tuple `(grid, values)`, where `values` has the average model output over
+      the background examples for each of the grid values.
+    """
+    grid, curves = self.ice(feature_name, grid)
+    return grid, np.mean(curves, axis=0)
+
+  def interaction(self, feature_name_1, feature_name_2, grid_1=None,
+                  grid_2=None):
+    """Returns the partial dependence of the model on a pair of features.
+
+    Args:
+      feature_name_1: Name of the first feature.
+      feature_name_2: Name of the second feature.
+      grid_1: Values of the first feature. Defaults to
+        `default_grid(feature_name_1)`.
+      grid_2: Values of the second feature. Defaults to
+        `default_grid(feature_name_2)`.
+
+    Returns:
+      A tuple `((grid_1, grid_2), surface)`, where `surface` has shape
+      `(len(grid_1), len(grid_2))` with the average model output when the
+      features are set to each pair of grid values.
+    """
+    if grid_1 is None:
+      grid_1 = self.default_grid(feature_name_1)
+    if grid_2 is None:
+      grid_2 = self.default_grid(feature_name_2)
+    grid_1, grid_2 = np.asarray(grid_1), np.asarray(grid_2)
+    mesh_1, mesh_2 = np.meshgrid(grid_1, grid_2, indexing='ij')
+    outputs = self._evaluate_grid([feature_name_1, feature_name_2],
+                                  [mesh_1.flatten(), mesh_2.flatten()])
+    surface = np.reshape(np.mean(outputs, axis=1), mesh_1.shape)
+    return (grid_1, grid_2), surface
+
+  def partial_dependences(self, feature_names=None, grids=None,
+                          num_workers=None):
+    """Returns the partial dependence of the model on each of the features.
+
+    Args:
+      feature_names: Names of the features. Defaults to all features.
+      grids: Optional mapping from feature names to grids. Features without a
+        grid use `default_grid`.
+      num_workers: Number of threads used to process features in parallel.
+
+    Returns:
+      A dict from feature names to `(grid, values)` tuples as returned by
+      `partial_dependence`.
+    """
+    feature_names = feature_names or self.feature_names
+    grids = grids or {}
+    with futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+      results = {
+          feature_name: executor.submit(self.partial_dependence, feature_name,
+                                        grids.get(feature_name))
+          for feature_name in feature_names
+      }
+      return {
+          feature_name: result.result()
+          for feature_name, result in results.items()
+      }
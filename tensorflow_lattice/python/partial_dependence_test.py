@@ -0,0 +1,169 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL partial dependence."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import partial_dependence
+from tensorflow_lattice.python import test_utils
+
+_FEATURE_CONFIGS = [
+    configs.FeatureConfig(
+        name='numerical_1',
+        lattice_size=3,
+        monotonicity='increasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+    ),
+    configs.FeatureConfig(
+        name='numerical_2',
+        lattice_size=2,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+    ),
+    configs.FeatureConfig(
+        name='categorical',
+        lattice_size=2,
+        num_buckets=3,
+    ),
+    configs.FeatureConfig(
+        name='numerical_3',
+        lattice_size=2,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+    ),
+]
+
+
+_LATTICES = [
+    ['numerical_1', 'categorical'],
+    ['numerical_2', 'numerical_3'],
+    ['numerical_1', 'numerical_3'],
+    ['categorical', 'numerical_2'],
+]
+
+
+class PartialDependenceTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _Model(self, model_type):
+    return test_utils.premade_model(
+        model_type,
+        _FEATURE_CONFIGS,
+        lattices=_LATTICES,
+        output_calibration=True,
+        output_calibration_num_keypoints=5,
+        output_initialization=[-1.0, 1.0])
+
+  def _BackgroundInputs(self, num_examples):
+    rng = np.random.RandomState(1)
+    return [
+        rng.uniform(size=num_examples),
+        rng.uniform(size=num_examples),
+        rng.randint(0, 3, size=num_examples),
+        rng.uniform(size=num_examples),
+    ]
+
+  def _NaiveIce(self, model, inputs, feature_values):
+    """Returns ICE curves computed by calling the model for each grid point."""
+    curves = []
+    for values in zip(*feature_values.values()):
+      modified_inputs = list(inputs)
+      for index, value in zip(feature_values.keys(), values):
+        modified_inputs[index] = np.full_like(inputs[index], value)
+      curves.append(
+          model.predict([np.reshape(x, [-1, 1]) for x in modified_inputs],
+                        verbose=0)[:, 0])
+    return np.array(curves).T
+
+  @parameterized.parameters(
+      ('linear',),
+      ('lattice',),
+      ('ensemble',),
+      ('shared_ensemble',),
+      ('packed_ensemble',),
+  )
+  def testPremadeModels(self, model_type):
+    model = self._Model(model_type)
+    inputs = self._BackgroundInputs(20)
+    # Small batch size to test batching of grid points.
+    analysis = partial_dependence.PartialDependence(
+        model, inputs, batch_size=50)
+
+    grid, curves = analysis.ice('numerical_1')
+    self.assertAllClose(grid, np.linspace(0.0, 1.0, num=5))
+    self.assertEqual(curves.shape, (20, 5))
+    self.assertAllClose(
+        curves, self._NaiveIce(model, inputs, {0: grid}), atol=1e-5)
+
+    grid, values = analysis.partial_dependence('categorical')
+    self.assertAllEqual(grid, [0, 1, 2])
+    self.assertAllClose(
+        values,
+        np.mean(self._NaiveIce(model, inputs, {2: grid}), axis=0),
+        atol=1e-5)
+
+    (grid_1, grid_2), surface = analysis.interaction(
+        'numerical_2', 'numerical_3', grid_1=[0.1, 0.5], grid_2=[0.2, 0.4, 0.9])
+    self.assertEqual(surface.shape, (2, 3))
+    mesh_1, mesh_2 = np.meshgrid(grid_1, grid_2, indexing='ij')
+    expected = np.mean(
+        self._NaiveIce(model, inputs, {
+            1: mesh_1.flatten(),
+            3: mesh_2.flatten()
+        }),
+        axis=0)
+    self.assertAllClose(surface.flatten(), expected, atol=1e-5)
+
+  def testParallelPartialDependences(self):
+    model = self._Model('ensemble')
+    analysis = partial_dependence.PartialDependence(model,
+                                                    self._BackgroundInputs(30))
+    results = analysis.partial_dependences(
+        grids={'numerical_2': [0.0, 0.3]}, num_workers=4)
+    self.assertCountEqual(results.keys(), analysis.feature_names)
+    self.assertAllClose(results['numerical_2'][0], [0.0, 0.3])
+    for feature_name, (grid, values) in results.items():
+      expected_grid, expected_values = analysis.partial_dependence(
+          feature_name, grid)
+      self.assertAllClose(grid, expected_grid)
+      self.assertAllClose(values, expected_values)
+
+  def testKerasModel(self):
+    inputs = [tf.keras.Input(shape=(1,)) for _ in range(3)]
+    hidden = tf.keras.layers.Dense(4, activation='relu')(
+        tf.keras.layers.Concatenate()(inputs))
+    model = tf.keras.Model(inputs=inputs, outputs=tf.keras.layers.Dense(1)(hidden))
+    background_inputs = self._BackgroundInputs(10)[:3]
+    with self.assertRaises(ValueError):
+      partial_dependence.PartialDependence(model, background_inputs)
+    analysis = partial_dependence.PartialDependence(
+        model, background_inputs, feature_names=['a', 'b', 'c'], batch_size=25)
+    grid, curves = analysis.ice('b', grid=[0.0, 0.5, 1.0])
+    self.assertAllClose(
+        curves,
+        self._NaiveIce(model, background_inputs, {1: grid}),
+        atol=1e-5)
+    grid = analysis.default_grid('a', num_points=5)
+    self.assertLen(grid, 5)
+    self.assertAllClose(grid[[0, -1]], [
+        np.min(background_inputs[0]),
+        np.max(background_inputs[0])
+    ])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,233 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Partial evaluation of TFL premade models on fixed feature values.
+
+When many examples share the values of some of the features, e.g. query
+features when scoring candidate items for a query, the model can be specialized
+to those values once and the smaller specialized model can be used for all the
+examples:
+
+- Calibrators of the fixed features are evaluated once.
+- Multilinear interpolation is linear along each lattice dimension, so a lattice
+  is sliced along the dimensions of the fixed features by interpolating its
+  kernel at their calibrated values. This results in a lower rank lattice over
+  the other features. Lattices with only fixed features collapse into a
+  constant.
+- Fixed features of calibrated linear models are folded into the bias.
+
+Specialized lattices with the same sizes are packed into multi-unit lattice
+layers.
+
+```python
+query_model = tfl.partial_evaluation.specialize_model(
+    model, {'query_country': 2, 'query_length': 3.0})
+scores = query_model.predict(candidate_features)
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+from . import configs
+from . import lattice_layer
+from . import linear_layer
+from . import premade_lib
+import numpy as np
+import tensorflow as tf
+
+
+def _copy_layer(layer, inputs):
+  """Applies a copy of the layer, with the same weights, to the inputs."""
+  layer_copy = layer.__class__.from_config(layer.get_config())
+  outputs = layer_copy(inputs)
+  layer_copy.set_weights(layer.get_weights())
+  return outputs
+
+
+def slice_lattice_kernel(kernel, lattice_sizes, dims, values):
+  """Returns the kernel of a lattice sliced along some of its dimensions.
+
+  The output of the sliced lattice for any inputs is the same as the output of
+  the original lattice with inputs of the sliced dimensions set to `values`.
+
+  Args:
+    kernel: Lattice kernel of shape `(prod(lattice_sizes), units)`.
+    lattice_sizes: List of lattice sizes.
+    dims: Indices of the sliced dimensions.
+    values: Inputs of the sliced dimensions. Values are clipped to the lattice
+      bounds.
+
+  Returns:
+    A numpy array of shape `(prod(remaining lattice sizes), units)`.
+  """
+  kernel = np.asarray(kernel)
+  units = kernel.shape[1]
+  kernel = np.reshape(kernel, list(lattice_sizes) + [units])
+  # Slices the highest dimensions first so that lower indices stay valid.
+  for dim, value in sorted(zip(dims, values), reverse=True):
+    value = np.clip(value, 0.0, lattice_sizes[dim] - 1.0)
+    # Weights of 1-D linear interpolation between the vertices.
+    weights = np.maximum(0.0, 1.0 - np.abs(value - np.arange(
+        lattice_sizes[dim])))
+    kernel = np.tensordot(kernel, weights, axes=[[dim], [0]])
+  return np.reshape(kernel, [-1, units])
+
+
+def _calibrated_value(model, feature_name, value, dtype):
+  """Returns the calibrated value of a feature for each calibration unit."""
+  layer = model.get_layer('{}_{}'.format(premade_lib.CALIB_LAYER_NAME,
+                                         feature_name))
+  calibrated = layer(tf.constant([[value]], dtype=dtype))
+  return np.reshape(calibrated.numpy(), [layer.units])
+
+
+def _specialized_lattices(submodels, free_inputs, fixed_calibrated, dtype):
+  """Returns specialized lattice outputs and the sum of collapsed lattices."""
+  constant = 0.0
+  groups = collections.OrderedDict()
+  for submodel in submodels:
+    free_dims = []
+    fixed_dims, fixed_values = [], []
+    for dim, (feature_name, unit) in enumerate(
+        zip(submodel.feature_names, submodel.calibration_units)):
+      if feature_name in fixed_calibrated:
+        fixed_dims.append(dim)
+        fixed_values.append(fixed_calibrated[feature_name][unit])
+      else:
+        free_dims.append(dim)
+    layer = submodel.layer
+    kernel = tf.keras.backend.get_value(layer.kernel)
+    kernel = slice_lattice_kernel(kernel[:, submodel.unit:submodel.unit + 1],
+                                  layer.lattice_sizes, fixed_dims, fixed_values)
+    if not free_dims:
+      constant += float(kernel[0, 0])
+      continue
+    lattice_sizes = tuple(layer.lattice_sizes[dim] for dim in free_dims)
+    lattice_inputs = tf.concat([
+        free_inputs[submodel.feature_names[dim]][submodel.calibration_units[dim]]
+        for dim in free_dims
+    ], axis=1)
+    groups.setdefault(lattice_sizes, []).append((kernel, lattice_inputs))
+
+  outputs = []
+  for lattice_sizes, lattices in groups.items():
+    kernel = np.concatenate([kernel for kernel, _ in lattices], axis=1)
+    layer = lattice_layer.Lattice(
+        lattice_sizes=list(lattice_sizes),
+        units=len(lattices),
+        clip_inputs=False,
+        kernel_initializer=tf.keras.initializers.Constant(kernel),
+        dtype=dtype)
+    if len(lattices) == 1:
+      lattice_output = layer(lattices[0][1])
+    else:
+      lattice_output = layer(
+          tf.stack([lattice_inputs for _, lattice_inputs in lattices], axis=1))
+    outputs.append(tf.reduce_sum(lattice_output, axis=1, keepdims=True))
+  return outputs, constant
+
+
+def specialize_model(model, fixed_features):
+  """Returns a model specialized to fixed values of some of its features.
+
+  The specialized model takes the inputs of the other features, in the order of
+  the original model inputs, and its outputs are the same as the outputs of the
+  original model with the fixed features set to the given values. Weights are
+  copied, so further training of the original model does not affect the
+  specialized model.
+
+  Args:
+    model: A `tfl.premade.CalibratedLinear`, `tfl.premade.CalibratedLattice` or
+      `tfl.premade.CalibratedLatticeEnsemble` model.
+    fixed_features: A dict from names of fixed features to their values.
+
+  Returns:
+    A `tf.keras.Model` taking one `(batch_size, 1)` input for each of the other
+    features.
+
+  Raises:
+    ValueError: If the model is not supported, feature names are unknown or
+      all features are fixed.
+  """
+  model_config = getattr(model, 'model_config', None)
+  if not isinstance(model_config, (configs.CalibratedLinearConfig,
+                                   configs.CalibratedLatticeConfig,
+                                   configs.CalibratedLatticeEnsembleConfig)):
+    raise ValueError('specialize_model requires a CalibratedLinear, '
+                     'CalibratedLattice or CalibratedLatticeEnsemble premade '
+                     'model.')
+  feature_names = [
+      feature_config.name for feature_config in model_config.feature_configs
+  ]
+  unknown_features = set(fixed_features) - set(feature_names)
+  if unknown_features:
+    raise ValueError('Unknown fixed features: {}'.format(
+        sorted(unknown_features)))
+  if len(fixed_features) == len(feature_names):
+    raise ValueError('At least one feature must not be fixed.')
+  dtype = model.outputs[0].dtype
+
+  fixed_calibrated = {}
+  inputs = []
+  free_inputs = {}
+  for feature_name, model_input in zip(feature_names, model.inputs):
+    if feature_name in fixed_features:
+      fixed_calibrated[feature_name] = _calibrated_value(
+          model, feature_name, fixed_features[feature_name], model_input.dtype)
+      continue
+    feature_input = tf.keras.Input(
+        shape=(1,), dtype=model_input.dtype, name=model_input.name)
+    inputs.append(feature_input)
+    layer = model.get_layer('{}_{}'.format(premade_lib.CALIB_LAYER_NAME,
+                                           feature_name))
+    free_inputs[feature_name] = tf.split(
+        _copy_layer(layer, feature_input), layer.units, axis=1)
+
+  submodels, average = premade_lib.premade_submodels(model)
+  if isinstance(model_config, configs.CalibratedLinearConfig):
+    layer = submodels[0].layer
+    kernel = tf.keras.backend.get_value(layer.kernel)[:, 0]
+    bias = tf.keras.backend.get_value(layer.bias) if layer.use_bias else 0.0
+    free_weights = []
+    for feature_name, weight in zip(feature_names, kernel):
+      if feature_name in fixed_calibrated:
+        bias += weight * fixed_calibrated[feature_name][0]
+      else:
+        free_weights.append(weight)
+    linear_input = tf.concat([
+        free_inputs[feature_name][0]
+        for feature_name in feature_names
+        if feature_name in free_inputs
+    ], axis=1)
+    output = linear_layer.Linear(
+        num_input_dims=len(free_weights),
+        use_bias=True,
+        kernel_initializer=tf.keras.initializers.Constant(free_weights),
+        bias_initializer=tf.keras.initializers.Constant(bias),
+        dtype=dtype)(
+            linear_input)
+  else:
+    outputs, constant = _specialized_lattices(submodels, free_inputs,
+                                              fixed_calibrated, dtype)
+    output = tf.add_n(outputs) + constant
+    if average:
+      output /= len(submodels)
+
+  if model_config.output_calibration:
+    output = _copy_layer(
+        model.get_layer(premade_lib.OUTPUT_CALIB_LAYER_NAME), output)
+  return tf.keras.Model(inputs=inputs, outputs=output)
@@ -0,0 +1,151 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL partial evaluation."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import lattice_layer as ll
+from tensorflow_lattice.python import partial_evaluation
+from tensorflow_lattice.python import test_utils
+
+_FEATURE_CONFIGS = [
+    configs.FeatureConfig(
+        name='query_1',
+        lattice_size=3,
+        monotonicity='increasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+    ),
+    configs.FeatureConfig(
+        name='item_1',
+        lattice_size=2,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+    ),
+    configs.FeatureConfig(
+        name='query_2',
+        lattice_size=2,
+        num_buckets=3,
+    ),
+    configs.FeatureConfig(
+        name='item_2',
+        lattice_size=3,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+    ),
+]
+
+
+_LATTICES = [['query_1', 'item_1'], ['query_1', 'query_2'],
+             ['item_2', 'query_2', 'item_1'], ['item_1', 'item_2'],
+             ['query_2', 'item_2']]
+
+
+class PartialEvaluationTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _Model(self, model_type, output_calibration=True):
+    return test_utils.premade_model(
+        model_type,
+        _FEATURE_CONFIGS,
+        lattices=_LATTICES,
+        output_calibration=output_calibration,
+        output_calibration_num_keypoints=5,
+        output_initialization=[-1.0, 1.0])
+
+  @parameterized.parameters(
+      ('linear', True),
+      ('lattice', False),
+      ('lattice', True),
+      ('ensemble', True),
+      ('shared_ensemble', False),
+      ('packed_ensemble', True),
+  )
+  def testSpecializedModel(self, model_type, output_calibration):
+    model = self._Model(model_type, output_calibration)
+    rng = np.random.RandomState(1)
+    num_examples = 100
+    item_1 = rng.uniform(size=[num_examples, 1])
+    item_2 = rng.uniform(size=[num_examples, 1])
+    for query_1, query_2 in [(0.3, 2), (1.0, 0), (-1.0, 1)]:
+      specialized_model = partial_evaluation.specialize_model(
+          model, {'query_1': query_1, 'query_2': query_2})
+      self.assertLen(specialized_model.inputs, 2)
+      inputs = [
+          np.full([num_examples, 1], query_1), item_1,
+          np.full([num_examples, 1], query_2), item_2
+      ]
+      expected = model.predict(inputs, verbose=0)
+      self.assertAllClose(
+          specialized_model.predict([item_1, item_2], verbose=0),
+          expected,
+          atol=1e-5)
+
+  def testLowerRankLattices(self):
+    model = self._Model('ensemble', output_calibration=False)
+    specialized_model = partial_evaluation.specialize_model(
+        model, {'query_1': 0.5, 'query_2': 1})
+    lattices = [
+        layer for layer in specialized_model.layers
+        if isinstance(layer, ll.Lattice)
+    ]
+    # Lattices over [item_1] and [item_2] and packed lattices over
+    # [item_2, item_1] and [item_1, item_2]. The [query_1, query_2] lattice
+    # collapses into a constant.
+    self.assertCountEqual([(layer.lattice_sizes, layer.units)
+                           for layer in lattices], [([2], 1), ([3], 1),
+                                                    ([3, 2], 1), ([2, 3], 1)])
+
+  def testSliceLatticeKernel(self):
+    lattice_sizes = [2, 3, 2]
+    layer = ll.Lattice(lattice_sizes=lattice_sizes, units=2)
+    rng = np.random.RandomState(2)
+    inputs = rng.uniform(size=[10, 3]) * [1.0, 2.0, 1.0]
+    # Both units get the same inputs.
+    layer(tf.zeros([1, 2, 3]))
+    kernel = rng.uniform(size=[12, 2])
+    tf.keras.backend.set_value(layer.kernel, kernel)
+    outputs = layer(tf.constant(np.stack([inputs, inputs], axis=1),
+                                dtype=tf.float32))
+    for i in range(10):
+      sliced_kernel = partial_evaluation.slice_lattice_kernel(
+          kernel, lattice_sizes, dims=[2, 0], values=inputs[i, [2, 0]])
+      self.assertEqual(sliced_kernel.shape, (3, 2))
+      interpolation_weights = np.maximum(
+          0.0, 1.0 - np.abs(inputs[i, 1] - np.arange(3)))
+      self.assertAllClose(
+          np.dot(interpolation_weights, sliced_kernel), outputs[i], atol=1e-5)
+
+  def testInvalidArguments(self):
+    model = self._Model('lattice')
+    with self.assertRaises(ValueError):
+      partial_evaluation.specialize_model(model, {'unknown': 1.0})
+    with self.assertRaises(ValueError):
+      partial_evaluation.specialize_model(model, {
+          'query_1': 0.0,
+          'query_2': 0,
+          'item_1': 0.0,
+          'item_2': 0.0
+      })
+    inputs = tf.keras.Input(shape=(1,))
+    keras_model = tf.keras.Model(
+        inputs=inputs, outputs=tf.keras.layers.Dense(1)(inputs))
+    with self.assertRaises(ValueError):
+      partial_evaluation.specialize_model(keras_model, {})
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -111,27 +111,10 @@ class CalibratedLatticeEnsemble(tf.keras.Model):
         separate_calibrators=model_config.separate_calibrators,
         dtype=dtype)
 
-    lattice_outputs = []
-    for submodel_index, (lattice_feature_names, lattice_input) in enumerate(
-        zip(model_config.lattices, submodels_inputs)):
-      lattice_feature_configs = [
-          model_config.feature_config_by_name(feature_name)
-          for feature_name in lattice_feature_names
-      ]
-
-      lattice_layer_output_range = (
-          premade_lib.LayerOutputRange.INPUT_TO_FINAL_CALIBRATION
-          if model_config.output_calibration else
-          premade_lib.LayerOutputRange.MODEL_OUTPUT)
-      lattice_outputs.append(
-          premade_lib.build_lattice_layer(
-              lattice_input=lattice_input,
-              feature_configs=lattice_feature_configs,
-              model_config=model_config,
-              layer_output_range=lattice_layer_output_range,
-              submodel_index=submodel_index,
-              is_inside_ensemble=True,
-              dtype=dtype))
+    lattice_outputs = premade_lib.build_ensemble_lattice_layers(
+        submodels_inputs=submodels_inputs,
+        model_config=model_config,
+        dtype=dtype)
 
     if len(lattice_outputs) > 1:
       averaged_lattice_output = tf.keras.layers.Average()(lattice_outputs)
@@ -414,6 +397,47 @@ class CalibratedLinear(tf.keras.Model):
     return model
 
 
+def _multi_unit_calibrated_lattice(model_config, units, dtype):
+  """Returns a calibrated lattice model with a shared calibration layer.
+
+  The inputs are calibrated once and fed to a single lattice layer with `units`
+  output units, so the model is equivalent to `units` `CalibratedLattice`
+  models that share their calibrators.
+
+  Args:
+    model_config: A `tfl.configs.CalibratedLatticeConfig` instance without
+      output calibration.
+    units: Number of lattice units.
+    dtype: dtype of layers used in the model.
+  """
+  input_layer = premade_lib.build_input_layer(
+      feature_configs=model_config.feature_configs, dtype=dtype)
+  submodels_inputs = premade_lib.build_calibration_layers(
+      calibration_input_layer=input_layer,
+      feature_configs=model_config.feature_configs,
+      model_config=model_config,
+      layer_output_range=premade_lib.LayerOutputRange.INPUT_TO_LATTICE,
+      submodels=[[
+          feature_config.name for feature_config in model_config.feature_configs
+      ]],
+      separate_calibrators=False,
+      dtype=dtype)
+  lattice_output = premade_lib.build_lattice_layer(
+      lattice_input=submodels_inputs[0],
+      feature_configs=model_config.feature_configs,
+      model_config=model_config,
+      layer_output_range=premade_lib.LayerOutputRange.MODEL_OUTPUT,
+      submodel_index=0,
+      is_inside_ensemble=False,
+      dtype=dtype,
+      units=units)
+  inputs = [
+      input_layer[feature_config.name]
+      for feature_config in model_config.feature_configs
+  ]
+  return tf.keras.Model(inputs=inputs, outputs=lattice_output)
+
+
 # TODO: add support for tf.map_fn and inputs of shape (B, ?, input_dim)
 # as well as non-ragged inputs using padding/mask.
 class AggregateFunction(tf.keras.Model):
@@ -479,10 +503,18 @@ class AggregateFunction(tf.keras.Model):
         output_min=-1.0,
         output_max=1.0,
         output_initialization=[-1.0, 1.0])
-    calibrated_lattice_models = [
-        CalibratedLattice(calibrated_lattice_config)
-        for _ in range(model_config.middle_dimension)
-    ]
+    if model_config.separate_calibrators:
+      calibrated_lattice_models = [
+          CalibratedLattice(calibrated_lattice_config)
+          for _ in range(model_config.middle_dimension)
+      ]
+    else:
+      calibrated_lattice_models = [
+          _multi_unit_calibrated_lattice(
+              calibrated_lattice_config,
+              units=model_config.middle_dimension,
+              dtype=dtype)
+      ]
     aggregation_layer_output_range = (
         premade_lib.LayerOutputRange.INPUT_TO_FINAL_CALIBRATION
         if model_config.output_calibration else
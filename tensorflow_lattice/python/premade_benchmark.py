@@ -0,0 +1,448 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""End-to-end training throughput benchmarks for TFL premade models.
+
+Trains TFL premade Keras models and canned estimators on a synthetic dataset
+and measures keypoint analysis time, crystals prefitting time, training
+throughput (steps/sec and examples/sec) and export time. The synthetic data is
+generated on the fly using stateless random ops, so the number of examples and
+features can be scaled (e.g. to 10M examples with 500 features) without
+materializing the dataset in memory. Run with:
+
+```shell
+python -m tensorflow_lattice.python.premade_benchmark --benchmark_filter=. \
+    --num_examples=10000000 --num_features=500 --categorical_fraction=0.2 \
+    --missing_fraction=0.05 --benchmark_output_file=/tmp/tfl_premade.json
+```
+
+`--benchmark_filter` (`--benchmarks` in older TF versions) is a regex selecting
+the benchmark methods to run, e.g. `--benchmark_filter=CalibratedLinear`. Each
+benchmark result is reported using `tf.test.Benchmark.report_benchmark` and, if
+`--benchmark_output_file` is set, also appended to the given file as a single
+line JSON object.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import tempfile
+import time
+
+from absl import flags
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import estimators
+from tensorflow_lattice.python import premade
+from tensorflow_lattice.python import premade_lib
+
+flags.DEFINE_string(
+    'benchmark_output_file', None,
+    'If set, benchmark results are appended to this file as JSON lines.')
+flags.DEFINE_integer('num_examples', 100000,
+                     'Number of examples in the synthetic dataset.')
+flags.DEFINE_integer('num_features', 20,
+                     'Number of features in the synthetic dataset.')
+flags.DEFINE_float('categorical_fraction', 0.2,
+                   'Fraction of features that are categorical.')
+flags.DEFINE_float('monotonic_fraction', 0.5,
+                   'Fraction of numeric features that are monotonic.')
+flags.DEFINE_float('missing_fraction', 0.05,
+                   'Fraction of missing values in numeric features.')
+flags.DEFINE_integer('num_buckets', 10,
+                     'Number of buckets of categorical features.')
+flags.DEFINE_integer('num_keypoints', 20,
+                     'Number of keypoints of PWL calibration layers.')
+flags.DEFINE_integer('batch_size', 1024, 'Training batch size.')
+flags.DEFINE_integer('num_steps', 100, 'Number of timed training steps.')
+flags.DEFINE_integer('num_analysis_examples', 100000,
+                     'Number of examples used for keypoint analysis.')
+flags.DEFINE_integer('num_prefitting_steps', 50,
+                     'Number of training steps of the crystals prefitting model.')
+flags.DEFINE_integer('num_lattices', 32,
+                     'Number of lattices in lattice ensemble models.')
+flags.DEFINE_integer('lattice_rank', 4,
+                     'Number of features in each lattice of ensemble models.')
+flags.DEFINE_integer(
+    'calibrated_lattice_num_features', 6,
+    'Number of features used by calibrated lattice models. A single lattice '
+    'with all features is not feasible for a large number of features.')
+flags.DEFINE_integer('seed', 42, 'Seed of the synthetic dataset.')
+
+FLAGS = flags.FLAGS
+
+# Value used for missing numeric features.
+_MISSING_VALUE = -1.0
+
+
+def synthetic_feature_configs(num_features,
+                              categorical_fraction=0.2,
+                              monotonic_fraction=0.5,
+                              num_buckets=10,
+                              num_keypoints=20):
+  """Returns feature configs of the synthetic dataset.
+
+  Args:
+    num_features: Total number of features.
+    categorical_fraction: Fraction of features that are categorical.
+    monotonic_fraction: Fraction of numeric features that are monotonic.
+    num_buckets: Number of buckets of categorical features. The last bucket is
+      used for missing values.
+    num_keypoints: Number of keypoints of PWL calibration layers.
+
+  Returns:
+    A list of `tfl.configs.FeatureConfig`. Numeric features are named
+    `numeric_{i}` and categorical features are named `categorical_{i}`.
+  """
+  num_categorical = int(round(num_features * categorical_fraction))
+  num_numeric = num_features - num_categorical
+  num_monotonic = int(round(num_numeric * monotonic_fraction))
+  feature_configs = []
+  for i in range(num_numeric):
+    feature_configs.append(
+        configs.FeatureConfig(
+            name='numeric_{}'.format(i),
+            lattice_size=2,
+            monotonicity='increasing' if i < num_monotonic else 'none',
+            pwl_calibration_num_keypoints=num_keypoints,
+            default_value=_MISSING_VALUE))
+  for i in range(num_categorical):
+    feature_configs.append(
+        configs.FeatureConfig(
+            name='categorical_{}'.format(i),
+            lattice_size=2,
+            num_buckets=num_buckets))
+  return feature_configs
+
+
+def synthetic_dataset(feature_configs,
+                      num_examples,
+                      batch_size,
+                      missing_fraction=0.0,
+                      seed=42):
+  """Returns a batched dataset of synthetic `(features, label)` examples.
+
+  Examples are generated on the fly from the batch index using stateless random
+  ops, so the dataset is deterministic and is never materialized in memory.
+  Numeric features are uniform in [0, 1] with `missing_fraction` of values set
+  to the missing value of the feature config. Categorical features are uniform
+  integer ids where the last bucket represents missing values. The binary label
+  is sampled from a logistic model that is increasing in the monotonic
+  features and has pairwise interactions between consecutive features.
+
+  Args:
+    feature_configs: Feature configs returned by `synthetic_feature_configs`.
+    num_examples: Number of examples in the dataset.
+    batch_size: Batch size.
+    missing_fraction: Fraction of missing values in numeric features.
+    seed: Seed of the random ops.
+
+  Returns:
+    A `tf.data.Dataset` of `(features, label)` tuples, where features is a dict
+    from feature name to a tensor of shape `(batch_size, 1)`.
+  """
+  rng = np.random.RandomState(seed)
+  num_features = len(feature_configs)
+  coefficients = rng.uniform(0.5, 1.5, size=num_features).astype(np.float32)
+  interactions = rng.uniform(-1.0, 1.0, size=num_features).astype(np.float32)
+  bucket_effects = [
+      rng.uniform(-1.0, 1.0, size=feature_config.num_buckets).astype(
+          np.float32) if feature_config.num_buckets else None
+      for feature_config in feature_configs
+  ]
+  num_batches = (num_examples + batch_size - 1) // batch_size
+
+  def generate_batch(batch_index):
+    batch_index = tf.cast(batch_index, tf.int32)
+    current_batch_size = tf.minimum(batch_size,
+                                    num_examples - batch_index * batch_size)
+    features = {}
+    effects = []
+    for i, feature_config in enumerate(feature_configs):
+      feature_seed = tf.stack([batch_index, seed + i])
+      if feature_config.num_buckets:
+        ids = tf.random.stateless_uniform([current_batch_size, 1],
+                                          seed=feature_seed,
+                                          maxval=feature_config.num_buckets,
+                                          dtype=tf.int32)
+        features[feature_config.name] = ids
+        effects.append(tf.gather(bucket_effects[i], ids))
+      else:
+        values = tf.random.stateless_uniform([current_batch_size, 1],
+                                             seed=feature_seed)
+        if feature_config.monotonicity == 'increasing':
+          effects.append(coefficients[i] * values)
+        else:
+          effects.append(coefficients[i] * tf.sin(6.0 * values))
+        missing = tf.random.stateless_uniform(
+            [current_batch_size, 1], seed=feature_seed + 1) < missing_fraction
+        features[feature_config.name] = tf.where(
+            missing, tf.constant(_MISSING_VALUE, dtype=values.dtype), values)
+    logits = tf.add_n(effects) - np.sum(coefficients) / 2.0
+    for i in range(num_features - 1):
+      logits += interactions[i] * effects[i] * effects[i + 1]
+    noise = tf.random.stateless_uniform([current_batch_size, 1],
+                                        seed=tf.stack(
+                                            [batch_index, seed + num_features]))
+    label = tf.cast(noise < tf.sigmoid(logits), tf.float32)
+    return features, label
+
+  return tf.data.Dataset.range(num_batches).map(
+      generate_batch, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+
+
+class PremadeBenchmark(tf.test.Benchmark):
+  """Benchmarks training of TFL premade models and canned estimators."""
+
+  def _feature_configs(self):
+    return synthetic_feature_configs(
+        num_features=FLAGS.num_features,
+        categorical_fraction=FLAGS.categorical_fraction,
+        monotonic_fraction=FLAGS.monotonic_fraction,
+        num_buckets=FLAGS.num_buckets,
+        num_keypoints=FLAGS.num_keypoints)
+
+  def _dataset(self, feature_configs, num_examples, repeat=False):
+    dataset = synthetic_dataset(
+        feature_configs=feature_configs,
+        num_examples=num_examples,
+        batch_size=FLAGS.batch_size,
+        missing_fraction=FLAGS.missing_fraction,
+        seed=FLAGS.seed)
+    if repeat:
+      dataset = dataset.repeat()
+    return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
+  def _keras_dataset(self, model_config, num_examples, repeat=False):
+    """Returns a dataset with premade model inputs in feature config order."""
+    feature_names = [
+        feature_config.name for feature_config in model_config.feature_configs
+    ]
+    return self._dataset(
+        model_config.feature_configs, num_examples, repeat=repeat).map(
+            lambda features, label:  # pylint: disable=g-long-lambda
+            (tuple(features[name] for name in feature_names), label))
+
+  def _report(self, name, num_steps, training_time, extras):
+    """Reports benchmark results and appends them to the output file."""
+    extras = dict(extras)
+    extras['steps_per_sec'] = num_steps / training_time
+    extras['examples_per_sec'] = num_steps * FLAGS.batch_size / training_time
+    self.report_benchmark(
+        iters=num_steps, wall_time=training_time / num_steps, name=name,
+        extras=extras)
+    result = {
+        'name': name,
+        'num_examples': FLAGS.num_examples,
+        'num_features': FLAGS.num_features,
+        'categorical_fraction': FLAGS.categorical_fraction,
+        'missing_fraction': FLAGS.missing_fraction,
+        'batch_size': FLAGS.batch_size,
+        'num_steps': num_steps,
+        'tf_version': tf.__version__,
+        'timestamp': time.time(),
+    }
+    result.update(extras)
+    if FLAGS.benchmark_output_file:
+      with tf.io.gfile.GFile(FLAGS.benchmark_output_file, 'a') as f:
+        f.write(json.dumps(result, sort_keys=True) + '\n')
+    return result
+
+  def _set_keypoints(self, model_config):
+    """Sets keypoints in place and returns the analysis time."""
+    start = time.time()
+    premade_lib.set_keypoints_from_dataset(
+        model_config,
+        self._keras_dataset(model_config, FLAGS.num_analysis_examples),
+        logits_output=True)
+    return time.time() - start
+
+  def _fit(self, model, model_config, num_steps):
+    """Trains the model for num_steps on the synthetic dataset."""
+    model.fit(
+        self._keras_dataset(model_config, FLAGS.num_examples, repeat=True),
+        epochs=1,
+        steps_per_epoch=num_steps,
+        verbose=0)
+
+  def _compile(self, model):
+    model.compile(
+        loss=tf.keras.losses.BinaryCrossentropy(from_logits=True),
+        optimizer=tf.keras.optimizers.Adam(0.01))
+
+  def _run_premade_benchmark(self, name, model_class, model_config):
+    """Measures analysis, prefitting, training and export of a premade model."""
+    extras = {}
+    extras['keypoint_analysis_time'] = self._set_keypoints(model_config)
+
+    if (isinstance(model_config, configs.CalibratedLatticeEnsembleConfig) and
+        model_config.lattices == 'crystals'):
+      start = time.time()
+      prefitting_model_config = premade_lib.construct_prefitting_model_config(
+          model_config)
+      prefitting_model = premade.CalibratedLatticeEnsemble(
+          prefitting_model_config)
+      self._compile(prefitting_model)
+      self._fit(prefitting_model, prefitting_model_config,
+                FLAGS.num_prefitting_steps)
+      premade_lib.set_crystals_lattice_ensemble(model_config,
+                                                prefitting_model_config,
+                                                prefitting_model)
+      extras['prefitting_time'] = time.time() - start
+    elif isinstance(model_config, configs.CalibratedLatticeEnsembleConfig):
+      premade_lib.set_random_lattice_ensemble(model_config)
+
+    start = time.time()
+    model = model_class(model_config)
+    self._compile(model)
+    # The first step includes tracing and graph optimizations.
+    self._fit(model, model_config, 1)
+    extras['setup_time'] = time.time() - start
+
+    start = time.time()
+    self._fit(model, model_config, FLAGS.num_steps)
+    training_time = time.time() - start
+
+    start = time.time()
+    model.save(os.path.join(tempfile.mkdtemp(), 'model'))
+    extras['export_time'] = time.time() - start
+    return self._report(name, FLAGS.num_steps, training_time, extras)
+
+  def _run_estimator_benchmark(self, name, model_config):
+    """Measures setup, training and export of a canned estimator."""
+    feature_configs = model_config.feature_configs
+    feature_columns = []
+    for feature_config in feature_configs:
+      if feature_config.num_buckets:
+        # The last bucket is used for out of vocabulary (missing) values.
+        feature_columns.append(
+            tf.feature_column.categorical_column_with_vocabulary_list(
+                feature_config.name,
+                vocabulary_list=list(range(feature_config.num_buckets - 1)),
+                default_value=-1))
+      else:
+        feature_columns.append(
+            tf.feature_column.numeric_column(
+                feature_config.name, default_value=_MISSING_VALUE))
+
+    def input_fn(num_examples, repeat=False):
+
+      def _input_fn():
+        dataset = self._dataset(feature_configs, num_examples, repeat)
+        return tf.compat.v1.data.make_one_shot_iterator(dataset).get_next()
+
+      return _input_fn
+
+    estimator = estimators.CannedClassifier(
+        feature_columns=feature_columns,
+        model_config=model_config,
+        feature_analysis_input_fn=input_fn(FLAGS.num_analysis_examples),
+        prefitting_input_fn=input_fn(FLAGS.num_examples, repeat=True),
+        prefitting_steps=FLAGS.num_prefitting_steps,
+        optimizer='Adam',
+        prefitting_optimizer='Adam',
+        model_dir=tempfile.mkdtemp())
+    train_input_fn = input_fn(FLAGS.num_examples, repeat=True)
+
+    extras = {}
+    # Includes keypoint analysis, crystals prefitting and graph construction.
+    start = time.time()
+    estimator.train(input_fn=train_input_fn, steps=1)
+    extras['setup_time'] = time.time() - start
+
+    start = time.time()
+    estimator.train(input_fn=train_input_fn, steps=FLAGS.num_steps)
+    training_time = time.time() - start
+
+    start = time.time()
+    serving_input_fn = (
+        tf.estimator.export.build_parsing_serving_input_receiver_fn(
+            feature_spec=tf.feature_column.make_parse_example_spec(
+                feature_columns)))
+    estimator.export_saved_model(estimator.model_dir, serving_input_fn)
+    extras['export_time'] = time.time() - start
+    return self._report(name, FLAGS.num_steps, training_time, extras)
+
+  def _calibrated_linear_config(self):
+    return configs.CalibratedLinearConfig(
+        feature_configs=self._feature_configs(),
+        output_initialization='quantiles')
+
+  def _calibrated_lattice_config(self):
+    return configs.CalibratedLatticeConfig(
+        feature_configs=self._feature_configs()
+        [:FLAGS.calibrated_lattice_num_features],
+        output_initialization='quantiles')
+
+  def _calibrated_lattice_ensemble_config(self, lattices, pack_lattices=False):
+    return configs.CalibratedLatticeEnsembleConfig(
+        feature_configs=self._feature_configs(),
+        lattices=lattices,
+        num_lattices=FLAGS.num_lattices,
+        lattice_rank=FLAGS.lattice_rank,
+        separate_calibrators=True,
+        output_initialization='quantiles',
+        pack_lattices=pack_lattices)
+
+  def benchmarkCalibratedLinear(self):
+    self._run_premade_benchmark('calibrated_linear', premade.CalibratedLinear,
+                                self._calibrated_linear_config())
+
+  def benchmarkCalibratedLattice(self):
+    self._run_premade_benchmark('calibrated_lattice',
+                                premade.CalibratedLattice,
+                                self._calibrated_lattice_config())
+
+  def benchmarkCalibratedLatticeEnsembleRandom(self):
+    self._run_premade_benchmark(
+        'calibrated_lattice_ensemble_random',
+        premade.CalibratedLatticeEnsemble,
+        self._calibrated_lattice_ensemble_config('random'))
+
+  def benchmarkCalibratedLatticeEnsembleCrystals(self):
+    self._run_premade_benchmark(
+        'calibrated_lattice_ensemble_crystals',
+        premade.CalibratedLatticeEnsemble,
+        self._calibrated_lattice_ensemble_config('crystals'))
+
+  def benchmarkCalibratedLatticeEnsemblePacked(self):
+    self._run_premade_benchmark(
+        'calibrated_lattice_ensemble_packed',
+        premade.CalibratedLatticeEnsemble,
+        self._calibrated_lattice_ensemble_config('random', pack_lattices=True))
+
+  def benchmarkCannedCalibratedLinear(self):
+    self._run_estimator_benchmark('canned_calibrated_linear',
+                                  self._calibrated_linear_config())
+
+  def benchmarkCannedCalibratedLattice(self):
+    self._run_estimator_benchmark('canned_calibrated_lattice',
+                                  self._calibrated_lattice_config())
+
+  def benchmarkCannedCalibratedLatticeEnsembleRandom(self):
+    self._run_estimator_benchmark(
+        'canned_calibrated_lattice_ensemble_random',
+        self._calibrated_lattice_ensemble_config('random'))
+
+  def benchmarkCannedCalibratedLatticeEnsembleCrystals(self):
+    self._run_estimator_benchmark(
+        'canned_calibrated_lattice_ensemble_crystals',
+        self._calibrated_lattice_ensemble_config('crystals'))
+
+
+if __name__ == '__main__':
+  tf.test.main()
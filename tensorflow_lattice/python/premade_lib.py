@@ -44,11 +44,16 @@ INPUT_LAYER_NAME = 'tfl_input'
 LATTICE_LAYER_NAME = 'tfl_lattice'
 LINEAR_LAYER_NAME = 'tfl_linear'
 OUTPUT_CALIB_LAYER_NAME = 'tfl_output_calib'
+PACKED_LATTICE_LAYER_NAME = 'tfl_packed_lattice'
 
 # Prefix for passthrough (identity) nodes for shared calibration.
 # These nodes pass shared calibrated values to submodels in an ensemble.
 CALIB_PASSTHROUGH_NAME = 'tfl_calib_passthrough'
 
+# Prefix for passthrough (identity) nodes for packed ensemble lattices.
+# These nodes split the outputs of packed lattices into submodel outputs.
+PACKED_LATTICE_PASSTHROUGH_NAME = 'tfl_packed_lattice_passthrough'
+
 # Prefix for defining feature calibrator regularizers.
 _INPUT_CALIB_REGULARIZER_PREFIX = 'calib_'
 
@@ -64,6 +69,9 @@ _REPEATED_PAIR_DISCOUNT_IN_CRYSTALS_SCORE = 0.5
 # Maximum number of swaps for the crystals algorithm.
 _MAX_CRYSTALS_SWAPS = 1000
 
+# Name used for label values when calculating output keypoints.
+_LABEL_KEYPOINTS_NAME = '__label__'
+
 
 def _input_calibration_regularizers(model_config, feature_config):
   """Returns pwl layer regularizers defined in the model and feature configs."""
@@ -301,7 +309,10 @@ def build_aggregation_layer(aggregation_input_layer, model_config,
       Should be one of the model configs in `tfl.configs`.
     calibrated_lattice_models: A list of calibrated lattice models of size
       model_config.middle_diemnsion, where each calbirated lattice model
-      instance is constructed using the same model configuration object.
+      instance is constructed using the same model configuration object. If
+      `model_config.separate_calibrators` is False, a list with a single
+      calibrated lattice model with `model_config.middle_dimension` output
+      units.
     layer_output_range: A `tfl.premade_lib.LayerOutputRange` enum.
     submodel_index: Corresponding index into submodels.
     dtype: dtype
@@ -316,14 +327,31 @@ def build_aggregation_layer(aggregation_input_layer, model_config,
                   ] * model_config.middle_dimension
   lattice_monotonicities = [1] * model_config.middle_dimension
 
+  # Calibrated lattice models take their inputs in the order of the feature
+  # configs.
+  aggregation_inputs = [
+      aggregation_input_layer[feature_config.name]
+      for feature_config in model_config.feature_configs
+  ]
+
   # Create the aggergated embeddings to pass to the middle lattice.
-  lattice_inputs = []
-  for i in range(model_config.middle_dimension):
+  agg_outputs = []
+  for i, calibrated_lattice_model in enumerate(calibrated_lattice_models):
     agg_layer_name = '{}_{}'.format(AGGREGATION_LAYER_NAME, i)
     agg_output = aggregation_layer.Aggregation(
-        calibrated_lattice_models[i], name=agg_layer_name)(
-            aggregation_input_layer)
-    agg_output = tf.keras.layers.Reshape((1,))(agg_output)
+        calibrated_lattice_model,
+        chunk_size=model_config.aggregation_chunk_size,
+        name=agg_layer_name)(
+            aggregation_inputs)
+    if model_config.separate_calibrators:
+      agg_outputs.append(tf.keras.layers.Reshape((1,))(agg_output))
+    else:
+      # A single calibrated lattice model with one unit per middle dimension.
+      agg_outputs.extend(
+          tf.split(agg_output, model_config.middle_dimension, axis=1))
+
+  lattice_inputs = []
+  for i, agg_output in enumerate(agg_outputs):
     if model_config.middle_calibration:
       agg_output = pwl_calibration_layer.PWLCalibration(
           input_keypoints=np.linspace(
@@ -449,27 +477,9 @@ def build_linear_layer(linear_input, feature_configs, model_config,
           linear_input)
 
 
-def build_lattice_layer(lattice_input, feature_configs, model_config,
-                        layer_output_range, submodel_index, is_inside_ensemble,
-                        dtype):
-  """Creates a `tfl.layers.Lattice` layer.
-
-  Args:
-    lattice_input: Input to the lattice layer.
-    feature_configs: A list of `tfl.configs.FeatureConfig` instances that
-      specify configurations for each feature.
-    model_config: Model configuration object describing model architecture.
-      Should be one of the model configs in `tfl.configs`.
-    layer_output_range: A `tfl.premade_lib.LayerOutputRange` enum.
-    submodel_index: Corresponding index into submodels.
-    is_inside_ensemble: If this layer is inside an ensemble.
-    dtype: dtype
-
-  Returns:
-    A `tfl.layers.Lattice` instance.
-  """
-  layer_name = '{}_{}'.format(LATTICE_LAYER_NAME, submodel_index)
-
+def _lattice_layer_kwargs(feature_configs, model_config, layer_output_range,
+                          is_inside_ensemble):
+  """Returns the `tfl.layers.Lattice` arguments for the given features."""
   (output_min, output_max, output_init_min,
    output_init_max) = _output_range(layer_output_range, model_config)
 
@@ -517,7 +527,7 @@ def build_lattice_layer(lattice_input, feature_configs, model_config,
       unimodalities=lattice_unimodalities,
       output_min=output_init_min,
       output_max=output_init_max)
-  return lattice_layer.Lattice(
+  return dict(
       lattice_sizes=lattice_sizes,
       monotonicities=lattice_monotonicities,
       unimodalities=lattice_unimodalities,
@@ -528,12 +538,291 @@ def build_lattice_layer(lattice_input, feature_configs, model_config,
       output_max=output_max,
       clip_inputs=False,
       kernel_regularizer=lattice_regularizers,
-      kernel_initializer=kernel_initializer,
+      kernel_initializer=kernel_initializer)
+
+
+def build_lattice_layer(lattice_input,
+                        feature_configs,
+                        model_config,
+                        layer_output_range,
+                        submodel_index,
+                        is_inside_ensemble,
+                        dtype,
+                        units=1):
+  """Creates a `tfl.layers.Lattice` layer.
+
+  Args:
+    lattice_input: Input to the lattice layer.
+    feature_configs: A list of `tfl.configs.FeatureConfig` instances that
+      specify configurations for each feature.
+    model_config: Model configuration object describing model architecture.
+      Should be one of the model configs in `tfl.configs`.
+    layer_output_range: A `tfl.premade_lib.LayerOutputRange` enum.
+    submodel_index: Corresponding index into submodels.
+    is_inside_ensemble: If this layer is inside an ensemble.
+    dtype: dtype
+    units: Number of lattice units. If greater than 1, all units are evaluated
+      on the same `lattice_input`.
+
+  Returns:
+    A `tfl.layers.Lattice` instance.
+  """
+  layer_name = '{}_{}'.format(LATTICE_LAYER_NAME, submodel_index)
+  lattice_kwargs = _lattice_layer_kwargs(
+      feature_configs=feature_configs,
+      model_config=model_config,
+      layer_output_range=layer_output_range,
+      is_inside_ensemble=is_inside_ensemble)
+  # Interpolation weights of a multi-unit lattice are computed once for all
+  # units.
+  return lattice_layer.Lattice(
+      units=units,
+      shared_inputs=units > 1,
       dtype=dtype,
-      name=layer_name)(
+      name=layer_name,
+      **lattice_kwargs)(
           lattice_input)
 
 
+def _ensemble_lattice_output_range(model_config):
+  """Returns the output range of lattices in an ensemble model."""
+  if model_config.output_calibration:
+    return LayerOutputRange.INPUT_TO_FINAL_CALIBRATION
+  return LayerOutputRange.MODEL_OUTPUT
+
+
+def _lattice_signature(lattice_kwargs):
+  """Returns a hashable key identifying lattices that can be packed."""
+  return repr(
+      sorted((key, value)
+             for key, value in six.iteritems(lattice_kwargs)
+             if key != 'kernel_initializer'))
+
+
+def packed_lattice_groups(model_config):
+  """Returns the groups of ensemble lattices packed into a single layer.
+
+  Lattices in the ensemble that have the same lattice sizes and the same
+  constraints and regularizers are packed into a single multi-unit
+  `tfl.layers.Lattice` layer, similar to `tfl.layers.RTL`. This reduces the
+  number of interpolation ops and constraint projections in the model. Groups
+  are ordered by their first submodel, and submodels within each group are
+  ordered by their submodel index, which is also their unit index in the packed
+  lattice layer. Lattices that can not be packed with any other lattice are
+  not included and use a separate lattice layer.
+
+  Args:
+    model_config: Model configuration object describing model architecture.
+      Should be a `tfl.configs.CalibratedLatticeEnsembleConfig` instance.
+
+  Returns:
+    A list of lists of submodel indices. Empty if `model_config.pack_lattices`
+    is not set.
+  """
+  if not getattr(model_config, 'pack_lattices', False):
+    return []
+  layer_output_range = _ensemble_lattice_output_range(model_config)
+  groups = collections.OrderedDict()
+  for submodel_index, lattice_feature_names in enumerate(model_config.lattices):
+    lattice_feature_configs = [
+        model_config.feature_config_by_name(feature_name)
+        for feature_name in lattice_feature_names
+    ]
+    lattice_kwargs = _lattice_layer_kwargs(
+        feature_configs=lattice_feature_configs,
+        model_config=model_config,
+        layer_output_range=layer_output_range,
+        # Avoid duplicate warnings. They are logged when building the layers.
+        is_inside_ensemble=False)
+    groups.setdefault(_lattice_signature(lattice_kwargs),
+                      []).append(submodel_index)
+  return [group for group in groups.values() if len(group) > 1]
+
+
+def submodel_lattice_units(model_config):
+  """Returns the lattice layer name and unit used for each ensemble submodel.
+
+  Args:
+    model_config: Model configuration object describing model architecture.
+      Should be a `tfl.configs.CalibratedLatticeEnsembleConfig` instance.
+
+  Returns:
+    A list with a `(layer_name, unit_index)` tuple for each submodel.
+  """
+  lattice_units = [('{}_{}'.format(LATTICE_LAYER_NAME, submodel_index), 0)
+                   for submodel_index in range(len(model_config.lattices))]
+  for group_index, group in enumerate(packed_lattice_groups(model_config)):
+    for unit_index, submodel_index in enumerate(group):
+      lattice_units[submodel_index] = ('{}_{}'.format(
+          PACKED_LATTICE_LAYER_NAME, group_index), unit_index)
+  return lattice_units
+
+
+class Submodel(
+    collections.namedtuple(
+        'Submodel', ['feature_names', 'calibration_units', 'layer', 'unit'])):
+  """A submodel of a premade model operating on calibrated features.
+
+  Attributes:
+    feature_names: Names of the features used by the submodel, in the order of
+      the submodel inputs.
+    calibration_units: Calibration unit used for each of the features.
+    layer: The `tfl.layers.Lattice` or `tfl.layers.Linear` layer of the
+      submodel.
+    unit: Unit of the lattice layer used by the submodel.
+  """
+
+
+def evaluate_submodel(submodel, inputs):
+  """Evaluates a submodel on calibrated inputs.
+
+  Args:
+    submodel: A `Submodel` instance.
+    inputs: List of calibrated inputs, each of shape `(batch_size, 1)`, in the
+      order of `submodel.feature_names`.
+
+  Returns:
+    Submodel outputs of shape `(batch_size, 1)`.
+  """
+  layer = submodel.layer
+  if isinstance(layer, linear_layer.Linear):
+    return layer(tf.concat(inputs, axis=1))
+  interpolation_weights = lattice_lib.compute_interpolation_weights(
+      inputs=tf.concat(inputs, axis=1),
+      lattice_sizes=layer.lattice_sizes,
+      clip_inputs=layer.clip_inputs)
+  return tf.matmul(interpolation_weights,
+                   layer.kernel[:, submodel.unit:submodel.unit + 1])
+
+
+def premade_submodels(model):
+  """Returns the submodels of a premade model and how they are combined.
+
+  Args:
+    model: A `tfl.premade` model with a `model_config`, other than
+      `tfl.premade.AggregateFunction`.
+
+  Returns:
+    A tuple `(submodels, average)`, where `submodels` is a list of `Submodel`
+    instances and `average` indicates if submodel outputs are averaged, as
+    opposed to a single submodel.
+
+  Raises:
+    ValueError: If the model type is not supported.
+  """
+  model_config = model.model_config
+  feature_names = [
+      feature_config.name for feature_config in model_config.feature_configs
+  ]
+  if isinstance(model_config, configs.CalibratedLinearConfig):
+    submodel = Submodel(
+        feature_names=feature_names,
+        calibration_units=[0] * len(feature_names),
+        layer=model.get_layer('{}_0'.format(LINEAR_LAYER_NAME)),
+        unit=0)
+    return [submodel], False
+  if isinstance(model_config, configs.CalibratedLatticeConfig):
+    submodel = Submodel(
+        feature_names=feature_names,
+        calibration_units=[0] * len(feature_names),
+        layer=model.get_layer('{}_0'.format(LATTICE_LAYER_NAME)),
+        unit=0)
+    return [submodel], False
+  if isinstance(model_config, configs.CalibratedLatticeEnsembleConfig):
+    # Follows the assignment of calibration units in build_calibration_layers.
+    calibration_last_index = {name: 0 for name in feature_names}
+    submodels = []
+    for lattice, (layer_name, unit) in zip(model_config.lattices,
+                                           submodel_lattice_units(model_config)):
+      calibration_units = []
+      for feature_name in lattice:
+        calibration_units.append(calibration_last_index[feature_name])
+        if model_config.separate_calibrators:
+          calibration_last_index[feature_name] += 1
+      submodels.append(
+          Submodel(
+              feature_names=list(lattice),
+              calibration_units=calibration_units,
+              layer=model.get_layer(layer_name),
+              unit=unit))
+    return submodels, len(submodels) > 1
+  raise ValueError('Unsupported model config type: {}'.format(
+      type(model_config)))
+
+
+def build_ensemble_lattice_layers(submodels_inputs, model_config, dtype):
+  """Creates the lattice layers of a calibrated lattice ensemble.
+
+  If `model_config.pack_lattices` is set, lattices returned by
+  `packed_lattice_groups` are packed into multi-unit lattice layers. Outputs of
+  packed lattices are split into passthrough (identity) nodes for each
+  submodel so that the model structure can be recovered for plotting and
+  analysis.
+
+  Args:
+    submodels_inputs: A list of calibrated inputs for each submodel, as returned
+      by `build_calibration_layers`.
+    model_config: Model configuration object describing model architecture.
+      Should be a `tfl.configs.CalibratedLatticeEnsembleConfig` instance.
+    dtype: dtype
+
+  Returns:
+    A list of lattice outputs, one for each submodel.
+  """
+  layer_output_range = _ensemble_lattice_output_range(model_config)
+  lattice_outputs = [None] * len(model_config.lattices)
+
+  # {PACKED_LATTICE_PASSTHROUGH_NAME}_{group_idx}_{unit_idx}_{submodel_idx}
+  for group_index, group in enumerate(packed_lattice_groups(model_config)):
+    lattice_feature_configs = [
+        model_config.feature_config_by_name(feature_name)
+        for feature_name in model_config.lattices[group[0]]
+    ]
+    lattice_kwargs = _lattice_layer_kwargs(
+        feature_configs=lattice_feature_configs,
+        model_config=model_config,
+        layer_output_range=layer_output_range,
+        is_inside_ensemble=True)
+    # Packed lattice input shape: (batch_size, units, lattice_rank).
+    lattice_input = tf.stack([
+        tf.concat(submodels_inputs[submodel_index], axis=1)
+        for submodel_index in group
+    ],
+                             axis=1)
+    packed_output = lattice_layer.Lattice(
+        units=len(group),
+        dropout_rate=getattr(model_config, 'lattice_dropout_rate', 0.0),
+        dtype=dtype,
+        name='{}_{}'.format(PACKED_LATTICE_LAYER_NAME, group_index),
+        **lattice_kwargs)(
+            lattice_input)
+    for unit_index, (submodel_index, unit_output) in enumerate(
+        zip(group, tf.split(packed_output, len(group), axis=1))):
+      passthrough_name = '{}_{}_{}_{}'.format(PACKED_LATTICE_PASSTHROUGH_NAME,
+                                              group_index, unit_index,
+                                              submodel_index)
+      lattice_outputs[submodel_index] = tf.identity(
+          unit_output, name=passthrough_name)
+
+  for submodel_index, (lattice_feature_names, lattice_input) in enumerate(
+      zip(model_config.lattices, submodels_inputs)):
+    if lattice_outputs[submodel_index] is not None:
+      continue
+    lattice_feature_configs = [
+        model_config.feature_config_by_name(feature_name)
+        for feature_name in lattice_feature_names
+    ]
+    lattice_outputs[submodel_index] = build_lattice_layer(
+        lattice_input=lattice_input,
+        feature_configs=lattice_feature_configs,
+        model_config=model_config,
+        layer_output_range=layer_output_range,
+        submodel_index=submodel_index,
+        is_inside_ensemble=True,
+        dtype=dtype)
+  return lattice_outputs
+
+
 def build_output_calibration_layer(output_calibration_input, model_config,
                                    dtype):
   """Creates a monotonic output calibration layer with inputs range [0, 1].
@@ -566,6 +855,354 @@ def build_output_calibration_layer(output_calibration_input, model_config,
           output_calibration_input)
 
 
+def _clip_and_unique(values, clip_min, clip_max):
+  """Clips values as requested and returns the sorted unique values."""
+  # Add min and max to the value list to make sure min/max in values match
+  # the requested range.
+  if clip_min is not None:
+    values = np.maximum(values, clip_min)
+    values = np.append(values, clip_min)
+  if clip_max is not None:
+    values = np.minimum(values, clip_max)
+    values = np.append(values, clip_max)
+  return np.unique(values)
+
+
+def _compress_keypoints_sketch(values, weights, max_sketch_size):
+  """Compresses a sketch to at most max_sketch_size weighted values."""
+  if max_sketch_size is None or values.size <= max_sketch_size:
+    return values, weights
+  # Keep order statistics that split the total weight into equal parts. The
+  # first and last values are always kept, and each kept value accumulates the
+  # weights of the values dropped before it.
+  cumulative_weights = np.cumsum(weights)
+  indices = np.searchsorted(
+      cumulative_weights,
+      np.linspace(cumulative_weights[0], cumulative_weights[-1],
+                  max_sketch_size))
+  indices = np.unique(np.minimum(indices, values.size - 1))
+  kept_cumulative_weights = cumulative_weights[indices]
+  return values[indices], np.ediff1d(
+      kept_cumulative_weights, to_begin=kept_cumulative_weights[0])
+
+
+def compute_keypoints_sketch(values,
+                             clip_min=None,
+                             clip_max=None,
+                             default_value=None,
+                             max_sketch_size=None,
+                             feature_name=None):
+  """Computes a mergeable sketch of the unique values observed for a feature.
+
+  The sketch is a pair of numpy arrays `(values, weights)`. The values are the
+  sorted unique values observed after removing default values and clipping to
+  `[clip_min, clip_max]`, and each weight is the number of unique values
+  represented by the corresponding sketch value. If there are more than
+  `max_sketch_size` unique values, the sketch is compressed to approximately
+  equally spaced weighted order statistics that include the minimum and the
+  maximum. Sketches of different parts of the data can be combined using
+  `merge_keypoints_sketches` and turned into keypoints using
+  `compute_keypoints`.
+
+  Args:
+    values: Array of observed values.
+    clip_min: Optional minimum value to clip the values to.
+    clip_max: Optional maximum value to clip the values to.
+    default_value: Optional default (missing) value to be ignored.
+    max_sketch_size: Maximum number of values in the sketch. If None, all unique
+      values are kept.
+    feature_name: Name of the feature used in error messages.
+
+  Returns:
+    A `(values, weights)` tuple of numpy arrays.
+
+  Raises:
+    ValueError: If NaN values are observed.
+  """
+  values = np.asarray(values).flatten()
+
+  # Remove default values before calculating stats.
+  values = values[values != default_value]
+
+  if np.isnan(values).any():
+    raise ValueError(
+        'NaN values were observed for numeric feature `{}`. '
+        'Consider replacing the values in transform or input_fn.'.format(
+            feature_name))
+
+  values = _clip_and_unique(values, clip_min, clip_max)
+  return _compress_keypoints_sketch(values, np.ones(values.size),
+                                    max_sketch_size)
+
+
+def merge_keypoints_sketches(sketches, max_sketch_size=None):
+  """Merges sketches created by `compute_keypoints_sketch`.
+
+  A value observed in several sketches represents itself only once, while the
+  weights of the dropped values it accumulated in compressed sketches are
+  summed. Merging uncompressed sketches is hence exact. For compressed
+  sketches, dropped values that were observed in several sketches are counted
+  once per sketch, so the merged sketch only approximates a sketch of the
+  combined data.
+
+  Args:
+    sketches: A list of `(values, weights)` sketches.
+    max_sketch_size: Maximum number of values in the merged sketch. If None,
+      all values of the given sketches are kept.
+
+  Returns:
+    The merged `(values, weights)` sketch.
+  """
+  values = np.concatenate([np.asarray(sketch[0]) for sketch in sketches])
+  weights = np.concatenate(
+      [np.asarray(sketch[1], dtype=float) for sketch in sketches])
+  merged_values, inverse_indices = np.unique(values, return_inverse=True)
+  # Each weight is one for the value itself plus the weight of the dropped
+  # values it represents.
+  merged_weights = np.ones(merged_values.size)
+  np.add.at(merged_weights, inverse_indices, weights - 1.0)
+  return _compress_keypoints_sketch(merged_values, merged_weights,
+                                    max_sketch_size)
+
+
+def compute_keypoints(sketch,
+                      num_keypoints,
+                      keypoints='quantiles',
+                      feature_name=None,
+                      reduce_num_keypoints=True):
+  """Calculates keypoints from a sketch of the observed values.
+
+  Args:
+    sketch: A `(values, weights)` sketch as returned by
+      `compute_keypoints_sketch` or `merge_keypoints_sketches`.
+    num_keypoints: Number of keypoints to calculate.
+    keypoints: One of 'quantiles' or 'uniform', or an explicit list of
+      keypoints which is returned as is.
+    feature_name: Name of the feature used in logs and error messages.
+    reduce_num_keypoints: If the number of keypoints should be reduced to the
+      number of unique values when using quantiles and there are not enough
+      unique values.
+
+  Returns:
+    A list of keypoints.
+
+  Raises:
+    ValueError: If keypoints mode is invalid or no values were observed.
+  """
+  if not isinstance(keypoints, str):
+    # Keypoints are explicitly provided in the config.
+    return [float(x) for x in keypoints]
+
+  values, weights = sketch
+  values = np.asarray(values, dtype=float)
+  weights = np.asarray(weights, dtype=float)
+  if not values.size:
+    raise ValueError(
+        'No values observed for feature `{}`.'.format(feature_name))
+
+  if keypoints == 'quantiles':
+    if reduce_num_keypoints and values.size < num_keypoints:
+      logging.info(
+          'Not enough unique values observed for feature `%s` to '
+          'construct %d keypoints for pwl calibration. Using %d unique '
+          'values as keypoints.', feature_name, num_keypoints, values.size)
+      num_keypoints = values.size
+    if np.all(weights == 1.0):
+      quantiles = np.quantile(
+          values, np.linspace(0., 1., num_keypoints), interpolation='nearest')
+    else:
+      # Nearest weighted quantiles, treating each value as repeated according
+      # to its weight.
+      cumulative_weights = np.cumsum(weights)
+      positions = np.around(
+          np.linspace(0., 1., num_keypoints) * (cumulative_weights[-1] - 1))
+      indices = np.searchsorted(cumulative_weights, positions, side='right')
+      quantiles = values[np.minimum(indices, values.size - 1)]
+    return [float(x) for x in quantiles]
+  elif keypoints == 'uniform':
+    linspace = np.linspace(np.min(values), np.max(values), num_keypoints)
+    return [float(x) for x in linspace]
+  else:
+    raise ValueError('Invalid keypoint generation mode: {}'.format(keypoints))
+
+
+def _unpack_dataset_element(element):
+  """Unpacks a dataset element into (features, label) following Keras."""
+  if len(element) == 1:
+    element = element[0]
+  if not isinstance(element, tuple):
+    return element, None
+  if len(element) == 1:
+    return element[0], None
+  if len(element) in (2, 3):
+    return element[0], element[1]
+  raise ValueError(
+      'Dataset elements should be features or tuples of (features, label) or '
+      '(features, label, weights): {}'.format(element))
+
+
+def _dataset_feature_values(features, feature_index, feature_config):
+  """Returns the values of a feature in a batch of features."""
+  if isinstance(features, dict):
+    input_name = '{}_{}'.format(INPUT_LAYER_NAME, feature_config.name)
+    if feature_config.name in features:
+      return features[feature_config.name]
+    if input_name in features:
+      return features[input_name]
+    raise ValueError('Feature `{}` not found in dataset features: {}'.format(
+        feature_config.name, list(features.keys())))
+  if isinstance(features, (list, tuple)):
+    return features[feature_index]
+  # A single tensor with one column per feature.
+  return features[:, feature_index]
+
+
+def _unique_dataset_values(values, default_value=None, clip_min=None,
+                           clip_max=None):
+  """Returns the unique values in a batch after removing defaults and clipping."""
+  if isinstance(values, tf.RaggedTensor):
+    values = values.flat_values
+  values = tf.reshape(values, [-1])
+  if values.dtype == tf.string:
+    return tf.unique(values).y
+  values = tf.cast(values, tf.float64)
+  if default_value is not None:
+    values = tf.boolean_mask(values, tf.not_equal(values, default_value))
+  if clip_min is not None:
+    values = tf.maximum(values, clip_min)
+  if clip_max is not None:
+    values = tf.minimum(values, clip_max)
+  return tf.unique(values).y
+
+
+def set_keypoints_from_dataset(model_config,
+                               dataset,
+                               logits_output=False,
+                               max_sketch_size=10000,
+                               num_parallel_calls=None):
+  """Calculates and sets input and output calibration keypoints in place.
+
+  Keypoints are calculated in a single streaming pass over the dataset, without
+  materializing it in memory. Each batch is reduced to the unique values of
+  each feature using `dataset.map` with parallel calls, and the results are
+  accumulated into bounded per-feature sketches (see
+  `compute_keypoints_sketch`). Keypoints are only calculated for numeric
+  features that have `pwl_calibration_input_keypoints` set to 'quantiles' or
+  'uniform', and output keypoints are only calculated if the model config has
+  `output_initialization` set to 'quantiles' or 'uniform' and the dataset has
+  labels.
+
+  Dataset elements are unpacked the same way as in `tf.keras.Model.fit`: they
+  can be features, or tuples of `(features, label)` or
+  `(features, label, sample_weights)`. Features can be a dict keyed by feature
+  name (or by the premade model input names), a list of tensors in the order of
+  the feature configs, or a single tensor with one column per feature.
+
+  ```python
+  model_config = tfl.configs.CalibratedLatticeConfig(...)
+  tfl.premade_lib.set_keypoints_from_dataset(model_config, train_dataset)
+  model = tfl.premade.CalibratedLattice(model_config)
+  ```
+
+  Must be called in eager mode.
+
+  Args:
+    model_config: Model configuration object describing model architecture.
+      Should be one of the model configs in `tfl.configs`.
+    dataset: A batched `tf.data.Dataset` with the features and labels.
+    logits_output: If the model is expected to produce logits. If True, output
+      keypoints are set linearly in the range [-2, 2], ignoring the label
+      distribution.
+    max_sketch_size: Maximum number of values kept for each feature. If None,
+      all unique values are kept and the keypoints are exact.
+    num_parallel_calls: Number of batches to process in parallel. Defaults to
+      `tf.data.experimental.AUTOTUNE`.
+
+  Raises:
+    ValueError: If NaN values are observed or dataset elements have an invalid
+      structure.
+  """
+  if num_parallel_calls is None:
+    num_parallel_calls = tf.data.experimental.AUTOTUNE
+  feature_indices = {}
+  for index, feature_config in enumerate(model_config.feature_configs):
+    if (not feature_config.num_buckets and
+        isinstance(feature_config.pwl_calibration_input_keypoints, str)):
+      feature_indices[feature_config.name] = index
+  set_output_keypoints = isinstance(model_config.output_initialization, str)
+  if logits_output and set_output_keypoints:
+    model_config.output_initialization = [
+        float(x) for x in np.linspace(
+            -2, 2, model_config.output_calibration_num_keypoints)
+    ]
+    set_output_keypoints = False
+
+  def unique_values_fn(*element):
+    features, label = _unpack_dataset_element(element)
+    unique_values = {}
+    for feature_name, index in six.iteritems(feature_indices):
+      feature_config = model_config.feature_configs[index]
+      unique_values[feature_name] = _unique_dataset_values(
+          _dataset_feature_values(features, index, feature_config),
+          default_value=feature_config.default_value,
+          clip_min=feature_config.pwl_calibration_clip_min,
+          clip_max=feature_config.pwl_calibration_clip_max)
+    if set_output_keypoints and label is not None:
+      unique_values[_LABEL_KEYPOINTS_NAME] = _unique_dataset_values(
+          label,
+          clip_min=model_config.output_min,
+          clip_max=model_config.output_max)
+    return unique_values
+
+  sketches = {}
+  string_label_values = set()
+  for batch_values in dataset.map(
+      unique_values_fn, num_parallel_calls=num_parallel_calls).prefetch(1):
+    for name, values in six.iteritems(batch_values):
+      values = values.numpy()
+      if name == _LABEL_KEYPOINTS_NAME and values.dtype == np.object_:
+        string_label_values.update(values)
+        continue
+      if name == _LABEL_KEYPOINTS_NAME:
+        clip_min, clip_max = model_config.output_min, model_config.output_max
+      else:
+        feature_config = model_config.feature_configs[feature_indices[name]]
+        clip_min = feature_config.pwl_calibration_clip_min
+        clip_max = feature_config.pwl_calibration_clip_max
+      batch_sketch = compute_keypoints_sketch(
+          values,
+          clip_min=clip_min,
+          clip_max=clip_max,
+          max_sketch_size=max_sketch_size,
+          feature_name=name)
+      if name in sketches:
+        batch_sketch = merge_keypoints_sketches([sketches[name], batch_sketch],
+                                                max_sketch_size)
+      sketches[name] = batch_sketch
+
+  for feature_name, index in six.iteritems(feature_indices):
+    feature_config = model_config.feature_configs[index]
+    feature_config.pwl_calibration_input_keypoints = compute_keypoints(
+        sketches.get(feature_name, ([], [])),
+        num_keypoints=feature_config.pwl_calibration_num_keypoints,
+        keypoints=feature_config.pwl_calibration_input_keypoints,
+        feature_name=feature_name)
+
+  if string_label_values:
+    # Default label values to [0, ... n_class-1] if string label.
+    sketches[_LABEL_KEYPOINTS_NAME] = compute_keypoints_sketch(
+        np.arange(len(string_label_values)),
+        clip_min=model_config.output_min,
+        clip_max=model_config.output_max)
+  if _LABEL_KEYPOINTS_NAME in sketches:
+    model_config.output_initialization = compute_keypoints(
+        sketches[_LABEL_KEYPOINTS_NAME],
+        num_keypoints=model_config.output_calibration_num_keypoints,
+        keypoints=model_config.output_initialization,
+        feature_name=_LABEL_KEYPOINTS_NAME,
+        reduce_num_keypoints=False)
+
+
 def set_categorical_monotonicities(feature_configs):
   """Maps categorical monotonicities to indices based on specified vocab list.
 
@@ -781,19 +1418,22 @@ def _verify_prefitting_model(prefitting_model, feature_names):
                 type(prefitting_model)))
 
 
-def _get_lattice_weights(prefitting_model, lattice_index):
+def _get_lattice_weights(prefitting_model_config, prefitting_model,
+                         lattice_index):
   """Gets the weights of the lattice at the specfied index."""
+  layer_name, unit_index = submodel_lattice_units(prefitting_model_config)[
+      lattice_index]
   if isinstance(prefitting_model, tf.keras.Model):
-    lattice_layer_name = '{}_{}'.format(LATTICE_LAYER_NAME, lattice_index)
     weights = tf.keras.backend.get_value(
-        prefitting_model.get_layer(lattice_layer_name).weights[0])
+        prefitting_model.get_layer(layer_name).weights[0])
   else:
     # We have already checked the types by this point, so if prefitting_model
     # is not a keras Model it must be an Estimator.
-    lattice_kernel_variable_name = '{}_{}/{}'.format(
-        LATTICE_LAYER_NAME, lattice_index, lattice_layer.LATTICE_KERNEL_NAME)
+    lattice_kernel_variable_name = '{}/{}'.format(
+        layer_name, lattice_layer.LATTICE_KERNEL_NAME)
     weights = prefitting_model.get_variable_value(lattice_kernel_variable_name)
-  return weights
+  # Packed lattices hold the weights of each lattice in a separate unit.
+  return weights[:, unit_index:unit_index + 1]
 
 
 def _get_torsions_and_laplacians(prefitting_model_config, prefitting_model,
@@ -804,7 +1444,8 @@ def _get_torsions_and_laplacians(prefitting_model_config, prefitting_model,
   torsions = [[[] for _ in range(num_fatures)] for _ in range(num_fatures)]
   for (lattice_index, lattice) in enumerate(prefitting_model_config.lattices):
     # Get lattice weights and normalize them.
-    weights = _get_lattice_weights(prefitting_model, lattice_index)
+    weights = _get_lattice_weights(prefitting_model_config, prefitting_model,
+                                   lattice_index)
     weights -= np.min(weights)
     weights /= np.max(weights)
     weights = tf.constant(weights)
@@ -1033,6 +1674,281 @@ def set_crystals_lattice_ensemble(model_config,
   ] for lattice in lattices]
 
 
+def _submodels_feature_names(model_config):
+  """Returns the list of feature names used by each submodel."""
+  if isinstance(model_config, configs.CalibratedLatticeEnsembleConfig):
+    if (not isinstance(model_config.lattices, list) or
+        any(isinstance(lattice, str) for lattice in model_config.lattices)):
+      raise ValueError(
+          'Lattices are not fully specified for ensemble config: {}'.format(
+              model_config.lattices))
+    return [list(lattice) for lattice in model_config.lattices]
+  return [[
+      feature_config.name for feature_config in model_config.feature_configs
+  ]]
+
+
+def _calibration_units_submodels(model_config):
+  """Returns a mapping from (feature name, calibrator unit) to submodels.
+
+  Follows the assignment of calibration units to submodels used in
+  `build_calibration_layers`. Each submodel is represented by the sorted tuple
+  of its feature names.
+
+  Args:
+    model_config: Model configuration object describing model architecture.
+  """
+  separate_calibrators = getattr(model_config, 'separate_calibrators', False)
+  units_submodels = {}
+  calibration_last_index = collections.defaultdict(int)
+  for submodel in _submodels_feature_names(model_config):
+    for feature_name in submodel:
+      unit = calibration_last_index[feature_name]
+      units_submodels.setdefault((feature_name, unit), tuple(sorted(submodel)))
+      if separate_calibrators:
+        calibration_last_index[feature_name] += 1
+  return units_submodels
+
+
+def _assign_projected(variable, value):
+  """Assigns value to variable after projecting it with variable constraints."""
+  value = np.asarray(value, dtype=variable.dtype.as_numpy_dtype)
+  constraint = getattr(variable, 'constraint', None)
+  if constraint is not None:
+    value = tf.keras.backend.get_value(
+        constraint(tf.constant(value, dtype=variable.dtype)))
+  tf.keras.backend.set_value(variable, value)
+
+
+def _map_units(values, source_units):
+  """Selects (or averages if None) columns of values for each target unit."""
+  return np.stack([
+      values[:, unit] if unit is not None else np.mean(values, axis=1)
+      for unit in source_units
+  ],
+                  axis=1)
+
+
+def _warm_start_pwl_calibration(layer, source_layer, source_units):
+  """Resamples source calibration functions onto the layer's keypoints."""
+  source_kernel = tf.keras.backend.get_value(source_layer.kernel)
+  source_outputs = np.cumsum(source_kernel, axis=0)
+  source_input_keypoints = np.array(source_layer.input_keypoints, dtype=float)
+  input_keypoints = np.array(layer.input_keypoints, dtype=float)
+  # Resampling a piecewise linear function keeps its monotonicity, and its
+  # convexity within the source keypoints range. Remaining violations (e.g. due
+  # to constant extrapolation) are fixed by the projection of the new layer.
+  outputs = np.stack([
+      np.interp(input_keypoints, source_input_keypoints, source_outputs[:, i])
+      for i in range(source_outputs.shape[1])
+  ],
+                     axis=1)
+  outputs = _map_units(outputs, source_units)
+  _assign_projected(layer.kernel,
+                    np.concatenate([outputs[:1], np.diff(outputs, axis=0)]))
+  if (isinstance(getattr(layer, 'missing_output', None), tf.Variable) and
+      isinstance(getattr(source_layer, 'missing_output', None), tf.Variable)):
+    _assign_projected(
+        layer.missing_output,
+        _map_units(
+            tf.keras.backend.get_value(source_layer.missing_output),
+            source_units))
+
+
+def _lattice_units(model_config):
+  """Returns the lattice layer name and unit used for each submodel."""
+  if isinstance(model_config, configs.CalibratedLatticeEnsembleConfig):
+    return submodel_lattice_units(model_config)
+  return [('{}_{}'.format(LATTICE_LAYER_NAME, 0), 0)]
+
+
+def _warm_start_lattice(layer, lattice_units, submodels, source_layers,
+                        source_lattice_units, source_submodels):
+  """Copies lattice weights of matching submodels into the layer.
+
+  Each unit of the layer is initialized from a source lattice unit with the same
+  set of features and lattice sizes, permuting the source lattice dimensions.
+
+  Args:
+    layer: A `tfl.layers.Lattice` layer to be initialized.
+    lattice_units: List of `(layer_name, unit_index)` for each submodel.
+    submodels: List of feature names used by each submodel.
+    source_layers: Dict from layer name to layer in the source model.
+    source_lattice_units: List of `(layer_name, unit_index)` for each submodel
+      of the source model.
+    source_submodels: List of feature names used by each source submodel.
+
+  Returns:
+    True if any of the layer units was initialized.
+  """
+  kernel = None
+  for submodel_index, (layer_name, unit_index) in enumerate(lattice_units):
+    if layer_name != layer.name:
+      continue
+    feature_names = submodels[submodel_index]
+    lattice_sizes = dict(zip(feature_names, layer.lattice_sizes))
+    for source_index, (source_layer_name, source_unit_index) in enumerate(
+        source_lattice_units):
+      source_feature_names = source_submodels[source_index]
+      source_layer = source_layers.get(source_layer_name)
+      if (sorted(source_feature_names) == sorted(feature_names) and
+          isinstance(source_layer, lattice_layer.Lattice) and
+          dict(zip(source_feature_names,
+                   source_layer.lattice_sizes)) == lattice_sizes):
+        if kernel is None:
+          kernel = tf.keras.backend.get_value(layer.kernel)
+        source_kernel = tf.keras.backend.get_value(
+            source_layer.kernel)[:, source_unit_index]
+        source_kernel = np.reshape(source_kernel,
+                                   list(source_layer.lattice_sizes))
+        permutation = [
+            source_feature_names.index(name) for name in feature_names
+        ]
+        kernel[:, unit_index] = np.reshape(
+            np.transpose(source_kernel, permutation), [-1])
+        break
+  if kernel is None:
+    return False
+  _assign_projected(layer.kernel, kernel)
+  return True
+
+
+def warm_start_from_model(model, source_model):
+  """Initializes a premade model using the weights of a trained premade model.
+
+  This can be used to warm start a model after recomputing calibration
+  keypoints (e.g. when retraining on new data), or after changing the model
+  structure. Weights are carried over as follows:
+
+  - PWL calibrators are resampled onto the keypoints of the new model by
+    evaluating the calibrated functions of the source model at the new
+    keypoints. The result is projected to satisfy the constraints of the new
+    layer, so monotonicity, convexity and bounds are preserved. When using
+    separate calibrators, each calibrator unit is initialized from the source
+    unit used by a submodel with the same features, or from the average of all
+    source units if no such submodel exists.
+  - Categorical calibrators with the same number of buckets are copied.
+  - Lattices are copied from source lattices with the same set of features and
+    lattice sizes, permuting lattice dimensions if needed. Packed lattices
+    are matched per submodel.
+  - Linear layers and output calibration are copied or resampled if their
+    features match.
+  - The models of matching aggregation layers are warm started recursively.
+
+  Layers that don't have a matching layer in the source model keep their
+  initial weights. Both models must be built.
+
+  ```python
+  model_config = copy.deepcopy(previous_model.model_config)
+  tfl.premade_lib.set_keypoints_from_dataset(model_config, new_dataset)
+  model = tfl.premade.CalibratedLatticeEnsemble(model_config)
+  tfl.premade_lib.warm_start_from_model(model, previous_model)
+  ```
+
+  Args:
+    model: A premade model to be initialized.
+    source_model: A trained premade model used for initialization.
+
+  Returns:
+    A list of names of layers that were warm started.
+  """
+  model_config = model.model_config
+  source_model_config = source_model.model_config
+  is_aggregate = isinstance(model_config, configs.AggregateFunctionConfig)
+  units_submodels = _calibration_units_submodels(model_config)
+  source_units_submodels = _calibration_units_submodels(source_model_config)
+  submodels = _submodels_feature_names(model_config)
+  source_submodels = _submodels_feature_names(source_model_config)
+  lattice_units = _lattice_units(model_config)
+  source_lattice_units = _lattice_units(source_model_config)
+  source_layers = {layer.name: layer for layer in source_model.layers}
+  calib_layer_prefix = '{}_'.format(CALIB_LAYER_NAME)
+  linear_layer_prefix = '{}_'.format(LINEAR_LAYER_NAME)
+
+  warm_started_layers = []
+  for layer in model.layers:
+    # Lattices of submodels are matched by their features since lattices might
+    # be packed differently in the two models.
+    if isinstance(layer, lattice_layer.Lattice) and not is_aggregate:
+      if _warm_start_lattice(
+          layer,
+          lattice_units=lattice_units,
+          submodels=submodels,
+          source_layers=source_layers,
+          source_lattice_units=source_lattice_units,
+          source_submodels=source_submodels):
+        warm_started_layers.append(layer.name)
+      continue
+
+    source_layer = source_layers.get(layer.name)
+    if source_layer is None or type(source_layer) is not type(layer):
+      continue
+
+    if isinstance(layer, aggregation_layer.Aggregation):
+      if (hasattr(layer.model, 'model_config') and
+          hasattr(source_layer.model, 'model_config')):
+        warm_started_layers.extend(
+            '{}/{}'.format(layer.name, name)
+            for name in warm_start_from_model(layer.model, source_layer.model))
+      continue
+
+    if layer.name == OUTPUT_CALIB_LAYER_NAME:
+      if layer.units == source_layer.units:
+        _warm_start_pwl_calibration(layer, source_layer,
+                                    list(range(layer.units)))
+        warm_started_layers.append(layer.name)
+
+    elif layer.name.startswith(calib_layer_prefix):
+      feature_name = layer.name[len(calib_layer_prefix):]
+      source_units = []
+      for unit in range(layer.units):
+        submodel = units_submodels.get((feature_name, unit))
+        matching_units = [
+            source_unit for source_unit in range(source_layer.units)
+            if source_units_submodels.get((feature_name,
+                                           source_unit)) == submodel
+        ]
+        if source_layer.units == 1:
+          source_units.append(0)
+        elif matching_units:
+          source_units.append(matching_units[0])
+        else:
+          source_units.append(None)
+
+      if isinstance(layer, pwl_calibration_layer.PWLCalibration):
+        if layer.is_cyclic or source_layer.is_cyclic:
+          logging.info('Cyclic calibrator %s is not warm started.', layer.name)
+          continue
+        _warm_start_pwl_calibration(layer, source_layer, source_units)
+        warm_started_layers.append(layer.name)
+      elif isinstance(layer,
+                      categorical_calibration_layer.CategoricalCalibration):
+        if layer.num_buckets != source_layer.num_buckets:
+          continue
+        _assign_projected(
+            layer.kernel,
+            _map_units(
+                tf.keras.backend.get_value(source_layer.kernel), source_units))
+        warm_started_layers.append(layer.name)
+
+    elif isinstance(layer, lattice_layer.Lattice):
+      # Middle lattices of aggregate function models are matched by name.
+      if (list(layer.lattice_sizes) == list(source_layer.lattice_sizes) and
+          layer.units == source_layer.units):
+        _assign_projected(layer.kernel,
+                          tf.keras.backend.get_value(source_layer.kernel))
+        warm_started_layers.append(layer.name)
+
+    elif isinstance(layer, linear_layer.Linear):
+      if (layer.name.startswith(linear_layer_prefix) and
+          submodels == source_submodels and
+          layer.use_bias == source_layer.use_bias):
+        layer.set_weights(source_layer.get_weights())
+        warm_started_layers.append(layer.name)
+
+  return warm_started_layers
+
+
 def verify_config(model_config):
   """Verifies that the model_config and feature_configs are fully specified.
 
@@ -1048,6 +1964,10 @@ def verify_config(model_config):
           any(not isinstance(x, str) for x in lattice)):
         raise ValueError(
             'Lattices are not fully specified for ensemble config.')
+    lattice_dropout_rate = getattr(model_config, 'lattice_dropout_rate', 0.0)
+    if lattice_dropout_rate and not getattr(model_config, 'pack_lattices',
+                                            False):
+      raise ValueError('lattice_dropout_rate requires pack_lattices.')
   if isinstance(model_config, configs.AggregateFunctionConfig):
     if model_config.middle_dimension < 1:
       raise ValueError('Middle dimension must be at least 1: {}'.format(
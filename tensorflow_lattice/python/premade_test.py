@@ -24,7 +24,9 @@ from absl import logging
 import numpy as np
 import pandas as pd
 import tensorflow as tf
+from tensorflow_lattice.python import aggregation_layer
 from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import lattice_layer
 from tensorflow_lattice.python import premade
 from tensorflow_lattice.python import premade_lib
 
@@ -350,6 +352,340 @@ class PremadeTest(tf.test.TestCase):
     expectation = [(0, 1)]
     self.assertListEqual(expectation, set_feature_configs[2].monotonicity)
 
+  def testSetKeypointsFromDataset(self):
+    rng = np.random.RandomState(0)
+    num_examples = 1000
+    numerical_1 = rng.normal(size=num_examples)
+    numerical_2 = np.where(
+        rng.uniform(size=num_examples) < 0.3, -1.0,
+        rng.uniform(size=num_examples))
+    categorical = rng.randint(0, 2, size=num_examples)
+    label = rng.randint(0, 5, size=num_examples).astype(np.float32)
+
+    model_config = configs.CalibratedLatticeConfig(
+        feature_configs=[
+            configs.FeatureConfig(
+                name='numerical_1',
+                pwl_calibration_num_keypoints=7,
+                pwl_calibration_clip_max=1.0),
+            configs.FeatureConfig(
+                name='numerical_2',
+                pwl_calibration_num_keypoints=5,
+                pwl_calibration_input_keypoints='uniform',
+                default_value=-1.0),
+            configs.FeatureConfig(name='categorical', num_buckets=2),
+        ],
+        output_calibration=True,
+        output_calibration_num_keypoints=3,
+        output_initialization='quantiles')
+    dataset = tf.data.Dataset.from_tensor_slices(({
+        'numerical_1': numerical_1,
+        'numerical_2': numerical_2,
+        'categorical': categorical,
+    }, label)).batch(64)
+    premade_lib.set_keypoints_from_dataset(
+        model_config, dataset, max_sketch_size=None)
+
+    expected_numerical_1 = np.quantile(
+        np.unique(np.minimum(numerical_1, 1.0)),
+        np.linspace(0.0, 1.0, 7),
+        interpolation='nearest')
+    self.assertAllClose(
+        expected_numerical_1,
+        model_config.feature_config_by_name(
+            'numerical_1').pwl_calibration_input_keypoints)
+    valid_numerical_2 = numerical_2[numerical_2 != -1.0]
+    self.assertAllClose(
+        np.linspace(np.min(valid_numerical_2), np.max(valid_numerical_2), 5),
+        model_config.feature_config_by_name(
+            'numerical_2').pwl_calibration_input_keypoints)
+    self.assertAllClose([0.0, 2.0, 4.0], model_config.output_initialization)
+
+    # Bounded sketches give approximately the same keypoints.
+    sketched_model_config = copy.deepcopy(model_config)
+    for feature_config in sketched_model_config.feature_configs:
+      if not feature_config.num_buckets:
+        feature_config.pwl_calibration_input_keypoints = 'quantiles'
+    sketched_model_config.output_initialization = 'quantiles'
+    premade_lib.set_keypoints_from_dataset(
+        sketched_model_config,
+        dataset.map(lambda x, y: ((x['numerical_1'], x['numerical_2']), y)),
+        logits_output=True,
+        max_sketch_size=50)
+    self.assertAllClose(
+        expected_numerical_1,
+        sketched_model_config.feature_configs[0].pwl_calibration_input_keypoints,
+        atol=0.1)
+    self.assertAllClose(
+        np.quantile(
+            np.unique(valid_numerical_2), np.linspace(0.0, 1.0, 5)),
+        sketched_model_config.feature_configs[1].pwl_calibration_input_keypoints,
+        atol=0.05)
+    self.assertAllClose([-2.0, 0.0, 2.0],
+                        sketched_model_config.output_initialization)
+
+  def testMergeKeypointsSketches(self):
+    rng = np.random.RandomState(0)
+    # Rounding makes some values appear in both parts of the data.
+    values = np.round(rng.uniform(size=2000), 3)
+    first_values, second_values = values[:1200], values[1200:]
+    expected_keypoints = premade_lib.compute_keypoints(
+        premade_lib.compute_keypoints_sketch(values), num_keypoints=9)
+
+    # Merging uncompressed sketches is exact.
+    sketch = premade_lib.merge_keypoints_sketches([
+        premade_lib.compute_keypoints_sketch(first_values),
+        premade_lib.compute_keypoints_sketch(second_values)
+    ])
+    self.assertAllEqual(np.unique(values), sketch[0])
+    self.assertAllEqual(np.ones(sketch[0].size), sketch[1])
+
+    # Merging compressed sketches keeps the weights of the dropped values.
+    sketch = premade_lib.merge_keypoints_sketches([
+        ([0.0, 1.0, 2.0], [1.0, 5.0, 5.0]),
+        ([0.0, 1.0, 2.0], [1.0, 3.0, 3.0]),
+    ])
+    self.assertAllEqual([0.0, 1.0, 2.0], sketch[0])
+    self.assertAllEqual([1.0, 7.0, 7.0], sketch[1])
+    sketch = premade_lib.merge_keypoints_sketches([
+        premade_lib.compute_keypoints_sketch(
+            first_values, max_sketch_size=50),
+        premade_lib.compute_keypoints_sketch(
+            second_values, max_sketch_size=50)
+    ], max_sketch_size=50)
+    self.assertLessEqual(sketch[0].size, 50)
+    self.assertAllClose(
+        expected_keypoints,
+        premade_lib.compute_keypoints(sketch, num_keypoints=9),
+        atol=0.05)
+
+  def testWarmStartFromModel(self):
+    source_model_config = configs.CalibratedLatticeEnsembleConfig(
+        feature_configs=copy.deepcopy(feature_configs),
+        lattices=[['numerical_1', 'categorical'],
+                  ['numerical_2', 'categorical']],
+        num_lattices=2,
+        lattice_rank=2,
+        separate_calibrators=True,
+        output_calibration=True,
+        output_initialization=[-1.0, 1.0])
+    source_model = premade.CalibratedLatticeEnsemble(source_model_config)
+    rng = np.random.RandomState(0)
+    for weight in source_model.trainable_weights:
+      tf.keras.backend.set_value(
+          weight,
+          tf.keras.backend.get_value(
+              weight.constraint(
+                  tf.constant(
+                      rng.uniform(size=weight.shape), dtype=weight.dtype))))
+
+    # Refined keypoints and reordered lattices with permuted features.
+    model_config = copy.deepcopy(source_model_config)
+    for feature_config in model_config.feature_configs[:2]:
+      feature_config.pwl_calibration_input_keypoints = np.linspace(
+          0.0, 1.0, num=19)
+    model_config.lattices = [['categorical', 'numerical_2'],
+                             ['numerical_1', 'categorical']]
+    model = premade.CalibratedLatticeEnsemble(model_config)
+    warm_started_layers = premade_lib.warm_start_from_model(
+        model, source_model)
+    self.assertCountEqual([
+        'tfl_calib_numerical_1', 'tfl_calib_numerical_2',
+        'tfl_calib_categorical', 'tfl_lattice_0', 'tfl_lattice_1',
+        'tfl_output_calib'
+    ], warm_started_layers)
+
+    inputs = [
+        rng.uniform(size=(100, 1)),
+        rng.uniform(size=(100, 1)),
+        rng.randint(0, 2, size=(100, 1)),
+    ]
+    self.assertAllClose(
+        source_model.predict(inputs), model.predict(inputs), atol=1e-5)
+
+    # Lattices of both models must be fully specified.
+    source_model.model_config.lattices = 'random'
+    with self.assertRaises(ValueError):
+      premade_lib.warm_start_from_model(model, source_model)
+
+  def testPackedLatticeEnsemble(self):
+    model_config = configs.CalibratedLatticeEnsembleConfig(
+        feature_configs=copy.deepcopy(feature_configs),
+        lattices=[['numerical_1', 'categorical'],
+                  ['numerical_2', 'categorical'],
+                  ['numerical_1', 'numerical_2'],
+                  ['numerical_1'],
+                  ['numerical_2'],
+                  ['categorical']],
+        num_lattices=6,
+        lattice_rank=2,
+        separate_calibrators=True,
+        output_calibration=True,
+        output_initialization=[-1.0, 1.0])
+    model = premade.CalibratedLatticeEnsemble(model_config)
+    rng = np.random.RandomState(0)
+    for weight in model.trainable_weights:
+      tf.keras.backend.set_value(
+          weight,
+          tf.keras.backend.get_value(
+              weight.constraint(
+                  tf.constant(
+                      rng.uniform(size=weight.shape), dtype=weight.dtype))))
+
+    packed_model_config = copy.deepcopy(model_config)
+    packed_model_config.pack_lattices = True
+    self.assertEqual([[0, 1], [3, 4]],
+                     premade_lib.packed_lattice_groups(packed_model_config))
+    self.assertEqual([('tfl_packed_lattice_0', 0), ('tfl_packed_lattice_0', 1),
+                      ('tfl_lattice_2', 0), ('tfl_packed_lattice_1', 0),
+                      ('tfl_packed_lattice_1', 1), ('tfl_lattice_5', 0)],
+                     premade_lib.submodel_lattice_units(packed_model_config))
+    packed_model = premade.CalibratedLatticeEnsemble(packed_model_config)
+    lattice_layer_names = [
+        layer.name
+        for layer in packed_model.layers
+        if isinstance(layer, lattice_layer.Lattice)
+    ]
+    self.assertCountEqual([
+        'tfl_packed_lattice_0', 'tfl_packed_lattice_1', 'tfl_lattice_2',
+        'tfl_lattice_5'
+    ], lattice_layer_names)
+    warm_started_layers = premade_lib.warm_start_from_model(
+        packed_model, model)
+    self.assertContainsSubset(lattice_layer_names, warm_started_layers)
+
+    inputs = [
+        rng.uniform(size=(100, 1)),
+        rng.uniform(size=(100, 1)),
+        rng.randint(0, 2, size=(100, 1)),
+    ]
+    self.assertAllClose(
+        model.predict(inputs), packed_model.predict(inputs), atol=1e-5)
+
+    # Weights of packed lattices can be extracted per submodel.
+    unpacked_model = premade.CalibratedLatticeEnsemble(model_config)
+    premade_lib.warm_start_from_model(unpacked_model, packed_model)
+    for submodel_index in range(6):
+      lattice_name = 'tfl_lattice_{}'.format(submodel_index)
+      self.assertAllClose(
+          model.get_layer(lattice_name).get_weights(),
+          unpacked_model.get_layer(lattice_name).get_weights())
+
+  def testPackedLatticeEnsembleDropout(self):
+    model_config = configs.CalibratedLatticeEnsembleConfig(
+        feature_configs=copy.deepcopy(feature_configs),
+        lattices=[['numerical_1', 'categorical'],
+                  ['numerical_2', 'categorical'],
+                  ['numerical_1', 'numerical_2'],
+                  ['numerical_2', 'numerical_1']],
+        separate_calibrators=True,
+        output_initialization=[-1.0, 1.0],
+        lattice_dropout_rate=0.5)
+    with self.assertRaisesRegex(ValueError, 'requires pack_lattices'):
+      premade.CalibratedLatticeEnsemble(model_config)
+    model_config.pack_lattices = True
+    model = premade.CalibratedLatticeEnsemble(model_config)
+    packed_layer = model.get_layer('tfl_packed_lattice_0')
+    self.assertEqual(packed_layer.dropout_rate, 0.5)
+
+    rng = np.random.RandomState(0)
+    inputs = [
+        rng.uniform(size=(100, 1)),
+        rng.uniform(size=(100, 1)),
+        rng.randint(0, 2, size=(100, 1)),
+    ]
+    labels = inputs[0][:, 0] - inputs[1][:, 0]
+    model.compile(loss='mse', optimizer=tf.keras.optimizers.Adam(0.1))
+    model.fit(inputs, labels, epochs=20, batch_size=10, verbose=0)
+    self.assertLess(model.evaluate(inputs, labels, verbose=0), 0.1)
+    # The full ensemble is used at inference.
+    self.assertAllClose(
+        model.predict(inputs, verbose=0), model(inputs, training=False))
+
+  def testAggregateFunctionSharedCalibrators(self):
+    model_config = configs.AggregateFunctionConfig(
+        feature_configs=copy.deepcopy(feature_configs),
+        middle_dimension=3,
+        middle_calibration=True,
+        middle_monotonicity='increasing',
+        output_initialization=[0.0, 1.0])
+    model = premade.AggregateFunction(model_config)
+    shared_model_config = copy.deepcopy(model_config)
+    shared_model_config.separate_calibrators = False
+    shared_model = premade.AggregateFunction(shared_model_config)
+
+    def aggregation_layers(model):
+      return [
+          layer for layer in model.layers
+          if isinstance(layer, aggregation_layer.Aggregation)
+      ]
+
+    def other_layers(model):
+      return [
+          layer for layer in model.layers
+          if layer.weights and
+          not isinstance(layer, aggregation_layer.Aggregation)
+      ]
+
+    self.assertLen(aggregation_layers(model), 3)
+    self.assertLen(aggregation_layers(shared_model), 1)
+    self.assertLess(shared_model.count_params(), model.count_params())
+
+    rng = np.random.RandomState(0)
+    for weight in shared_model.trainable_weights:
+      tf.keras.backend.set_value(
+          weight,
+          tf.keras.backend.get_value(
+              weight.constraint(
+                  tf.constant(
+                      rng.uniform(size=weight.shape), dtype=weight.dtype))))
+
+    # Separate calibrated lattices with copies of the shared calibrators and
+    # a single unit of the shared lattice are equivalent to the shared model.
+    shared_submodel = aggregation_layers(shared_model)[0].model
+    for unit, layer in enumerate(aggregation_layers(model)):
+      for submodel_layer in layer.model.layers:
+        if not submodel_layer.weights:
+          continue
+        weights = shared_submodel.get_layer(submodel_layer.name).get_weights()
+        if isinstance(submodel_layer, lattice_layer.Lattice):
+          weights = [weights[0][:, unit:unit + 1]]
+        submodel_layer.set_weights(weights)
+    for layer, shared_layer in zip(
+        other_layers(model), other_layers(shared_model)):
+      layer.set_weights(shared_layer.get_weights())
+
+    inputs = [
+        tf.ragged.constant([[0.1, 0.5], [0.3], [0.9, 0.2, 0.7]]),
+        tf.ragged.constant([[0.4, 0.2], [0.8], [0.1, 0.6, 0.3]]),
+        tf.ragged.constant([[0, 1], [1], [1, 0, 0]]),
+    ]
+    self.assertAllClose(model(inputs), shared_model(inputs), atol=1e-5)
+
+  def testAggregateFunctionChunked(self):
+    model_config = configs.AggregateFunctionConfig(
+        feature_configs=copy.deepcopy(feature_configs),
+        middle_dimension=2,
+        output_initialization=[0.0, 1.0])
+    model = premade.AggregateFunction(model_config)
+    chunked_model_config = copy.deepcopy(model_config)
+    chunked_model_config.aggregation_chunk_size = 2
+    chunked_model = premade.AggregateFunction(chunked_model_config)
+    chunked_model.set_weights(model.get_weights())
+
+    inputs = [
+        tf.ragged.constant([[0.1, 0.5], [0.3], [0.9, 0.2, 0.7]]),
+        tf.ragged.constant([[0.4, 0.2], [0.8], [0.1, 0.6, 0.3]]),
+        tf.ragged.constant([[0, 1], [1], [1, 0, 0]]),
+    ]
+    self.assertAllClose(model(inputs), chunked_model(inputs), atol=1e-5)
+
+    labels = np.array([[0.2], [0.5], [0.8]])
+    for m in [model, chunked_model]:
+      m.compile(loss='mse', optimizer=tf.keras.optimizers.SGD(0.1))
+      m.fit(inputs, labels, batch_size=3, epochs=2, shuffle=False, verbose=0)
+    self.assertAllClose(model(inputs), chunked_model(inputs), atol=1e-5)
+
   def testVerifyConfig(self):
     unspecified_model_config = configs.CalibratedLatticeEnsembleConfig(
         feature_configs=copy.deepcopy(unspecified_feature_configs),
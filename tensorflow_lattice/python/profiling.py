@@ -0,0 +1,420 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Profiling of TFL layers, constraints and regularizers during training.
+
+`ProfilingCallback` is a Keras callback that instruments the TFL layers of a
+model for the duration of `model.fit`. It records the wall time spent in the
+`call` of each TFL layer, in the regularizers of TFL layer weights and in the
+weight constraints applied by the optimizer after each gradient step (including
+all the Dykstra projection iterations). This shows how the step time of a TFL
+model splits between calibration, interpolation, regularization and constraint
+projection, e.g. to decide where to spend the `num_projection_iterations`
+budget.
+
+```python
+profiler = tfl.profiling.ProfilingCallback(log_dir='/tmp/tfl_profile')
+model.fit(x, y, callbacks=[profiler])
+profiler.summary()
+```
+
+Timings are measured within the training graph using `tf.timestamp`. Ops that
+run in parallel to a measured layer are included in its wall time, so timings
+of different layers may overlap. TFL layers nested in other TFL layers, such as
+the lattices of `tfl.layers.RTL`, are included in the time of the outermost
+TFL layer and are not timed separately.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from . import aggregation_layer
+from . import categorical_calibration_layer
+from . import lattice_layer
+from . import linear_layer
+from . import parallel_combination_layer
+from . import pwl_calibration_layer
+from . import rtl_layer
+import tensorflow as tf
+from tensorflow import keras
+
+# Categories of profiled operations as shown in the summary table and used as
+# the prefix of the TensorBoard scalars.
+CALIBRATION = "calibration"
+INTERPOLATION = "interpolation"
+LINEAR = "linear"
+COMBINATION = "combination"
+REGULARIZER = "regularizer"
+CONSTRAINT = "constraint"
+
+_LAYER_CATEGORIES = [
+    (pwl_calibration_layer.PWLCalibration, CALIBRATION),
+    (categorical_calibration_layer.CategoricalCalibration, CALIBRATION),
+    (lattice_layer.Lattice, INTERPOLATION),
+    (rtl_layer.RTL, INTERPOLATION),
+    (linear_layer.Linear, LINEAR),
+    (parallel_combination_layer.ParallelCombination, COMBINATION),
+    (aggregation_layer.Aggregation, COMBINATION),
+]
+
+
+def layer_category(layer):
+  """Returns the profiling category of a TFL layer or None for other layers."""
+  for layer_class, category in _LAYER_CATEGORIES:
+    if isinstance(layer, layer_class):
+      return category
+  return None
+
+
+class _TimingStats(object):
+  """Accumulates sampled wall times of a profiled operation."""
+
+  def __init__(self, name, category, num_projection_iterations=None):
+    self.name = name
+    self.category = category
+    self.num_projection_iterations = num_projection_iterations
+    self.total_time = tf.Variable(0.0, dtype=tf.float64, trainable=False)
+    self.count = tf.Variable(0, dtype=tf.int64, trainable=False)
+
+  def record(self, elapsed, sample):
+    """Returns an op adding elapsed time to the stats if sample is True."""
+    return tf.group(
+        self.total_time.assign_add(elapsed * tf.cast(sample, tf.float64)),
+        self.count.assign_add(tf.cast(sample, tf.int64)))
+
+
+def _timed(fn, stats, sample):
+  """Wraps fn so that its wall time is recorded in stats.
+
+  Ops created by fn have a control dependency on the start timestamp, and the
+  end timestamp depends on the outputs of fn, so the timestamps bracket the ops
+  created by fn even in graph mode.
+
+  Args:
+    fn: Callable to wrap.
+    stats: `_TimingStats` to record the wall time of fn into.
+    sample: Boolean variable indicating if the current step is sampled.
+
+  Returns:
+    Wrapped callable with the same signature and outputs as fn.
+  """
+
+  def _identity(x):
+    if tf.is_tensor(x) or isinstance(x, tf.Variable):
+      return tf.identity(x)
+    return x
+
+  def timed_fn(*args, **kwargs):
+    input_tensors = [
+        x for x in tf.nest.flatten((args, kwargs)) if tf.is_tensor(x)
+    ]
+    with tf.control_dependencies(input_tensors):
+      start = tf.timestamp()
+    with tf.control_dependencies([start]):
+      outputs = fn(*args, **kwargs)
+    output_tensors = [x for x in tf.nest.flatten(outputs) if tf.is_tensor(x)]
+    with tf.control_dependencies(output_tensors):
+      elapsed = tf.timestamp() - start
+    with tf.control_dependencies([stats.record(elapsed, sample)]):
+      return tf.nest.map_structure(_identity, outputs)
+
+  return timed_fn
+
+
+class _TimedConstraint(keras.constraints.Constraint):
+  """Constraint wrapper recording the wall time of the wrapped constraint."""
+
+  def __init__(self, constraint, stats, sample):
+    self.constraint = constraint
+    self._timed_call = _timed(constraint, stats, sample)
+
+  def __call__(self, w):
+    return self._timed_call(w)
+
+  def get_config(self):
+    return self.constraint.get_config()
+
+
+def _variable_name(variable):
+  return variable.name.split(":")[0]
+
+
+class ProfilingCallback(keras.callbacks.Callback):
+  # pyformat: disable
+  """Keras callback profiling TFL layers, regularizers and constraints.
+
+  At the beginning of training, the callback wraps the `call` of each outermost
+  TFL layer of the model, the regularization losses of TFL layer weights and
+  the constraints of their weights with timing ops, and it retraces the
+  training function. The hooks are removed at the end of training.
+
+  Timings are recorded every `layer_sampling_rate` training steps for layer
+  calls and regularizers, and every `constraint_sampling_rate` steps for
+  constraints. Mean sampled wall times (in milliseconds) are written as
+  TensorBoard scalars named `tfl_profiling/{category}/{name}` if `log_dir` is
+  set, and a summary table with the accumulated timings can be printed using
+  `summary`.
+
+  Attributes:
+    - All `__init__` arguments.
+
+  Example:
+
+  ```python
+  profiler = tfl.profiling.ProfilingCallback(
+      log_dir='/tmp/tfl_profile', constraint_sampling_rate=10)
+  model.fit(x, y, epochs=10, callbacks=[profiler])
+  profiler.summary()
+  ```
+  """
+  # pyformat: enable
+
+  def __init__(self,
+               log_dir=None,
+               layer_sampling_rate=1,
+               constraint_sampling_rate=1,
+               update_freq="epoch",
+               print_fn=None):
+    """Initializes an instance of `ProfilingCallback`.
+
+    Args:
+      log_dir: If set, directory to write TensorBoard scalars to.
+      layer_sampling_rate: Timings of layer calls and regularizers are recorded
+        every `layer_sampling_rate` training steps.
+      constraint_sampling_rate: Timings of constraints are recorded every
+        `constraint_sampling_rate` training steps.
+      update_freq: 'epoch' or an integer. If 'epoch', TensorBoard scalars are
+        written after each epoch. If an integer, scalars are written every
+        `update_freq` training steps.
+      print_fn: If set, the summary table is printed using this function at the
+        end of training.
+
+    Raises:
+      ValueError: If sampling rates or update_freq are invalid.
+    """
+    super(ProfilingCallback, self).__init__()
+    if layer_sampling_rate < 1 or constraint_sampling_rate < 1:
+      raise ValueError(
+          "Sampling rates must be positive. Given: {}, {}".format(
+              layer_sampling_rate, constraint_sampling_rate))
+    if update_freq != "epoch" and (not isinstance(update_freq, int) or
+                                   update_freq < 1):
+      raise ValueError(
+          "update_freq must be 'epoch' or a positive integer: {}".format(
+              update_freq))
+    self.log_dir = log_dir
+    self.layer_sampling_rate = layer_sampling_rate
+    self.constraint_sampling_rate = constraint_sampling_rate
+    self.update_freq = update_freq
+    self.print_fn = print_fn
+    self._stats = []
+    self._step = 0
+    self._writer = None
+    self._restore_fns = []
+    self._logged_values = {}
+    self._sample_layers = tf.Variable(False, trainable=False)
+    self._sample_constraints = tf.Variable(False, trainable=False)
+
+  def _new_stats(self, name, category, num_projection_iterations=None):
+    stats = _TimingStats(name, category, num_projection_iterations)
+    self._stats.append(stats)
+    return stats
+
+  def _instrument_call(self, layer, category):
+    """Wraps the call of the layer with timing ops."""
+    stats = self._new_stats(layer.name, category)
+    layer.call = _timed(layer.call, stats, self._sample_layers)
+    self._restore_fns.append(lambda: delattr(layer, "call"))
+
+  def _instrument_losses(self, layer):
+    """Wraps the callable losses of the layer with timing ops."""
+    # pylint: disable=protected-access
+    callable_losses = list(layer._callable_losses)
+    for i, loss_fn in enumerate(callable_losses):
+      name = "{}/regularizer".format(layer.name)
+      if len(callable_losses) > 1:
+        name += "_{}".format(i)
+      stats = self._new_stats(name, REGULARIZER)
+      layer._callable_losses[i] = _timed(loss_fn, stats, self._sample_layers)
+
+    def restore_losses():
+      layer._callable_losses[:] = callable_losses
+    # pylint: enable=protected-access
+
+    self._restore_fns.append(restore_losses)
+
+  def _instrument_constraint(self, variable):
+    """Wraps the constraint of the variable with timing ops."""
+    constraint = variable.constraint
+    stats = self._new_stats(
+        _variable_name(variable),
+        CONSTRAINT,
+        num_projection_iterations=getattr(constraint,
+                                          "num_projection_iterations", None))
+    # pylint: disable=protected-access
+    variable._constraint = _TimedConstraint(constraint, stats,
+                                            self._sample_constraints)
+
+    def restore_constraint():
+      variable._constraint = constraint
+    # pylint: enable=protected-access
+
+    self._restore_fns.append(restore_constraint)
+
+  def _reset_functions(self):
+    """Resets the cached Keras functions so that they get retraced."""
+    self.model.train_function = None
+    self.model.test_function = None
+    self.model.predict_function = None
+
+  def on_train_begin(self, logs=None):
+    self._stats = []
+    self._step = 0
+    self._logged_values = {}
+    if self.log_dir:
+      self._writer = tf.summary.create_file_writer(self.log_dir)
+
+    tfl_layers = [
+        layer for layer in [self.model] + list(self.model.submodules)
+        if layer_category(layer) is not None
+    ]
+    # Calls of nested TFL layers are timed as part of their outermost TFL
+    # layer, so that each category does not count them twice.
+    nested_layers = set()
+    for layer in tfl_layers:
+      nested_layers.update(id(sublayer) for sublayer in layer.submodules)
+
+    seen_variables = set()
+    for layer in tfl_layers:
+      if id(layer) not in nested_layers:
+        self._instrument_call(layer, layer_category(layer))
+      self._instrument_losses(layer)
+      for variable in layer.trainable_weights:
+        if (variable.ref() in seen_variables or
+            getattr(variable, "constraint", None) is None):
+          continue
+        seen_variables.add(variable.ref())
+        self._instrument_constraint(variable)
+
+    self._reset_functions()
+    self.model.train_function = self.model.make_train_function()
+
+  def on_train_batch_begin(self, batch, logs=None):
+    self._sample_layers.assign(self._step % self.layer_sampling_rate == 0)
+    self._sample_constraints.assign(
+        self._step % self.constraint_sampling_rate == 0)
+
+  def on_train_batch_end(self, batch, logs=None):
+    # Validation and prediction steps are not profiled.
+    self._sample_layers.assign(False)
+    self._sample_constraints.assign(False)
+    self._step += 1
+    if self.update_freq != "epoch" and self._step % self.update_freq == 0:
+      self._write_summaries(self._step)
+
+  def on_epoch_end(self, epoch, logs=None):
+    if self.update_freq == "epoch":
+      self._write_summaries(epoch)
+
+  def on_train_end(self, logs=None):
+    for restore_fn in reversed(self._restore_fns):
+      restore_fn()
+    self._restore_fns = []
+    self._reset_functions()
+    if self._writer is not None:
+      self._writer.flush()
+    if self.print_fn is not None:
+      self.summary(print_fn=self.print_fn)
+
+  def _write_summaries(self, step):
+    """Writes mean timings since the last write as TensorBoard scalars."""
+    if self._writer is None:
+      return
+    with self._writer.as_default():
+      for stats in self._stats:
+        total_time = float(stats.total_time.numpy())
+        count = int(stats.count.numpy())
+        last_total_time, last_count = self._logged_values.get(
+            id(stats), (0.0, 0))
+        self._logged_values[id(stats)] = (total_time, count)
+        if count > last_count:
+          tf.summary.scalar(
+              "tfl_profiling/{}/{}".format(stats.category, stats.name),
+              1000.0 * (total_time - last_total_time) / (count - last_count),
+              step=step)
+
+  def results(self):
+    """Returns accumulated timings of all profiled operations.
+
+    Returns:
+      A list of dicts with keys 'name', 'category', 'count' (number of sampled
+      calls), 'total_time' (in seconds), 'mean_time' (in seconds) and
+      'num_projection_iterations' (None for non-constraint operations).
+    """
+    results = []
+    for stats in self._stats:
+      total_time = float(stats.total_time.numpy())
+      count = int(stats.count.numpy())
+      results.append({
+          "name": stats.name,
+          "category": stats.category,
+          "count": count,
+          "total_time": total_time,
+          "mean_time": total_time / count if count else 0.0,
+          "num_projection_iterations": stats.num_projection_iterations,
+      })
+    return results
+
+  def summary(self, print_fn=None):
+    """Prints a summary table of accumulated timings.
+
+    Rows are sorted by mean time within each category. The share column is the
+    share of the mean time of each row among all rows of its category.
+
+    Args:
+      print_fn: Print function to use. Defaults to `print`.
+    """
+    if print_fn is None:
+      print_fn = print
+    results = self.results()
+    header = ("Name", "Category", "Calls", "Mean (ms)", "Total (ms)", "Share",
+              "Projection iterations")
+    rows = []
+    categories = sorted(set(result["category"] for result in results))
+    for category in categories:
+      category_results = sorted(
+          [result for result in results if result["category"] == category],
+          key=lambda result: -result["mean_time"])
+      category_time = sum(result["mean_time"] for result in category_results)
+      for result in category_results:
+        rows.append((
+            result["name"],
+            result["category"],
+            str(result["count"]),
+            "{:.3f}".format(1000.0 * result["mean_time"]),
+            "{:.3f}".format(1000.0 * result["total_time"]),
+            "{:.1%}".format(result["mean_time"] / category_time
+                            if category_time else 0.0),
+            ("" if result["num_projection_iterations"] is None else str(
+                result["num_projection_iterations"])),
+        ))
+    widths = [
+        max([len(header[i])] + [len(row[i]) for row in rows])
+        for i in range(len(header))
+    ]
+    line_format = "  ".join("{:<%d}" % width for width in widths)
+    print_fn(line_format.format(*header))
+    print_fn("  ".join("-" * width for width in widths))
+    for row in rows:
+      print_fn(line_format.format(*row))
@@ -0,0 +1,178 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL profiling callback."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tempfile
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow_lattice.python import lattice_layer as ll
+from tensorflow_lattice.python import profiling
+from tensorflow_lattice.python import pwl_calibration_layer as pwl
+from tensorflow_lattice.python import rtl_layer
+
+
+class ProfilingTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _BuildModel(self):
+    inputs = keras.Input(shape=(2,))
+    calibrated = [
+        pwl.PWLCalibration(
+            input_keypoints=np.linspace(0.0, 1.0, 5),
+            output_min=0.0,
+            output_max=1.0,
+            monotonicity="increasing",
+            kernel_regularizer=("hessian", 0.0, 1e-3),
+            name="calib_{}".format(i))(inputs[:, i:i + 1]) for i in range(2)
+    ]
+    outputs = ll.Lattice(
+        lattice_sizes=[2, 2],
+        monotonicities=["increasing", "increasing"],
+        kernel_regularizer=[("torsion", 0.0, 1e-3), ("laplacian", 0.0, 1e-3)],
+        name="lattice")(keras.layers.Concatenate()(calibrated))
+    model = keras.Model(inputs=inputs, outputs=outputs)
+    model.compile(loss="mse", optimizer=keras.optimizers.Adam(0.01))
+    return model
+
+  @parameterized.parameters(
+      (1, 1, 20, 20),
+      (2, 5, 10, 4),
+  )
+  def testProfilingCallback(self, layer_sampling_rate, constraint_sampling_rate,
+                            expected_layer_count, expected_constraint_count):
+    np.random.seed(42)
+    x = np.random.uniform(size=(80, 2)).astype(np.float32)
+    y = np.mean(x, axis=1, keepdims=True)
+    model = self._BuildModel()
+    log_dir = tempfile.mkdtemp()
+    summary_lines = []
+    profiler = profiling.ProfilingCallback(
+        log_dir=log_dir,
+        layer_sampling_rate=layer_sampling_rate,
+        constraint_sampling_rate=constraint_sampling_rate,
+        print_fn=summary_lines.append)
+    # 20 training steps in total. Validation steps are not profiled.
+    model.fit(
+        x,
+        y,
+        batch_size=16,
+        epochs=4,
+        verbose=0,
+        validation_data=(x, y),
+        callbacks=[profiler])
+
+    results = {result["name"]: result for result in profiler.results()}
+    expected_categories = {
+        "calib_0": profiling.CALIBRATION,
+        "calib_1": profiling.CALIBRATION,
+        "lattice": profiling.INTERPOLATION,
+        "calib_0/regularizer": profiling.REGULARIZER,
+        "calib_1/regularizer": profiling.REGULARIZER,
+        "lattice/regularizer": profiling.REGULARIZER,
+        "calib_0/pwl_calibration_kernel": profiling.CONSTRAINT,
+        "calib_1/pwl_calibration_kernel": profiling.CONSTRAINT,
+        "lattice/lattice_kernel": profiling.CONSTRAINT,
+    }
+    self.assertEqual(
+        {name: result["category"] for name, result in results.items()},
+        expected_categories)
+    for name, category in expected_categories.items():
+      expected_count = (
+          expected_constraint_count
+          if category == profiling.CONSTRAINT else expected_layer_count)
+      self.assertEqual(results[name]["count"], expected_count)
+      self.assertGreater(results[name]["total_time"], 0.0)
+    self.assertEqual(
+        results["lattice/lattice_kernel"]["num_projection_iterations"], 10)
+    self.assertIsNone(results["lattice"]["num_projection_iterations"])
+
+    # Header, separator and one row per profiled operation.
+    self.assertLen(summary_lines, len(expected_categories) + 2)
+    self.assertIn("lattice/lattice_kernel", "\n".join(summary_lines))
+    self.assertTrue(
+        any(f.startswith("events.out.tfevents") for f in os.listdir(log_dir)))
+
+    # Hooks are removed at the end of training.
+    for layer in model.layers:
+      if profiling.layer_category(layer) is not None:
+        self.assertNotIn("call", layer.__dict__)
+    model.fit(x, y, batch_size=16, epochs=1, verbose=0)
+    for result in profiler.results():
+      self.assertEqual(result["count"], results[result["name"]]["count"])
+
+  def testNestedLayers(self):
+    np.random.seed(42)
+    x = np.random.uniform(size=(32, 3)).astype(np.float32)
+    y = np.mean(x, axis=1, keepdims=True)
+    inputs = keras.Input(shape=(3,))
+    outputs = rtl_layer.RTL(
+        num_lattices=4,
+        lattice_rank=2,
+        output_min=0.0,
+        output_max=1.0,
+        name="rtl")({
+            "increasing": inputs
+        })
+    model = keras.Model(
+        inputs=inputs,
+        outputs=keras.layers.Lambda(
+            lambda x: tf.reduce_mean(x, axis=1, keepdims=True))(outputs))
+    model.compile(loss="mse", optimizer=keras.optimizers.Adam(0.01))
+    profiler = profiling.ProfilingCallback()
+    model.fit(x, y, batch_size=16, epochs=1, verbose=0, callbacks=[profiler])
+
+    # Lattices of the RTL layer are only timed as part of the RTL layer.
+    interpolation_results = [
+        result for result in profiler.results()
+        if result["category"] == profiling.INTERPOLATION
+    ]
+    self.assertLen(interpolation_results, 1)
+    self.assertEqual(interpolation_results[0]["name"], "rtl")
+    self.assertEqual(interpolation_results[0]["count"], 2)
+    # Constraints of the nested lattices are still profiled.
+    self.assertNotEmpty([
+        result for result in profiler.results()
+        if result["category"] == profiling.CONSTRAINT
+    ])
+
+  def testProfilingDoesNotChangeTraining(self):
+    np.random.seed(42)
+    x = np.random.uniform(size=(80, 2)).astype(np.float32)
+    y = np.mean(x, axis=1, keepdims=True)
+    predictions = []
+    for callbacks in [[], [profiling.ProfilingCallback()]]:
+      keras.utils.set_random_seed(42)
+      model = self._BuildModel()
+      model.fit(
+          x, y, batch_size=16, epochs=2, shuffle=False, verbose=0,
+          callbacks=callbacks)
+      predictions.append(model.predict(x, verbose=0))
+    self.assertAllClose(predictions[0], predictions[1])
+
+  def testInvalidArguments(self):
+    with self.assertRaises(ValueError):
+      profiling.ProfilingCallback(layer_sampling_rate=0)
+    with self.assertRaises(ValueError):
+      profiling.ProfilingCallback(update_freq="batch")
+
+
+if __name__ == "__main__":
+  tf.test.main()
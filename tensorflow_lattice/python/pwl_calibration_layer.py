@@ -515,6 +515,37 @@ class PWLCalibration(keras.layers.Layer):
               eps=eps))
     return asserts
 
+  def constraint_violations(self):
+    """Returns amounts by which layer weights violate constraints.
+
+    Cheap alternative to `assert_constraints` which can be used to monitor
+    constraints during training, e.g. using
+    `tfl.constraint_metrics.ConstraintViolation`. Outputs for keypoints are
+    computed directly from the kernel, hence clamping is not taken into
+    account.
+
+    Returns:
+      Dict from constraint type ('monotonicity' or 'bounds') to a 1-d tensor of
+      non-negative violation amounts.
+    """
+    violations = pwl_calibration_lib.constraint_violations(
+        outputs=self.keypoints_outputs(),
+        monotonicity=pwl_calibration_lib.canonicalize_monotonicity(
+            self.monotonicity),
+        output_min=self.output_min,
+        output_max=self.output_max)
+
+    if (self.impute_missing and self.missing_output_value is None and
+        "bounds" in violations):
+      missing_violations = pwl_calibration_lib.constraint_violations(
+          outputs=self.missing_output,
+          monotonicity=0,
+          output_min=self.output_min,
+          output_max=self.output_max)
+      violations["bounds"] = tf.concat(
+          [violations["bounds"], missing_violations["bounds"]], axis=0)
+    return violations
+
   def keypoints_outputs(self):
     """Returns tensor which corresponds to outputs of layer for keypoints."""
     kp_outputs = tf.cumsum(self.kernel)
@@ -872,6 +872,48 @@ def assert_constraints(outputs,
   return asserts
 
 
+def constraint_violations(outputs, monotonicity, output_min, output_max):
+  """Returns amounts by which 'outputs' violate constraints.
+
+  Unlike `assert_constraints`, this function does not build assertion ops and
+  is cheap enough to be evaluated periodically during training.
+
+  Args:
+    outputs: Tensor of shape `(num_output_values, units)` which represents
+      outputs of pwl calibration layer. If monotonicity is specified these
+      outputs must be for consequtive inputs.
+    monotonicity: One of {-1, 0, 1}. -1 for decreasing, 1 for increasing 0 means
+      no monotonicity.
+    output_min: Lower bound or None.
+    output_max: Upper bound or None.
+
+  Raises:
+    ValueError: If monotonicity is not one of {-1, 0, 1}
+
+  Returns:
+    Dict from constraint type ('monotonicity' or 'bounds') to a 1-d tensor of
+    non-negative violation amounts. Constraint types which are not specified are
+    omitted.
+  """
+  if monotonicity not in [-1, 0, 1]:
+    raise ValueError("'monotonicity' must be one of: [-1, 0, 1]. It is: %s" %
+                     monotonicity)
+  violations = {}
+  if monotonicity != 0:
+    diffs = outputs[1:] - outputs[0:-1]
+    violations["monotonicity"] = tf.nn.relu(
+        tf.reshape(-monotonicity * diffs, [-1]))
+
+  bounds_violations = []
+  if output_min is not None:
+    bounds_violations.append(tf.reshape(output_min - outputs, [-1]))
+  if output_max is not None:
+    bounds_violations.append(tf.reshape(outputs - output_max, [-1]))
+  if bounds_violations:
+    violations["bounds"] = tf.nn.relu(tf.concat(bounds_violations, axis=0))
+  return violations
+
+
 def verify_hyperparameters(input_keypoints=None,
                            output_min=None,
                            output_max=None,
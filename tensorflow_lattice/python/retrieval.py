@@ -0,0 +1,208 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Top-k retrieval from large candidate tables with TFL premade models.
+
+Instead of scoring every candidate, `top_k` partitions the candidates into
+boxes of feature space and bounds the model output within each box using
+`tfl.interval_evaluation.model_bounds`. Premade models are monotonic in
+monotonic features, so those features are set to the corner of the box that
+maximizes the output, and the other features are bounded by interval evaluation
+of the calibrators and lattices.
+
+Boxes are scored exactly in decreasing order of their bounds until no
+remaining box can enter the top k. The result is the same as ranking all
+candidates by their scores.
+
+```python
+result = tfl.retrieval.top_k(model, {'price': prices, 'rating': ratings}, k=10)
+best_candidates = result.indices
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+from . import interval_evaluation
+import numpy as np
+import tensorflow as tf
+
+
+class TopKResult(
+    collections.namedtuple('TopKResult', ['indices', 'scores', 'num_scored'])):
+  """Result of top-k retrieval.
+
+  Attributes:
+    indices: Indices of the top candidates in decreasing order of their scores.
+      Candidates with equal scores are ordered by their indices.
+    scores: Model outputs of the top candidates.
+    num_scored: Number of candidates that were scored exactly.
+  """
+
+
+def _feature_columns(model, candidates):
+  """Returns candidate features as a list of 1-d arrays in model input order."""
+  feature_configs = model.model_config.feature_configs
+  if isinstance(candidates, dict):
+    missing_features = [
+        feature_config.name
+        for feature_config in feature_configs
+        if feature_config.name not in candidates
+    ]
+    if missing_features:
+      raise ValueError('Missing candidate features: {}'.format(
+          missing_features))
+    candidates = [
+        candidates[feature_config.name] for feature_config in feature_configs
+    ]
+  if len(candidates) != len(feature_configs):
+    raise ValueError('Expected {} candidate features, got {}.'.format(
+        len(feature_configs), len(candidates)))
+  columns = [
+      np.reshape(column, [-1]).astype(model_input.dtype.as_numpy_dtype)
+      for column, model_input in zip(candidates, model.inputs)
+  ]
+  if len(set(len(column) for column in columns)) != 1:
+    raise ValueError('All candidate features must have the same length.')
+  return columns
+
+
+def _partition(columns, leaf_size):
+  """Splits candidates into boxes by recursive median splits.
+
+  Each box is split along the feature with the largest range relative to its
+  range over all candidates.
+
+  Args:
+    columns: List of 1-d feature arrays.
+    leaf_size: Maximum number of candidates in a box.
+
+  Returns:
+    List of candidate index arrays, one per box.
+  """
+  scales = [
+      max(float(np.max(column)) - float(np.min(column)), 1e-12)
+      for column in columns
+  ]
+  stack = [np.arange(len(columns[0]))]
+  boxes = []
+  while stack:
+    indices = stack.pop()
+    if len(indices) <= leaf_size:
+      boxes.append(indices)
+      continue
+    widths = [(float(np.max(column[indices])) - float(np.min(column[indices])))
+              / scale for column, scale in zip(columns, scales)]
+    dimension = int(np.argmax(widths))
+    if widths[dimension] <= 0.0:
+      # All candidates in the box have the same features.
+      boxes.append(indices)
+      continue
+    half = len(indices) // 2
+    order = np.argpartition(columns[dimension][indices], half)
+    stack.append(indices[order[half:]])
+    stack.append(indices[order[:half]])
+  return boxes
+
+
+def _box_upper_bounds(model, columns, boxes, batch_size):
+  """Returns upper bounds on model outputs within each box."""
+  order = np.concatenate(boxes)
+  starts = np.cumsum([0] + [len(box) for box in boxes[:-1]])
+  lower = []
+  upper = []
+  for column in columns:
+    values = column[order].astype(np.float64)
+    lower.append(np.minimum.reduceat(values, starts)[:, np.newaxis])
+    upper.append(np.maximum.reduceat(values, starts)[:, np.newaxis])
+  _, upper_bounds = interval_evaluation.model_bounds(
+      model, lower, upper, batch_size=batch_size)
+  return upper_bounds[:, 0]
+
+
+def top_k(model, candidates, k, leaf_size=256, batch_size=65536,
+          tolerance=1e-5):
+  """Returns the k candidates with the highest model outputs.
+
+  The result is the same as ranking all candidates by their model outputs, but
+  only candidates in boxes of feature space that might contain one of the top
+  candidates are scored.
+
+  Args:
+    model: A `tfl.premade.CalibratedLinear`, `tfl.premade.CalibratedLattice` or
+      `tfl.premade.CalibratedLatticeEnsemble` model.
+    candidates: Candidate features, either a dict from feature names to 1-d
+      arrays or a list of arrays in the order of model inputs.
+    k: Number of candidates to retrieve.
+    leaf_size: Maximum number of candidates in a box.
+    batch_size: Maximum number of examples evaluated by the model at once.
+    tolerance: Relative slack added to the box bounds to account for floating
+      point rounding in model evaluation.
+
+  Returns:
+    A `TopKResult` instance.
+
+  Raises:
+    ValueError: If the model is not supported or candidates do not match the
+      model inputs.
+  """
+  if getattr(model, 'model_config', None) is None:
+    raise ValueError('top_k requires a premade model.')
+  if k <= 0:
+    raise ValueError('k must be positive, got {}.'.format(k))
+  columns = _feature_columns(model, candidates)
+  k = min(k, len(columns[0]))
+
+  boxes = _partition(columns, leaf_size)
+  upper_bounds = _box_upper_bounds(model, columns, boxes, batch_size)
+  box_order = np.argsort(-upper_bounds, kind='stable')
+
+  top_indices = np.zeros([0], dtype=np.int64)
+  top_scores = np.zeros([0], dtype=np.float64)
+  num_scored = 0
+  position = 0
+  while position < len(box_order):
+    # Boxes with bounds below the threshold can not enter the top k.
+    threshold = -np.inf
+    if len(top_indices) == k:
+      threshold = top_scores[-1] - tolerance * max(1.0, abs(top_scores[-1]))
+    if upper_bounds[box_order[position]] < threshold:
+      break
+    # Scores the next box, or enough boxes to fill the top k, in a batch.
+    batch_indices = []
+    num_batch = 0
+    while (position < len(box_order) and
+           (not batch_indices or
+            (len(top_indices) + num_batch < k and
+             num_batch + len(boxes[box_order[position]]) <= batch_size))):
+      batch_indices.append(boxes[box_order[position]])
+      num_batch += len(boxes[box_order[position]])
+      position += 1
+    batch_indices = np.concatenate(batch_indices)
+    batch_inputs = [
+        tf.constant(column[batch_indices][:, np.newaxis]) for column in columns
+    ]
+    scores = np.asarray(
+        model(batch_inputs, training=False), dtype=np.float64)[:, 0]
+    num_scored += len(batch_indices)
+
+    indices = np.concatenate([top_indices, batch_indices])
+    scores = np.concatenate([top_scores, scores])
+    order = np.lexsort((indices, -scores))[:k]
+    top_indices = indices[order]
+    top_scores = scores[order]
+  return TopKResult(
+      indices=top_indices, scores=top_scores, num_scored=num_scored)
@@ -0,0 +1,156 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL top-k retrieval."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import retrieval
+from tensorflow_lattice.python import test_utils
+
+_FEATURE_CONFIGS = [
+    configs.FeatureConfig(
+        name='increasing',
+        lattice_size=3,
+        monotonicity='increasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+    ),
+    configs.FeatureConfig(
+        name='decreasing',
+        lattice_size=2,
+        monotonicity='decreasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+    ),
+    configs.FeatureConfig(
+        name='unconstrained',
+        lattice_size=3,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=6),
+        default_value=-1.0,
+    ),
+    configs.FeatureConfig(
+        name='categorical',
+        lattice_size=2,
+        num_buckets=4,
+        default_value=-1,
+    ),
+]
+
+_LATTICES = [['increasing', 'categorical'], ['increasing', 'decreasing'],
+             ['decreasing', 'unconstrained', 'categorical'],
+             ['unconstrained', 'increasing']]
+
+
+def _candidates(num_candidates):
+  rng = np.random.RandomState(1)
+  unconstrained = rng.uniform(size=num_candidates)
+  unconstrained[rng.uniform(size=num_candidates) < 0.1] = -1.0
+  return {
+      'increasing': rng.uniform(size=num_candidates),
+      'decreasing': rng.uniform(size=num_candidates),
+      'unconstrained': unconstrained,
+      'categorical': rng.randint(-1, 3, size=num_candidates),
+  }
+
+
+def _brute_force(model, candidates, k):
+  inputs = [
+      candidates[feature_config.name][:, np.newaxis]
+      for feature_config in model.model_config.feature_configs
+  ]
+  scores = model.predict(inputs, batch_size=1000, verbose=0)[:, 0]
+  order = np.lexsort((np.arange(len(scores)), -scores))[:k]
+  return order, scores[order]
+
+
+class RetrievalTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _Model(self, model_type, output_calibration):
+    return test_utils.premade_model(
+        model_type,
+        _FEATURE_CONFIGS,
+        lattices=_LATTICES,
+        output_calibration=output_calibration,
+        output_calibration_num_keypoints=5,
+        output_initialization=[-1.0, 1.0])
+
+  @parameterized.parameters(
+      ('linear', True, 10),
+      ('lattice', False, 1),
+      ('lattice', True, 25),
+      ('ensemble', True, 10),
+      ('shared_ensemble', False, 10),
+      ('packed_ensemble', True, 50),
+  )
+  def testTopK(self, model_type, output_calibration, k):
+    model = self._Model(model_type, output_calibration)
+    candidates = _candidates(3000)
+    result = retrieval.top_k(model, candidates, k, leaf_size=32)
+    expected_indices, expected_scores = _brute_force(model, candidates, k)
+    self.assertAllEqual(result.indices, expected_indices)
+    self.assertAllClose(result.scores, expected_scores, atol=1e-6)
+    self.assertLessEqual(result.num_scored, 3000)
+
+  def testPruning(self):
+    # Calibrators and lattices are initialized to linear functions.
+    model = test_utils.premade_model(
+        'lattice',
+        _FEATURE_CONFIGS[:2],
+        seed=None,
+        output_initialization=[-1.0, 1.0])
+    candidates = _candidates(5000)
+    del candidates['unconstrained']
+    del candidates['categorical']
+    result = retrieval.top_k(model, candidates, 10, leaf_size=16)
+    expected_indices, _ = _brute_force(model, candidates, 10)
+    self.assertAllEqual(result.indices, expected_indices)
+    self.assertLess(result.num_scored, 100)
+
+  def testListCandidatesAndLargeK(self):
+    model = self._Model('ensemble', False)
+    candidates = _candidates(50)
+    result = retrieval.top_k(
+        model, [
+            candidates[feature_config.name]
+            for feature_config in _FEATURE_CONFIGS
+        ],
+        k=100,
+        leaf_size=4)
+    expected_indices, _ = _brute_force(model, candidates, 50)
+    self.assertAllEqual(result.indices, expected_indices)
+    self.assertEqual(result.num_scored, 50)
+
+  def testInvalidArguments(self):
+    model = self._Model('lattice', False)
+    candidates = _candidates(10)
+    with self.assertRaises(ValueError):
+      retrieval.top_k(model, candidates, 0)
+    with self.assertRaises(ValueError):
+      retrieval.top_k(model, {'increasing': candidates['increasing']}, 1)
+    candidates['increasing'] = candidates['increasing'][:5]
+    with self.assertRaises(ValueError):
+      retrieval.top_k(model, candidates, 1)
+    inputs = tf.keras.Input(shape=(1,))
+    keras_model = tf.keras.Model(
+        inputs=inputs, outputs=tf.keras.layers.Dense(1)(inputs))
+    with self.assertRaises(ValueError):
+      retrieval.top_k(keras_model, [np.zeros(3)], 1)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -121,6 +121,8 @@ class RTL(keras.layers.Layer):
                clip_inputs=True,
                kernel_initializer='random_monotonic_initializer',
                kernel_regularizer=None,
+               sparse_kernel_gradients=False,
+               dropout_rate=0.0,
                **kwargs):
     # pyformat: disable
     """Initializes an instance of `RTL`.
@@ -174,6 +176,15 @@ class RTL(keras.layers.Layer):
           regularization amount for graph Laplacian regularizer. l1 and l2 can
           either be single floats or lists of floats to specify different
           regularization amount for every dimension.
+      sparse_kernel_gradients: If lattices should be evaluated by gathering
+        kernel rows of the lattice cells that contain the inputs, which results
+        in sparse (`tf.IndexedSlices`) kernel gradients. See
+        `tfl.layers.Lattice` for details.
+      dropout_rate: Fraction of the lattices left out in each training step.
+        Outputs of the active lattices are scaled so that averages of lattice
+        outputs stay unbiased. Lattices with the same constraints are packed
+        into multi-unit `tfl.layers.Lattice` layers, and the fraction applies
+        within each of those. See `tfl.layers.Lattice` for details.
       **kwargs: Other args passed to `tf.keras.layers.Layer` initializer.
 
     Raises:
@@ -192,6 +203,8 @@ class RTL(keras.layers.Layer):
     self.clip_inputs = clip_inputs
     self.kernel_initializer = kernel_initializer
     self.kernel_regularizer = kernel_regularizer
+    self.sparse_kernel_gradients = sparse_kernel_gradients
+    self.dropout_rate = dropout_rate
 
   def build(self, input_shape):
     """Standard Keras build() method."""
@@ -211,6 +224,8 @@ class RTL(keras.layers.Layer):
           clip_inputs=self.clip_inputs,
           kernel_initializer=self.kernel_initializer,
           kernel_regularizer=self.kernel_regularizer,
+          sparse_kernel_gradients=self.sparse_kernel_gradients,
+          dropout_rate=self.dropout_rate,
       )
     super(RTL, self).build(input_shape)
 
@@ -304,6 +319,8 @@ class RTL(keras.layers.Layer):
         'clip_inputs': self.clip_inputs,
         'kernel_initializer': self.kernel_initializer,
         'kernel_regularizer': self.kernel_regularizer,
+        'sparse_kernel_gradients': self.sparse_kernel_gradients,
+        'dropout_rate': self.dropout_rate,
     })
     return config
 
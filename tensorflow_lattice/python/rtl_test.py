@@ -129,6 +129,28 @@ class RTLTest(parameterized.TestCase, tf.test.TestCase):
     model.fit([c, d, e, f], target_cdef)
     model.predict([c, d, e, f])
 
+  def testRTLDropout(self):
+    if self.disable_all:
+      return
+    rtl = rtl_layer.RTL(num_lattices=8, lattice_rank=2, dropout_rate=0.5)
+    inputs = {
+        "unconstrained": tf.constant(
+            np.random.random_sample(size=(10, 4)), dtype=tf.float32)
+    }
+    outputs = [
+        rtl(inputs),
+        rtl(inputs, training=False),
+        rtl(inputs, training=True)
+    ]
+    if not tf.executing_eagerly():
+      self.evaluate(tf.compat.v1.global_variables_initializer())
+    outputs, inference_outputs, training_outputs = self.evaluate(outputs)
+    self.assertAllClose(inference_outputs, outputs)
+    # Half of the lattices are evaluated and their outputs are doubled.
+    active = np.any(training_outputs != 0.0, axis=0)
+    self.assertEqual(np.sum(active), 4)
+    self.assertAllClose(training_outputs[:, active], 2.0 * outputs[:, active])
+
   def testRTLSaveLoad(self):
     if self.disable_all:
       return
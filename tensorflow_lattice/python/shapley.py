@@ -0,0 +1,283 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Exact Shapley value attributions for TFL premade models.
+
+Interventional Shapley values attribute the difference between the model output
+for an example and the average output over a background dataset to the input
+features. The value of a coalition of features is the average model output over
+the background examples when the features in the coalition are set to the
+values of the explained example.
+
+Computing Shapley values of a general model is exponential in the number of
+features. TFL premade models are sums of low-rank submodels, and Shapley values
+are linear in the model, so exact values are computed per submodel:
+
+- Each lattice of rank `r` is evaluated on all `2^r` coalitions of its
+  features, and the attributions of its features are weighted differences of
+  the coalition values.
+- Calibrated linear models are additive, and the attribution of each feature is
+  its weight times the difference between its calibrated value and the average
+  calibrated value over the background examples.
+
+Attributions of an ensemble are the sums of the submodel attributions divided by
+the number of submodels. Output calibration is not additive, so attributions
+explain the model output before output calibration.
+
+```python
+explainer = tfl.shapley.ShapleyExplainer(
+    model, background_inputs=[x[name] for name in feature_names])
+attributions = explainer.shapley_values(inputs)
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+
+from . import configs
+from . import linear_layer
+from . import premade_lib
+import numpy as np
+import tensorflow as tf
+
+
+def _coalition_weights(rank):
+  """Returns the matrix mapping coalition values to Shapley values.
+
+  Coalitions are indexed by bit masks over the `rank` features. The Shapley
+  value of feature `i` is the sum over coalitions `S` without `i` of
+  `|S|! (rank - |S| - 1)! / rank! * (v(S + {i}) - v(S))`.
+
+  Args:
+    rank: Number of features.
+
+  Returns:
+    A numpy array of shape `(rank, 2**rank)`.
+  """
+  num_coalitions = 2**rank
+  weights = np.zeros([rank, num_coalitions])
+  for mask in range(num_coalitions):
+    size = bin(mask).count('1')
+    for i in range(rank):
+      if mask & (1 << i):
+        # S = mask - {i} with |S| = size - 1.
+        weights[i, mask] += (
+            math.factorial(size - 1) * math.factorial(rank - size) /
+            math.factorial(rank))
+      else:
+        weights[i, mask] -= (
+            math.factorial(size) * math.factorial(rank - size - 1) /
+            math.factorial(rank))
+  return weights
+
+
+class ShapleyExplainer(object):
+  # pyformat: disable
+  """Computes exact interventional Shapley values of a premade model.
+
+  Attributes:
+    - All `__init__` arguments.
+    feature_names: Names of the model input features.
+    base_value: Average model output before output calibration over the
+      background examples. For each example, the sum of the Shapley values and
+      the base value is the model output before output calibration.
+
+  Example:
+
+  ```python
+  explainer = tfl.shapley.ShapleyExplainer(model, background_inputs)
+  attributions = explainer.shapley_values(inputs)
+  ```
+  """
+  # pyformat: enable
+
+  def __init__(self,
+               model,
+               background_inputs,
+               batch_size=100000,
+               max_lattice_rank=16):
+    """Initializes a `ShapleyExplainer` instance.
+
+    Args:
+      model: A `tfl.premade` model with a `model_config`, other than
+        `tfl.premade.AggregateFunction`.
+      background_inputs: List of background feature values, one array of shape
+        `(num_examples,)` or `(num_examples, 1)` for each model input.
+      batch_size: Maximum number of (coalition, example, background example)
+        triplets evaluated at once.
+      max_lattice_rank: Maximum number of features of a lattice. Lattices with
+        more features have too many coalitions to enumerate.
+
+    Raises:
+      ValueError: If the model is not supported or background inputs do not
+        match the model inputs.
+    """
+    model_config = getattr(model, 'model_config', None)
+    if model_config is None or isinstance(model_config,
+                                          configs.AggregateFunctionConfig):
+      raise ValueError('ShapleyExplainer requires a premade model other than '
+                       'AggregateFunction.')
+    self.model = model
+    self.batch_size = batch_size
+    self.max_lattice_rank = max_lattice_rank
+    self.feature_names = [
+        feature_config.name for feature_config in model_config.feature_configs
+    ]
+    if len(self.feature_names) != len(background_inputs):
+      raise ValueError(
+          'Number of background inputs ({}) does not match the number of '
+          'features ({}).'.format(
+              len(background_inputs), len(self.feature_names)))
+    self.background_inputs = [
+        np.reshape(np.asarray(values), [-1, 1]) for values in background_inputs
+    ]
+    self.num_background_examples = self.background_inputs[0].shape[0]
+
+    self._submodels, self._average = premade_lib.premade_submodels(model)
+    for submodel in self._submodels:
+      if (not isinstance(submodel.layer, linear_layer.Linear) and
+          len(submodel.feature_names) > max_lattice_rank):
+        raise ValueError(
+            'Lattice with {} features exceeds max_lattice_rank {}.'.format(
+                len(submodel.feature_names), max_lattice_rank))
+    self._coalition_weights = {}
+    self._background_calibrated = self._calibrate_inputs(
+        self.background_inputs)
+    outputs = [
+        premade_lib.evaluate_submodel(
+            submodel, self._submodel_inputs(submodel,
+                                            self._background_calibrated))
+        for submodel in self._submodels
+    ]
+    output = tf.add_n(outputs)
+    if self._average:
+      output /= len(self._submodels)
+    self.base_value = float(np.mean(output))
+
+  def _calibrate_inputs(self, inputs):
+    """Returns calibrated values of each feature, one tensor per unit."""
+    calibrated = {}
+    for feature_name, values, model_input in zip(self.feature_names, inputs,
+                                                 self.model.inputs):
+      layer = self.model.get_layer('{}_{}'.format(premade_lib.CALIB_LAYER_NAME,
+                                                  feature_name))
+      outputs = layer(
+          tf.constant(np.reshape(values, [-1, 1]), dtype=model_input.dtype))
+      calibrated[feature_name] = tf.split(outputs, layer.units, axis=1)
+    return calibrated
+
+  def _submodel_inputs(self, submodel, calibrated):
+    return [
+        calibrated[feature_name][unit] for feature_name, unit in zip(
+            submodel.feature_names, submodel.calibration_units)
+    ]
+
+  def _linear_shapley_values(self, submodel, inputs):
+    """Returns Shapley values of a linear submodel."""
+    layer = submodel.layer
+    background_inputs = tf.concat(
+        self._submodel_inputs(submodel, self._background_calibrated), axis=1)
+    if layer.clip_value_min is not None and layer.clip_value_max is not None:
+      inputs = tf.clip_by_value(inputs, layer.clip_value_min,
+                                layer.clip_value_max)
+      background_inputs = tf.clip_by_value(background_inputs,
+                                           layer.clip_value_min,
+                                           layer.clip_value_max)
+    return (inputs - tf.reduce_mean(background_inputs, axis=0)) * tf.reshape(
+        layer.kernel, [1, -1])
+
+  def _lattice_shapley_values(self, submodel, inputs):
+    """Returns Shapley values of a lattice submodel.
+
+    Args:
+      submodel: A `premade_lib.Submodel` with a lattice layer.
+      inputs: List of calibrated submodel inputs of the explained examples,
+        each of shape `(num_examples, 1)`.
+
+    Returns:
+      A tensor of shape `(num_examples, rank)`.
+    """
+    rank = len(inputs)
+    num_coalitions = 2**rank
+    if rank not in self._coalition_weights:
+      self._coalition_weights[rank] = tf.constant(
+          _coalition_weights(rank), dtype=inputs[0].dtype)
+    coalition_weights = self._coalition_weights[rank]
+    background_inputs = self._submodel_inputs(submodel,
+                                              self._background_calibrated)
+    num_background = self.num_background_examples
+    num_examples = int(inputs[0].shape[0])
+    examples_per_batch = max(
+        1, self.batch_size // (num_coalitions * num_background))
+    masks = np.arange(num_coalitions)
+    values = []
+    for start in range(0, num_examples, examples_per_batch):
+      batch_inputs = [x[start:start + examples_per_batch] for x in inputs]
+      batch_size = int(batch_inputs[0].shape[0])
+      coalition_inputs = []
+      for i in range(rank):
+        # Shape: (batch_size * num_background, 1).
+        example_values = tf.repeat(batch_inputs[i], num_background, axis=0)
+        background_values = tf.tile(background_inputs[i], [batch_size, 1])
+        in_coalition = tf.constant((masks >> i) & 1 == 1)
+        coalition_inputs.append(
+            tf.reshape(
+                tf.where(
+                    tf.reshape(in_coalition, [-1, 1, 1]),
+                    example_values[tf.newaxis], background_values[tf.newaxis]),
+                [-1, 1]))
+      outputs = premade_lib.evaluate_submodel(submodel, coalition_inputs)
+      # Average over background examples gives the coalition values.
+      coalition_values = tf.reduce_mean(
+          tf.reshape(outputs, [num_coalitions, batch_size, num_background]),
+          axis=2)
+      values.append(tf.transpose(tf.matmul(coalition_weights,
+                                           coalition_values)))
+    return tf.concat(values, axis=0)
+
+  def shapley_values(self, inputs):
+    """Returns the Shapley values of each feature for each example.
+
+    Args:
+      inputs: List of feature values of the explained examples, one array of
+        shape `(num_examples,)` or `(num_examples, 1)` for each model input.
+
+    Returns:
+      A numpy array of shape `(num_examples, num_features)`.
+
+    Raises:
+      ValueError: If inputs do not match the model inputs.
+    """
+    if len(inputs) != len(self.feature_names):
+      raise ValueError(
+          'Number of inputs ({}) does not match the number of features '
+          '({}).'.format(len(inputs), len(self.feature_names)))
+    calibrated = self._calibrate_inputs(inputs)
+    num_examples = int(calibrated[self.feature_names[0]][0].shape[0])
+    attributions = np.zeros([num_examples, len(self.feature_names)])
+    for submodel in self._submodels:
+      submodel_inputs = self._submodel_inputs(submodel, calibrated)
+      if isinstance(submodel.layer, linear_layer.Linear):
+        values = self._linear_shapley_values(
+            submodel, tf.concat(submodel_inputs, axis=1))
+      else:
+        values = self._lattice_shapley_values(submodel, submodel_inputs)
+      values = values.numpy()
+      for i, feature_name in enumerate(submodel.feature_names):
+        attributions[:, self.feature_names.index(feature_name)] += values[:, i]
+    if self._average:
+      attributions /= len(self._submodels)
+    return attributions
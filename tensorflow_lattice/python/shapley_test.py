@@ -0,0 +1,175 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for TFL Shapley value attributions."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import math
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import premade_lib
+from tensorflow_lattice.python import shapley
+from tensorflow_lattice.python import test_utils
+
+_FEATURE_CONFIGS = [
+    configs.FeatureConfig(
+        name='numerical_1',
+        lattice_size=3,
+        monotonicity='increasing',
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=5),
+    ),
+    configs.FeatureConfig(
+        name='numerical_2',
+        lattice_size=2,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+    ),
+    configs.FeatureConfig(
+        name='categorical',
+        lattice_size=2,
+        num_buckets=3,
+    ),
+    configs.FeatureConfig(
+        name='numerical_3',
+        lattice_size=2,
+        pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=4),
+    ),
+]
+
+
+_LATTICES = [
+    ['numerical_1', 'categorical', 'numerical_3'],
+    ['numerical_2', 'numerical_3'],
+    ['numerical_1', 'numerical_3'],
+    ['categorical', 'numerical_2'],
+]
+
+
+class ShapleyTest(parameterized.TestCase, tf.test.TestCase):
+
+  def _Model(self, model_type, output_calibration):
+    return test_utils.premade_model(
+        model_type,
+        _FEATURE_CONFIGS,
+        lattices=_LATTICES,
+        output_calibration=output_calibration,
+        output_calibration_num_keypoints=5,
+        output_initialization=[-1.0, 1.0])
+
+  def _Inputs(self, num_examples, seed):
+    rng = np.random.RandomState(seed)
+    return [
+        rng.uniform(size=num_examples),
+        rng.uniform(size=num_examples),
+        rng.randint(0, 3, size=num_examples),
+        rng.uniform(size=num_examples),
+    ]
+
+  def _BruteForceShapleyValues(self, model, inputs, background_inputs):
+    """Returns Shapley values by enumerating coalitions of all features."""
+    num_features = len(inputs)
+    num_background = len(background_inputs[0])
+
+    def coalition_values(coalition, example):
+      model_inputs = [
+          np.full([num_background, 1], inputs[i][example]) if i in coalition
+          else np.reshape(background_inputs[i], [-1, 1])
+          for i in range(num_features)
+      ]
+      return np.mean(model.predict(model_inputs, verbose=0))
+
+    num_examples = len(inputs[0])
+    values = np.zeros([num_examples, num_features])
+    for example in range(num_examples):
+      for i in range(num_features):
+        others = [j for j in range(num_features) if j != i]
+        for size in range(num_features):
+          weight = (
+              math.factorial(size) * math.factorial(num_features - size - 1) /
+              math.factorial(num_features))
+          for coalition in itertools.combinations(others, size):
+            values[example, i] += weight * (
+                coalition_values(set(coalition) | {i}, example) -
+                coalition_values(set(coalition), example))
+    return values
+
+  @parameterized.parameters(
+      ('linear',),
+      ('lattice',),
+      ('ensemble',),
+      ('shared_ensemble',),
+      ('packed_ensemble',),
+  )
+  def testPremadeModels(self, model_type):
+    model = self._Model(model_type, output_calibration=False)
+    background_inputs = self._Inputs(10, seed=1)
+    inputs = self._Inputs(3, seed=2)
+    # Small batch size to test batching of examples.
+    explainer = shapley.ShapleyExplainer(
+        model, background_inputs, batch_size=100)
+    values = explainer.shapley_values(inputs)
+    self.assertEqual(values.shape, (3, 4))
+    self.assertAllClose(
+        values,
+        self._BruteForceShapleyValues(model, inputs, background_inputs),
+        atol=1e-5)
+    # Attributions sum up to the difference from the average output.
+    outputs = model.predict([np.reshape(x, [-1, 1]) for x in inputs],
+                            verbose=0)[:, 0]
+    self.assertAllClose(
+        np.sum(values, axis=1) + explainer.base_value, outputs, atol=1e-5)
+    self.assertAllClose(
+        explainer.base_value,
+        np.mean(
+            model.predict([np.reshape(x, [-1, 1]) for x in background_inputs],
+                          verbose=0)),
+        atol=1e-5)
+
+  def testOutputCalibration(self):
+    model = self._Model('ensemble', output_calibration=True)
+    background_inputs = self._Inputs(20, seed=1)
+    inputs = self._Inputs(50, seed=2)
+    explainer = shapley.ShapleyExplainer(model, background_inputs)
+    values = explainer.shapley_values(inputs)
+    # Attributions explain the input of the output calibrator.
+    uncalibrated_model = tf.keras.Model(
+        inputs=model.inputs,
+        outputs=model.get_layer(premade_lib.OUTPUT_CALIB_LAYER_NAME).input)
+    outputs = uncalibrated_model.predict(
+        [np.reshape(x, [-1, 1]) for x in inputs], verbose=0)[:, 0]
+    self.assertAllClose(
+        np.sum(values, axis=1) + explainer.base_value, outputs, atol=1e-5)
+
+  def testInvalidArguments(self):
+    model = self._Model('lattice', output_calibration=False)
+    with self.assertRaises(ValueError):
+      shapley.ShapleyExplainer(model, self._Inputs(10, seed=1)[:3])
+    with self.assertRaises(ValueError):
+      shapley.ShapleyExplainer(
+          model, self._Inputs(10, seed=1), max_lattice_rank=3)
+    inputs = [tf.keras.Input(shape=(1,)) for _ in range(4)]
+    keras_model = tf.keras.Model(
+        inputs=inputs,
+        outputs=tf.keras.layers.Dense(1)(tf.keras.layers.Concatenate()(inputs)))
+    with self.assertRaises(ValueError):
+      shapley.ShapleyExplainer(keras_model, self._Inputs(10, seed=1))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -12,16 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Helpers to train simple model for tests and print debug output."""
+"""Helpers to build and train simple models for tests and print debug output."""
 
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import copy
 import time
-from . import visualization
 from absl import logging
 import numpy as np
+import tensorflow as tf
+
+from . import configs
+from . import premade
 
 
 class TimeTracker(object):
@@ -114,6 +118,8 @@ def run_training_loop(config,
                  np.median(training_step_times))
 
   if plot_path:
+    # Imported here so that test utils do not require matplotlib.
+    from . import visualization  # pylint: disable=g-import-not-at-top
     predictions = keras_model.predict(np_training_inputs)
     plots = {
         "Ground truth": training_labels,
@@ -274,3 +280,62 @@ def get_linear_lattice_interpolation_fn(lattice_sizes, monotonicities,
     return result
 
   return linear_interpolation_fn
+
+
+def randomize_weights(weights, seed=0):
+  """Sets weights to uniformly random values projected onto their constraints.
+
+  Args:
+    weights: List of Keras weights, e.g. `model.trainable_weights`.
+    seed: Random seed.
+  """
+  rng = np.random.RandomState(seed)
+  for weight in weights:
+    value = tf.constant(rng.uniform(size=weight.shape), dtype=weight.dtype)
+    if weight.constraint is not None:
+      value = weight.constraint(value)
+    tf.keras.backend.set_value(weight, tf.keras.backend.get_value(value))
+
+
+def premade_model(model_type, feature_configs, lattices=None, seed=0,
+                  **kwargs):
+  """Returns a premade model with random weights.
+
+  Args:
+    model_type: One of 'linear', 'lattice', 'ensemble', 'shared_ensemble' or
+      'packed_ensemble'. Linear models use a bias. Ensembles use separate
+      calibrators, except for 'shared_ensemble', and 'packed_ensemble' packs
+      its lattices.
+    feature_configs: List of `tfl.configs.FeatureConfig`. A copy is used by the
+      model.
+    lattices: Lattices of ensemble models.
+    seed: Random seed of the weights, see `randomize_weights`. Weights are left
+      at their initial values if `None`.
+    **kwargs: Other arguments of the model config, e.g. `output_calibration`.
+
+  Returns:
+    A `tfl.premade.CalibratedLinear`, `tfl.premade.CalibratedLattice` or
+    `tfl.premade.CalibratedLatticeEnsemble` model.
+  """
+  feature_configs = copy.deepcopy(feature_configs)
+  if model_type == 'linear':
+    model = premade.CalibratedLinear(
+        configs.CalibratedLinearConfig(
+            feature_configs=feature_configs, use_bias=True, **kwargs))
+  elif model_type == 'lattice':
+    model = premade.CalibratedLattice(
+        configs.CalibratedLatticeConfig(
+            feature_configs=feature_configs, **kwargs))
+  elif model_type in ('ensemble', 'shared_ensemble', 'packed_ensemble'):
+    model = premade.CalibratedLatticeEnsemble(
+        configs.CalibratedLatticeEnsembleConfig(
+            feature_configs=feature_configs,
+            lattices=copy.deepcopy(lattices),
+            separate_calibrators=(model_type != 'shared_ensemble'),
+            pack_lattices=(model_type == 'packed_ensemble'),
+            **kwargs))
+  else:
+    raise ValueError('Unknown model type: {}'.format(model_type))
+  if seed is not None:
+    randomize_weights(model.trainable_weights, seed=seed)
+  return model
@@ -0,0 +1,241 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Scoring latency benchmarks for TFL premade models exported to TFLite.
+
+Exports TFL premade models with `tfl.export.to_tflite`, with and without int8
+kernel quantization, and measures the scoring latency of the TFLite interpreter
+on CPU against the Keras model for a sweep of batch sizes. Model sizes and the
+maximum absolute error of the exported models are reported as well. Run with:
+
+```shell
+python -m tensorflow_lattice.python.tflite_benchmark --benchmark_filter=. \
+    --num_threads=1 --benchmark_output_file=/tmp/tfl_tflite_benchmark.json
+```
+
+`--benchmark_filter` (`--benchmarks` in older TF versions) is a regex selecting
+the benchmark methods to run, e.g. `--benchmark_filter=CalibratedLattice`. Each
+benchmark result is reported using `tf.test.Benchmark.report_benchmark` and, if
+`--benchmark_output_file` is set, also appended to the given file as a single
+line JSON object.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import platform
+import time
+
+from absl import flags
+import numpy as np
+import tensorflow as tf
+from tensorflow_lattice.python import configs
+from tensorflow_lattice.python import export
+from tensorflow_lattice.python import premade
+from tensorflow_lattice.python import premade_lib
+from tensorflow_lattice.python import test_utils
+
+flags.DEFINE_string(
+    'benchmark_output_file', None,
+    'If set, benchmark results are appended to this file as JSON lines.')
+flags.DEFINE_integer('benchmark_iters', 100,
+                     'Number of timed iterations for each measurement.')
+flags.DEFINE_integer('benchmark_warmup_iters', 10,
+                     'Number of untimed iterations before each measurement.')
+flags.DEFINE_integer('num_features', 16, 'Number of model features.')
+flags.DEFINE_integer('num_threads', 1,
+                     'Number of threads used by the TFLite interpreter.')
+flags.DEFINE_integer('num_lattices', 32,
+                     'Number of lattices in lattice ensemble models.')
+flags.DEFINE_integer('lattice_rank', 5,
+                     'Number of features in each lattice of ensemble models.')
+flags.DEFINE_integer(
+    'calibrated_lattice_num_features', 5,
+    'Number of features used by calibrated lattice models. A single lattice '
+    'with all features is not feasible for a large number of features.')
+
+FLAGS = flags.FLAGS
+
+_BATCH_SIZES = [1, 32, 1024]
+
+# Number of buckets of categorical features.
+_NUM_BUCKETS = 8
+
+# Value used for missing numeric features.
+_MISSING_VALUE = -1.0
+
+
+def _time_fn(fn, iters, warmup_iters):
+  """Returns median wall time of fn() in seconds."""
+  for _ in range(warmup_iters):
+    fn()
+  times = []
+  for _ in range(iters):
+    start = time.time()
+    fn()
+    times.append(time.time() - start)
+  return float(np.median(times))
+
+
+def _feature_configs(num_features):
+  """Returns feature configs with every fourth feature categorical.
+
+  Lattices with 5 or more features have at least 4^5 = 1024 vertices, so their
+  kernels are quantized by `tfl.export.to_tflite(model, quantize=True)`.
+  """
+  feature_configs = []
+  for i in range(num_features):
+    if i % 4 == 3:
+      feature_configs.append(
+          configs.FeatureConfig(
+              name='categorical_{}'.format(i),
+              lattice_size=4,
+              num_buckets=_NUM_BUCKETS))
+    else:
+      feature_configs.append(
+          configs.FeatureConfig(
+              name='numeric_{}'.format(i),
+              lattice_size=4,
+              monotonicity='increasing' if i % 2 == 0 else 'none',
+              pwl_calibration_input_keypoints=np.linspace(0.0, 1.0, num=20),
+              default_value=_MISSING_VALUE))
+  return feature_configs
+
+
+def _inputs(feature_configs, batch_size, rng):
+  """Returns premade model inputs with 5% missing numeric values."""
+  inputs = []
+  for feature_config in feature_configs:
+    if feature_config.num_buckets:
+      inputs.append(
+          rng.randint(feature_config.num_buckets,
+                      size=[batch_size, 1]).astype(np.float32))
+    else:
+      values = rng.uniform(size=[batch_size, 1]).astype(np.float32)
+      values[rng.uniform(size=[batch_size, 1]) < 0.05] = _MISSING_VALUE
+      inputs.append(values)
+  return inputs
+
+
+class TFLiteBenchmark(tf.test.Benchmark):
+  """Benchmarks scoring latency of TFL premade models exported to TFLite."""
+
+  def _run_model_benchmark(self, model_name, model):
+    """Measures and reports Keras and TFLite latency of a premade model."""
+    iters = FLAGS.benchmark_iters
+    warmup_iters = FLAGS.benchmark_warmup_iters
+    test_utils.randomize_weights(model.trainable_weights, seed=42)
+    rng = np.random.RandomState(43)
+    feature_configs = model.model_config.feature_configs
+
+    start = time.time()
+    float_model = export.to_tflite(model)
+    export_time = time.time() - start
+    quantized_model = export.to_tflite(model, quantize=True)
+    float_scorer = export.TFLiteScorer(
+        float_model, num_threads=FLAGS.num_threads)
+    quantized_scorer = export.TFLiteScorer(
+        quantized_model, num_threads=FLAGS.num_threads)
+
+    @tf.function
+    def keras_forward(inputs):
+      return model(inputs, training=False)
+
+    results = []
+    for batch_size in _BATCH_SIZES:
+      inputs = _inputs(feature_configs, batch_size, rng)
+      keras_inputs = [tf.constant(value) for value in inputs]
+      expected = keras_forward(keras_inputs).numpy()
+      extras = {
+          'keras_time':
+              _time_fn(lambda: keras_forward(keras_inputs), iters,
+                       warmup_iters),
+          'tflite_time':
+              _time_fn(lambda: float_scorer.predict(inputs), iters,
+                       warmup_iters),
+          'tflite_quantized_time':
+              _time_fn(lambda: quantized_scorer.predict(inputs), iters,
+                       warmup_iters),
+          'tflite_max_error':
+              float(np.max(np.abs(float_scorer.predict(inputs) - expected))),
+          'tflite_quantized_max_error':
+              float(
+                  np.max(np.abs(quantized_scorer.predict(inputs) - expected))),
+          'tflite_model_bytes': len(float_model),
+          'tflite_quantized_model_bytes': len(quantized_model),
+          'export_time': export_time,
+      }
+      name = '{}_batch_size_{}'.format(model_name, batch_size)
+      self.report_benchmark(
+          iters=iters,
+          wall_time=extras['tflite_time'],
+          name=name,
+          extras=extras)
+
+      result = {
+          'name': name,
+          'model': model_name,
+          'batch_size': batch_size,
+          'num_features': len(feature_configs),
+          'num_threads': FLAGS.num_threads,
+          'iters': iters,
+          'machine': platform.machine(),
+          'tf_version': tf.__version__,
+          'timestamp': time.time(),
+      }
+      result.update(extras)
+      if FLAGS.benchmark_output_file:
+        with tf.io.gfile.GFile(FLAGS.benchmark_output_file, 'a') as f:
+          f.write(json.dumps(result, sort_keys=True) + '\n')
+      results.append(result)
+    return results
+
+  def benchmarkCalibratedLinear(self):
+    self._run_model_benchmark(
+        'calibrated_linear',
+        premade.CalibratedLinear(
+            configs.CalibratedLinearConfig(
+                feature_configs=_feature_configs(FLAGS.num_features),
+                output_calibration=True,
+                output_initialization=[0.0, 1.0])))
+
+  def benchmarkCalibratedLattice(self):
+    self._run_model_benchmark(
+        'calibrated_lattice',
+        premade.CalibratedLattice(
+            configs.CalibratedLatticeConfig(
+                feature_configs=_feature_configs(
+                    FLAGS.calibrated_lattice_num_features),
+                output_initialization=[0.0, 1.0])))
+
+  def benchmarkCalibratedLatticeEnsemble(self):
+    for pack_lattices in [False, True]:
+      model_config = configs.CalibratedLatticeEnsembleConfig(
+          feature_configs=_feature_configs(FLAGS.num_features),
+          lattices='random',
+          num_lattices=FLAGS.num_lattices,
+          lattice_rank=FLAGS.lattice_rank,
+          separate_calibrators=True,
+          output_initialization=[0.0, 1.0],
+          pack_lattices=pack_lattices)
+      premade_lib.set_random_lattice_ensemble(model_config)
+      self._run_model_benchmark(
+          'calibrated_lattice_ensemble_packed'
+          if pack_lattices else 'calibrated_lattice_ensemble',
+          premade.CalibratedLatticeEnsemble(model_config))
+
+
+if __name__ == '__main__':
+  tf.test.main()